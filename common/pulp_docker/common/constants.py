@@ -15,6 +15,10 @@ DISTRIBUTOR_CONFIG_FILE_NAME = 'server/plugins.conf.d/docker_distributor.json'
 DISTRIBUTOR_EXPORT_CONFIG_FILE_NAME = 'server/plugins.conf.d/docker_distributor_export.json'
 FOREIGN_LAYER = 'application/vnd.docker.image.rootfs.foreign.diff.tar.gzip'
 
+# Files of a v2 export tar file. The OCI layout file is the first file of the tar file.
+EXPORT_OCI_LAYOUT_FILE_NAME = 'oci-layout'
+EXPORT_MANIFEST_FILE_NAME = 'pulp-export.json'
+
 REPO_NOTE_DOCKER = 'docker-repo'
 
 # Config keys for the importer
@@ -24,22 +28,65 @@ CONFIG_KEY_UPSTREAM_NAME = 'upstream_name'
 CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY = 'docker_publish_directory'
 CONFIG_VALUE_DOCKER_PUBLISH_DIRECTORY = '/var/lib/pulp/published/docker'
 CONFIG_KEY_EXPORT_FILE = 'export_file'
+CONFIG_KEY_EXPORT_API_VERSION = 'export_api_version'
+CONFIG_KEY_EXPORT_COMPRESSION = 'export_compression'
+CONFIG_KEY_EXPORT_COMPRESSION_LEVEL = 'export_compression_level'
+CONFIG_KEY_EXPORT_COMPRESSION_THREADS = 'export_compression_threads'
+CONFIG_KEY_EXPORT_DELTA_BASE = 'export_delta_base'
+CONFIG_KEY_EXPORT_START_DATE = 'export_start_date'
 
 # Config keys for a distributor instance in the database
 CONFIG_KEY_REDIRECT_URL = 'redirect-url'
 CONFIG_KEY_PROTECTED = 'protected'
 CONFIG_KEY_REPO_REGISTRY_ID = 'repo-registry-id'
+CONFIG_KEY_INCREMENTAL_PUBLISH = 'incremental_publish'
+CONFIG_KEY_SYMLINK_WORKERS = 'symlink_workers'
+CONFIG_KEY_SHARED_BLOBS = 'shared_blobs'
+CONFIG_KEY_COMPACT_REDIRECT_FILE = 'compact_redirect_file'
+CONFIG_KEY_REDIRECT_FILE_INDEX = 'redirect_file_index'
+CONFIG_KEY_STATIC_LAYOUT = 'static_layout'
+
+# Config keys of the importer and of the distributors
+CONFIG_KEY_PROFILE = 'profile'
+CONFIG_KEY_PROFILE_MEMORY = 'profile_memory'
+
+# Keys of the metadata of an upload
+UPLOAD_KEY_EXPORT_ARCHIVE = 'export_archive'
+UPLOAD_KEY_TAGS = 'tags'
+UPLOAD_KEY_REMOVE_TAGS = 'remove_tags'
+UPLOAD_KEY_DIRECTORY = 'directory'
+
+# Results of the bulk update of tags, reported by tag name
+TAG_RESULT_CREATED = 'created'
+TAG_RESULT_UPDATED = 'updated'
+TAG_RESULT_UNCHANGED = 'unchanged'
+TAG_RESULT_REMOVED = 'removed'
+TAG_RESULT_NOT_FOUND = 'not_found'
+TAG_RESULT_MISSING_MANIFEST = 'missing_manifest'
+TAG_RESULT_FAILED = 'failed'
 
 # Config keys for an importer override config
 CONFIG_KEY_MASK_ID = 'mask_id'
 CONFIG_KEY_ENABLE_V1 = 'enable_v1'
 CONFIG_KEY_ENABLE_V2 = 'enable_v2'
 CONFIG_KEY_WHITELIST_TAGS = 'tags'
+CONFIG_KEY_SYNC_STATE_ON_DISK = 'sync_state_on_disk'
+CONFIG_KEY_MANIFEST_DOWNLOAD_THREADS = 'manifest_download_threads'
+CONFIG_KEY_CATALOG_SYNC = 'catalog_sync'
+CONFIG_KEY_CATALOG_NAMESPACE = 'catalog_namespace'
+CONFIG_KEY_METADATA_ENGINE = 'metadata_engine'
+CONFIG_KEY_METADATA_HOST_LIMIT = 'metadata_host_limit'
+CONFIG_KEY_UPLOAD_BUFFER_SIZE = 'upload_buffer_size'
+CONFIG_KEY_UPLOAD_COMPRESSION_LEVEL = 'upload_compression_level'
+CONFIG_KEY_UPLOAD_COMPRESSION_THREADS = 'upload_compression_threads'
+CONFIG_KEY_UPLOAD_DIRECTORIES = 'upload_directories'
 
 SYNC_STEP_MAIN = 'sync_step_main'
 SYNC_STEP_METADATA = 'sync_step_metadata'
 SYNC_STEP_DOWNLOAD = 'sync_step_download'
 SYNC_STEP_SAVE = 'sync_step_save'
+SYNC_STEP_GET_LOCAL = 'sync_step_get_local'
+SYNC_STEP_CATALOG = 'sync_step_catalog'
 SYNC_STEP_SAVE_V1 = 'v1_sync_step_save'
 SYNC_STEP_METADATA_V1 = 'v1_sync_step_metadata'
 SYNC_STEP_GET_LOCAL_V1 = 'v1_sync_step_get_local'
@@ -51,6 +98,8 @@ UPLOAD_STEP_SAVE = 'upload_step_save'
 UPLOAD_TAG_STEP = 'upload_tags_step'
 UPLOAD_STEP_IMAGE_MANIFEST = 'upload_step_image_manifest'
 UPLOAD_STEP_MANIFEST_LIST = 'upload_step_manifest_list'
+UPLOAD_STEP_EXPORT_ARCHIVE = 'upload_step_export_archive'
+UPLOAD_STEP_DIRECTORY = 'upload_step_directory'
 
 # Keys that are specified on the repo config
 PUBLISH_STEP_WEB_PUBLISHER = 'publish_to_web'
@@ -64,6 +113,14 @@ PUBLISH_STEP_TAGS = 'publish_tags'
 PUBLISH_STEP_OVER_HTTP = 'publish_images_over_http'
 PUBLISH_STEP_DIRECTORY = 'publish_directory'
 PUBLISH_STEP_TAR = 'save_tar'
+PUBLISH_STEP_INCREMENTAL = 'publish_incremental'
+PUBLISH_STEP_SYMLINKS = 'publish_symlinks'
+PUBLISH_STEP_HTTPD_CONFIG = 'publish_httpd_config'
+PUBLISH_STEP_EXPORT_BLOBS = 'export_blobs'
+PUBLISH_STEP_EXPORT_MANIFESTS = 'export_manifests'
+PUBLISH_STEP_EXPORT_MANIFEST_LISTS = 'export_manifest_lists'
+PUBLISH_STEP_EXPORT_TAGS = 'export_tags'
+PUBLISH_STEP_EXPORT_INDEX = 'export_index'
 
 # Dictionary keys to be used when storing or accessing a list of tag dictionaries
 # on the repo scratchpad
@@ -51,3 +51,51 @@ DKR1019 = Error("DKR1019", _("Tag does not contain required field: %(field)s."),
 DKR1020 = Error("DKR1020", _("Image download(s) from %(failed_urls)s failed. Sync task has"
                              " failed to prevent a corrupted repository."),
                 ['failed_urls'])
+DKR1021 = Error("DKR1021", _("The value specified for %(field)s: '%(value)s' is not a positive "
+                             "integer."),
+                ['field', 'value'])
+DKR1022 = Error("DKR1022", _("The value specified for %(field)s: '%(value)s' is not one of: "
+                             "%(choices)s."),
+                ['field', 'value', 'choices'])
+DKR1023 = Error("DKR1023", _("zstd compression requires the python zstandard module to be "
+                             "installed."),
+                [])
+DKR1024 = Error("DKR1024", _("The value specified for %(field)s: '%(value)s' is not an ISO 8601 "
+                             "date."),
+                ['field', 'value'])
+DKR1025 = Error("DKR1025", _("The uploaded file is not a supported export, it does not contain a "
+                             "version %(version)s %(file_name)s file."),
+                ['version', 'file_name'])
+DKR1026 = Error("DKR1026", _("The value specified for %(field)s is not %(expected)s."),
+                ['field', 'expected'])
+DKR1027 = Error("DKR1027", _("The directory %(path)s is not in one of the directories listed in "
+                             "the upload_directories setting of the importer."),
+                ['path'])
+DKR1028 = Error("DKR1028", _("The directory %(path)s is neither a skopeo directory nor an OCI "
+                             "image layout."),
+                ['path'])
+DKR1029 = Error("DKR1029", _("Image Manifest %(digest)s has the unsupported mediaType "
+                             "%(media_type)s."),
+                ['digest', 'media_type'])
+DKR1030 = Error("DKR1030", _("Could not retrieve the repository catalog of %(registry)s: "
+                             "%(reason)s."),
+                ['registry', 'reason'])
+DKR1031 = Error("DKR1031", _("The sync of the repositories %(repos)s from the registry catalog "
+                             "failed."),
+                ['repos'])
+DKR1032 = Error("DKR1032", _("The static_layout option cannot be enabled for a protected "
+                             "repository, the web server does not check entitlement "
+                             "certificates."),
+                [])
+DKR1033 = Error("DKR1033", _("The export manifest %(path)s specified for %(field)s could not be "
+                             "read: %(reason)s."),
+                ['field', 'path', 'reason'])
+DKR1034 = Error("DKR1034", _("The shared_blobs option cannot be enabled for a protected "
+                             "repository, the shared blobs are served to the clients of every "
+                             "repository."),
+                [])
+DKR1035 = Error("DKR1035", _("The export manifest of the uploaded file is not valid: %(reason)s."),
+                ['reason'])
+DKR1036 = Error("DKR1036", _("The digest %(digest)s uses the unsupported algorithm "
+                             "%(algorithm)s."),
+                ['digest', 'algorithm'])
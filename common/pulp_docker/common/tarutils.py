@@ -1,8 +1,110 @@
+from collections import OrderedDict
 import contextlib
+from cStringIO import StringIO
 import json
 import os
 import tarfile
 
+from pulp_docker.common import constants
+
+
+# First bytes of a zstd frame
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+
+# The index of the last tar file that was indexed, by path, size and modification time. This
+# only lives in the process, nothing is written next to the tar file.
+_index_cache = {}
+
+
+class TarIndex(object):
+    """
+    The names, data offsets and sizes of the regular files in a tar file, read in a single pass
+    over its headers. The files are then read by seeking straight to their data, instead of
+    scanning the headers of the tar file again.
+
+    The tar file stays open until close() is called, so the members are all read through the
+    same handle. For a compressed tar file, reading the members in the order of the tar file
+    only decompresses each part of it once.
+    """
+
+    def __init__(self, tarfile_path):
+        """
+        :param tarfile_path: full path to the tarfile
+        :type  tarfile_path: basestring
+        :raises IOError: if the file does not exist
+        :raises tarfile.ReadError: if the file is not a tar file
+        """
+        self.path = tarfile_path
+        # (data offset, size) by member name, in the order of the tar file
+        self.members = OrderedDict()
+        self._archive = tarfile.open(tarfile_path)
+        try:
+            for member in self._archive:
+                if member.isfile():
+                    self.members[member.name] = (member.offset_data, member.size)
+        except Exception:
+            self.close()
+            raise
+
+    def find(self, basename):
+        """
+        :param basename: file name to look for
+        :type  basename: basestring
+        :return:         names of the members with the given file name, in the order of the tar
+                         file
+        :rtype:          list
+        """
+        return [name for name in self.members if os.path.basename(name) == basename]
+
+    def open(self, name):
+        """
+        Read a member of the tar file.
+
+        :param name: name of the member
+        :type  name: basestring
+        :return:     file-like object holding the contents of the member
+        :rtype:      cStringIO.StringIO
+        :raises KeyError: if the tar file has no such member
+        """
+        offset, size = self.members[name]
+        # tarfile handles the compressed tar files, the offsets are in the uncompressed data
+        self._archive.fileobj.seek(offset)
+        return StringIO(self._archive.fileobj.read(size))
+
+    def close(self):
+        """
+        Close the tar file.
+        """
+        self._archive.close()
+
+
+def get_index(tarfile_path):
+    """
+    Get the index of a tar file. The index of the last file, and its open handle, is kept in
+    memory for as long as the file is not modified and no other file is indexed, so that the
+    functions of this module scan the tar file only once.
+
+    :param tarfile_path: full path to the tarfile
+    :type  tarfile_path: basestring
+    :return:             the index
+    :rtype:              TarIndex
+    :raises IOError: if the file does not exist
+    :raises tarfile.ReadError: if the file is not a tar file
+    """
+    try:
+        stat = os.stat(tarfile_path)
+    except OSError as e:
+        raise IOError(e.errno, e.strerror, tarfile_path)
+    key = (os.path.abspath(tarfile_path), stat.st_size, stat.st_mtime)
+    index = _index_cache.get(key)
+    if index is None:
+        index = TarIndex(tarfile_path)
+        for previous in _index_cache.values():
+            previous.close()
+        _index_cache.clear()
+        _index_cache[key] = index
+    return index
+
 
 def get_metadata(tarfile_path):
     """
@@ -24,21 +126,20 @@ def get_metadata(tarfile_path):
     """
     metadata = {}
 
-    with contextlib.closing(tarfile.open(tarfile_path)) as archive:
-        for member in archive.getmembers():
-            # find the "json" files, which contain all image metadata
-            if os.path.basename(member.path) == 'json':
-                image_data = json.load(archive.extractfile(member))
-                # At some point between docker 0.10 and 1.0, it changed behavior
-                # of whether these keys are capitalized or not.
-                image_id = image_data.get('id', image_data.get('Id'))
-                parent_id = image_data.get('parent', image_data.get('Parent'))
-                metadata[image_id] = {
-                    'parent': parent_id,
-                    # image 511136ea does not have a Size attribute, which has
-                    # caused problems during upload
-                    'size': image_data.get('Size'),
-                }
+    index = get_index(tarfile_path)
+    # find the "json" files, which contain all image metadata
+    for name in index.find('json'):
+        image_data = json.load(index.open(name))
+        # At some point between docker 0.10 and 1.0, it changed behavior
+        # of whether these keys are capitalized or not.
+        image_id = image_data.get('id', image_data.get('Id'))
+        parent_id = image_data.get('parent', image_data.get('Parent'))
+        metadata[image_id] = {
+            'parent': parent_id,
+            # image 511136ea does not have a Size attribute, which has
+            # caused problems during upload
+            'size': image_data.get('Size'),
+        }
 
     return metadata
 
@@ -50,9 +151,8 @@ def get_tags(tarfile_path):
     :param tarfile_path:    full path to the tarfile
     :type  tarfile_path:    basestring
     """
-    with contextlib.closing(tarfile.open(tarfile_path)) as archive:
-        repo_file = archive.extractfile('repositories')
-        repo_json = json.load(repo_file)
+    repo_file = get_index(tarfile_path).open('repositories')
+    repo_json = json.load(repo_file)
 
     if len(repo_json) != 1:
         raise ValueError('pulp only supports one repo per tarfile')
@@ -116,6 +216,28 @@ def get_youngest_children(metadata):
     return list(image_ids)
 
 
+def is_export_archive(tarfile_path):
+    """
+    Determine whether a file is a v2 export of the export distributor, which starts with the OCI
+    layout file. Only v2 exports can be zstd compressed.
+
+    :param tarfile_path: full path to the file
+    :type tarfile_path:  basestring
+    :return:             True if the file is a v2 export
+    :rtype:              bool
+    """
+    with open(tarfile_path, 'rb') as archive_file:
+        if archive_file.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC:
+            return True
+        archive_file.seek(0)
+        try:
+            with contextlib.closing(tarfile.open(fileobj=archive_file, mode='r|*')) as archive:
+                member = archive.next()
+        except tarfile.TarError:
+            return False
+    return member is not None and member.name == constants.EXPORT_OCI_LAYOUT_FILE_NAME
+
+
 def get_image_manifest(tarfile_path):
     """
     Given a path to a tarfile, this returns the decoded manifest.json file if it exists
@@ -127,11 +249,54 @@ def get_image_manifest(tarfile_path):
     :rtype               list or dict
     """
     image_manifest = []
-    with contextlib.closing(tarfile.open(tarfile_path)) as archive:
-        for member in archive.getmembers():
-            # find the "manifest.json" file
-            if os.path.basename(member.path) == 'manifest.json':
-                image_manifest = json.load(archive.extractfile(member))
-                break
+    index = get_index(tarfile_path)
+    # find the "manifest.json" file
+    for name in index.find('manifest.json'):
+        image_manifest = json.load(index.open(name))
+        break
 
     return image_manifest
+
+
+def get_blob_digests(image_manifest):
+    """
+    Given a decoded v2 image manifest, this returns the digests of the blobs it references,
+    leaving out the foreign layers, which are not uploaded.
+
+    :param image_manifest: decoded schema 1 or schema 2 image manifest
+    :type image_manifest:  dict
+    :return:               digests of the layers and of the config blob
+    :rtype:                set
+    """
+    if image_manifest.get('schemaVersion') == 1:
+        return set(layer['blobSum'] for layer in image_manifest.get('fsLayers', []))
+    digests = set(layer['digest'] for layer in image_manifest.get('layers', [])
+                  if layer.get('mediaType') != constants.FOREIGN_LAYER)
+    if image_manifest.get('config'):
+        digests.add(image_manifest['config']['digest'])
+    return digests
+
+
+def copy_without_blobs(tarfile_path, destination_path, digests):
+    """
+    Copy a tarfile of a skopeo directory, leaving out the given blobs.
+
+    :param tarfile_path:     full path to the tarfile
+    :type tarfile_path:      basestring
+    :param destination_path: full path to the tarfile to create
+    :type destination_path:  basestring
+    :param digests:          digests of the blobs to leave out
+    :type digests:           iterable
+    """
+    names = set()
+    for digest in digests:
+        checksum = digest.rpartition(':')[2]
+        # skopeo directory transport versions before 1.1 add a .tar extension
+        names.update((checksum, '%s.tar' % checksum))
+    with contextlib.closing(tarfile.open(tarfile_path)) as source:
+        with contextlib.closing(tarfile.open(destination_path, 'w')) as destination:
+            for member in source:
+                if not member.isfile():
+                    destination.addfile(member)
+                elif os.path.basename(member.name) not in names:
+                    destination.addfile(member, source.extractfile(member))
@@ -1,13 +1,18 @@
 import os
+import shutil
+import tarfile
+import tempfile
 import unittest
 
 import mock
 
-from pulp_docker.common import tarutils
+from pulp_docker.common import constants, tarutils
 
 
 busybox_tar_path = os.path.join(os.path.dirname(__file__), '../data/busyboxlight.tar')
 skopeo_tar_path = os.path.join(os.path.dirname(__file__), '../data/skopeo.tar')
+skopeo_layer_digest = 'sha256:9e87eff13613eed2f67b0188f8604d1bbdd3a7f5d6a4f565e8923817db65d6e5'
+skopeo_config_digest = 'sha256:efe10ee6727fe52d2db2eb5045518fe98d8e31fdad1cbdd5e1f737018c349ebb'
 
 # these are in correct ancestry order
 busybox_ids = (
@@ -130,3 +135,128 @@ class TestGetImageManifest(unittest.TestCase):
     def test_with_busybox(self):
         ret = tarutils.get_image_manifest(busybox_tar_path)
         self.assertEqual(ret, [])
+
+
+class TestIsExportArchive(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.working_dir, 'export.tar.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_export(self):
+        layout_path = os.path.join(self.working_dir, 'oci-layout')
+        with open(layout_path, 'w') as layout_file:
+            layout_file.write('{}')
+        archive = tarfile.open(self.path, 'w:gz')
+        archive.add(layout_path, 'oci-layout')
+        archive.close()
+
+        self.assertTrue(tarutils.is_export_archive(self.path))
+
+    def test_zstd(self):
+        with open(self.path, 'w') as archive_file:
+            archive_file.write(tarutils.ZSTD_MAGIC + 'data')
+
+        self.assertTrue(tarutils.is_export_archive(self.path))
+
+    def test_with_skopeo(self):
+        self.assertFalse(tarutils.is_export_archive(skopeo_tar_path))
+
+    def test_not_a_tar_file(self):
+        with open(self.path, 'w') as archive_file:
+            archive_file.write('{}')
+
+        self.assertFalse(tarutils.is_export_archive(self.path))
+
+
+class TestGetIndex(unittest.TestCase):
+    def setUp(self):
+        tarutils._index_cache.clear()
+
+    def test_cached(self):
+        index = tarutils.get_index(busybox_tar_path)
+
+        self.assertTrue(tarutils.get_index(busybox_tar_path) is index)
+        self.assertEqual(index.find('repositories'), ['repositories'])
+
+    @mock.patch('pulp_docker.common.tarutils.TarIndex', side_effect=tarutils.TarIndex)
+    def test_single_scan(self, mock_index):
+        tarutils.get_metadata(busybox_tar_path)
+        tarutils.get_tags(busybox_tar_path)
+        tarutils.get_image_manifest(busybox_tar_path)
+
+        mock_index.assert_called_once_with(busybox_tar_path)
+
+    @mock.patch('pulp_docker.common.tarutils.tarfile.open', side_effect=tarfile.open)
+    def test_single_open(self, mock_open):
+        index = tarutils.get_index(busybox_tar_path)
+        index.open('repositories')
+        for name in index.find('json'):
+            index.open(name)
+
+        mock_open.assert_called_once_with(busybox_tar_path)
+
+    def test_other_file_closes_index(self):
+        index = tarutils.get_index(busybox_tar_path)
+
+        tarutils.get_index(skopeo_tar_path)
+
+        self.assertTrue(index._archive.closed)
+        self.assertTrue(tarutils.get_index(busybox_tar_path) is not index)
+
+    def test_path_does_not_exist(self):
+        self.assertRaises(IOError, tarutils.get_index, '/a/b/c/d')
+
+    def test_open_missing_member(self):
+        self.assertRaises(KeyError, tarutils.get_index(busybox_tar_path).open, 'missing')
+
+    def test_compressed(self):
+        working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, working_dir)
+        path = os.path.join(working_dir, 'image.tar.gz')
+        with tarfile.open(path, 'w:gz') as archive:
+            archive.add(busybox_tar_path, 'layer.tar')
+            archive.add(skopeo_tar_path, 'other.tar')
+
+        with open(skopeo_tar_path) as skopeo_tar:
+            self.assertEqual(tarutils.get_index(path).open('other.tar').read(), skopeo_tar.read())
+
+
+class TestGetBlobDigests(unittest.TestCase):
+    def test_schema2(self):
+        ret = tarutils.get_blob_digests(tarutils.get_image_manifest(skopeo_tar_path))
+
+        self.assertEqual(ret, set([skopeo_layer_digest, skopeo_config_digest]))
+
+    def test_foreign_layer(self):
+        image_manifest = {'schemaVersion': 2,
+                          'config': {'digest': 'sha256:c'},
+                          'layers': [{'digest': 'sha256:a', 'mediaType': 'layer'},
+                                     {'digest': 'sha256:b', 'mediaType': constants.FOREIGN_LAYER}]}
+
+        ret = tarutils.get_blob_digests(image_manifest)
+
+        self.assertEqual(ret, set(['sha256:a', 'sha256:c']))
+
+    def test_schema1(self):
+        image_manifest = {'schemaVersion': 1,
+                          'fsLayers': [{'blobSum': 'sha256:a'}, {'blobSum': 'sha256:a'}]}
+
+        self.assertEqual(tarutils.get_blob_digests(image_manifest), set(['sha256:a']))
+
+
+class TestCopyWithoutBlobs(unittest.TestCase):
+    def test_copy(self):
+        working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, working_dir)
+        path = os.path.join(working_dir, 'image.tar')
+
+        tarutils.copy_without_blobs(skopeo_tar_path, path, [skopeo_layer_digest])
+
+        with tarfile.open(path) as archive:
+            self.assertEqual(archive.getnames(),
+                             ['%s.tar' % skopeo_config_digest[len('sha256:'):], 'manifest.json'])
+        self.assertEqual(tarutils.get_image_manifest(path),
+                         tarutils.get_image_manifest(skopeo_tar_path))
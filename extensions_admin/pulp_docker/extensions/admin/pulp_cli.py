@@ -11,7 +11,8 @@ from pulp_docker.extensions.admin.cudl import UpdateDockerRepositoryCommand
 from pulp_docker.extensions.admin.images import ImageCopyCommand
 from pulp_docker.extensions.admin.images import ImageRemoveCommand
 from pulp_docker.extensions.admin.images import ImageSearchCommand
-from pulp_docker.extensions.admin.upload import TagUpdateCommand, UploadDockerImageCommand
+from pulp_docker.extensions.admin.upload import ImportDirectoryCommand, TagBulkUpdateCommand, \
+    TagUpdateCommand, UploadDockerImageCommand
 from pulp_docker.extensions.admin.repo_list import ListDockerRepositoriesCommand
 
 
@@ -78,6 +79,7 @@ def add_upload_section(context, parent_section):
     """
     upload_section = parent_section.create_subsection(SECTION_UPLOADS, DESC_UPLOADS)
     upload_section.add_command(UploadDockerImageCommand(context))
+    upload_section.add_command(ImportDirectoryCommand(context))
     return upload_section
 
 
@@ -96,6 +98,7 @@ def add_repo_section(context, parent_section):
     repo_section.add_command(UpdateDockerRepositoryCommand(context))
     repo_section.add_command(ListDockerRepositoriesCommand(context))
     repo_section.add_command(TagUpdateCommand(context))
+    repo_section.add_command(TagBulkUpdateCommand(context))
     add_search_section(context, repo_section)
     add_copy_section(context, repo_section)
     add_remove_section(context, repo_section)
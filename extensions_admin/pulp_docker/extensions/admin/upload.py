@@ -1,6 +1,8 @@
 from gettext import gettext as _
 import json
+import os
 import tarfile
+import tempfile
 
 from pulp.client.commands.repo.upload import UploadCommand
 from pulp.client.extensions.extensions import PulpCliOption
@@ -20,7 +22,24 @@ TAG_NAME_OPTION = PulpCliOption('--tag-name', d)
 d = _('digest of the image manifest or manifest list (e.g. sha256:3e006...)')
 DIGEST_OPTION = PulpCliOption('--digest', d)
 
+d = _('JSON file mapping the names of the tags to create or update to the digests of image '
+      'manifests or manifest lists, e.g. {"latest": "sha256:3e006..."}')
+TAGS_FILE_OPTION = PulpCliOption('--tags-file', d, required=False)
+
+d = _('name of a tag to remove from the repository; may be specified multiple times')
+REMOVE_TAG_OPTION = PulpCliOption('--remove-tag', d, required=False, allow_multiple=True)
+
+d = _('path on the Pulp server of a skopeo directory or an OCI image layout; it must be in one '
+      'of the directories listed in the upload_directories setting of the importer')
+SERVER_DIR_OPTION = PulpCliOption('--server-dir', d)
+
 DESC_UPDATE_TAGS = _('create or update a tag to point to a manifest')
+DESC_IMPORT_DIRECTORY = _('import a v2 image from a directory on the Pulp server, without '
+                          'uploading it')
+DESC_BULK_UPDATE_TAGS = _('create, update and remove many tags in a single request')
+
+# Search of the content units of a type, across all the repositories
+CONTENT_UNIT_SEARCH_PATH = '/v2/content/units/%s/search/'
 
 
 class UploadDockerImageCommand(UploadCommand):
@@ -28,6 +47,34 @@ class UploadDockerImageCommand(UploadCommand):
     def __init__(self, context):
         super(UploadDockerImageCommand, self).__init__(context)
         self.add_option(OPT_MASK_ANCESTOR_ID)
+        # Temporary copies of the tarballs made by strip_known_blobs
+        self.stripped_files = []
+
+    def run(self, **kwargs):
+        """
+        Upload the files, then remove the temporary copies of the tarballs whose upload is done.
+
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+        """
+        try:
+            super(UploadDockerImageCommand, self).run(**kwargs)
+        finally:
+            self.remove_stripped_files()
+
+    def remove_stripped_files(self):
+        """
+        Remove the temporary copies of the tarballs, except the ones of the paused uploads, which
+        are needed to resume them.
+        """
+        paused = set(tracker.source_filename for tracker in self.upload_manager.list_uploads())
+        for filename in self.stripped_files:
+            if filename not in paused:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+        self.stripped_files = [filename for filename in self.stripped_files if filename in paused]
 
     def determine_type_id(self, filename, **kwargs):
         """
@@ -35,11 +82,14 @@ class UploadDockerImageCommand(UploadCommand):
 
         json -> Manifest List
         tarfile -> V1 Image or V2 Image Manifest
+        v2 export -> Image Manifest, all the content of the export is imported
 
         :return: ID of the type of file being uploaded
         :rtype:  str
         :raises: RuntimeError if file is not a valid tarfile or json file.
         """
+        if tarutils.is_export_archive(filename):
+            return constants.MANIFEST_TYPE_ID
 
         try:
             image_manifest = tarutils.get_image_manifest(filename)
@@ -65,6 +115,7 @@ class UploadDockerImageCommand(UploadCommand):
         Returns unit key and metadata as empty dictionaries. This is appropriate
         in this case, since docker image consists of multiple layers each having
         it's own unit key and each layer is imported separately into the server database.
+        The metadata of a v2 export flags it as such.
 
         :param filename: full path to the file being uploaded
         :type  filename: str, None
@@ -77,6 +128,8 @@ class UploadDockerImageCommand(UploadCommand):
         """
         unit_key = {}
         metadata = {}
+        if tarutils.is_export_archive(filename):
+            metadata[constants.UPLOAD_KEY_EXPORT_ARCHIVE] = True
 
         return unit_key, metadata
 
@@ -96,6 +149,55 @@ class UploadDockerImageCommand(UploadCommand):
 
         return override_config
 
+    def create_upload_list(self, file_bundles, **kwargs):
+        """
+        Replace the v2 image tarballs with tarballs that leave out the blobs the server already
+        has, before the upload requests are created. The importer uses the blobs it has for
+        the ones that are not in the tarball.
+
+        :param file_bundles: the files to upload
+        :type  file_bundles: list of pulp.client.commands.repo.upload.FileBundle
+        :param kwargs:       arguments passed into the upload call by the user
+        :type  kwargs:       dict
+        :return:             the ids of the upload requests
+        :rtype:              list
+        """
+        for bundle in file_bundles:
+            if bundle.type_id == constants.MANIFEST_TYPE_ID and \
+                    not bundle.metadata.get(constants.UPLOAD_KEY_EXPORT_ARCHIVE):
+                bundle.filename = self.strip_known_blobs(bundle.filename)
+        return super(UploadDockerImageCommand, self).create_upload_list(file_bundles, **kwargs)
+
+    def strip_known_blobs(self, filename):
+        """
+        Ask the server which of the blobs of a v2 image it already has, and if it has any, copy
+        the tarball without them into a temporary file.
+
+        :param filename: full path to the v2 image tarball
+        :type  filename: str
+        :return:         full path to the tarball to upload
+        :rtype:          str
+        """
+        digests = tarutils.get_blob_digests(tarutils.get_image_manifest(filename))
+        if not digests:
+            return filename
+        criteria = {'filters': {'digest': {'$in': sorted(digests)}}, 'fields': ['digest']}
+        response = self.context.server.server.POST(
+            CONTENT_UNIT_SEARCH_PATH % constants.BLOB_TYPE_ID, {'criteria': criteria})
+        known_digests = set(unit['digest'] for unit in response.response_body) & digests
+        if not known_digests:
+            return filename
+
+        msg = _('%(known)d of the %(total)d blobs of %(file)s are already on the server and '
+                'will not be uploaded.')
+        self.prompt.write(msg % {'known': len(known_digests), 'total': len(digests),
+                                 'file': os.path.basename(filename)})
+        fd, stripped_filename = tempfile.mkstemp(prefix='pulp-docker-', suffix='.tar')
+        os.close(fd)
+        self.stripped_files.append(stripped_filename)
+        tarutils.copy_without_blobs(filename, stripped_filename, known_digests)
+        return stripped_filename
+
 
 class TagUpdateCommand(UploadCommand):
     """
@@ -161,3 +263,144 @@ class TagUpdateCommand(UploadCommand):
         digest = kwargs[DIGEST_OPTION.keyword]
 
         return {'name': tag_name, 'digest': digest}
+
+
+class TagBulkUpdateCommand(UploadCommand):
+    """
+    Command used to create, update and remove many tags of a repository at once. The server
+    validates and applies all the changes in a single task, and reports the result of each tag.
+    """
+
+    def __init__(self, context):
+        super(TagBulkUpdateCommand, self).__init__(context, name='tags',
+                                                   upload_files=False,
+                                                   description=DESC_BULK_UPDATE_TAGS)
+        self.add_option(TAGS_FILE_OPTION)
+        self.add_option(REMOVE_TAG_OPTION)
+
+    def determine_type_id(self, filename, **kwargs):
+        """
+        Returns the ID of the type of file being uploaded.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: ID of the type of file being uploaded
+        :rtype:  str
+        """
+
+        return constants.TAG_TYPE_ID
+
+    def generate_unit_key(self, filename, **kwargs):
+        """
+        Returns the unit key that should be specified in the upload request.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str, None
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: unit key that should be uploaded for the file
+        :rtype:  dict
+        """
+
+        return {'repo_id': kwargs[std_options.OPTION_REPO_ID.keyword]}
+
+    def generate_metadata(self, filename, **kwargs):
+        """
+        Returns a dictionary of metadata that should be included
+        as part of the upload request.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str, None
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: metadata information that should be uploaded for the file
+        :rtype:  dict
+        """
+
+        metadata = {constants.UPLOAD_KEY_TAGS: {},
+                    constants.UPLOAD_KEY_REMOVE_TAGS: kwargs.get(REMOVE_TAG_OPTION.keyword) or []}
+        tags_file = kwargs.get(TAGS_FILE_OPTION.keyword)
+        if tags_file:
+            with open(tags_file) as tags_fp:
+                metadata[constants.UPLOAD_KEY_TAGS] = json.load(tags_fp)
+        return metadata
+
+    def succeeded(self, task):
+        """
+        Display the result of each tag after the task succeeded.
+
+        :param task: the task that updated the tags
+        :type  task: pulp.bindings.responses.Task
+        """
+        super(TagBulkUpdateCommand, self).succeeded(task)
+        report = ((task.result or {}).get('details') or {}).get('tags') or {}
+        for tag_name in sorted(report):
+            result = report[tag_name]
+            line = '%s: %s' % (tag_name, result['result'])
+            if result.get('digest'):
+                line += ' (%s)' % result['digest']
+            self.prompt.write(line, skip_wrap=True)
+
+
+class ImportDirectoryCommand(UploadCommand):
+    """
+    Command used to import the v2 images of a skopeo directory or an OCI image layout that is
+    already on the Pulp server. Nothing is uploaded: the importer reads the directory.
+    """
+
+    def __init__(self, context):
+        super(ImportDirectoryCommand, self).__init__(context, name='import-dir',
+                                                     upload_files=False,
+                                                     description=DESC_IMPORT_DIRECTORY)
+        self.add_option(SERVER_DIR_OPTION)
+
+    def determine_type_id(self, filename, **kwargs):
+        """
+        Returns the ID of the type of file being uploaded.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: ID of the type of file being uploaded
+        :rtype:  str
+        """
+
+        return constants.MANIFEST_TYPE_ID
+
+    def generate_unit_key(self, filename, **kwargs):
+        """
+        Returns the unit key that should be specified in the upload request.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str, None
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: unit key that should be uploaded for the file
+        :rtype:  dict
+        """
+
+        return {}
+
+    def generate_metadata(self, filename, **kwargs):
+        """
+        Returns a dictionary of metadata that should be included
+        as part of the upload request.
+
+        :param filename: full path to the file being uploaded
+        :type  filename: str, None
+        :param kwargs: arguments passed into the upload call by the user
+        :type  kwargs: dict
+
+        :return: metadata information that should be uploaded for the file
+        :rtype:  dict
+        """
+
+        return {constants.UPLOAD_KEY_DIRECTORY: kwargs[SERVER_DIR_OPTION.keyword]}
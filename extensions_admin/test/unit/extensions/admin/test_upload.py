@@ -1,3 +1,7 @@
+import json
+import os
+import tarfile
+import tempfile
 import unittest
 
 import mock
@@ -5,7 +9,8 @@ import mock
 from pulp_docker.common import constants
 from pulp_docker.extensions.admin.upload import UploadDockerImageCommand, \
     OPT_MASK_ANCESTOR_ID, TagUpdateCommand, TAG_NAME_OPTION, \
-    DIGEST_OPTION
+    DIGEST_OPTION, TagBulkUpdateCommand, TAGS_FILE_OPTION, REMOVE_TAG_OPTION, \
+    ImportDirectoryCommand, SERVER_DIR_OPTION
 from pulp.client.commands import options as std_options
 import data
 
@@ -35,6 +40,14 @@ class TestUploadDockerImageCommand(unittest.TestCase):
         self.assertEqual(unit_key, {})
         self.assertEqual(metadata, {})
 
+    @mock.patch('pulp_docker.extensions.admin.upload.tarutils.is_export_archive')
+    def test_export_archive(self, mock_is_export_archive):
+        mock_is_export_archive.return_value = True
+        ret = self.command.determine_type_id(data.busybox_tar_path)
+        unit_key, metadata = self.command.generate_unit_key_and_metadata(data.busybox_tar_path)
+        self.assertEqual(ret, constants.MANIFEST_TYPE_ID)
+        self.assertEqual(metadata, {constants.UPLOAD_KEY_EXPORT_ARCHIVE: True})
+
     def test_generate_override_config(self):
         ret = self.command.generate_override_config()
         self.assertEqual(ret, {})
@@ -50,6 +63,71 @@ class TestUploadDockerImageCommand(unittest.TestCase):
         ret = self.command.generate_override_config(**kwargs)
         self.assertEqual(ret, {})
 
+    @mock.patch('pulp_docker.extensions.admin.upload.UploadCommand.create_upload_list')
+    def test_create_upload_list_strips_known_blobs(self, mock_create_upload_list):
+        known_digest = 'sha256:9e87eff13613eed2f67b0188f8604d1bbdd3a7f5d6a4f565e8923817db65d6e5'
+        self.context.server.server.POST.return_value.response_body = [{'digest': known_digest}]
+        bundle = mock.MagicMock(filename=data.skopeo_tar_path, type_id=constants.MANIFEST_TYPE_ID,
+                                metadata={})
+
+        self.command.create_upload_list([bundle])
+
+        path = self.context.server.server.POST.call_args[0][0]
+        criteria = self.context.server.server.POST.call_args[0][1]['criteria']
+        self.assertEqual(path, '/v2/content/units/docker_blob/search/')
+        self.assertEqual(len(criteria['filters']['digest']['$in']), 2)
+        self.assertNotEqual(bundle.filename, data.skopeo_tar_path)
+        self.assertEqual(self.command.stripped_files, [bundle.filename])
+        self.addCleanup(os.remove, bundle.filename)
+        with tarfile.open(bundle.filename) as archive:
+            self.assertEqual(len(archive.getnames()), 2)
+            self.assertTrue('%s.tar' % known_digest[len('sha256:'):] not in archive.getnames())
+        mock_create_upload_list.assert_called_once_with([bundle])
+
+    @mock.patch('pulp_docker.extensions.admin.upload.UploadCommand.create_upload_list')
+    def test_create_upload_list_no_known_blobs(self, mock_create_upload_list):
+        self.context.server.server.POST.return_value.response_body = []
+        bundle = mock.MagicMock(filename=data.skopeo_tar_path, type_id=constants.MANIFEST_TYPE_ID,
+                                metadata={})
+
+        self.command.create_upload_list([bundle])
+
+        self.assertEqual(bundle.filename, data.skopeo_tar_path)
+        mock_create_upload_list.assert_called_once_with([bundle])
+
+    @mock.patch('pulp_docker.extensions.admin.upload.UploadCommand.run')
+    def test_run_removes_stripped_files(self, mock_run):
+        fd, done_filename = tempfile.mkstemp()
+        os.close(fd)
+        fd, paused_filename = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, paused_filename)
+        self.command.upload_manager = mock.MagicMock()
+        self.command.upload_manager.list_uploads.return_value = [
+            mock.MagicMock(source_filename=paused_filename)]
+
+        def run(**kwargs):
+            self.command.stripped_files.extend([done_filename, paused_filename])
+
+        mock_run.side_effect = run
+
+        self.command.run(repo_id=data.repo_id)
+
+        mock_run.assert_called_once_with(repo_id=data.repo_id)
+        self.assertFalse(os.path.exists(done_filename))
+        self.assertTrue(os.path.exists(paused_filename))
+        self.assertEqual(self.command.stripped_files, [paused_filename])
+
+    @mock.patch('pulp_docker.extensions.admin.upload.UploadCommand.create_upload_list')
+    def test_create_upload_list_v1_image(self, mock_create_upload_list):
+        bundle = mock.MagicMock(filename=data.busybox_tar_path, type_id=constants.IMAGE_TYPE_ID,
+                                metadata={})
+
+        self.command.create_upload_list([bundle])
+
+        self.assertEqual(bundle.filename, data.busybox_tar_path)
+        self.assertFalse(self.context.server.server.POST.called)
+
 
 class TestTagUpdateCommand(unittest.TestCase):
     def setUp(self):
@@ -76,3 +154,73 @@ class TestTagUpdateCommand(unittest.TestCase):
     def test_generate_override_config(self):
         ret = self.command.generate_override_config()
         self.assertEqual(ret, {})
+
+
+class TestTagBulkUpdateCommand(unittest.TestCase):
+    def setUp(self):
+        self.context = mock.MagicMock()
+        self.context.config = test_config
+        self.command = TagBulkUpdateCommand(self.context)
+
+    def test_determine_id(self):
+        ret = self.command.determine_type_id(None)
+        self.assertEqual(ret, constants.TAG_TYPE_ID)
+
+    def test_generate_unit_key(self):
+        kwargs = {std_options.OPTION_REPO_ID.keyword: data.repo_id}
+        unit_key = self.command.generate_unit_key(None, **kwargs)
+        self.assertEqual(unit_key, {'repo_id': data.repo_id})
+
+    def test_generate_metadata(self):
+        fd, tags_file = tempfile.mkstemp()
+        self.addCleanup(os.remove, tags_file)
+        with os.fdopen(fd, 'w') as tags_fp:
+            json.dump({data.tag_name: data.manifest_digest}, tags_fp)
+        kwargs = {TAGS_FILE_OPTION.keyword: tags_file, REMOVE_TAG_OPTION.keyword: ['old']}
+
+        metadata = self.command.generate_metadata(None, **kwargs)
+
+        expected = {constants.UPLOAD_KEY_TAGS: {data.tag_name: data.manifest_digest},
+                    constants.UPLOAD_KEY_REMOVE_TAGS: ['old']}
+        self.assertEqual(metadata, expected)
+
+    def test_generate_metadata_removals_only(self):
+        kwargs = {TAGS_FILE_OPTION.keyword: None, REMOVE_TAG_OPTION.keyword: ['old']}
+        metadata = self.command.generate_metadata(None, **kwargs)
+        self.assertEqual(metadata, {constants.UPLOAD_KEY_TAGS: {},
+                                    constants.UPLOAD_KEY_REMOVE_TAGS: ['old']})
+
+    @mock.patch('pulp_docker.extensions.admin.upload.UploadCommand.succeeded')
+    def test_succeeded(self, mock_succeeded):
+        self.command.prompt = mock.MagicMock()
+        task = mock.MagicMock(result={'details': {'tags': {
+            'latest': {'digest': data.manifest_digest, 'result': constants.TAG_RESULT_UPDATED},
+            'old': {'result': constants.TAG_RESULT_REMOVED}}}})
+
+        self.command.succeeded(task)
+
+        mock_succeeded.assert_called_once_with(task)
+        self.assertEqual(self.command.prompt.write.call_args_list, [
+            mock.call('latest: updated (%s)' % data.manifest_digest, skip_wrap=True),
+            mock.call('old: removed', skip_wrap=True)])
+
+
+class TestImportDirectoryCommand(unittest.TestCase):
+    def setUp(self):
+        self.context = mock.MagicMock()
+        self.context.config = test_config
+        self.command = ImportDirectoryCommand(self.context)
+
+    def test_determine_id(self):
+        ret = self.command.determine_type_id(None)
+        self.assertEqual(ret, constants.MANIFEST_TYPE_ID)
+
+    def test_generate_unit_key(self):
+        kwargs = {SERVER_DIR_OPTION.keyword: '/srv/images/busybox'}
+        unit_key = self.command.generate_unit_key(None, **kwargs)
+        self.assertEqual(unit_key, {})
+
+    def test_generate_metadata(self):
+        kwargs = {SERVER_DIR_OPTION.keyword: '/srv/images/busybox'}
+        metadata = self.command.generate_metadata(None, **kwargs)
+        self.assertEqual(metadata, {constants.UPLOAD_KEY_DIRECTORY: '/srv/images/busybox'})
@@ -0,0 +1,284 @@
+"""
+Compressed file readers and writers shared by the export distributor and the upload importer.
+
+Gzip output can be produced by several threads at once: the data is cut into blocks that are
+compressed independently, and each block is written as a complete gzip member. A sequence of
+gzip members is itself a valid gzip file (RFC 1952), so the output can be read by any gzip
+reader, including Docker's. zlib releases the GIL while compressing, so threads are enough to
+use several cores, which matters because Celery workers are daemonic and cannot start process
+pools.
+"""
+from collections import deque
+from gettext import gettext as _
+import gzip
+from multiprocessing.pool import ThreadPool
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from pulp_docker.common import tarutils
+
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSION_TYPES = (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+# Extension appended to the name of a file compressed with each type
+FILE_SUFFIXES = {
+    COMPRESSION_NONE: '',
+    COMPRESSION_GZIP: '.gz',
+    COMPRESSION_ZSTD: '.zst',
+}
+
+DEFAULT_LEVELS = {
+    COMPRESSION_GZIP: 6,
+    COMPRESSION_ZSTD: 3,
+}
+
+# Size of the blocks compressed independently by ParallelGzipWriter
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def zstd_available():
+    """
+    :return: True if zstd compression is available
+    :rtype:  bool
+    """
+    return zstandard is not None
+
+
+def open_writer(fileobj, compression, level=None, threads=1, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Wrap a file object so that everything written to it is compressed. Closing the returned
+    object finishes the compressed stream, but does not close the wrapped file object.
+
+    :param fileobj:     file object the compressed data is written to
+    :type  fileobj:     file
+    :param compression: one of COMPRESSION_TYPES
+    :type  compression: basestring
+    :param level:       compression level, or None for the default level of the compression type
+    :type  level:       int or NoneType
+    :param threads:     number of threads compressing the data
+    :type  threads:     int
+    :param block_size:  size of the blocks that are compressed in parallel
+    :type  block_size:  int
+    :return:            file-like object accepting the uncompressed data
+    :rtype:             object
+    :raises ValueError: if the compression type is unknown or not available
+    """
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression)
+    if compression == COMPRESSION_NONE:
+        return UncompressedWriter(fileobj)
+    if compression == COMPRESSION_GZIP:
+        if threads > 1:
+            return ParallelGzipWriter(fileobj, level, threads, block_size)
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level)
+    if compression == COMPRESSION_ZSTD:
+        if not zstd_available():
+            raise ValueError(_('zstd compression requires the zstandard module'))
+        return ZstdWriter(fileobj, level, threads)
+    raise ValueError(_('Unknown compression type: %(type)s') % {'type': compression})
+
+
+def open_reader(fileobj):
+    """
+    Wrap a file object so that zstd compressed data is decompressed when read. Other files are
+    returned as they are: tarfile detects gzip and bzip2 compression by itself.
+
+    :param fileobj: file object positioned at the start of the file
+    :type  fileobj: file
+    :return:        file-like object returning the data read from the file
+    :rtype:         object
+    :raises ValueError: if the file is zstd compressed and zstd is not available
+    """
+    magic = fileobj.read(len(tarutils.ZSTD_MAGIC))
+    fileobj.seek(0)
+    if magic != tarutils.ZSTD_MAGIC:
+        return fileobj
+    if not zstd_available():
+        raise ValueError(_('zstd decompression requires the zstandard module'))
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def gzip_file(source_path, destination_path, level=None, threads=1, buffer_size=None):
+    """
+    Compress a file with gzip.
+
+    :param source_path:      path of the file to compress
+    :type  source_path:      basestring
+    :param destination_path: path of the compressed file to create
+    :type  destination_path: basestring
+    :param level:            compression level, or None for the default level
+    :type  level:            int or NoneType
+    :param threads:          number of threads compressing the data
+    :type  threads:          int
+    :param buffer_size:      size of the reads from the source file, and of the blocks that are
+                             compressed in parallel
+    :type  buffer_size:      int or NoneType
+    """
+    buffer_size = buffer_size or DEFAULT_BLOCK_SIZE
+    with open(source_path, 'rb') as source:
+        with open(destination_path, 'wb') as destination:
+            writer = open_writer(destination, COMPRESSION_GZIP, level, threads, buffer_size)
+            try:
+                while True:
+                    data = source.read(buffer_size)
+                    if not data:
+                        break
+                    writer.write(data)
+            finally:
+                writer.close()
+
+
+class UncompressedWriter(object):
+    """
+    Writer that passes the data through, so that callers can treat all compression types alike.
+    """
+
+    def __init__(self, fileobj):
+        """
+        :param fileobj: file object the data is written to
+        :type  fileobj: file
+        """
+        self.fileobj = fileobj
+
+    def write(self, data):
+        """
+        :param data: data to write
+        :type  data: str
+        """
+        self.fileobj.write(data)
+
+    def close(self):
+        """
+        Nothing needs to be finished for uncompressed data.
+        """
+        pass
+
+
+class ParallelGzipWriter(object):
+    """
+    Writer that compresses blocks of data on a pool of threads, writing each block as a gzip
+    member, in the order the data was written.
+    """
+
+    def __init__(self, fileobj, level, threads, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        :param fileobj:    file object the compressed data is written to
+        :type  fileobj:    file
+        :param level:      compression level
+        :type  level:      int
+        :param threads:    number of threads compressing the data
+        :type  threads:    int
+        :param block_size: size of the blocks compressed independently
+        :type  block_size: int
+        """
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads
+        self.block_size = block_size
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._pool = ThreadPool(threads)
+
+    def write(self, data):
+        """
+        :param data: data to compress
+        :type  data: str
+        """
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            data = ''.join(self._buffer)
+            for start in range(0, len(data) - self.block_size + 1, self.block_size):
+                self._submit(data[start:start + self.block_size])
+            remainder = data[len(data) - len(data) % self.block_size:]
+            self._buffer = [remainder] if remainder else []
+            self._buffered = len(remainder)
+
+    def close(self):
+        """
+        Compress the remaining data and wait for all the blocks to be written.
+        """
+        if self._pool is None:
+            return
+        try:
+            if self._buffered or not self._pending:
+                # An empty gzip member keeps the output a valid gzip file for empty input
+                self._submit(''.join(self._buffer))
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().get())
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._buffer = []
+            self._buffered = 0
+
+    def _submit(self, block):
+        """
+        Queue a block for compression, first writing out the oldest blocks if too many are
+        pending, which bounds the memory used.
+
+        :param block: data to compress
+        :type  block: str
+        """
+        while len(self._pending) >= self.threads * 2:
+            self.fileobj.write(self._pending.popleft().get())
+        self._pending.append(self._pool.apply_async(_gzip_block, (block, self.level)))
+
+
+class ZstdWriter(object):
+    """
+    Writer that compresses the data with zstd, using the threads of the zstd library.
+    """
+
+    def __init__(self, fileobj, level, threads):
+        """
+        :param fileobj: file object the compressed data is written to
+        :type  fileobj: file
+        :param level:   compression level
+        :type  level:   int
+        :param threads: number of threads compressing the data
+        :type  threads: int
+        """
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads if threads > 1 else 0)
+        self._compressobj = compressor.compressobj()
+        self.fileobj = fileobj
+
+    def write(self, data):
+        """
+        :param data: data to compress
+        :type  data: str
+        """
+        self.fileobj.write(self._compressobj.compress(data))
+
+    def close(self):
+        """
+        Finish the zstd frame.
+        """
+        if self._compressobj is not None:
+            self.fileobj.write(self._compressobj.flush())
+            self._compressobj = None
+
+
+def _gzip_block(data, level):
+    """
+    Compress a block of data as a complete gzip member.
+
+    :param data:  data to compress
+    :type  data:  str
+    :param level: compression level
+    :type  level: int
+    :return:      the gzip member
+    :rtype:       str
+    """
+    # 16 + MAX_WBITS makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
@@ -0,0 +1,96 @@
+"""
+Parsing of the settings of the importer and the distributors. Values that came in through the
+REST API may be strings, so booleans and integers are parsed from strings as well.
+"""
+from pulp.server.exceptions import PulpCodedValidationException
+
+from pulp_docker.common import error_codes
+
+
+def get_boolean(config, key, default=False):
+    """
+    Get a boolean value from the configuration. "true" and "false" strings are accepted as well.
+
+    :param config:  configuration instance
+    :type  config:  pulp.plugins.config.PluginCallConfiguration or dict
+    :param key:     the configuration key to look up
+    :type  key:     basestring
+    :param default: value to return if the key is not set
+    :type  default: bool
+    :return:        the parsed value
+    :rtype:         bool
+    """
+    value = config.get(key, default)
+    if isinstance(value, basestring):
+        return value.lower() == 'true'
+    return bool(value)
+
+
+def parse_positive_int(value):
+    """
+    Parse a positive integer.
+
+    :param value: the value to parse
+    :type  value: int or basestring
+    :return:      the parsed value, or None if it is not a positive integer
+    :rtype:       int or NoneType
+    """
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if value < 1:
+        return None
+    return value
+
+
+def get_positive_int(config, key, default):
+    """
+    Get a positive integer from the configuration, for the settings validate_config has already
+    checked.
+
+    :param config:  configuration instance
+    :type  config:  pulp.plugins.config.PluginCallConfiguration or dict
+    :param key:     the configuration key to look up
+    :type  key:     basestring
+    :param default: value to return if the key is not set or invalid
+    :type  default: int or NoneType
+    :return:        the parsed value
+    :rtype:         int or NoneType
+    """
+    value = config.get(key)
+    if value is None:
+        return default
+    parsed = parse_positive_int(value)
+    if parsed is None:
+        return default
+    return parsed
+
+
+def get_int_setting(config, key, default, choices=None):
+    """
+    Get a positive integer from the configuration, for the settings that are only checked when
+    they are used.
+
+    :param config:  configuration instance
+    :type  config:  pulp.plugins.config.PluginCallConfiguration or dict
+    :param key:     the configuration key to look up
+    :type  key:     basestring
+    :param default: value to return if the key is not set
+    :type  default: int or NoneType
+    :param choices: the valid values, if not all positive integers are valid
+    :type  choices: list or NoneType
+    :return:        the parsed value
+    :rtype:         int or NoneType
+    :raises PulpCodedValidationException: if the value is not valid
+    """
+    value = config.get(key)
+    if value is None:
+        return default
+    parsed = parse_positive_int(value)
+    if parsed is None:
+        raise PulpCodedValidationException(error_code=error_codes.DKR1021, field=key, value=value)
+    if choices is not None and parsed not in choices:
+        raise PulpCodedValidationException(error_code=error_codes.DKR1022, field=key, value=value,
+                                           choices=', '.join(str(c) for c in choices))
+    return parsed
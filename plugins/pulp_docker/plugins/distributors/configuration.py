@@ -1,13 +1,22 @@
+from gettext import gettext as _
+import json
 import os
 import re
 from urlparse import urlparse
 
+from pulp.common import dateutils
 from pulp.plugins.rsync import configuration as rsync_config
 from pulp.server.config import config as server_config
 from pulp.server.db.model import Distributor
 from pulp.server.exceptions import PulpCodedValidationException
 
 from pulp_docker.common import constants, error_codes
+from pulp_docker.plugins import compression, config_utils
+
+
+EXPORT_API_VERSIONS = ('v1', 'v2')
+# Kinds of content listed in the export manifest of a v2 export
+EXPORT_CONTENT_KINDS = ('blobs', 'manifests', 'manifest_lists')
 
 
 def validate_config(config, repo):
@@ -37,13 +46,48 @@ def validate_config(config, repo):
             errors.append(PulpCodedValidationException(error_code=error_codes.DKR1003,
                                                        field=constants.CONFIG_KEY_REDIRECT_URL,
                                                        url=server_url))
-    protected = config.get(constants.CONFIG_KEY_PROTECTED)
-    if protected:
-        protected_parsed = config.get_boolean(constants.CONFIG_KEY_PROTECTED)
-        if protected_parsed is None:
-            errors.append(PulpCodedValidationException(error_code=error_codes.DKR1004,
-                                                       field=constants.CONFIG_KEY_PROTECTED,
-                                                       value=protected))
+    for key in (constants.CONFIG_KEY_PROTECTED, constants.CONFIG_KEY_INCREMENTAL_PUBLISH,
+                constants.CONFIG_KEY_SHARED_BLOBS, constants.CONFIG_KEY_COMPACT_REDIRECT_FILE,
+                constants.CONFIG_KEY_REDIRECT_FILE_INDEX, constants.CONFIG_KEY_STATIC_LAYOUT,
+                constants.CONFIG_KEY_PROFILE, constants.CONFIG_KEY_PROFILE_MEMORY):
+        value = config.get(key)
+        if value:
+            parsed = config.get_boolean(key)
+            if parsed is None:
+                errors.append(PulpCodedValidationException(error_code=error_codes.DKR1004,
+                                                           field=key, value=value))
+    if get_static_layout(config) and get_protected(config):
+        errors.append(PulpCodedValidationException(error_code=error_codes.DKR1032))
+    if config_utils.get_boolean(config, constants.CONFIG_KEY_SHARED_BLOBS) and \
+            get_protected(config):
+        errors.append(PulpCodedValidationException(error_code=error_codes.DKR1034))
+
+    for key in (constants.CONFIG_KEY_SYMLINK_WORKERS, constants.CONFIG_KEY_EXPORT_COMPRESSION_LEVEL,
+                constants.CONFIG_KEY_EXPORT_COMPRESSION_THREADS):
+        value = config.get(key)
+        if value is not None and config_utils.parse_positive_int(value) is None:
+            errors.append(PulpCodedValidationException(error_code=error_codes.DKR1021,
+                                                       field=key, value=value))
+
+    for key, choices in ((constants.CONFIG_KEY_EXPORT_API_VERSION, EXPORT_API_VERSIONS),
+                         (constants.CONFIG_KEY_EXPORT_COMPRESSION, compression.COMPRESSION_TYPES)):
+        value = config.get(key)
+        if value is not None and value not in choices:
+            errors.append(PulpCodedValidationException(error_code=error_codes.DKR1022,
+                                                       field=key, value=value,
+                                                       choices=', '.join(choices)))
+    if config.get(constants.CONFIG_KEY_EXPORT_COMPRESSION) == compression.COMPRESSION_ZSTD and \
+            not compression.zstd_available():
+        errors.append(PulpCodedValidationException(error_code=error_codes.DKR1023))
+    start_date = config.get(constants.CONFIG_KEY_EXPORT_START_DATE)
+    if start_date is not None and _parse_date(start_date) is None:
+        errors.append(PulpCodedValidationException(error_code=error_codes.DKR1024,
+                                                   field=constants.CONFIG_KEY_EXPORT_START_DATE,
+                                                   value=start_date))
+    try:
+        read_export_delta_base(config)
+    except PulpCodedValidationException as e:
+        errors.append(e)
 
     # Check that the repo_registry is valid
     repo_registry_id = config.get(constants.CONFIG_KEY_REPO_REGISTRY_ID)
@@ -180,6 +224,33 @@ def get_app_publish_dir(config, docker_api_version):
     return os.path.join(get_root_publish_directory(config, docker_api_version), 'app',)
 
 
+def get_httpd_config_dir(config):
+    """
+    Get the directory where the web server configuration snippets of the repositories published
+    in the static layout are stored
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+
+    :returns:      the directory holding the configuration snippets
+    :rtype:        str
+    """
+    return os.path.join(get_root_publish_directory(config, 'v2'), 'httpd')
+
+
+def get_httpd_config_file_name(repo):
+    """
+    Get the name to use when generating the web server configuration snippet for a repository
+
+    :param repo: the repository to get the configuration snippet name for
+    :type  repo: pulp.plugins.model.Repository
+
+    :returns: the name to use for the configuration snippet
+    :rtype:  str
+    """
+    return '%s.conf' % repo.id
+
+
 def get_redirect_file_name(repo):
     """
     Get the name to use when generating the redirect file for a repository
@@ -193,6 +264,19 @@ def get_redirect_file_name(repo):
     return '%s.json' % repo.id
 
 
+def get_redirect_index_file_name(repo):
+    """
+    Get the name to use when generating the index of the redirect file for a repository
+
+    :param repo: the repository to get the index file name for
+    :type  repo: pulp.plugins.model.Repository
+
+    :returns: the name to use for the redirect index file
+    :rtype:  str
+    """
+    return '%s.index' % repo.id
+
+
 def get_redirect_url(config, repo, docker_api_version):
     """
     Get the redirect URL for a given repo & configuration
@@ -293,9 +377,130 @@ def get_export_repo_file_with_path(repo, config, docker_api_version):
     if not file_name:
         file_name = os.path.join(get_export_repo_directory(config, docker_api_version),
                                  get_export_repo_filename(repo, config))
+        if docker_api_version == 'v2':
+            file_name += compression.FILE_SUFFIXES[get_export_compression(config)]
     return file_name
 
 
+def get_export_api_version(config):
+    """
+    Get the Docker API version whose content the export distributor exports.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       'v1' or 'v2', 'v1' if not configured
+    :rtype:        str
+    """
+    return config.get(constants.CONFIG_KEY_EXPORT_API_VERSION) or 'v1'
+
+
+def get_export_compression(config):
+    """
+    Get the compression applied to a v2 export.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       one of compression.COMPRESSION_TYPES, no compression if not configured
+    :rtype:        str
+    """
+    return config.get(constants.CONFIG_KEY_EXPORT_COMPRESSION) or compression.COMPRESSION_NONE
+
+
+def get_export_compression_level(config):
+    """
+    Get the compression level applied to a v2 export.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       the compression level, or None to use the default of the compression type
+    :rtype:        int or NoneType
+    """
+    return config_utils.get_positive_int(config, constants.CONFIG_KEY_EXPORT_COMPRESSION_LEVEL,
+                                         None)
+
+
+def get_export_compression_threads(config):
+    """
+    Get the number of threads compressing a v2 export.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       number of threads, 1 if not configured
+    :rtype:        int
+    """
+    return config_utils.get_positive_int(config, constants.CONFIG_KEY_EXPORT_COMPRESSION_THREADS, 1)
+
+
+def get_export_delta_base(config):
+    """
+    Get the export manifest of the earlier export a v2 delta export is based on.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       path of the export manifest, or None if the export is not based on one
+    :rtype:        str or NoneType
+    """
+    return config.get(constants.CONFIG_KEY_EXPORT_DELTA_BASE) or None
+
+
+def read_export_delta_base(config):
+    """
+    Read the export manifest of the earlier export a v2 delta export is based on.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       the export manifest, or None if the export is not based on one
+    :rtype:        dict or NoneType
+    :raises:       PulpCodedValidationException if the export manifest cannot be read
+    """
+    path = get_export_delta_base(config)
+    if path is None:
+        return None
+    try:
+        with open(path) as base_file:
+            base = json.load(base_file)
+    except IOError as e:
+        reason = e.strerror
+    except ValueError as e:
+        reason = str(e)
+    else:
+        if isinstance(base, dict) and isinstance(base.get('content'), dict) and \
+                'created' in base and \
+                all(isinstance(base['content'].get(kind), list) for kind in EXPORT_CONTENT_KINDS):
+            return base
+        reason = _('it is not the export manifest of a v2 export')
+    raise PulpCodedValidationException(error_code=error_codes.DKR1033,
+                                       field=constants.CONFIG_KEY_EXPORT_DELTA_BASE,
+                                       path=path, reason=reason)
+
+
+def get_export_start_date(config):
+    """
+    Get the date a v2 delta export exports the content added to the repository since.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       the date, or None if the export is not based on a date
+    :rtype:        datetime.datetime or NoneType
+    """
+    value = config.get(constants.CONFIG_KEY_EXPORT_START_DATE)
+    if not value:
+        return None
+    return _parse_date(value)
+
+
+def get_export_manifest_path(export_file):
+    """
+    Get the path of the export manifest written next to a v2 export.
+
+    :param export_file: path of the exported tar file
+    :type  export_file: basestring
+    :return:            path of the export manifest
+    :rtype:             str
+    """
+    return export_file + '.json'
+
+
 def get_repo_registry_id(repo, config):
     """
     Get the registry ID that should be used by the docker API.  If a registry name has not
@@ -314,6 +519,110 @@ def get_repo_registry_id(repo, config):
     return registry
 
 
+def get_incremental_publish(config):
+    """
+    Determine whether the web publish should only apply the changes since the last publish
+    instead of building a new directory tree.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       True if incremental publishing is enabled
+    :rtype:        bool
+    """
+    return config_utils.get_boolean(config, constants.CONFIG_KEY_INCREMENTAL_PUBLISH)
+
+
+def get_compact_redirect_file(config):
+    """
+    Determine whether the v2 redirect file should be written in the compact version 5 format.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       True if the compact format is enabled
+    :rtype:        bool
+    """
+    return config_utils.get_boolean(config, constants.CONFIG_KEY_COMPACT_REDIRECT_FILE)
+
+
+def get_redirect_file_index(config):
+    """
+    Determine whether a sorted index should be published next to the v2 redirect file.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       True if the index should be published
+    :rtype:        bool
+    """
+    return config_utils.get_boolean(config, constants.CONFIG_KEY_REDIRECT_FILE_INDEX)
+
+
+def get_static_layout(config):
+    """
+    Determine whether the v2 publish should include the files needed to serve the repository
+    with a plain web server.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       True if the static layout is enabled
+    :rtype:        bool
+    """
+    return config_utils.get_boolean(config, constants.CONFIG_KEY_STATIC_LAYOUT)
+
+
+def get_protected(config):
+    """
+    Determine whether the repository is protected by an entitlement certificate.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       True if the repository is protected
+    :rtype:        bool
+    """
+    return config_utils.get_boolean(config, constants.CONFIG_KEY_PROTECTED)
+
+
+def get_shared_blobs_dir(config):
+    """
+    Get the directory holding the Blobs shared by all the repositories, if the distributor is
+    configured to publish into it.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       the shared Blob directory, or None if each repository publishes its own Blobs
+    :rtype:        str or NoneType
+    """
+    if not config_utils.get_boolean(config, constants.CONFIG_KEY_SHARED_BLOBS):
+        return None
+    return os.path.join(get_root_publish_directory(config, 'v2'), 'blobs')
+
+
+def get_symlink_workers(config):
+    """
+    Get the number of threads used to create the symlinks of a publish.
+
+    :param config: configuration instance
+    :type  config: pulp.plugins.config.PluginCallConfiguration or dict
+    :return:       number of worker threads, 1 if not configured
+    :rtype:        int
+    """
+    return config_utils.get_positive_int(config, constants.CONFIG_KEY_SYMLINK_WORKERS, 1)
+
+
+def _parse_date(value):
+    """
+    Parse an ISO 8601 date.
+
+    :param value: the date
+    :type  value: basestring
+    :return:      the parsed date, or None if the value is not an ISO 8601 date
+    :rtype:       datetime.datetime or NoneType
+    """
+    try:
+        return dateutils.parse_iso8601_datetime(value)
+    except (ValueError, TypeError):
+        return None
+
+
 def _is_valid_repo_registry_id(repo_registry_id):
     """
     Docker registry repos are restricted to lower case letters, numbers, hyphens, underscores, and
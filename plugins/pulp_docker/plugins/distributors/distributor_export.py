@@ -8,8 +8,7 @@ from pulp.common.config import read_json_config
 from pulp.plugins.distributor import Distributor
 
 from pulp_docker.common import constants
-from pulp_docker.plugins.distributors.v1_publish_steps import ExportPublisher
-from pulp_docker.plugins.distributors import configuration
+from pulp_docker.plugins.distributors import configuration, v1_publish_steps, v2_export_steps
 
 
 _logger = logging.getLogger(__name__)
@@ -51,7 +50,8 @@ class DockerExportDistributor(Distributor):
         return {
             'id': constants.DISTRIBUTOR_EXPORT_TYPE_ID,
             'display_name': _('Docker Export Distributor'),
-            'types': [constants.IMAGE_TYPE_ID]
+            'types': [constants.IMAGE_TYPE_ID, constants.BLOB_TYPE_ID, constants.MANIFEST_TYPE_ID,
+                      constants.MANIFEST_LIST_TYPE_ID, constants.TAG_TYPE_ID]
         }
 
     def __init__(self):
@@ -118,7 +118,10 @@ class DockerExportDistributor(Distributor):
         :return: report describing the publish run
         :rtype:  pulp.plugins.model.PublishReport
         """
-        self._publisher = ExportPublisher(repo, publish_conduit, config)
+        if configuration.get_export_api_version(config) == 'v2':
+            self._publisher = v2_export_steps.ExportPublisher(repo, publish_conduit, config)
+        else:
+            self._publisher = v1_publish_steps.ExportPublisher(repo, publish_conduit, config)
         return self._publisher.publish()
 
     def cancel_publish_repo(self):
@@ -157,10 +160,13 @@ class DockerExportDistributor(Distributor):
             if repo_dir:
                 shutil.rmtree(repo_dir, ignore_errors=True)
 
-        # Remove the published app file & directory links
+        # Remove the published app file & directory links, and the manifest of a v2 export
+        v2_export_file = configuration.get_export_repo_file_with_path(repo, config, 'v2')
         file_list = [os.path.join(configuration.get_export_repo_directory(config, "v1"),
                                   configuration.get_export_repo_directory(config, "v2"),
-                                  configuration.get_export_repo_filename(repo, config))]
+                                  configuration.get_export_repo_filename(repo, config)),
+                     v2_export_file,
+                     configuration.get_export_manifest_path(v2_export_file)]
 
         for file_name in file_list:
             try:
@@ -9,7 +9,7 @@ from pulp.plugins.distributor import Distributor
 
 from pulp_docker.common import constants
 from pulp_docker.plugins.distributors.publish_steps import WebPublisher
-from pulp_docker.plugins.distributors import configuration
+from pulp_docker.plugins.distributors import configuration, symlinks
 
 
 _logger = logging.getLogger(__name__)
@@ -170,7 +170,11 @@ class DockerWebDistributor(Distributor):
                     os.path.join(configuration.get_app_publish_dir(config, "v1"),
                                  configuration.get_redirect_file_name(repo)),
                     os.path.join(configuration.get_app_publish_dir(config, "v2"),
-                                 configuration.get_redirect_file_name(repo))]
+                                 configuration.get_redirect_file_name(repo)),
+                    os.path.join(configuration.get_app_publish_dir(config, "v2"),
+                                 configuration.get_redirect_index_file_name(repo)),
+                    os.path.join(configuration.get_httpd_config_dir(config),
+                                 configuration.get_httpd_config_file_name(repo))]
 
         for repo_dir in dir_list:
             try:
@@ -178,3 +182,10 @@ class DockerWebDistributor(Distributor):
             except OSError:
                 # It's fine if this file doesn't exist
                 pass
+
+        # The Blobs only this repository published may have been removed by an orphan cleanup
+        shared_blobs_dir = configuration.get_shared_blobs_dir(config)
+        if shared_blobs_dir:
+            removed = symlinks.remove_dangling_links(shared_blobs_dir)
+            _logger.debug(_('Removed %(count)d dangling links from %(dir)s') %
+                          {'count': removed, 'dir': shared_blobs_dir})
@@ -1,6 +1,10 @@
+from collections import defaultdict
 from gettext import gettext as _
+import errno
 import json
+from json.encoder import encode_basestring_ascii
 import os
+import shutil
 
 import mongoengine
 from pulp.common import dateutils
@@ -8,13 +12,60 @@ from pulp.plugins.util import misc, publish_step
 from pulp.plugins.rsync.publish import Publisher, RSyncPublishStep
 from pulp.plugins.util.publish_step import RSyncFastForwardUnitPublishStep
 from pulp.server.db.model import Distributor
+from pulp.server.exceptions import PulpCodedException
 
-from pulp_docker.common import constants
-from pulp_docker.plugins import models
-from pulp_docker.plugins.distributors import configuration, v1_publish_steps
+from pulp_docker.common import constants, error_codes
+from pulp_docker.plugins import models, step_profiling
+from pulp_docker.plugins.distributors import (configuration, static_layout, symlinks,
+                                              v1_publish_steps)
 
 
-class WebPublisher(publish_step.PublishStep):
+def get_tagged_manifests(repo_id):
+    """
+    Load the Manifests and Manifest Lists referenced by the Tags of a repository, using one query
+    per model instead of one query per Tag.
+
+    :param repo_id: id of the repository whose Tags are published
+    :type  repo_id: basestring
+    :return:        dictionary mapping each digest to a tuple of the unit and its schema version,
+                    which is constants.MANIFEST_LIST_TYPE for Manifest Lists
+    :rtype:         dict
+    """
+    digests = sorted(models.Tag.objects.filter(repo_id=repo_id).distinct('manifest_digest'))
+    manifests = {}
+    manifest_lists = models.ManifestList.objects.filter(digest__in=digests).only(
+        'digest', '_storage_path')
+    for manifest_list in manifest_lists:
+        manifests[manifest_list.digest] = (manifest_list, constants.MANIFEST_LIST_TYPE)
+    # An image Manifest wins if a digest is somehow known as both types
+    image_manifests = models.Manifest.objects.filter(digest__in=digests).only(
+        'digest', 'schema_version', '_storage_path')
+    for manifest in image_manifests:
+        manifests[manifest.digest] = (manifest, manifest.schema_version)
+    return manifests
+
+
+def get_tagged_manifest(manifests, tag):
+    """
+    Find the Manifest or Manifest List that a Tag references.
+
+    :param manifests: dictionary as returned by get_tagged_manifests()
+    :type  manifests: dict
+    :param tag:       the Tag being published
+    :type  tag:       pulp_docker.plugins.models.Tag
+    :return:          tuple of the unit and its schema version
+    :rtype:           tuple
+    :raises mongoengine.DoesNotExist: if the referenced unit does not exist
+    """
+    try:
+        return manifests[tag.manifest_digest]
+    except KeyError:
+        raise mongoengine.DoesNotExist(
+            _('Manifest {d} referenced by tag {t} does not exist').format(d=tag.manifest_digest,
+                                                                          t=tag.name))
+
+
+class WebPublisher(step_profiling.ProfiledTaskMixin, publish_step.PublishStep):
     """
     Docker Web publisher class that is responsible for the actual publishing
     of a docker repository via a web server. It will publish the repository with v1 code and v2
@@ -37,6 +88,7 @@ class WebPublisher(publish_step.PublishStep):
         super(WebPublisher, self).__init__(
             step_type=constants.PUBLISH_STEP_WEB_PUBLISHER, repo=repo,
             publish_conduit=publish_conduit, config=config)
+        self.v2_publisher = None
 
         predistributor = self.get_predistributor()
         if predistributor:
@@ -51,8 +103,23 @@ class WebPublisher(publish_step.PublishStep):
         # Publish v1 content, and then publish v2 content
         self.add_child(v1_publish_steps.WebPublisher(repo, publish_conduit, config,
                                                      repo_content_unit_q=date_filter))
-        self.add_child(V2WebPublisher(repo, publish_conduit, config,
-                                      repo_content_unit_q=date_filter))
+        self.v2_publisher = V2WebPublisher(repo, publish_conduit, config,
+                                           repo_content_unit_q=date_filter)
+        self.add_child(self.v2_publisher)
+
+    def process_lifecycle(self):
+        """
+        Publish the repository, stopping the threads creating the v2 symlinks if the publish
+        fails or is canceled before they are done.
+
+        :return: the report of the publish
+        :rtype:  pulp.plugins.model.PublishReport
+        """
+        try:
+            return super(WebPublisher, self).process_lifecycle()
+        finally:
+            if self.v2_publisher is not None:
+                self.v2_publisher.symlink_creator.close()
 
     def create_date_range_filter(self, start_date=None, end_date=None):
         """
@@ -112,6 +179,18 @@ class V2WebPublisher(publish_step.PublishStep):
             publish_conduit=publish_conduit, config=config)
 
         self.redirect_data = {1: set(), 2: set(), 'list': set(), 'amd64': {}}
+        # In incremental mode the links are only recorded here, as a mapping of the link path
+        # relative to the working directory to its target, and applied by IncrementalPublishStep.
+        self.incremental = configuration.get_incremental_publish(config)
+        self.published_links = {} if self.incremental else None
+        self.symlink_creator = symlinks.SymlinkCreator(configuration.get_symlink_workers(config))
+        self.shared_blobs_dir = configuration.get_shared_blobs_dir(config)
+        self.static_layout = configuration.get_static_layout(config)
+        if self.static_layout and configuration.get_protected(config):
+            # Also checked here for the override config of a publish
+            raise PulpCodedException(error_code=error_codes.DKR1032)
+        if self.shared_blobs_dir and configuration.get_protected(config):
+            raise PulpCodedException(error_code=error_codes.DKR1034)
 
         docker_api_version = 'v2'
         publish_dir = configuration.get_web_publish_dir(repo, config, docker_api_version)
@@ -122,9 +201,25 @@ class V2WebPublisher(publish_step.PublishStep):
         misc.mkdir(self.working_dir)
         self.web_working_dir = os.path.join(self.get_working_dir(), 'web')
         master_publish_dir = configuration.get_master_publish_dir(repo, config, docker_api_version)
-        atomic_publish_step = publish_step.AtomicDirectoryPublishStep(
-            self.get_working_dir(), [('', publish_dir), (app_file, app_publish_location)],
-            master_publish_dir, step_type=constants.PUBLISH_STEP_OVER_HTTP)
+        publish_locations = [('', publish_dir), (app_file, app_publish_location)]
+        index_file = None
+        if configuration.get_redirect_file_index(config):
+            index_file = configuration.get_redirect_index_file_name(repo)
+            publish_locations.append(
+                (index_file, os.path.join(os.path.dirname(app_publish_location), index_file)))
+        httpd_config_file = None
+        if self.static_layout:
+            httpd_config_file = configuration.get_httpd_config_file_name(repo)
+            publish_locations.append(
+                (httpd_config_file,
+                 os.path.join(configuration.get_httpd_config_dir(config), httpd_config_file)))
+        if self.incremental:
+            atomic_publish_step = IncrementalPublishStep(
+                self.get_working_dir(), publish_locations, master_publish_dir)
+        else:
+            atomic_publish_step = publish_step.AtomicDirectoryPublishStep(
+                self.get_working_dir(), publish_locations, master_publish_dir,
+                step_type=constants.PUBLISH_STEP_OVER_HTTP)
         atomic_publish_step.description = _('Making v2 files available via web.')
         self.add_child(PublishBlobsStep(repo_content_unit_q=repo_content_unit_q))
         self.publish_manifests_step = PublishManifestsStep(
@@ -134,9 +229,72 @@ class V2WebPublisher(publish_step.PublishStep):
             repo_content_unit_q=repo_content_unit_q)
         self.add_child(self.publish_manifest_lists_step)
         self.add_child(PublishTagsStep())
-        self.add_child(RedirectFileStep(os.path.join(self.get_working_dir(), app_file)))
+        self.add_child(CreateSymlinksStep(self.symlink_creator))
+        if index_file:
+            index_file = os.path.join(self.get_working_dir(), index_file)
+        self.add_child(RedirectFileStep(os.path.join(self.get_working_dir(), app_file),
+                                        index_file))
+        if httpd_config_file:
+            self.add_child(HttpdConfigStep(os.path.join(self.get_working_dir(), httpd_config_file),
+                                           publish_dir))
         self.add_child(atomic_publish_step)
 
+    def create_symlink(self, source_path, link_path):
+        """
+        Create a link inside the working directory. In incremental mode the link is only recorded
+        so that IncrementalPublishStep can compare it with the previously published links.
+        Otherwise the link may be created asynchronously, and is only guaranteed to exist once
+        CreateSymlinksStep has run.
+
+        :param source_path: path the link should point to
+        :type  source_path: basestring
+        :param link_path:   absolute path of the link, inside the working directory
+        :type  link_path:   basestring
+        """
+        if self.published_links is None:
+            self.symlink_creator.create_symlink(source_path, link_path)
+        else:
+            relative_path = os.path.relpath(link_path, self.get_working_dir())
+            self.published_links[relative_path] = source_path
+
+    def publish_static_manifest(self, source_path, reference, schema_version):
+        """
+        Link a manifest into the static layout, named after the reference and its media type.
+
+        :param source_path:    path of the stored manifest
+        :type  source_path:    basestring
+        :param reference:      digest or tag the manifest is referenced by
+        :type  reference:      basestring
+        :param schema_version: schema version of the manifest, or constants.MANIFEST_LIST_TYPE
+        :type  schema_version: int or basestring
+        """
+        manifests_dir = os.path.join(self.get_working_dir(), 'manifests')
+        misc.mkdir(manifests_dir)
+        link_path = os.path.join(
+            manifests_dir, static_layout.get_manifest_file_name(reference, schema_version))
+        self.create_symlink(source_path, link_path)
+
+
+class CreateSymlinksStep(publish_step.PluginStep):
+    """
+    Wait for the symlinks queued by the previous steps to be created.
+    """
+
+    def __init__(self, symlink_creator):
+        """
+        :param symlink_creator: the creator that the previous steps queued their symlinks with
+        :type  symlink_creator: pulp_docker.plugins.distributors.symlinks.SymlinkCreator
+        """
+        super(CreateSymlinksStep, self).__init__(step_type=constants.PUBLISH_STEP_SYMLINKS)
+        self.symlink_creator = symlink_creator
+        self.description = _('Creating symlinks.')
+
+    def process_main(self, item=None):
+        """
+        Wait for the pending symlinks.
+        """
+        self.symlink_creator.wait()
+
 
 class PublishBlobsStep(publish_step.UnitModelPluginStep):
     """
@@ -157,15 +315,39 @@ class PublishBlobsStep(publish_step.UnitModelPluginStep):
                                                repo_content_unit_q=repo_content_unit_q)
         self.description = _('Publishing Blobs.')
 
+    def initialize(self):
+        """
+        When the Blobs are shared between repositories, link the repository's blobs directory to
+        the shared directory.
+        """
+        super(PublishBlobsStep, self).initialize()
+        shared_blobs_dir = self.parent.shared_blobs_dir
+        if shared_blobs_dir:
+            misc.mkdir(shared_blobs_dir)
+            self.parent.create_symlink(shared_blobs_dir, self.get_blobs_directory())
+
     def process_main(self, item):
         """
-        Link the item to the Blob file.
+        Link the item to the Blob file. Blobs in the shared directory are only linked if they are
+        not there yet, only the links of the repository's own Blobs are looked up so the cost of
+        a publish does not grow with the shared directory. A link left dangling by the removal
+        of the Blob's file is replaced.
 
         :param item: The Blob to process
         :type  item: pulp_docker.plugins.models.Blob
         """
-        misc.create_symlink(item._storage_path,
-                            os.path.join(self.get_blobs_directory(), item.unit_key['digest']))
+        digest = item.unit_key['digest']
+        shared_blobs_dir = self.parent.shared_blobs_dir
+        if not shared_blobs_dir:
+            self.parent.create_symlink(item._storage_path,
+                                       os.path.join(self.get_blobs_directory(), digest))
+            return
+        link_path = os.path.join(shared_blobs_dir, digest)
+        if os.path.exists(link_path):
+            return
+        if os.path.islink(link_path):
+            symlinks.remove_link(link_path)
+        self.parent.symlink_creator.create_symlink(item._storage_path, link_path)
 
     def get_blobs_directory(self):
         """
@@ -204,9 +386,12 @@ class PublishManifestsStep(publish_step.UnitModelPluginStep):
         :param item: The Manifest to process
         :type  item: pulp_docker.plugins.models.Manifest
         """
-        misc.create_symlink(item._storage_path,
-                            os.path.join(self.get_manifests_directory(), str(item.schema_version),
-                                         item.unit_key['digest']))
+        self.parent.create_symlink(item._storage_path,
+                                   os.path.join(self.get_manifests_directory(),
+                                                str(item.schema_version), item.unit_key['digest']))
+        if self.parent.static_layout:
+            self.parent.publish_static_manifest(item._storage_path, item.unit_key['digest'],
+                                                item.schema_version)
         self.parent.redirect_data[item.schema_version].add(item.unit_key['digest'])
 
     def get_manifests_directory(self):
@@ -239,6 +424,21 @@ class PublishManifestListsStep(publish_step.UnitModelPluginStep):
             model_classes=[models.ManifestList],
             repo_content_unit_q=repo_content_unit_q)
         self.description = _('Publishing Manifest Lists.')
+        # Names of the Tags referencing each Manifest List digest, populated by initialize()
+        self._tag_names = None
+
+    def initialize(self):
+        """
+        Load the names of all the Tags that reference Manifest Lists in the repository.
+        """
+        super(PublishManifestListsStep, self).initialize()
+        self._tag_names = defaultdict(list)
+        # the manifest list model does not contain the tag field anymore, and a manifest list
+        # can have several tags
+        tags = models.Tag.objects.filter(repo_id=self.get_repo().id,
+                                         manifest_type=constants.MANIFEST_LIST_TYPE)
+        for tag in tags.only('name', 'manifest_digest'):
+            self._tag_names[tag.manifest_digest].append(tag.name)
 
     def process_main(self, item):
         """
@@ -247,19 +447,18 @@ class PublishManifestListsStep(publish_step.UnitModelPluginStep):
         :param item: The Manifest List to process
         :type  item: pulp_docker.plugins.models.ManifestList
         """
-        misc.create_symlink(item._storage_path,
-                            os.path.join(self.get_manifests_directory(),
-                                         constants.MANIFEST_LIST_TYPE, item.unit_key['digest']))
+        self.parent.create_symlink(item._storage_path,
+                                   os.path.join(self.get_manifests_directory(),
+                                                constants.MANIFEST_LIST_TYPE,
+                                                item.unit_key['digest']))
+        if self.parent.static_layout:
+            self.parent.publish_static_manifest(item._storage_path, item.unit_key['digest'],
+                                                constants.MANIFEST_LIST_TYPE)
         redirect_data = self.parent.redirect_data
         redirect_data[constants.MANIFEST_LIST_TYPE].add(item.unit_key['digest'])
         if item.amd64_digest:
-            # we query the tag collection because the manifest list model does not contain
-            # the tag field anymore
-            # Manifest list can have several tags
-            tags = models.Tag.objects.filter(manifest_digest=item.digest,
-                                             repo_id=self.get_repo().id)
-            for tag in tags:
-                redirect_data['amd64'][tag.name] = (item.amd64_digest,
+            for tag_name in self._tag_names.get(item.digest, []):
+                redirect_data['amd64'][tag_name] = (item.amd64_digest,
                                                     item.amd64_schema_version)
 
     def get_manifests_directory(self):
@@ -287,6 +486,15 @@ class PublishTagsStep(publish_step.UnitModelPluginStep):
         self.description = _('Publishing Tags.')
         # Collect the tag names we've seen so we can write them out during the finalize() method.
         self._tag_names = set()
+        # Manifests and Manifest Lists by digest, populated by initialize()
+        self._manifests = None
+
+    def initialize(self):
+        """
+        Load all the Manifests and Manifest Lists that the repository's Tags reference.
+        """
+        super(PublishTagsStep, self).initialize()
+        self._manifests = get_tagged_manifests(self.get_repo().id)
 
     def process_main(self, item):
         """
@@ -295,16 +503,13 @@ class PublishTagsStep(publish_step.UnitModelPluginStep):
         :param item: The tag to process
         :type  item: pulp_docker.plugins.models.Tag
         """
-        try:
-            manifest = models.Manifest.objects.get(digest=item.manifest_digest)
-            schema_version = manifest.schema_version
-        except mongoengine.DoesNotExist:
-            manifest = models.ManifestList.objects.get(digest=item.manifest_digest)
-            schema_version = constants.MANIFEST_LIST_TYPE
-        misc.create_symlink(
+        manifest, schema_version = get_tagged_manifest(self._manifests, item)
+        self.parent.create_symlink(
             manifest._storage_path,
             os.path.join(self.parent.publish_manifests_step.get_manifests_directory(),
                          str(schema_version), item.name))
+        if self.parent.static_layout:
+            self.parent.publish_static_manifest(manifest._storage_path, item.name, schema_version)
         self._tag_names.add(item.name)
         self.parent.redirect_data[schema_version].add(item.name)
 
@@ -314,29 +519,40 @@ class PublishTagsStep(publish_step.UnitModelPluginStep):
         """
         tags_path = os.path.join(self.parent.get_working_dir(), 'tags')
         misc.mkdir(tags_path)
+        registry_id = configuration.get_repo_registry_id(self.get_repo(), self.get_config())
         with open(os.path.join(tags_path, 'list'), 'w') as list_file:
             tag_data = {
-                'name': configuration.get_repo_registry_id(self.get_repo(), self.get_config()),
+                'name': registry_id,
                 'tags': list(self._tag_names)}
             list_file.write(json.dumps(tag_data))
-        # We don't need the tag names anymore
+        if self.parent.static_layout:
+            static_layout.write_tag_pages(tags_path, registry_id, self._tag_names)
+        # We don't need the tag names and manifests anymore
         del self._tag_names
+        self._manifests = None
 
 
 class RedirectFileStep(publish_step.PublishStep):
     """
     This step creates the JSON file that describes the published repository for Crane to use.
+    The file is written value by value, each array element by element, so no encoded copy of
+    the document, or of its arrays, is built. Only the sorted arrays of the compact version 5
+    file and of the index are lists, of the keys the publish already holds.
     """
-    def __init__(self, app_publish_location):
+    def __init__(self, app_publish_location, index_publish_location=None):
         """
         Initialize the step.
 
-        :param app_publish_location: The full path to the location of the JSON file that this step
-                                     will generate.
-        :type  app_publish_location: basestring
+        :param app_publish_location:   The full path to the location of the JSON file that this
+                                       step will generate.
+        :type  app_publish_location:   basestring
+        :param index_publish_location: The full path to the location of the sorted index of the
+                                       JSON file, or None if no index should be generated.
+        :type  index_publish_location: basestring or NoneType
         """
         super(RedirectFileStep, self).__init__(step_type=constants.PUBLISH_STEP_REDIRECT_FILE)
         self.app_publish_location = app_publish_location
+        self.index_publish_location = index_publish_location
 
     def process_main(self):
         """
@@ -348,18 +564,289 @@ class RedirectFileStep(publish_step.PublishStep):
         schema2_data = redirect_data[2]
         manifest_list_data = redirect_data['list']
         manifest_list_amd64 = redirect_data['amd64']
+        compact = configuration.get_compact_redirect_file(self.get_config())
+
+        # Version 5 has the same keys, with sorted arrays and without any whitespace. The index
+        # is sorted too, so the arrays are only sorted once for both.
+        if compact or self.index_publish_location:
+            schema2_data = sorted(schema2_data)
+            manifest_list_data = sorted(manifest_list_data)
+            amd64_tags = sorted(manifest_list_amd64)
+        else:
+            amd64_tags = manifest_list_amd64.iterkeys()
 
-        rdata = {
-            'type': 'pulp-docker-redirect', 'version': 4, 'repository': self.get_repo().id,
-            'repo-registry-id': registry, 'url': redirect_url,
+        fields = {
+            'type': 'pulp-docker-redirect', 'version': 5 if compact else 4,
+            'repository': self.get_repo().id, 'repo-registry-id': registry, 'url': redirect_url,
             'protected': self.get_config().get('protected', False),
-            'schema2_data': list(schema2_data),
-            'manifest_list_data': list(manifest_list_data),
-            'manifest_list_amd64_tags': manifest_list_amd64}
-
+            'schema2_data': schema2_data, 'manifest_list_data': manifest_list_data,
+            'manifest_list_amd64_tags': None}
+        item_separator, key_separator = (',', ':') if compact else (', ', ': ')
+        amd64_template = '%%s%s[%%s%s%%d]' % (key_separator, item_separator)
         misc.mkdir(os.path.dirname(self.app_publish_location))
         with open(self.app_publish_location, 'w') as app_file:
-            app_file.write(json.dumps(rdata))
+            app_file.write('{')
+            for index, key in enumerate(sorted(fields)):
+                if index:
+                    app_file.write(item_separator)
+                app_file.write('%s%s' % (encode_basestring_ascii(key), key_separator))
+                value = fields[key]
+                if key == 'manifest_list_amd64_tags':
+                    app_file.write('{')
+                    _write_json_items(app_file, item_separator, (
+                        amd64_template % (encode_basestring_ascii(tag),
+                                          encode_basestring_ascii(manifest_list_amd64[tag][0]),
+                                          manifest_list_amd64[tag][1])
+                        for tag in amd64_tags))
+                    app_file.write('}')
+                elif isinstance(value, (list, set)):
+                    app_file.write('[')
+                    _write_json_items(app_file, item_separator,
+                                      (encode_basestring_ascii(item) for item in value))
+                    app_file.write(']')
+                else:
+                    app_file.write(json.dumps(value))
+            app_file.write('}')
+
+        if self.index_publish_location:
+            self._write_index(schema2_data, manifest_list_data, amd64_tags, manifest_list_amd64)
+
+    def _write_index(self, schema2_data, manifest_list_data, amd64_tags, manifest_list_amd64):
+        """
+        Write the index of the redirect file. It has one line per entry, sorted so that an entry
+        can be found with a binary search over the file:
+
+            amd64 <tag> <digest> <schema version>
+            list <digest or tag>
+            schema2 <digest or tag>
+
+        The kinds of lines sort in this order, and the characters of the digests and tags all
+        sort after the space, so the lines are written from the sorted arrays without sorting
+        them again.
+
+        :param schema2_data:        sorted digests and tags of the schema version 2 image
+                                    manifests
+        :type  schema2_data:        list
+        :param manifest_list_data:  sorted digests and tags of the manifest lists
+        :type  manifest_list_data:  list
+        :param amd64_tags:          sorted tags of manifest_list_amd64
+        :type  amd64_tags:          list
+        :param manifest_list_amd64: amd64 image manifest digest and schema version by tag
+        :type  manifest_list_amd64: dict
+        """
+        misc.mkdir(os.path.dirname(self.index_publish_location))
+        with open(self.index_publish_location, 'w') as index_file:
+            for tag in amd64_tags:
+                digest, schema_version = manifest_list_amd64[tag]
+                index_file.write('amd64 %s %s %s\n' % (tag, digest, schema_version))
+            for key in manifest_list_data:
+                index_file.write('list %s\n' % key)
+            for key in schema2_data:
+                index_file.write('schema2 %s\n' % key)
+
+
+def _write_json_items(output, separator, items):
+    """
+    Write the encoded items of a JSON array or object, one at a time.
+
+    :param output:    file the items are written to
+    :type  output:    file
+    :param separator: separator of the items
+    :type  separator: str
+    :param items:     the encoded items
+    :type  items:     iterator
+    """
+    first = next(items, None)
+    if first is not None:
+        output.write(first)
+        output.writelines(separator + item for item in items)
+
+
+class HttpdConfigStep(publish_step.PublishStep):
+    """
+    This step creates the Apache configuration snippet that serves a repository published in the
+    static layout without Crane.
+    """
+    def __init__(self, config_publish_location, web_publish_dir):
+        """
+        Initialize the step.
+
+        :param config_publish_location: The full path to the location of the configuration snippet
+                                        that this step will generate.
+        :type  config_publish_location: basestring
+        :param web_publish_dir:         The directory the repository is published to.
+        :type  web_publish_dir:         basestring
+        """
+        super(HttpdConfigStep, self).__init__(step_type=constants.PUBLISH_STEP_HTTPD_CONFIG)
+        self.config_publish_location = config_publish_location
+        self.web_publish_dir = web_publish_dir
+
+    def process_main(self):
+        """
+        Publish the configuration snippet.
+        """
+        registry = configuration.get_repo_registry_id(self.get_repo(), self.get_config())
+        misc.mkdir(os.path.dirname(self.config_publish_location))
+        with open(self.config_publish_location, 'w') as config_file:
+            config_file.write(static_layout.render_httpd_config(self.get_repo().id, registry,
+                                                                self.web_publish_dir))
+
+
+class IncrementalPublishStep(publish_step.PluginStep):
+    """
+    Make the working directory available via web, changing only what differs from an earlier
+    publish.
+
+    Two directories are kept inside the master publish directory. One of them is live, the other
+    one holds an older publish together with a state file listing the links it contains. The
+    links recorded by the parent are compared with that state, only the affected links are added
+    or removed, the regular files of the working directory (tags list, redirect file) are copied
+    over, and the publish locations are then switched to it with an atomic rename. The live
+    directory is never modified, so clients always see a complete publish.
+    """
+    DIRECTORIES = ('incremental-a', 'incremental-b')
+
+    def __init__(self, source_dir, publish_locations, master_publish_dir):
+        """
+        :param source_dir:         the working directory containing the regular files to publish
+        :type  source_dir:         basestring
+        :param publish_locations:  list of tuples of the location relative to the published
+                                   directory and the absolute path to link it from
+        :type  publish_locations:  list
+        :param master_publish_dir: directory holding the published directories
+        :type  master_publish_dir: basestring
+        """
+        super(IncrementalPublishStep, self).__init__(step_type=constants.PUBLISH_STEP_INCREMENTAL)
+        self.source_dir = source_dir
+        self.publish_locations = publish_locations
+        self.master_publish_dir = master_publish_dir
+
+    def process_main(self, item=None):
+        """
+        Bring the inactive directory up to date and atomically switch the publish locations to it.
+        """
+        target_dir = self._get_inactive_dir()
+        state_path = target_dir + '.json'
+        state = self._load_state(target_dir, state_path)
+        links = self.parent.published_links
+
+        for relative_path, source_path in state['links'].iteritems():
+            if links.get(relative_path) != source_path:
+                self._remove(os.path.join(target_dir, relative_path))
+        for relative_path, source_path in links.iteritems():
+            if state['links'].get(relative_path) != source_path:
+                misc.create_symlink(source_path, os.path.join(target_dir, relative_path))
+
+        files = self._copy_files(target_dir)
+        for relative_path in set(state['files']) - set(files):
+            self._remove(os.path.join(target_dir, relative_path))
+
+        with open(state_path, 'w') as state_file:
+            json.dump({'links': links, 'files': files}, state_file)
+
+        for source_relative_location, publish_location in self.publish_locations:
+            self._switch_link(os.path.normpath(os.path.join(target_dir, source_relative_location)),
+                              publish_location)
+
+        # Anything else, such as directories from a non incremental publish, is not needed anymore
+        keep = set(self.DIRECTORIES)
+        keep.update([name + '.json' for name in self.DIRECTORIES])
+        for name in set(os.listdir(self.master_publish_dir)) - keep:
+            path = os.path.join(self.master_publish_dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                self._remove(path)
+
+    def _get_inactive_dir(self):
+        """
+        Find the directory that the publish locations do not currently point at.
+
+        :return: absolute path of the directory to publish into
+        :rtype:  basestring
+        """
+        live_dir = os.path.realpath(self.publish_locations[0][1])
+        for name in self.DIRECTORIES:
+            candidate = os.path.join(self.master_publish_dir, name)
+            if os.path.realpath(candidate) != live_dir:
+                return candidate
+
+    @staticmethod
+    def _load_state(target_dir, state_path):
+        """
+        Load the list of links and files that the directory contains. If the state is not known,
+        the directory is emptied so that it can be built from scratch.
+
+        :param target_dir: the directory that is going to be published
+        :type  target_dir: basestring
+        :param state_path: path to the state file of that directory
+        :type  state_path: basestring
+        :return:           dictionary with the "links" and "files" keys
+        :rtype:            dict
+        """
+        try:
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+            if os.path.isdir(target_dir):
+                return state
+        except (IOError, ValueError):
+            pass
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        shutil.rmtree(target_dir, ignore_errors=True)
+        misc.mkdir(target_dir)
+        return {'links': {}, 'files': []}
+
+    def _copy_files(self, target_dir):
+        """
+        Copy the regular files from the working directory to the target directory.
+
+        :param target_dir: the directory that is going to be published
+        :type  target_dir: basestring
+        :return:           paths of the copied files, relative to the target directory
+        :rtype:            list
+        """
+        files = []
+        for root, dirs, file_names in os.walk(self.source_dir):
+            for file_name in file_names:
+                source_path = os.path.join(root, file_name)
+                relative_path = os.path.relpath(source_path, self.source_dir)
+                destination = os.path.join(target_dir, relative_path)
+                misc.mkdir(os.path.dirname(destination))
+                shutil.copy(source_path, destination)
+                files.append(relative_path)
+        return files
+
+    @staticmethod
+    def _remove(path):
+        """
+        Remove a link or file, ignoring it if it is already gone.
+
+        :param path: path to remove
+        :type  path: basestring
+        """
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    @staticmethod
+    def _switch_link(source_path, publish_location):
+        """
+        Atomically point publish_location at source_path.
+
+        :param source_path:      absolute path that should be published
+        :type  source_path:      basestring
+        :param publish_location: absolute path of the published link
+        :type  publish_location: basestring
+        """
+        publish_dir = os.path.dirname(publish_location)
+        misc.mkdir(publish_dir)
+        tmp_link = os.path.join(publish_dir, '.%s.tmp' % os.path.basename(publish_location))
+        IncrementalPublishStep._remove(tmp_link)
+        os.symlink(source_path, tmp_link)
+        os.rename(tmp_link, publish_location)
 
 
 class PublishTagsForRsyncStep(RSyncFastForwardUnitPublishStep):
@@ -390,6 +877,15 @@ class PublishTagsForRsyncStep(RSyncFastForwardUnitPublishStep):
                                                       published_unit_path=['manifests'])
         self._tag_names = set()
         self.repo_registry_id = repo_registry_id
+        # Manifests and Manifest Lists by digest, populated by initialize()
+        self._manifests = None
+
+    def initialize(self):
+        """
+        Load all the Manifests and Manifest Lists that the repository's Tags reference.
+        """
+        super(PublishTagsForRsyncStep, self).initialize()
+        self._manifests = get_tagged_manifests(self.get_repo().id)
 
     def process_main(self, item=None):
         """
@@ -398,17 +894,12 @@ class PublishTagsForRsyncStep(RSyncFastForwardUnitPublishStep):
         :param item: The tag to process
         :type  item: pulp_docker.plugins.models.Tag
         """
-        try:
-            manifest = models.Manifest.objects.get(digest=item.manifest_digest)
-            schema_version = str(manifest.schema_version)
-        except mongoengine.DoesNotExist:
-            manifest = models.ManifestList.objects.get(digest=item.manifest_digest)
-            schema_version = constants.MANIFEST_LIST_TYPE
+        manifest, schema_version = get_tagged_manifest(self._manifests, item)
         filename = item.name
         symlink = self.make_link_unit(manifest, filename, self.get_working_dir(),
                                       self.remote_repo_path,
                                       self.get_config().get("remote")["root"],
-                                      self.published_unit_path + [schema_version])
+                                      self.published_unit_path + [str(schema_version)])
         self.parent.symlink_list.append(symlink)
         self._tag_names.add(item.name)
 
@@ -423,11 +914,12 @@ class PublishTagsForRsyncStep(RSyncFastForwardUnitPublishStep):
                 'name': self.repo_registry_id,
                 'tags': list(self._tag_names)}
             list_file.write(json.dumps(tag_data))
-        # We don't need the tag names anymore
+        # We don't need the tag names and manifests anymore
         del self._tag_names
+        self._manifests = None
 
 
-class DockerRsyncPublisher(Publisher):
+class DockerRsyncPublisher(step_profiling.ProfiledTaskMixin, Publisher):
 
     REPO_CONTENT_TYPES = (constants.IMAGE_TYPE_ID, constants.BLOB_TYPE_ID,
                           constants.MANIFEST_TYPE_ID, constants.MANIFEST_LIST_TYPE_ID)
@@ -0,0 +1,143 @@
+"""
+Helpers for the static v2 layout, which lets a plain web server answer Docker registry requests
+without Crane.
+
+Next to the regular ``manifests/<schema>/<reference>`` links, every manifest is linked as
+``manifests/<reference>.<extension>``, where the extension identifies its media type, which the
+generated web server configuration sets as the content type. The tag list is additionally split
+into pages of TAGS_PAGE_SIZE tags, matching ``tags/list?n=<TAGS_PAGE_SIZE>&last=<tag>`` requests.
+
+Like the rest of the published content, the static layout is only served over SSL. It has no
+equivalent of the entitlement certificate checks Crane does for protected repositories, so it
+cannot be enabled for them.
+"""
+import json
+import os
+import re
+
+from pulp.plugins.util import misc
+
+from pulp_docker.common import constants
+
+
+# File extension and media type by schema version
+MANIFEST_FORMATS = {
+    1: ('v1.json', constants.MEDIATYPE_SIGNED_MANIFEST_S1),
+    2: ('v2.json', constants.MEDIATYPE_MANIFEST_S2),
+    constants.MANIFEST_LIST_TYPE: ('list.json', constants.MEDIATYPE_MANIFEST_LIST),
+}
+
+TAGS_PAGE_SIZE = 100
+TAGS_PAGES_DIRECTORY = 'list.pages'
+
+# The grammar of a tag name. The last= parameter of the tag list requests goes into the path of
+# the page, so it must never match "/" or "..".
+TAG_NAME_RE = '[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}'
+
+HTTPD_CONFIG_TEMPLATE = """\
+# Serves the Docker registry v2 API for %(registry_id)s from the static files published by
+# Pulp. Generated on every publish of repository %(repo_id)s, do not edit.
+RewriteEngine On
+
+RewriteCond %%{HTTP:Accept} %(list_accept)s
+RewriteCond %(web_dir)s/manifests/$1.%(list_ext)s -f
+RewriteRule ^/v2/%(registry_re)s/manifests/([^/]+)$ %(web_dir)s/manifests/$1.%(list_ext)s \
+[L,T=%(list_type)s]
+RewriteCond %%{HTTP:Accept} %(v2_accept)s
+RewriteCond %(web_dir)s/manifests/$1.%(v2_ext)s -f
+RewriteRule ^/v2/%(registry_re)s/manifests/([^/]+)$ %(web_dir)s/manifests/$1.%(v2_ext)s \
+[L,T=%(v2_type)s]
+RewriteCond %(web_dir)s/manifests/$1.%(v1_ext)s -f
+RewriteRule ^/v2/%(registry_re)s/manifests/([^/]+)$ %(web_dir)s/manifests/$1.%(v1_ext)s \
+[L,T=%(v1_type)s]
+
+RewriteRule ^/v2/%(registry_re)s/blobs/([^/]+)$ %(web_dir)s/blobs/$1 \
+[L,T=application/octet-stream]
+
+RewriteCond %%{QUERY_STRING} ^n=%(page_size)d$
+RewriteRule ^/v2/%(registry_re)s/tags/list$ \
+%(web_dir)s/tags/%(pages)s/%(page_size)d/first.json? [L,T=application/json]
+RewriteCond %%{QUERY_STRING} ^n=%(page_size)d&last=(%(tag_re)s)$
+RewriteCond %(web_dir)s/tags/%(pages)s/%(page_size)d/after/%%1.json -f
+RewriteRule ^/v2/%(registry_re)s/tags/list$ \
+%(web_dir)s/tags/%(pages)s/%(page_size)d/after/%%1.json? [L,T=application/json]
+RewriteRule ^/v2/%(registry_re)s/tags/list$ %(web_dir)s/tags/list? [L,T=application/json]
+
+<Directory %(web_dir)s>
+    Header set Docker-Distribution-API-Version "registry/2.0"
+    SSLRequireSSL
+    Options FollowSymlinks
+    Require all granted
+</Directory>
+"""
+
+
+def get_manifest_file_name(reference, schema_version):
+    """
+    Get the name of the file a manifest is published as in the static layout.
+
+    :param reference:      digest or tag the manifest is referenced by
+    :type  reference:      basestring
+    :param schema_version: schema version of the manifest, or constants.MANIFEST_LIST_TYPE
+    :type  schema_version: int or basestring
+    :return:               the file name
+    :rtype:                basestring
+    """
+    return '%s.%s' % (reference, MANIFEST_FORMATS[schema_version][0])
+
+
+def write_tag_pages(tags_dir, name, tag_names):
+    """
+    Write the tag list split into pages, as the registry API returns them for the
+    ``tags/list?n=<TAGS_PAGE_SIZE>&last=<tag>`` requests. The first page is ``first.json``, and
+    each following page is named after the last tag of the page before it.
+
+    :param tags_dir:  the tags directory of the published repository
+    :type  tags_dir:  basestring
+    :param name:      name of the repository in the registry
+    :type  name:      basestring
+    :param tag_names: names of all the published tags
+    :type  tag_names: iterable
+    """
+    pages_dir = os.path.join(tags_dir, TAGS_PAGES_DIRECTORY, str(TAGS_PAGE_SIZE))
+    misc.mkdir(os.path.join(pages_dir, 'after'))
+    tag_names = sorted(tag_names)
+    for start in range(0, max(len(tag_names), 1), TAGS_PAGE_SIZE):
+        if start:
+            page_path = os.path.join(pages_dir, 'after', '%s.json' % tag_names[start - 1])
+        else:
+            page_path = os.path.join(pages_dir, 'first.json')
+        with open(page_path, 'w') as page_file:
+            json.dump({'name': name, 'tags': tag_names[start:start + TAGS_PAGE_SIZE]}, page_file)
+
+
+def render_httpd_config(repo_id, registry_id, web_dir):
+    """
+    Render the Apache configuration snippet serving a repository in the static layout.
+
+    :param repo_id:     id of the published repository
+    :type  repo_id:     basestring
+    :param registry_id: name of the repository in the registry
+    :type  registry_id: basestring
+    :param web_dir:     directory the repository is published to
+    :type  web_dir:     basestring
+    :return:            the configuration snippet
+    :rtype:             basestring
+    """
+    return HTTPD_CONFIG_TEMPLATE % {
+        'repo_id': repo_id,
+        'registry_id': registry_id,
+        'registry_re': re.escape(registry_id),
+        'web_dir': web_dir.rstrip('/'),
+        'list_accept': 'manifest\\.list\\.v2\\+json',
+        'list_ext': MANIFEST_FORMATS[constants.MANIFEST_LIST_TYPE][0],
+        'list_type': constants.MEDIATYPE_MANIFEST_LIST,
+        'v2_accept': 'manifest\\.v2\\+json',
+        'v2_ext': MANIFEST_FORMATS[2][0],
+        'v2_type': constants.MEDIATYPE_MANIFEST_S2,
+        'v1_ext': MANIFEST_FORMATS[1][0],
+        'v1_type': constants.MEDIATYPE_SIGNED_MANIFEST_S1,
+        'pages': TAGS_PAGES_DIRECTORY,
+        'page_size': TAGS_PAGE_SIZE,
+        'tag_re': TAG_NAME_RE,
+    }
@@ -0,0 +1,152 @@
+import errno
+import os
+from multiprocessing.pool import ThreadPool
+import threading
+
+from pulp.plugins.util import misc
+
+
+class SymlinkCreator(object):
+    """
+    Creates the symlinks of a publish, optionally using a pool of worker threads. Each symlink
+    is a round trip on network filesystems, so creating them concurrently keeps large publishes
+    from being bound by the latency of the publish directory.
+
+    Parent directories are created once, by the caller's thread, before the link is handed to
+    a worker. With a single worker the links are created synchronously.
+    """
+
+    def __init__(self, workers=1):
+        """
+        :param workers: number of threads used to create the symlinks
+        :type  workers: int
+        """
+        self.workers = workers
+        self._directories = set()
+        self._pool = None
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def create_symlink(self, source_path, link_path):
+        """
+        Create a symlink, creating its parent directory if needed. The link may not exist yet
+        when this returns; call wait() before relying on it.
+
+        :param source_path: path the link should point to
+        :type  source_path: basestring
+        :param link_path:   absolute path of the link
+        :type  link_path:   basestring
+        """
+        link_path = link_path.rstrip('/')
+        parent_dir = os.path.dirname(link_path)
+        if parent_dir not in self._directories:
+            misc.mkdir(parent_dir)
+            self._directories.add(parent_dir)
+
+        if self.workers <= 1:
+            self._symlink(source_path, link_path)
+            return
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        self._pool.apply_async(self._create_symlink, (source_path, link_path))
+
+    def wait(self):
+        """
+        Wait for all the pending symlinks to be created.
+
+        :raises Exception: the first error of a worker, if any of the symlinks could not be
+                           created
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._errors:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+    def close(self):
+        """
+        Stop the worker threads, dropping the symlinks that are still pending. This is a no-op
+        once wait() has returned, so the owner of the creator calls it when the publish ends,
+        whether or not it failed before waiting for the symlinks.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._errors = []
+
+    def _create_symlink(self, source_path, link_path):
+        """
+        Create a symlink from a worker thread, recording any error for wait() to raise.
+
+        :param source_path: path the link should point to
+        :type  source_path: basestring
+        :param link_path:   absolute path of the link
+        :type  link_path:   basestring
+        """
+        try:
+            self._symlink(source_path, link_path)
+        except Exception as e:
+            with self._lock:
+                self._errors.append(e)
+
+    @staticmethod
+    def _symlink(source_path, link_path):
+        """
+        Create a symlink whose parent directory exists. A link that already points to the source
+        path is left alone.
+
+        :param source_path: path the link should point to
+        :type  source_path: basestring
+        :param link_path:   absolute path of the link
+        :type  link_path:   basestring
+        :raises OSError: if the link cannot be created or already points somewhere else
+        """
+        try:
+            os.symlink(source_path, link_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.islink(link_path) or \
+                    os.readlink(link_path) != source_path:
+                raise
+
+
+def remove_link(link_path):
+    """
+    Remove a symlink, if it still exists.
+
+    :param link_path: absolute path of the link
+    :type  link_path: basestring
+    """
+    try:
+        os.unlink(link_path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def remove_dangling_links(directory):
+    """
+    Remove the symlinks of a directory whose target no longer exists, like the links of the
+    shared Blob directory to the Blobs removed by an orphan cleanup.
+
+    :param directory: the directory
+    :type  directory: basestring
+    :return:          number of links removed
+    :rtype:           int
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return 0
+        raise
+    removed = 0
+    for name in names:
+        link_path = os.path.join(directory, name)
+        if os.path.islink(link_path) and not os.path.exists(link_path):
+            remove_link(link_path)
+            removed += 1
+    return removed
@@ -6,8 +6,8 @@ from pulp.plugins.util.publish_step import PublishStep, UnitModelPluginStep, \
     AtomicDirectoryPublishStep, SaveTarFilePublishStep
 
 from pulp_docker.common import constants
-from pulp_docker.plugins import models
-from pulp_docker.plugins.distributors import configuration
+from pulp_docker.plugins import models, step_profiling
+from pulp_docker.plugins.distributors import configuration, symlinks
 from pulp_docker.plugins.distributors.metadata import RedirectFileContext
 
 
@@ -52,7 +52,7 @@ class WebPublisher(PublishStep):
         self.add_child(atomic_publish_step)
 
 
-class ExportPublisher(PublishStep):
+class ExportPublisher(step_profiling.ProfiledTaskMixin, PublishStep):
     """
     Docker Export publisher class that is responsible for the actual publishing
     of a docker repository via a tar file
@@ -88,6 +88,7 @@ class PublishImagesStep(UnitModelPluginStep):
 
         self.context = None
         self.redirect_context = None
+        self.symlink_creator = None
         self.description = _('Publishing Image Files.')
 
     def initialize(self):
@@ -108,18 +109,27 @@ class PublishImagesStep(UnitModelPluginStep):
         :type  item: pulp_docker.common.models.Image
         """
         self.redirect_context.add_unit_metadata(item)
+        if self.symlink_creator is None:
+            self.symlink_creator = symlinks.SymlinkCreator(
+                configuration.get_symlink_workers(self.get_config()))
         target_base = os.path.join(self.get_web_directory(), item.unit_key['image_id'])
         files = ['ancestry', 'json', 'layer']
         for file_name in files:
-            misc.create_symlink(os.path.join(item.storage_path, file_name),
-                                os.path.join(target_base, file_name))
+            self.symlink_creator.create_symlink(os.path.join(item.storage_path, file_name),
+                                                os.path.join(target_base, file_name))
 
     def finalize(self):
         """
-        Close & finalize each the metadata context
+        Wait for the pending symlinks, and close & finalize each the metadata context
         """
-        if self.redirect_context:
-            self.redirect_context.finalize()
+        try:
+            if self.symlink_creator:
+                self.symlink_creator.wait()
+        finally:
+            if self.symlink_creator:
+                self.symlink_creator.close()
+            if self.redirect_context:
+                self.redirect_context.finalize()
 
     def get_web_directory(self):
         """
@@ -0,0 +1,478 @@
+from gettext import gettext as _
+import json
+import os
+import tarfile
+import time
+from cStringIO import StringIO
+
+from pulp.common import dateutils
+from pulp.plugins.util import misc, publish_step
+from pulp.server.db import model as pulp_models
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import compression, models, step_profiling
+from pulp_docker.plugins.distributors import configuration
+from pulp_docker.plugins.distributors.publish_steps import get_tagged_manifest, \
+    get_tagged_manifests
+
+
+MANIFEST_MEDIA_TYPES = {
+    1: constants.MEDIATYPE_SIGNED_MANIFEST_S1,
+    2: constants.MEDIATYPE_MANIFEST_S2,
+    constants.MANIFEST_LIST_TYPE: constants.MEDIATYPE_MANIFEST_LIST,
+}
+OCI_REF_NAME_ANNOTATION = 'org.opencontainers.image.ref.name'
+
+EXPORT_MANIFEST_VERSION = 1
+CONTENT_KINDS = configuration.EXPORT_CONTENT_KINDS
+
+
+class ExportPublisher(step_profiling.ProfiledTaskMixin, publish_step.PublishStep):
+    """
+    Docker v2 Export publisher class that streams the content of a repository into a tar file.
+
+    The tar file is an OCI image layout: every Blob, Manifest and Manifest List is stored once in
+    blobs/<algorithm>/<hex>, and index.json lists the tagged manifests. It also contains the
+    manifest.json read by "docker load" for the tags referencing schema version 2 manifests. The
+    content is read directly from the content storage, and nothing is staged on disk.
+
+    Every export also writes an export manifest, both into the tar file and next to it, listing
+    the content of the repository. A delta export, based either on the export manifest of an
+    earlier export or on a date, only contains the content added since then, and its export
+    manifest lists the content removed since the earlier export. Delta exports are applied by
+    uploading them to the importer, and cannot be read by "docker load".
+    """
+
+    def __init__(self, repo, publish_conduit, config):
+        """
+        :param repo: Pulp managed Docker repository
+        :type  repo: pulp.plugins.model.Repository
+        :param publish_conduit: Conduit providing access to relative Pulp functionality
+        :type  publish_conduit: pulp.plugins.conduits.repo_publish.RepoPublishConduit
+        :param config: Pulp configuration for the distributor
+        :type  config: pulp.plugins.config.PluginCallConfiguration
+        """
+        super(ExportPublisher, self).__init__(
+            step_type=constants.PUBLISH_STEP_EXPORT_PUBLISHER, repo=repo,
+            publish_conduit=publish_conduit, config=config)
+
+        self.tar_writer = TarWriter(
+            configuration.get_export_repo_file_with_path(repo, config, 'v2'),
+            configuration.get_export_compression(config),
+            configuration.get_export_compression_level(config),
+            configuration.get_export_compression_threads(config))
+        self.export_manifest_path = configuration.get_export_manifest_path(
+            self.tar_writer.path)
+        # Digests of the content exported by an earlier export, by kind of content
+        self.base_content = None
+        self.base_created = None
+        base = configuration.read_export_delta_base(config)
+        if base is not None:
+            self.base_content = dict((kind, set(base['content'][kind])) for kind in CONTENT_KINDS)
+            self.base_created = base['created']
+        self.start_date = None
+        start_date = configuration.get_export_start_date(config)
+        if start_date is not None:
+            # Association dates are stored as ISO 8601 strings in UTC, which sort as dates
+            self.start_date = dateutils.format_iso8601_datetime(
+                dateutils.to_utc_datetime(start_date))
+        # ids of the units associated to the repository since start_date, loaded on first use
+        self._new_unit_ids = None
+        self.delta = self.base_content is not None or self.start_date is not None
+        # Digests of all the content, and of the exported content, by kind of content
+        self.content = dict((kind, []) for kind in CONTENT_KINDS)
+        self.added = dict((kind, []) for kind in CONTENT_KINDS)
+        self.tags = []
+
+        # OCI descriptors of the exported Manifests and Manifest Lists, by digest
+        self.descriptors = {}
+        # Entries of the index.json and manifest.json files, populated by ExportTagsStep
+        self.index_manifests = []
+        self.load_manifests = []
+
+        self.add_child(ExportBlobsStep())
+        self.add_child(ExportManifestsStep())
+        self.add_child(ExportManifestListsStep())
+        self.add_child(ExportTagsStep())
+        self.add_child(ExportIndexStep())
+
+    def process_lifecycle(self):
+        """
+        Export the repository, removing the partial tar file if the export fails or is canceled.
+
+        :return: the report of the publish
+        :rtype:  pulp.plugins.model.PublishReport
+        """
+        try:
+            return super(ExportPublisher, self).process_lifecycle()
+        finally:
+            self.tar_writer.discard()
+
+    def add_content(self, kind, unit):
+        """
+        Record a unit of the repository, and determine whether it should be exported.
+
+        :param kind: one of CONTENT_KINDS
+        :type  kind: basestring
+        :param unit: the Blob, Manifest or Manifest List
+        :type  unit: pulp.server.db.model.FileContentUnit
+        :return:     True if the unit is new since the base of a delta export, or if this is not
+                     a delta export
+        :rtype:      bool
+        """
+        self.content[kind].append(unit.digest)
+        if self.base_content is not None:
+            new = unit.digest not in self.base_content[kind]
+        elif self.start_date is not None:
+            if self._new_unit_ids is None:
+                associations = pulp_models.RepositoryContentUnit.objects.filter(
+                    repo_id=self.get_repo().id, created__gte=self.start_date)
+                self._new_unit_ids = set(associations.values_list('unit_id'))
+            new = unit.id in self._new_unit_ids
+        else:
+            new = True
+        if new:
+            self.added[kind].append(unit.digest)
+        return new
+
+    def get_export_manifest(self):
+        """
+        Build the export manifest, describing the content of the repository and of the export.
+
+        :return: the export manifest
+        :rtype:  dict
+        """
+        if self.base_content is not None:
+            removed = dict((kind, sorted(self.base_content[kind] - set(self.content[kind])))
+                           for kind in CONTENT_KINDS)
+        else:
+            removed = dict((kind, []) for kind in CONTENT_KINDS)
+        return {
+            'version': EXPORT_MANIFEST_VERSION,
+            'repository': self.get_repo().id,
+            'created': dateutils.format_iso8601_datetime(dateutils.now_utc_datetime_with_tzinfo()),
+            'base': self.base_created or self.start_date,
+            'content': dict((kind, sorted(self.content[kind])) for kind in CONTENT_KINDS),
+            'added': dict((kind, sorted(self.added[kind])) for kind in CONTENT_KINDS),
+            'removed': removed,
+            'tags': self.tags}
+
+
+class ExportBlobsStep(publish_step.UnitModelPluginStep):
+    """
+    Export Blobs.
+    """
+
+    def __init__(self, repo_content_unit_q=None):
+        """
+        :param repo_content_unit_q: optional Q object that will be applied to the queries performed
+                                    against RepoContentUnit model
+        :type  repo_content_unit_q: mongoengine.Q
+        """
+        super(ExportBlobsStep, self).__init__(step_type=constants.PUBLISH_STEP_EXPORT_BLOBS,
+                                              model_classes=[models.Blob],
+                                              repo_content_unit_q=repo_content_unit_q)
+        self.description = _('Exporting Blobs.')
+
+    def initialize(self):
+        """
+        Start the tar file with the OCI layout file, which identifies it as an export.
+        """
+        super(ExportBlobsStep, self).initialize()
+        self.parent.tar_writer.add_data(constants.EXPORT_OCI_LAYOUT_FILE_NAME,
+                                        json.dumps({'imageLayoutVersion': '1.0.0'}))
+
+    def process_main(self, item):
+        """
+        Add the Blob to the tar file.
+
+        :param item: The Blob to process
+        :type  item: pulp_docker.plugins.models.Blob
+        """
+        if self.parent.add_content('blobs', item):
+            self.parent.tar_writer.add_file(get_blob_path(item.digest), item._storage_path)
+
+
+class ExportManifestsStep(publish_step.UnitModelPluginStep):
+    """
+    Export Manifests.
+    """
+
+    def __init__(self, repo_content_unit_q=None):
+        """
+        :param repo_content_unit_q: optional Q object that will be applied to the queries performed
+                                    against RepoContentUnit model
+        :type  repo_content_unit_q: mongoengine.Q
+        """
+        super(ExportManifestsStep, self).__init__(
+            step_type=constants.PUBLISH_STEP_EXPORT_MANIFESTS, model_classes=[models.Manifest],
+            repo_content_unit_q=repo_content_unit_q)
+        self.description = _('Exporting Manifests.')
+
+    def process_main(self, item):
+        """
+        Add the Manifest to the tar file.
+
+        :param item: The Manifest to process
+        :type  item: pulp_docker.plugins.models.Manifest
+        """
+        if self.parent.add_content('manifests', item):
+            export_manifest(self.parent, item, item.schema_version)
+
+
+class ExportManifestListsStep(publish_step.UnitModelPluginStep):
+    """
+    Export Manifest Lists.
+    """
+
+    def __init__(self, repo_content_unit_q=None):
+        """
+        :param repo_content_unit_q: optional Q object that will be applied to the queries performed
+                                    against RepoContentUnit model
+        :type  repo_content_unit_q: mongoengine.Q
+        """
+        super(ExportManifestListsStep, self).__init__(
+            step_type=constants.PUBLISH_STEP_EXPORT_MANIFEST_LISTS,
+            model_classes=[models.ManifestList], repo_content_unit_q=repo_content_unit_q)
+        self.description = _('Exporting Manifest Lists.')
+
+    def process_main(self, item):
+        """
+        Add the Manifest List to the tar file.
+
+        :param item: The Manifest List to process
+        :type  item: pulp_docker.plugins.models.ManifestList
+        """
+        if self.parent.add_content('manifest_lists', item):
+            export_manifest(self.parent, item, constants.MANIFEST_LIST_TYPE)
+
+
+class ExportTagsStep(publish_step.UnitModelPluginStep):
+    """
+    Collect the index.json and manifest.json entries of the Tags.
+    """
+
+    def __init__(self, repo_content_unit_q=None):
+        """
+        :param repo_content_unit_q: optional Q object that will be applied to the queries performed
+                                    against RepoContentUnit model
+        :type  repo_content_unit_q: mongoengine.Q
+        """
+        super(ExportTagsStep, self).__init__(step_type=constants.PUBLISH_STEP_EXPORT_TAGS,
+                                             model_classes=[models.Tag],
+                                             repo_content_unit_q=repo_content_unit_q)
+        self.description = _('Exporting Tags.')
+        # Manifests and Manifest Lists by digest, populated by initialize()
+        self._manifests = None
+        # docker load entries by Manifest digest
+        self._load_manifests = None
+        self._registry_id = None
+
+    def initialize(self):
+        """
+        Load all the Manifests and Manifest Lists that the repository's Tags reference.
+        """
+        super(ExportTagsStep, self).initialize()
+        self._manifests = get_tagged_manifests(self.get_repo().id)
+        self._load_manifests = {}
+        self._registry_id = configuration.get_repo_registry_id(self.get_repo(), self.get_config())
+
+    def process_main(self, item):
+        """
+        Add the Tag to the export manifest, to the index if its manifest is exported, and to the
+        docker load manifest if it references a schema version 2 Manifest and this is not a delta
+        export.
+
+        :param item: The Tag to process
+        :type  item: pulp_docker.plugins.models.Tag
+        """
+        manifest, schema_version = get_tagged_manifest(self._manifests, item)
+        self.parent.tags.append({'name': item.name, 'manifest_digest': item.manifest_digest,
+                                 'schema_version': item.schema_version,
+                                 'manifest_type': item.manifest_type})
+        if manifest.digest not in self.parent.descriptors:
+            # Exported by an earlier export
+            return
+        descriptor = dict(self.parent.descriptors[manifest.digest])
+        descriptor['annotations'] = {OCI_REF_NAME_ANNOTATION: item.name}
+        self.parent.index_manifests.append(descriptor)
+        if schema_version != 2 or self.parent.delta:
+            return
+
+        load_manifest = self._load_manifests.get(manifest.digest)
+        if load_manifest is None:
+            with open(manifest._storage_path) as manifest_file:
+                manifest_data = json.load(manifest_file)
+            load_manifest = {
+                'Config': get_blob_path(manifest_data['config']['digest']),
+                'RepoTags': [],
+                'Layers': [get_blob_path(layer['digest']) for layer in manifest_data['layers']]}
+            self._load_manifests[manifest.digest] = load_manifest
+            self.parent.load_manifests.append(load_manifest)
+        load_manifest['RepoTags'].append('%s:%s' % (self._registry_id, item.name))
+
+    def finalize(self):
+        """
+        Add the Manifests and Manifest Lists that no Tag references to the index.
+        """
+        tagged = set(manifest.digest for manifest, _schema in self._manifests.itervalues())
+        for digest in sorted(set(self.parent.descriptors) - tagged):
+            self.parent.index_manifests.append(self.parent.descriptors[digest])
+        self._manifests = None
+        self._load_manifests = None
+
+
+class ExportIndexStep(publish_step.PluginStep):
+    """
+    Write the index files and close the tar file.
+    """
+
+    def __init__(self):
+        super(ExportIndexStep, self).__init__(step_type=constants.PUBLISH_STEP_EXPORT_INDEX)
+        self.description = _('Writing the export index.')
+
+    def process_main(self, item=None):
+        """
+        Write the OCI index, the docker load manifest and the export manifest, and move the tar
+        file into place.
+        """
+        tar_writer = self.parent.tar_writer
+        tar_writer.add_data('index.json', json.dumps({'schemaVersion': 2,
+                                                      'manifests': self.parent.index_manifests}))
+        tar_writer.add_data('manifest.json', json.dumps(self.parent.load_manifests))
+        export_manifest = json.dumps(self.parent.get_export_manifest())
+        tar_writer.add_data(constants.EXPORT_MANIFEST_FILE_NAME, export_manifest)
+        tar_writer.close()
+        with open(self.parent.export_manifest_path, 'w') as export_manifest_file:
+            export_manifest_file.write(export_manifest)
+
+
+class TarWriter(object):
+    """
+    Streams files into a possibly compressed tar file. The tar file is written next to its final
+    location and only renamed into place once it is complete.
+    """
+
+    def __init__(self, path, compression_type, level=None, threads=1):
+        """
+        :param path:             path of the tar file to create
+        :type  path:             basestring
+        :param compression_type: one of compression.COMPRESSION_TYPES
+        :type  compression_type: basestring
+        :param level:            compression level, or None for the default level
+        :type  level:            int or NoneType
+        :param threads:          number of threads compressing the tar file
+        :type  threads:          int
+        """
+        self.path = path
+        self.compression_type = compression_type
+        self.level = level
+        self.threads = threads
+        self._file = None
+        self._writer = None
+        self._tar = None
+
+    def add_file(self, name, path):
+        """
+        Add a file to the tar file.
+
+        :param name: name of the file in the tar file
+        :type  name: basestring
+        :param path: path of the file to add
+        :type  path: basestring
+        """
+        self._open()
+        tar_info = self._tar.gettarinfo(path, name)
+        tar_info.uid = tar_info.gid = 0
+        tar_info.uname = tar_info.gname = ''
+        tar_info.mode = 0644
+        with open(path, 'rb') as content:
+            self._tar.addfile(tar_info, content)
+
+    def add_data(self, name, data):
+        """
+        Add a file with the given contents to the tar file.
+
+        :param name: name of the file in the tar file
+        :type  name: basestring
+        :param data: contents of the file
+        :type  data: str
+        """
+        self._open()
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = len(data)
+        tar_info.mtime = int(time.time())
+        tar_info.mode = 0644
+        self._tar.addfile(tar_info, StringIO(data))
+
+    def close(self):
+        """
+        Finish the tar file and move it to its final location.
+        """
+        self._open()
+        self._tar.close()
+        self._writer.close()
+        self._file.close()
+        os.rename(self._file.name, self.path)
+        self._tar = self._writer = self._file = None
+
+    def discard(self):
+        """
+        Close the tar file and remove it, if it was opened and not completed.
+        """
+        if self._file is None:
+            return
+        try:
+            self._writer.close()
+        except Exception:
+            # The error of the export is the one that matters
+            pass
+        finally:
+            self._file.close()
+            os.unlink(self._file.name)
+            self._tar = self._writer = self._file = None
+
+    def _open(self):
+        """
+        Open the tar file, if it is not open yet.
+        """
+        if self._tar is not None:
+            return
+        misc.mkdir(os.path.dirname(self.path))
+        self._file = open(self.path + '.part', 'wb')
+        self._writer = compression.open_writer(self._file, self.compression_type, self.level,
+                                               self.threads)
+        # The content storage may link to the actual files, always store their contents
+        self._tar = tarfile.open(fileobj=self._writer, mode='w|', dereference=True)
+
+
+def export_manifest(publisher, manifest, schema_version):
+    """
+    Add a Manifest or Manifest List to the tar file and record its OCI descriptor.
+
+    :param publisher:      the ExportPublisher
+    :type  publisher:      ExportPublisher
+    :param manifest:       the Manifest or Manifest List to export
+    :type  manifest:       pulp_docker.plugins.models.Manifest or
+                           pulp_docker.plugins.models.ManifestList
+    :param schema_version: schema version of the manifest, or constants.MANIFEST_LIST_TYPE
+    :type  schema_version: int or basestring
+    """
+    publisher.tar_writer.add_file(get_blob_path(manifest.digest), manifest._storage_path)
+    publisher.descriptors[manifest.digest] = {
+        'mediaType': MANIFEST_MEDIA_TYPES[schema_version],
+        'digest': manifest.digest,
+        'size': os.path.getsize(manifest._storage_path)}
+
+
+def get_blob_path(digest):
+    """
+    Get the path of a blob in the OCI image layout.
+
+    :param digest: digest of the blob, in the <algorithm>:<hex> form
+    :type  digest: basestring
+    :return:       path of the blob, relative to the root of the layout
+    :rtype:        basestring
+    """
+    algorithm, hex_digest = digest.split(':', 1)
+    return 'blobs/%s/%s' % (algorithm, hex_digest)
@@ -0,0 +1,84 @@
+"""
+HTTP connections shared by the downloaders of a worker process.
+
+Each nectar downloader has its own requests session, with its own connection pools, so every
+downloader opens new TCP and TLS connections to the registry. The syncs create several
+downloaders for metadata, tokens and blobs. share_connections() mounts the same HTTPAdapter,
+and so the same pools of keep-alive connections, on all the downloaders that connect with the
+same TLS and proxy settings. The connections are then reused from one downloader to the next and
+from one sync to the next in the same worker.
+
+The authentication stays with each downloader: requests sends the session's headers and
+credentials with each request, while the adapter only holds the connections.
+"""
+import threading
+
+from requests.adapters import HTTPAdapter
+
+
+# Minimum number of connections kept open to each host
+DEFAULT_POOL_SIZE = 10
+
+# Number of hosts the connections are kept open to, by adapter
+POOL_HOSTS = 10
+
+# Settings of a nectar DownloaderConfig that change how the connections are made. Downloaders
+# only share connections when all of them are equal.
+CONNECTION_SETTINGS = ('ssl_validation', 'ssl_ca_cert', 'ssl_client_cert', 'ssl_client_key',
+                       'proxy_url', 'proxy_port', 'proxy_username', 'proxy_password')
+
+_adapters = {}
+_lock = threading.Lock()
+
+
+def share_connections(downloader):
+    """
+    Make a downloader use the shared connection pools for its settings, for both http and https.
+
+    :param downloader: downloader whose session is given the shared adapter
+    :type  downloader: nectar.downloaders.threaded.HTTPThreadedDownloader
+    :return:           the downloader
+    :rtype:            nectar.downloaders.threaded.HTTPThreadedDownloader
+    """
+    config = downloader.config
+    key = tuple(getattr(config, name, None) for name in CONNECTION_SETTINGS)
+    pool_size = max(getattr(config, 'max_concurrent', None) or 0, DEFAULT_POOL_SIZE)
+    for prefix in ('http://', 'https://'):
+        current = downloader.session.get_adapter(prefix)
+        adapter = get_adapter(key, pool_size, getattr(current, 'max_retries', 0))
+        downloader.session.mount(prefix, adapter)
+    return downloader
+
+
+def get_adapter(key, pool_size, max_retries=0):
+    """
+    Get the shared adapter for some connection settings, creating it if needed. An adapter
+    whose pools are too small for pool_size is replaced by a bigger one for the next callers.
+
+    :param key:         the connection settings
+    :type  key:         tuple
+    :param pool_size:   number of connections to each host the caller may use at the same time
+    :type  pool_size:   int
+    :param max_retries: retries of the adapter, if it is created
+    :type  max_retries: int or urllib3.util.retry.Retry
+    :return:            the adapter
+    :rtype:             requests.adapters.HTTPAdapter
+    """
+    with _lock:
+        adapter = _adapters.get(key)
+        if adapter is None or adapter._pool_maxsize < pool_size:
+            # connections beyond pool_size are opened when needed, and closed after their request
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size,
+                                  max_retries=max_retries, pool_block=False)
+            _adapters[key] = adapter
+        return adapter
+
+
+def clear():
+    """
+    Close the shared connections, and forget the adapters.
+    """
+    with _lock:
+        for adapter in _adapters.values():
+            adapter.close()
+        _adapters.clear()
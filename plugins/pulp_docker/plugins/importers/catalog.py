@@ -0,0 +1,195 @@
+"""
+Sync of all the repositories listed in the catalog of a Docker v2 registry.
+
+A repository whose importer has ``catalog_sync`` set does not sync content itself. Its sync
+lists the registry's ``/v2/_catalog``, optionally only one namespace of it, and syncs each of the
+upstream repositories into a Pulp repository of its own, creating the Pulp repositories that do
+not exist yet. All the syncs run in the same task, one after the other, so the registry is only
+checked once and the connections and the token of the registry client are reused from one
+repository to the next. Blobs shared by several upstream repositories are only downloaded once:
+once saved by the sync of one repository, the syncs of the others find them in Pulp.
+"""
+from gettext import gettext as _
+import logging
+import os
+import shutil
+
+from pulp.common.constants import REPO_NOTE_TYPE_KEY
+from pulp.common.plugins import importer_constants
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.util import misc, nectar_config, publish_step
+from pulp.server.controllers import repository
+from pulp.server.db import model as pulp_models
+from pulp.server.exceptions import MissingValue, PulpCodedException
+
+from pulp_docker.common import constants, error_codes
+from pulp_docker.plugins import registry, step_profiling
+from pulp_docker.plugins.importers import sync
+
+
+_logger = logging.getLogger(__name__)
+
+# Importer config keys that only apply to the catalog repository
+CATALOG_CONFIG_KEYS = (constants.CONFIG_KEY_CATALOG_SYNC, constants.CONFIG_KEY_CATALOG_NAMESPACE)
+
+
+def get_repo_id(catalog_repo_id, name):
+    """
+    Get the id of the Pulp repository an upstream repository of the catalog is synced into.
+
+    :param catalog_repo_id: id of the catalog repository
+    :type  catalog_repo_id: basestring
+    :param name:            name of the upstream repository
+    :type  name:            basestring
+    :return:                the repository id
+    :rtype:                 basestring
+    """
+    return '%s-%s' % (catalog_repo_id, name.replace('/', '-'))
+
+
+class CatalogSyncStep(step_profiling.ProfiledTaskMixin, publish_step.PluginStep):
+    """
+    This PluginStep syncs every repository of the catalog of a Docker v2 registry into a Pulp
+    repository of its own.
+    """
+
+    def __init__(self, repo=None, conduit=None, config=None):
+        """
+        Check that the feed is a Docker v2 registry, and create the registry client shared by the
+        syncs of all the repositories.
+
+        :param repo:    the catalog repository
+        :type  repo:    pulp.plugins.model.Repository
+        :param conduit: sync conduit to use
+        :type  conduit: pulp.plugins.conduits.repo_sync.RepoSyncConduit
+        :param config:  config object for the sync
+        :type  config:  pulp.plugins.config.PluginCallConfiguration
+        """
+        super(CatalogSyncStep, self).__init__(
+            step_type=constants.SYNC_STEP_CATALOG, repo=repo, conduit=conduit, config=config,
+            plugin_type=constants.IMPORTER_TYPE_ID)
+        self.description = _('Syncing Docker Registry Catalog')
+
+        url = config.get(importer_constants.KEY_FEED)
+        if not url:
+            raise MissingValue([importer_constants.KEY_FEED])
+        download_config = nectar_config.importer_config_to_nectar_config(config.flatten())
+        self.index_repository = registry.V2Repository('', download_config, url,
+                                                      self.get_working_dir(),
+                                                      **sync.get_metadata_options(config))
+        if not self.index_repository.api_version_check():
+            raise PulpCodedException(error_code=error_codes.DKR1008, registry=url)
+
+        # The sync of the upstream repository in progress, so that it can be canceled
+        self.repository_sync_step = None
+        self.failed_repos = []
+
+    def process_main(self, item=None):
+        """
+        Sync each repository of the catalog, going on with the next ones when one of them fails.
+
+        :raises PulpCodedException: if any of the repositories failed to sync
+        """
+        names = self.index_repository.get_catalog(
+            self.get_config().get(constants.CONFIG_KEY_CATALOG_NAMESPACE))
+        self.total_units = len(names)
+        for name in names:
+            if self.canceled:
+                return
+            try:
+                succeeded = self._sync_repository(name)
+            except Exception:
+                _logger.exception(_('Sync of %(name)s from the catalog failed') % {'name': name})
+                succeeded = False
+            if succeeded:
+                self.progress_successes += 1
+            else:
+                self.progress_failures += 1
+                self.failed_repos.append(name)
+            self.report_progress()
+
+        if self.failed_repos:
+            raise PulpCodedException(error_code=error_codes.DKR1031,
+                                     repos=', '.join(self.failed_repos))
+
+    def _sync_repository(self, name):
+        """
+        Sync an upstream repository into its Pulp repository, then update the unit counts of the
+        repository and queue its automatic publishes, as a sync task of the repository would.
+
+        :param name: name of the upstream repository
+        :type  name: basestring
+        :return:     True if the sync succeeded
+        :rtype:      bool
+        """
+        repo_obj, importer_config = self._get_repository(name)
+        working_dir = os.path.join(self.get_working_dir(), repo_obj.repo_id)
+        misc.mkdir(working_dir)
+        index_repository = self.index_repository.with_name(name, working_dir)
+        config = PluginCallConfiguration(self.get_config().plugin_config, dict(importer_config),
+                                         self.get_config().override_config)
+        try:
+            self.repository_sync_step = sync.SyncStep(
+                repo=repo_obj.to_transfer_repo(), conduit=self.get_conduit(), config=config,
+                index_repository=index_repository, working_dir=working_dir)
+            report = self.repository_sync_step.process_lifecycle()
+        finally:
+            self.repository_sync_step = None
+            # the next repository reuses the token, if the registry accepts it for that one too
+            self.index_repository.token = index_repository.token
+            shutil.rmtree(working_dir, ignore_errors=True)
+
+        repository.rebuild_content_unit_counts(repo_obj)
+        repository.update_last_unit_added(repo_obj.repo_id)
+        if not report.success_flag:
+            return False
+        for distributor in pulp_models.Distributor.objects(repo_id=repo_obj.repo_id,
+                                                           auto_publish=True):
+            repository.queue_publish(repo_obj.repo_id, distributor.distributor_id)
+        return True
+
+    def _get_repository(self, name):
+        """
+        Get the Pulp repository an upstream repository is synced into, creating it if needed. A
+        new repository gets the importer config of the catalog repository, for the upstream
+        repository, and the same distributors as the repositories created by pulp-admin.
+
+        :param name: name of the upstream repository
+        :type  name: basestring
+        :return:     the repository and the config of its importer
+        :rtype:      tuple of (pulp.server.db.model.Repository, dict)
+        """
+        repo_id = get_repo_id(self.get_repo().id, name)
+        repo_obj = pulp_models.Repository.objects.filter(repo_id=repo_id).first()
+        if repo_obj is not None:
+            return repo_obj, pulp_models.Importer.objects.get(repo_id=repo_id).config
+
+        importer_config = dict((key, value) for key, value in
+                               self.get_config().repo_plugin_config.items()
+                               if key not in CATALOG_CONFIG_KEYS)
+        importer_config[constants.CONFIG_KEY_UPSTREAM_NAME] = name
+        distributor_config = {constants.CONFIG_KEY_REPO_REGISTRY_ID: name}
+        distributors = [
+            dict(distributor_type_id=constants.DISTRIBUTOR_WEB_TYPE_ID,
+                 distributor_config=distributor_config,
+                 auto_publish=True,
+                 distributor_id=constants.CLI_WEB_DISTRIBUTOR_ID),
+            dict(distributor_type_id=constants.DISTRIBUTOR_EXPORT_TYPE_ID,
+                 distributor_config=distributor_config,
+                 auto_publish=False, distributor_id=constants.CLI_EXPORT_DISTRIBUTOR_ID)
+        ]
+        _logger.info(_('Creating repository %(repo)s for %(name)s') % {'repo': repo_id,
+                                                                       'name': name})
+        repo_obj = repository.create_repo(
+            repo_id, notes={REPO_NOTE_TYPE_KEY: constants.REPO_NOTE_DOCKER},
+            importer_type_id=constants.IMPORTER_TYPE_ID,
+            importer_repo_plugin_config=importer_config, distributor_list=distributors)
+        return repo_obj, importer_config
+
+    def cancel(self):
+        """
+        Cancel the catalog sync, and the sync of the repository in progress.
+        """
+        super(CatalogSyncStep, self).cancel()
+        if self.repository_sync_step is not None:
+            self.repository_sync_step.cancel()
@@ -12,7 +12,7 @@ from pulp.server.exceptions import PulpCodedValidationException
 
 from pulp_docker.common import constants
 from pulp_docker.plugins import models
-from pulp_docker.plugins.importers import sync, upload
+from pulp_docker.plugins.importers import catalog, sync, upload
 
 
 _logger = logging.getLogger(__name__)
@@ -81,7 +81,11 @@ class DockerImporter(Importer):
         :return: report of the details of the sync
         :rtype:  pulp.plugins.model.SyncReport
         """
-        self.sync_step = sync.SyncStep(repo=repo, conduit=sync_conduit, config=config)
+        if config.get_boolean(constants.CONFIG_KEY_CATALOG_SYNC):
+            self.sync_step = catalog.CatalogSyncStep(repo=repo, conduit=sync_conduit,
+                                                     config=config)
+        else:
+            self.sync_step = sync.SyncStep(repo=repo, conduit=sync_conduit, config=config)
 
         return self.sync_step.process_lifecycle()
 
@@ -141,6 +145,10 @@ class DockerImporter(Importer):
             details.update(unit=dict(type_id=unit.type_id,
                                      unit_key=unit.unit_key,
                                      metadata=self._get_unit_metadata(unit)))
+        if upload_step.tag_report is not None:
+            details.update(tags=upload_step.tag_report)
+        if upload_step.profile_summary is not None:
+            details.update(profile=upload_step.profile_summary)
         return {'success_flag': True, 'summary': '', 'details': details}
 
     @classmethod
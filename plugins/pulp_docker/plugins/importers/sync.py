@@ -4,34 +4,48 @@ This module contains the primary sync entry point for Docker v2 registries.
 from gettext import gettext as _
 import httplib
 import itertools
+import json
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 
 from mongoengine import NotUniqueError
+from nectar.downloaders.threaded import HTTPThreadedDownloader
 
 from pulp.common.plugins import importer_constants
 from pulp.plugins.util import nectar_config, publish_step
 from pulp.plugins.util import misc
 
 from pulp.server.controllers import repository
-from pulp.server.exceptions import MissingValue, PulpCodedException
+from pulp.server.db import model as pulp_models
+from pulp.server.exceptions import (MissingValue, PulpCodedException,
+                                    PulpCodedValidationException)
 
 from pulp_docker.common import constants, error_codes
-from pulp_docker.plugins import models, registry, auth_util
-from pulp_docker.plugins.importers import v1_sync
+from pulp_docker.plugins import (models, registry, auth_util, config_utils, http_pool,
+                                 metadata_fetcher, step_profiling, sync_metrics)
+from pulp_docker.plugins.importers import sync_state, v1_sync
+from pulp_docker.plugins.importers.sync_state import SyncUnit
 
 
 _logger = logging.getLogger(__name__)
 
+# Number of digests looked up in each query on the units Pulp already has
+UNIT_QUERY_PAGE_SIZE = 1000
 
-class SyncStep(publish_step.PluginStep):
+# Number of tags in each shard of a sharded manifest download
+SYNC_SHARD_SIZE = 50
+
+
+class SyncStep(step_profiling.ProfiledTaskMixin, publish_step.PluginStep):
     """
     This PluginStep is the primary entry point into a repository sync against a Docker v2 registry.
     """
     # The sync will fail if these settings are not provided in the config
     required_settings = (constants.CONFIG_KEY_UPSTREAM_NAME, importer_constants.KEY_FEED)
 
-    def __init__(self, repo=None, conduit=None, config=None):
+    def __init__(self, repo=None, conduit=None, config=None, index_repository=None,
+                 working_dir=None):
         """
         This method initializes the SyncStep. It first validates the config to ensure that the
         required keys are present. It then constructs some needed items (such as a download config),
@@ -39,25 +53,39 @@ class SyncStep(publish_step.PluginStep):
         instantiates child tasks that are appropriate for syncing a v2 registry, and if it is not it
         raises a NotImplementedError.
 
-        :param repo:        repository to sync
-        :type  repo:        pulp.plugins.model.Repository
-        :param conduit:     sync conduit to use
-        :type  conduit:     pulp.plugins.conduits.repo_sync.RepoSyncConduit
-        :param config:      config object for the sync
-        :type  config:      pulp.plugins.config.PluginCallConfiguration
+        :param repo:             repository to sync
+        :type  repo:             pulp.plugins.model.Repository
+        :param conduit:          sync conduit to use
+        :type  conduit:          pulp.plugins.conduits.repo_sync.RepoSyncConduit
+        :param config:           config object for the sync
+        :type  config:           pulp.plugins.config.PluginCallConfiguration
+        :param index_repository: v2 repository to sync from, already known to be served by a v2
+                                 registry. The catalog sync passes one sharing its downloaders
+                                 and token. By default one is created from the config.
+        :type  index_repository: pulp_docker.plugins.registry.V2Repository
+        :param working_dir:      working directory of the sync, by default the task's
+        :type  working_dir:      basestring
         """
         super(SyncStep, self).__init__(
             step_type=constants.SYNC_STEP_MAIN, repo=repo, conduit=conduit, config=config,
-            plugin_type=constants.IMPORTER_TYPE_ID)
+            working_dir=working_dir, plugin_type=constants.IMPORTER_TYPE_ID)
         self.description = _('Syncing Docker Repository')
 
         self._validate(config)
+        self.metrics = sync_metrics.SyncMetrics()
         download_config = nectar_config.importer_config_to_nectar_config(config.flatten())
         upstream_name = config.get(constants.CONFIG_KEY_UPSTREAM_NAME)
         url = config.get(importer_constants.KEY_FEED)
-        # The DownloadMetadataSteps will set these to a list of Manifests and Blobs
-        self.available_manifests = []
-        self.available_blobs = []
+        # The DownloadManifestsStep will fill these with SyncUnits for Manifests and Blobs
+        if config.get_boolean(constants.CONFIG_KEY_SYNC_STATE_ON_DISK):
+            self.sync_state_db = sync_state.SyncStateDatabase(
+                os.path.join(self.get_working_dir(), sync_state.DATABASE_FILE_NAME))
+            self.available_manifests = self.sync_state_db.unit_list('available_manifests')
+            self.available_blobs = self.sync_state_db.unit_list('available_blobs')
+        else:
+            self.sync_state_db = None
+            self.available_manifests = sync_state.SyncUnitList()
+            self.available_blobs = sync_state.SyncUnitList()
 
         # Unit keys, populated by v1_sync.GetMetadataStep
         self.v1_available_units = []
@@ -65,19 +93,29 @@ class SyncStep(publish_step.PluginStep):
         self.v1_tags = {}
 
         # Create a Repository object to interact with.
-        self.index_repository = registry.V2Repository(
-            upstream_name, download_config, url, self.get_working_dir())
-        self.v1_index_repository = registry.V1Repository(upstream_name, download_config, url,
-                                                         self.get_working_dir())
+        if index_repository is None:
+            self.index_repository = registry.V2Repository(
+                upstream_name, download_config, url, self.get_working_dir(),
+                **get_metadata_options(config))
+        else:
+            self.index_repository = index_repository
+        self.index_repository.metrics = self.metrics
 
         # determine which API versions are supported and add corresponding steps
         v2_enabled = config.get(constants.CONFIG_KEY_ENABLE_V2, default=True)
         v1_enabled = config.get(constants.CONFIG_KEY_ENABLE_V1, default=False)
+        self.v1_index_repository = None
+        if v1_enabled:
+            self.v1_index_repository = registry.V1Repository(upstream_name, download_config, url,
+                                                             self.get_working_dir())
         if not v2_enabled:
             _logger.debug(_('v2 API skipped due to config'))
         if not v1_enabled:
             _logger.debug(_('v1 API skipped due to config'))
-        v2_found = v2_enabled and self.index_repository.api_version_check()
+        if index_repository is not None:
+            v2_found = v2_enabled
+        else:
+            v2_found = v2_enabled and self.index_repository.api_version_check()
         v1_found = v1_enabled and self.v1_index_repository.api_version_check()
         if v2_found:
             _logger.debug(_('v2 API found'))
@@ -104,10 +142,13 @@ class SyncStep(publish_step.PluginStep):
         # them to be separate steps because we have already downloaded all the Manifests but should
         # only save the new ones, while needing to go download the missing Blobs. Thus they must be
         # handled separately.
-        self.step_get_local_manifests = publish_step.GetLocalUnitsStep(
-            importer_type=constants.IMPORTER_TYPE_ID, available_units=self.available_manifests)
-        self.step_get_local_blobs = publish_step.GetLocalUnitsStep(
-            importer_type=constants.IMPORTER_TYPE_ID, available_units=self.available_blobs)
+        self.step_get_local_manifests = GetLocalV2UnitsStep(
+            available_units=self.available_manifests,
+            new_units=self._new_unit_list('new_manifests'),
+            metrics_phase=sync_metrics.PHASE_GET_LOCAL_MANIFESTS)
+        self.step_get_local_blobs = GetLocalV2UnitsStep(
+            available_units=self.available_blobs, new_units=self._new_unit_list('new_blobs'),
+            metrics_phase=sync_metrics.PHASE_GET_LOCAL_BLOBS)
         self.add_child(self.step_get_local_manifests)
         self.add_child(self.step_get_local_blobs)
         self.add_child(
@@ -116,8 +157,22 @@ class SyncStep(publish_step.PluginStep):
                 repo=self.repo, config=self.config, description=_('Downloading remote files')))
         self.add_child(SaveUnitsStep())
         self.save_tags_step = SaveTagsStep()
+        if self.sync_state_db is not None:
+            self.save_tags_step.tagged_manifests = self.sync_state_db.tag_list('tagged_manifests')
         self.add_child(self.save_tags_step)
 
+    def _new_unit_list(self, name):
+        """
+        :param name: name of the collection in the sync state database
+        :type  name: basestring
+        :return:     an empty collection of SyncUnits, on disk if the sync state is kept on disk
+        :rtype:      pulp_docker.plugins.importers.sync_state.SyncUnitList or
+                     pulp_docker.plugins.importers.sync_state.DiskSyncUnitList
+        """
+        if self.sync_state_db is None:
+            return sync_state.SyncUnitList()
+        return self.sync_state_db.unit_list(name)
+
     def add_v1_steps(self, repo, config):
         """
         Add v1 sync steps.
@@ -142,13 +197,14 @@ class SyncStep(publish_step.PluginStep):
     def generate_download_requests(self):
         """
         a generator that yields DownloadRequest objects based on which units
-        were determined to be needed. This looks at the GetLocalUnits step's
-        output, which includes a list of units that need their files downloaded.
+        were determined to be needed. This looks at the GetLocalV2UnitsStep's
+        new units, the blobs that need their files downloaded.
 
         :return:    generator of DownloadRequest instances
         :rtype:     types.GeneratorType
         """
-        for unit in self.step_get_local_blobs.units_to_download:
+        for unit in self.step_get_local_blobs.new_units:
+            self.metrics.expect_blob(unit.size)
             yield self.index_repository.create_blob_download_request(unit.digest)
 
     def v1_generate_download_requests(self):
@@ -175,6 +231,20 @@ class SyncStep(publish_step.PluginStep):
             yield self.v1_index_repository.create_download_request(unit.image_id, 'layer',
                                                                    destination_dir)
 
+    def process_lifecycle(self):
+        """
+        Run the sync, closing the sync state database and logging the sync's measurements when
+        it is done.
+        """
+        try:
+            return super(SyncStep, self).process_lifecycle()
+        finally:
+            if self.sync_state_db is not None:
+                self.sync_state_db.close()
+            _logger.info(_('Sync metrics of repository %(repo)s: %(metrics)s') % {
+                'repo': self.get_repo().id,
+                'metrics': json.dumps(self.metrics.to_dict(), sort_keys=True)})
+
     @classmethod
     def _validate(cls, config):
         """
@@ -194,7 +264,45 @@ class SyncStep(publish_step.PluginStep):
             raise MissingValue(missing)
 
 
-class DownloadManifestsStep(publish_step.PluginStep):
+def get_metadata_options(config):
+    """
+    Read the settings of the metadata requests of the registry client from the config.
+
+    :param config: config object for the sync
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+    :return:       keyword arguments of registry.V2Repository for the settings
+    :rtype:        dict
+    :raises PulpCodedValidationException: if a setting is not valid
+    """
+    engine = config.get(constants.CONFIG_KEY_METADATA_ENGINE, metadata_fetcher.ENGINE_THREADED)
+    if engine not in metadata_fetcher.ENGINES:
+        raise PulpCodedValidationException(error_code=error_codes.DKR1022,
+                                           field=constants.CONFIG_KEY_METADATA_ENGINE,
+                                           value=engine,
+                                           choices=', '.join(metadata_fetcher.ENGINES))
+    host_limit = config_utils.get_int_setting(config, constants.CONFIG_KEY_METADATA_HOST_LIMIT,
+                                              metadata_fetcher.DEFAULT_HOST_LIMIT)
+    return {'metadata_engine': engine, 'metadata_host_limit': host_limit}
+
+
+class DownloadManifestsStep(sync_metrics.MeasuredStepMixin, publish_step.PluginStep):
+    """
+    Download the manifests of the upstream tags.
+
+    The manifests are fetched one request at a time, so most of the time of a sync of a
+    repository with many tags is spent waiting for the registry. When the
+    manifest_download_threads setting is more than 1, the tag list is split into shards of
+    SYNC_SHARD_SIZE tags, which that many threads download and process into SyncShards. This
+    step's thread merges each shard into the SyncStep's collections as soon as it is done, in the
+    order of the tags, so the collections are only ever written by one thread and each blob is
+    still only kept once.
+
+    Only the waiting for the registry is parallel: the threads share the GIL, so the parsing and
+    hashing of the manifests still use one core, and the units and tags are still saved by one
+    thread in SaveUnitsStep and SaveTagsStep.
+    """
+    metrics_phase = sync_metrics.PHASE_DOWNLOAD_MANIFESTS
+
     def __init__(self, repo=None, conduit=None, config=None):
         """
         :param repo:        repository to sync
@@ -222,28 +330,123 @@ class DownloadManifestsStep(publish_step.PluginStep):
         if whitelist_tags:
             available_tags = list(set(available_tags) & set(whitelist_tags))
 
-        # This will be a set of Blob digests. The set is used because they can be repeated and we
-        # only want to download each layer once.
-        available_blobs = set()
+        # This will be the Blob digests, with the sizes the manifests give. They can be repeated
+        # and we only want to download each layer once. When the sync state is kept on disk, the
+        # digests go straight to the database, which keeps each of them once.
+        if self.parent.sync_state_db is None:
+            available_blobs = sync_state.DigestSizes()
+        else:
+            available_blobs = self.parent.available_blobs.digest_set(models.Blob)
         self.total_units = len(available_tags)
+        threads = config_utils.get_int_setting(
+            self.config, constants.CONFIG_KEY_MANIFEST_DOWNLOAD_THREADS, 1)
+        if threads > 1:
+            self._process_shards(available_tags, available_blobs, threads)
+        else:
+            for tag in available_tags:
+                self._process_tag(tag, available_blobs)
+        # Update the available units with the Blobs we learned about
+        if self.parent.sync_state_db is None:
+            self.parent.available_blobs.extend(SyncUnit(models.Blob, digest, size=size)
+                                               for digest, size in available_blobs.items())
+
+    def _process_shards(self, available_tags, available_blobs, threads):
+        """
+        Process the tags in shards, on a pool of threads, merging each shard as it is done.
+
+        :param available_tags:  the tags to process
+        :type  available_tags:  list
+        :param available_blobs: set of current available blobs accumulated during sync
+        :type  available_blobs: pulp_docker.plugins.importers.sync_state.DigestSizes or
+                                pulp_docker.plugins.importers.sync_state.DigestSet
+        :param threads:         number of shards processed at the same time
+        :type  threads:         int
+        """
+        tag_shards = (available_tags[start:start + SYNC_SHARD_SIZE]
+                      for start in range(0, len(available_tags), SYNC_SHARD_SIZE))
+        pool = ThreadPool(threads)
+        try:
+            for shard in pool.imap(self._process_shard, tag_shards):
+                self.parent.available_manifests.extend(shard.available_manifests)
+                for blob_digest, size in shard.available_blobs.items():
+                    available_blobs.add(blob_digest, size)
+                for tagged_manifest in shard.tagged_manifests:
+                    self.parent.save_tags_step.tagged_manifests.append(tagged_manifest)
+                self.progress_successes += shard.successes
+                self.report_progress()
+        except Exception:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
+    def _process_shard(self, tags):
+        """
+        Process a shard of the tags. This runs on a worker thread, so the results are collected
+        in a SyncShard instead of the SyncStep's collections.
+
+        :param tags: the tags of the shard
+        :type  tags: list
+        :return:     what was learned from the tags
+        :rtype:      SyncShard
+        """
+        shard = SyncShard()
+        for tag in tags:
+            self._process_tag(tag, shard.available_blobs, shard)
+        return shard
+
+    def _process_tag(self, tag, available_blobs, shard=None):
+        """
+        Download and process the manifests of a tag.
+
+        :param tag:             the tag
+        :type  tag:             basestring
+        :param available_blobs: set of current available blobs accumulated during sync
+        :type  available_blobs: pulp_docker.plugins.importers.sync_state.DigestSizes or
+                                pulp_docker.plugins.importers.sync_state.DigestSet
+        :param shard:           the shard collecting the results, or None to add them to the
+                                SyncStep
+        :type  shard:           SyncShard or NoneType
+        """
         man_list = 'application/vnd.docker.distribution.manifest.list.v2+json'
-        for tag in available_tags:
-            manifests = self.parent.index_repository.get_manifest(tag)
-            for manifest in manifests:
-                manifest, digest, content_type = manifest
-                if content_type == man_list:
-                    self._process_manifest_list(manifest, digest, available_blobs, tag)
-                else:
-                    has_foreign_layer = self._process_manifest(manifest, digest, available_blobs,
-                                                               tag)
-                    if has_foreign_layer:
-                        # we don't want to process schema1 manifest with foreign layers
-                        break
-        # Update the available units with the Manifests and Blobs we learned about
-        available_blobs = [models.Blob(digest=d) for d in available_blobs]
-        self.parent.available_blobs.extend(available_blobs)
-
-    def _process_manifest_list(self, manifest_list, digest, available_blobs, tag):
+        manifests = self.parent.index_repository.get_manifest(tag)
+        for manifest in manifests:
+            manifest, digest, content_type = manifest
+            if content_type == man_list:
+                self._process_manifest_list(manifest, digest, available_blobs, tag, shard=shard)
+            else:
+                has_foreign_layer = self._process_manifest(manifest, digest, available_blobs,
+                                                           tag, shard=shard)
+                if has_foreign_layer:
+                    # we don't want to process schema1 manifest with foreign layers
+                    break
+
+    def add_manifest(self, sync_unit):
+        """
+        Add a manifest found upstream to the SyncStep.
+
+        :param sync_unit: the manifest
+        :type  sync_unit: pulp_docker.plugins.importers.sync_state.SyncUnit
+        """
+        self.parent.available_manifests.append(sync_unit)
+        self.progress_successes += 1
+
+    def add_tag(self, tag, sync_unit, manifest_type):
+        """
+        Remember a tag for the SaveTagsStep.
+
+        :param tag:           the tag
+        :type  tag:           basestring
+        :param sync_unit:     the manifest the tag references
+        :type  sync_unit:     pulp_docker.plugins.importers.sync_state.SyncUnit
+        :param manifest_type: constants.MANIFEST_IMAGE_TYPE or constants.MANIFEST_LIST_TYPE
+        :type  manifest_type: basestring
+        """
+        self.parent.save_tags_step.tagged_manifests.append((tag, sync_unit, manifest_type))
+
+    def _process_manifest_list(self, manifest_list, digest, available_blobs, tag, shard=None):
         """
         Process manifest list.
 
@@ -252,27 +455,27 @@ class DownloadManifestsStep(publish_step.PluginStep):
         :param digest: Digest of the manifest list to be processed
         :type digest: basesting
         :param available_blobs: set of current available blobs accumulated dusring sync
-        :type available_blobs: set
+        :type available_blobs: pulp_docker.plugins.importers.sync_state.DigestSizes or
+                               pulp_docker.plugins.importers.sync_state.DigestSet
         :param tag: Tag which the manifest references
         :type tag: basestring
-
-
-        :return: An initialized Manifest List object
-        :rtype: pulp_docker.plugins.models.ManifestList
-
+        :param shard: the shard collecting the results, or None to add them to the SyncStep
+        :type shard: SyncShard or NoneType
         """
+        target = self if shard is None else shard
 
         # Save the manifest list to the working directory
         with open(os.path.join(self.get_working_dir(), digest), 'w') as manifest_file:
             manifest_file.write(manifest_list)
-        manifest_list = models.ManifestList.from_json(manifest_list, digest)
-        self.parent.available_manifests.append(manifest_list)
-        for image_man in manifest_list.manifests:
+        manifest_list = json.loads(manifest_list)
+        sync_unit = SyncUnit(models.ManifestList, digest, manifest_list['schemaVersion'])
+        for image_man in manifest_list['manifests']:
             manifests = self.parent.index_repository.get_manifest(image_man['digest'], headers=True,
                                                                   tag=False)
             manifest, digest, _ = manifests[0]
-            self._process_manifest(manifest, digest, available_blobs, tag=None)
-        if manifest_list.amd64_digest and manifest_list.amd64_schema_version == 2:
+            self._process_manifest(manifest, digest, available_blobs, tag=None, shard=shard)
+        amd64_digest, amd64_schema_version = models.ManifestList.get_amd64_manifest(manifest_list)
+        if amd64_digest and amd64_schema_version == 2:
             try:
                 # for compatibility with older clients, try to fetch schema1 in case it is available
                 # we set the headers to False in order to get the conversion to schema1
@@ -280,17 +483,16 @@ class DownloadManifestsStep(publish_step.PluginStep):
                 manifest, digest, content_type = manifests[0]
                 if content_type in (constants.MEDIATYPE_MANIFEST_S1,
                                     constants.MEDIATYPE_SIGNED_MANIFEST_S1):
-                    self._process_manifest(manifest, digest, available_blobs, tag=tag)
+                    self._process_manifest(manifest, digest, available_blobs, tag=tag, shard=shard)
             except IOError as e:
                 if '404 Client Error' not in str(e):
                     raise
                 pass
+        target.add_manifest(sync_unit)
         # Remember this tag for the SaveTagsStep.
-        self.parent.save_tags_step.tagged_manifests.append((tag, manifest_list,
-                                                            constants.MANIFEST_LIST_TYPE))
-        self.progress_successes += 1
+        target.add_tag(tag, sync_unit, constants.MANIFEST_LIST_TYPE)
 
-    def _process_manifest(self, manifest, digest, available_blobs, tag=None):
+    def _process_manifest(self, manifest, digest, available_blobs, tag=None, shard=None):
         """
         Process manifest.
 
@@ -301,37 +503,164 @@ class DownloadManifestsStep(publish_step.PluginStep):
         :param tag: Tag which the manifest references
         :type tag: basestring
         :param available_blobs: set of current available blobs accumulated dusring sync
-        :type available_blobs: set
+        :type available_blobs: pulp_docker.plugins.importers.sync_state.DigestSizes or
+                               pulp_docker.plugins.importers.sync_state.DigestSet
+        :param shard: the shard collecting the results, or None to add them to the SyncStep
+        :type shard: SyncShard or NoneType
 
         :return: a boolean which indicates if the Manifest has foreign layers
         :rtype: bool
         """
+        target = self if shard is None else shard
 
         # Save the manifest to the working directory
         with open(os.path.join(self.get_working_dir(), digest), 'w') as manifest_file:
             manifest_file.write(manifest)
-        manifest = models.Manifest.from_json(manifest, digest)
-        self.parent.available_manifests.append(manifest)
+        manifest = json.loads(manifest)
+        sync_unit = SyncUnit(models.Manifest, digest, manifest['schemaVersion'])
+        # The layers are read the same way as in models.Manifest.from_json(). Only schema 2
+        # manifests give the sizes of the layers.
+        try:
+            layers = [(layer['digest'], layer['mediaType'], layer.get('size'))
+                      for layer in manifest['layers']]
+            layers.append((manifest['config']['digest'], None, manifest['config'].get('size')))
+        except KeyError:
+            layers = [(layer['blobSum'], None, None) for layer in manifest['fsLayers']]
         has_foreign_layer = False
-        for layer in manifest.fs_layers:
-            if layer.layer_type == constants.FOREIGN_LAYER:
+        for layer_digest, layer_type, layer_size in layers:
+            if layer_type == constants.FOREIGN_LAYER:
                 has_foreign_layer = True
-            else:
-                available_blobs.add(layer.blob_sum)
-        if manifest.config_layer:
-            available_blobs.add(manifest.config_layer)
-        self.progress_successes += 1
+            elif layer_digest:
+                layer_digest = intern(str(layer_digest))
+                available_blobs.add(layer_digest, layer_size)
+        target.add_manifest(sync_unit)
         # Remember this tag for the SaveTagsStep.
         if tag:
-            self.parent.save_tags_step.tagged_manifests.append((tag, manifest,
-                                                                constants.MANIFEST_IMAGE_TYPE))
+            target.add_tag(tag, sync_unit, constants.MANIFEST_IMAGE_TYPE)
         return has_foreign_layer
 
 
-class SaveUnitsStep(publish_step.SaveUnitsStep):
+class SyncShard(object):
+    """
+    What the DownloadManifestsStep learned from a shard of the upstream tags, on a worker thread.
+    """
+
+    def __init__(self):
+        self.available_manifests = []
+        self.available_blobs = sync_state.DigestSizes()
+        self.tagged_manifests = []
+        self.successes = 0
+
+    def add_manifest(self, sync_unit):
+        """
+        :param sync_unit: a manifest found upstream
+        :type  sync_unit: pulp_docker.plugins.importers.sync_state.SyncUnit
+        """
+        self.available_manifests.append(sync_unit)
+        self.successes += 1
+
+    def add_tag(self, tag, sync_unit, manifest_type):
+        """
+        :param tag:           the tag
+        :type  tag:           basestring
+        :param sync_unit:     the manifest the tag references
+        :type  sync_unit:     pulp_docker.plugins.importers.sync_state.SyncUnit
+        :param manifest_type: constants.MANIFEST_IMAGE_TYPE or constants.MANIFEST_LIST_TYPE
+        :type  manifest_type: basestring
+        """
+        self.tagged_manifests.append((tag, sync_unit, manifest_type))
+
+
+class GetLocalV2UnitsStep(sync_metrics.MeasuredStepMixin, publish_step.PluginStep):
+    """
+    Associate the available units Pulp already has with the repository, and build the documents
+    of the others, which need to be downloaded and saved.
+
+    This does the job of publish_step.GetLocalUnitsStep for SyncUnits, looking the units up by
+    digest a page at a time instead of needing a document for every unit found upstream. The
+    documents of the new units are built as units_to_download is iterated over.
+    """
+    def __init__(self, available_units, new_units=None,
+                 metrics_phase=sync_metrics.PHASE_GET_LOCAL_BLOBS):
+        """
+        :param available_units: the units found upstream
+        :type  available_units: pulp_docker.plugins.importers.sync_state.SyncUnitList or
+                                pulp_docker.plugins.importers.sync_state.DiskSyncUnitList
+        :param new_units:       empty collection the units Pulp does not have are added to, by
+                                default an in memory list
+        :type  new_units:       pulp_docker.plugins.importers.sync_state.SyncUnitList or
+                                pulp_docker.plugins.importers.sync_state.DiskSyncUnitList
+        :param metrics_phase:   phase of the sync measurements the step is measured as
+        :type  metrics_phase:   basestring
+        """
+        super(GetLocalV2UnitsStep, self).__init__(step_type=constants.SYNC_STEP_GET_LOCAL,
+                                                  plugin_type=constants.IMPORTER_TYPE_ID)
+        self.metrics_phase = metrics_phase
+        self.available_units = available_units
+        self.new_units = sync_state.SyncUnitList() if new_units is None else new_units
+        self.units_to_download = sync_state.UnitDocuments(self.new_units, self._build_unit)
+
+    def process_main(self, item=None):
+        """
+        Sort the available units into those to associate and those to download.
+        """
+        metrics = self.parent.metrics
+        for model, units in self.available_units.pages(UNIT_QUERY_PAGE_SIZE):
+            known_units = dict(
+                (unit.digest, unit) for unit in
+                model.objects.filter(digest__in=[u.digest for u in units]).only('id', 'digest'))
+            metrics.record_db(sync_metrics.DB_QUERY)
+            ids_in_repo = self._find_in_repo(model, known_units.values())
+            new_units = []
+            for unit in units:
+                known_unit = known_units.get(unit.digest)
+                if known_unit is None:
+                    new_units.append(unit)
+                elif known_unit.id not in ids_in_repo:
+                    repository.associate_single_unit(self.get_repo().repo_obj, known_unit)
+                    metrics.record_db(sync_metrics.DB_ASSOCIATE)
+            self.new_units.extend(new_units)
+
+    def _find_in_repo(self, model, units):
+        """
+        :param model: the units' model class
+        :type  model: type
+        :param units: units Pulp already has
+        :type  units: list
+        :return:      ids of the units that are already in the repository
+        :rtype:       set
+        """
+        if not units:
+            return set()
+        unit_qs = pulp_models.RepositoryContentUnit.objects.filter(
+            repo_id=self.get_repo().id,
+            unit_type_id=model._content_type_id.default,
+            unit_id__in=[unit.id for unit in units]).values_list('unit_id')
+        self.parent.metrics.record_db(sync_metrics.DB_QUERY)
+        return set(unit_qs)
+
+    def _build_unit(self, sync_unit):
+        """
+        Build the document of a unit that is new to Pulp. Manifests are read back from the working
+        directory, where the DownloadManifestsStep saved them.
+
+        :param sync_unit: the unit found upstream
+        :type  sync_unit: SyncUnit
+        :return:          the unit to download and save
+        :rtype:           pulp.server.db.model.FileContentUnit
+        """
+        if sync_unit.model is models.Blob:
+            return models.Blob(digest=sync_unit.digest)
+        with open(os.path.join(self.get_working_dir(), sync_unit.digest)) as manifest_file:
+            return sync_unit.model.from_json(manifest_file.read(), sync_unit.digest)
+
+
+class SaveUnitsStep(sync_metrics.MeasuredStepMixin, publish_step.SaveUnitsStep):
     """
     Save the Units that need to be added to the repository and move them to the content folder.
     """
+    metrics_phase = sync_metrics.PHASE_SAVE_UNITS
+
     def __init__(self):
         """
         Initialize the step, setting its description.
@@ -359,25 +688,32 @@ class SaveUnitsStep(publish_step.SaveUnitsStep):
         :param item: The Unit to save in Pulp.
         :type  item: pulp.server.db.model.FileContentUnit
         """
+        metrics = self.parent.metrics
         item.set_storage_path(item.digest)
         try:
+            metrics.record_db(sync_metrics.DB_SAVE)
             item.save_and_import_content(os.path.join(self.get_working_dir(), item.digest))
         except NotUniqueError:
             item = item.__class__.objects.get(**item.unit_key)
+            metrics.record_db(sync_metrics.DB_QUERY)
         repository.associate_single_unit(self.get_repo().repo_obj, item)
+        metrics.record_db(sync_metrics.DB_ASSOCIATE)
 
 
-class SaveTagsStep(publish_step.SaveUnitsStep):
+class SaveTagsStep(sync_metrics.MeasuredStepMixin, publish_step.SaveUnitsStep):
     """
     Create or update Tag objects to reflect the tags that we found during the sync.
     """
+    metrics_phase = sync_metrics.PHASE_SAVE_TAGS
+
     def __init__(self):
         """
         Initialize the step, setting its description.
         """
         super(SaveTagsStep, self).__init__(step_type=constants.SYNC_STEP_SAVE)
         self.description = _('Saving Tags')
-        # This list contains tuple of (tag, manifest)
+        # This list contains tuples of (tag, SyncUnit, manifest_type). The SyncStep replaces it
+        # with a collection in its database when the sync state is kept on disk.
         self.tagged_manifests = []
 
     def process_main(self):
@@ -387,23 +723,27 @@ class SaveTagsStep(publish_step.SaveUnitsStep):
         create one. We'll rely on the uniqueness constraint in MongoDB to allow us to try to create
         it, and if that fails we'll fall back to updating the existing one.
         """
+        metrics = self.parent.metrics
         self.total_units = len(self.tagged_manifests)
         for tag, manifest, manifest_type in self.tagged_manifests:
             new_tag = models.Tag.objects.tag_manifest(repo_id=self.get_repo().repo_obj.repo_id,
                                                       tag_name=tag, manifest_digest=manifest.digest,
                                                       schema_version=manifest.schema_version,
                                                       manifest_type=manifest_type)
+            metrics.record_db(sync_metrics.DB_TAG)
             if new_tag:
                 repository.associate_single_unit(self.get_repo().repo_obj, new_tag)
+                metrics.record_db(sync_metrics.DB_ASSOCIATE)
                 self.progress_successes += 1
 
 
-class AuthDownloadStep(publish_step.DownloadStep):
+class AuthDownloadStep(sync_metrics.MeasuredStepMixin, publish_step.DownloadStep):
     """
     Download remote files. For v2, this may require authentication. This step attempts
     to download files, and if it fails due to a 401, it will retry with basic auth if the auth
     scheme is Basic, or retrieve the auth token and retry the download if the scheme is Bearer.
     """
+    metrics_phase = sync_metrics.PHASE_DOWNLOAD_BLOBS
 
     def __init__(self, step_type, downloads=None, repo=None, conduit=None, config=None,
                  working_dir=None, plugin_type=None, description=''):
@@ -425,6 +765,19 @@ class AuthDownloadStep(publish_step.DownloadStep):
         self._requests_map = {}
         self._failed_download_urls = []
 
+    def initialize(self):
+        """
+        Make the downloader use the shared connections, and start with the token of the
+        registry client, which is valid for the blobs of the same repository.
+        """
+        super(AuthDownloadStep, self).initialize()
+        if isinstance(self.downloader, HTTPThreadedDownloader):
+            http_pool.share_connections(self.downloader)
+            token = self.parent.index_repository.token
+            if token:
+                self.downloader.extra_headers = auth_util.update_token_auth_header(
+                    self.downloader.extra_headers, token)
+
     def process_main(self, item=None):
         """
         Allow request objects to be available after a download fails.
@@ -447,18 +800,18 @@ class AuthDownloadStep(publish_step.DownloadStep):
         if report.error_report.get('response_code') == httplib.UNAUTHORIZED:
             request = self._requests_map[report.url]
             auth_header = report.headers.get('www-authenticate')
+            self._record_download(report)
 
             if auth_header is None:
                 raise IOError("401 responses are expected to contain authentication information")
+            self.parent.metrics.record_auth_retry()
             if "Basic" in auth_header:
                 self.downloader.extra_headers = auth_util.update_basic_auth_header(
                     self.downloader.extra_headers,
                     self.basic_auth_username, self.basic_auth_password)
                 _logger.debug(_('Download unauthorized, retrying with basic authentication'))
             else:
-                token = auth_util.request_token(self.parent.index_repository.auth_downloader,
-                                                request, auth_header,
-                                                self.parent.index_repository.name)
+                token = self.parent.index_repository.request_token(request, auth_header)
                 self.downloader.extra_headers = auth_util.update_token_auth_header(
                     self.downloader.extra_headers, token)
                 # Remove auth from config to not overwrite bearer token in headers
@@ -471,8 +824,31 @@ class AuthDownloadStep(publish_step.DownloadStep):
         if report.state is report.DOWNLOAD_SUCCEEDED:
             self.download_succeeded(report)
         elif report.state is report.DOWNLOAD_FAILED:
+            self._record_download(report)
             super(AuthDownloadStep, self).download_failed(report)
             # Docker blobs have ancestry relationships and need all blobs to function. Sync should
             # stop immediately to prevent publishing of an incomplete repository.
             self._failed_download_urls.append(report.url)
             self.downloader.cancel()
+
+    def download_succeeded(self, report):
+        """
+        Record the download in the sync's measurements.
+
+        :param report: download report
+        :type  report: nectar.report.DownloadReport
+        """
+        self._record_download(report)
+        super(AuthDownloadStep, self).download_succeeded(report)
+
+    def _record_download(self, report):
+        """
+        :param report: report of a blob download
+        :type  report: nectar.report.DownloadReport
+        """
+        seconds = 0.0
+        if report.start_time and report.finish_time:
+            seconds = (report.finish_time - report.start_time).total_seconds()
+        self.parent.metrics.record_request(sync_metrics.ENDPOINT_BLOBS, seconds,
+                                           failed=report.state == report.DOWNLOAD_FAILED,
+                                           size=report.bytes_downloaded)
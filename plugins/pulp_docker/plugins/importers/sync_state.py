@@ -0,0 +1,319 @@
+"""
+Collections holding what a v2 sync learns about the upstream repository until it is saved.
+
+A sync keeps a record of every manifest, blob and tag found upstream until the end of the sync.
+These are normally kept in memory. For huge repositories they can be kept in a sqlite database
+in the working directory instead, so the memory used by the sync does not grow with the size of
+the repository. The database only lives as long as the sync, so it is written without a journal
+and without waiting for the disk.
+"""
+import sqlite3
+
+from pulp_docker.plugins import models
+
+
+# Name of the database file in the sync's working directory
+DATABASE_FILE_NAME = 'sync_state.sqlite'
+
+# Number of rows read from the database at a time
+READ_PAGE_SIZE = 1000
+
+# The models of the units found upstream, by content type id
+SYNC_MODELS = dict((model._content_type_id.default, model)
+                   for model in (models.Blob, models.Manifest, models.ManifestList))
+
+
+class SyncUnit(object):
+    """
+    A compact record of a Manifest, ManifestList or Blob found upstream. Syncs of large
+    repositories keep one of these per unit for the whole sync, so the documents are only built,
+    by GetLocalV2UnitsStep, for the units Pulp does not have yet.
+    """
+    __slots__ = ('model', 'digest', 'schema_version', 'size')
+
+    def __init__(self, model, digest, schema_version=None, size=None):
+        """
+        :param model:          the unit's model class
+        :type  model:          type
+        :param digest:         the unit's digest
+        :type  digest:         basestring
+        :param schema_version: schema version of a manifest
+        :type  schema_version: int or NoneType
+        :param size:           size of a blob, when a schema 2 manifest gives it
+        :type  size:           int or NoneType
+        """
+        self.model = model
+        # the same digests are referenced by many manifests and tags, keep a single copy of each
+        self.digest = intern(str(digest))
+        self.schema_version = schema_version
+        self.size = size
+
+
+class SyncUnitList(list):
+    """
+    In memory list of SyncUnits.
+    """
+
+    def pages(self, page_size):
+        """
+        Iterate over the units a page at a time, leaving out repeated units.
+
+        :param page_size: maximum number of units in a page
+        :type  page_size: int
+        :return:          generator of the model of the units, and the units of a page sorted by
+                          digest
+        :rtype:           generator of (type, list of SyncUnit)
+        """
+        units_by_model = {}
+        for unit in self:
+            units_by_model.setdefault(unit.model, {})[unit.digest] = unit
+        for model, units in units_by_model.items():
+            digests = sorted(units)
+            for start in range(0, len(digests), page_size):
+                yield model, [units[digest] for digest in digests[start:start + page_size]]
+
+
+class DigestSizes(dict):
+    """
+    In memory digests of the blobs found upstream, with their sizes when a manifest gives them.
+    """
+
+    def add(self, digest, size=None):
+        """
+        :param digest: digest of the blob
+        :type  digest: basestring
+        :param size:   size of the blob, None if the manifest does not give it
+        :type  size:   int or NoneType
+        """
+        if size is not None or digest not in self:
+            self[digest] = size
+
+
+class SyncStateDatabase(object):
+    """
+    sqlite database holding the collections of a sync.
+
+    The collections never keep a cursor open between two reads, so units can be added to one
+    collection while another one is read.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the database file to create
+        :type  path: basestring
+        """
+        # autocommit, the database is not kept after the sync and does not need transactions
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.text_factory = str
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+
+    def unit_list(self, name):
+        """
+        :param name: name of the collection, used as the name of its table
+        :type  name: basestring
+        :return:     a new empty collection of SyncUnits
+        :rtype:      DiskSyncUnitList
+        """
+        return DiskSyncUnitList(self.connection, name)
+
+    def tag_list(self, name):
+        """
+        :param name: name of the collection, used as the name of its table
+        :type  name: basestring
+        :return:     a new empty collection of tagged manifests
+        :rtype:      DiskTagList
+        """
+        return DiskTagList(self.connection, name)
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self.connection.close()
+
+
+class DiskSyncUnitList(object):
+    """
+    Collection of SyncUnits stored in a SyncStateDatabase. Each unit is only stored once, adding
+    a unit that is already in the collection only sets its size if it did not have one.
+    """
+
+    def __init__(self, connection, name):
+        """
+        :param connection: connection to the database
+        :type  connection: sqlite3.Connection
+        :param name:       name of the table to create
+        :type  name:       basestring
+        """
+        self.connection = connection
+        self.name = name
+        self.connection.execute(
+            'CREATE TABLE %s (model TEXT NOT NULL, digest TEXT NOT NULL, schema_version INTEGER, '
+            'size INTEGER, PRIMARY KEY (model, digest))' % name)
+
+    def append(self, unit):
+        """
+        :param unit: unit to add
+        :type  unit: SyncUnit
+        """
+        self.extend([unit])
+
+    def extend(self, units):
+        """
+        :param units: units to add
+        :type  units: iterable of SyncUnit
+        """
+        units = list(units)
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO %s VALUES (?, ?, ?, ?)' % self.name,
+            ((unit.model._content_type_id.default, unit.digest, unit.schema_version, unit.size)
+             for unit in units))
+        # a blob found in a schema 1 manifest first only gets its size from a schema 2 manifest
+        self.connection.executemany(
+            'UPDATE %s SET size = ? WHERE model = ? AND digest = ? AND size IS NULL' % self.name,
+            ((unit.size, unit.model._content_type_id.default, unit.digest)
+             for unit in units if unit.size is not None))
+
+    def digest_set(self, model):
+        """
+        Get a set-like view of the digests of the units of a model, whose add() method adds a
+        unit to this collection.
+
+        :param model: the model of the units added through the view
+        :type  model: type
+        :return:      the view
+        :rtype:       DigestSet
+        """
+        return DigestSet(self, model)
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM %s' % self.name).fetchone()[0]
+
+    def __iter__(self):
+        for model, units in self.pages(READ_PAGE_SIZE):
+            for unit in units:
+                yield unit
+
+    def pages(self, page_size):
+        """
+        Iterate over the units a page at a time.
+
+        :param page_size: maximum number of units in a page
+        :type  page_size: int
+        :return:          generator of the model of the units, and the units of a page sorted by
+                          digest
+        :rtype:           generator of (type, list of SyncUnit)
+        """
+        type_ids = [row[0] for row in
+                    self.connection.execute('SELECT DISTINCT model FROM %s' % self.name)]
+        for type_id in type_ids:
+            model = SYNC_MODELS[type_id]
+            last_digest = ''
+            while True:
+                rows = self.connection.execute(
+                    'SELECT digest, schema_version, size FROM %s WHERE model = ? AND digest > ? '
+                    'ORDER BY digest LIMIT ?' % self.name,
+                    (type_id, last_digest, page_size)).fetchall()
+                if not rows:
+                    break
+                yield model, [SyncUnit(model, digest, schema_version, size)
+                              for digest, schema_version, size in rows]
+                last_digest = rows[-1][0]
+
+
+class DigestSet(object):
+    """
+    Add units of one model to a DiskSyncUnitList by digest.
+    """
+
+    def __init__(self, unit_list, model):
+        """
+        :param unit_list: the collection the units are added to
+        :type  unit_list: DiskSyncUnitList
+        :param model:     the model of the units
+        :type  model:     type
+        """
+        self.unit_list = unit_list
+        self.model = model
+
+    def add(self, digest, size=None):
+        """
+        :param digest: digest of the unit to add
+        :type  digest: basestring
+        :param size:   size of the unit, None if it is not known
+        :type  size:   int or NoneType
+        """
+        self.unit_list.append(SyncUnit(self.model, digest, size=size))
+
+
+class DiskTagList(object):
+    """
+    Collection of the (tag, SyncUnit, manifest_type) tuples of the SaveTagsStep, stored in a
+    SyncStateDatabase, in the order they are added.
+    """
+
+    def __init__(self, connection, name):
+        """
+        :param connection: connection to the database
+        :type  connection: sqlite3.Connection
+        :param name:       name of the table to create
+        :type  name:       basestring
+        """
+        self.connection = connection
+        self.name = name
+        self.connection.execute(
+            'CREATE TABLE %s (position INTEGER PRIMARY KEY, tag TEXT NOT NULL, '
+            'model TEXT NOT NULL, digest TEXT NOT NULL, schema_version INTEGER, '
+            'manifest_type TEXT NOT NULL)' % name)
+
+    def append(self, tagged_manifest):
+        """
+        :param tagged_manifest: the tag, the manifest it references and the manifest's type
+        :type  tagged_manifest: tuple of (basestring, SyncUnit, basestring)
+        """
+        tag, unit, manifest_type = tagged_manifest
+        self.connection.execute(
+            'INSERT INTO %s (tag, model, digest, schema_version, manifest_type) '
+            'VALUES (?, ?, ?, ?, ?)' % self.name,
+            (tag, unit.model._content_type_id.default, unit.digest, unit.schema_version,
+             manifest_type))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM %s' % self.name).fetchone()[0]
+
+    def __iter__(self):
+        last_position = 0
+        while True:
+            rows = self.connection.execute(
+                'SELECT position, tag, model, digest, schema_version, manifest_type FROM %s '
+                'WHERE position > ? ORDER BY position LIMIT ?' % self.name,
+                (last_position, READ_PAGE_SIZE)).fetchall()
+            if not rows:
+                break
+            for position, tag, type_id, digest, schema_version, manifest_type in rows:
+                yield tag, SyncUnit(SYNC_MODELS[type_id], digest, schema_version), manifest_type
+            last_position = rows[-1][0]
+
+
+class UnitDocuments(object):
+    """
+    Iterable over the documents of a collection of SyncUnits, built as they are needed.
+    """
+
+    def __init__(self, units, build_unit):
+        """
+        :param units:      the units
+        :type  units:      SyncUnitList or DiskSyncUnitList
+        :param build_unit: function building the document of a unit
+        :type  build_unit: callable
+        """
+        self.units = units
+        self.build_unit = build_unit
+
+    def __len__(self):
+        return len(self.units)
+
+    def __iter__(self):
+        for unit in self.units:
+            yield self.build_unit(unit)
@@ -15,31 +15,60 @@ If you feel the need to blame this file, don't use git blame. The code was taken
 which was later negative committed:
 
 https://github.com/pulp/pulp_docker/commit/cc624a1c9ca4fd805e66e0cef646e0302a35da12
+
+The v2 exports of the export distributor can be uploaded as well, which applies the exported
+content, and for delta exports the removals, to the repository.
+
+Images can also be imported without tarring them, from a skopeo directory or an OCI image layout
+on the Pulp server. The blobs are validated and imported straight from the directory, which must
+be in one of the directories listed in the upload_directories setting of the importer.
 """
 from gettext import gettext as _
 import contextlib
 import functools
-import gzip
+import hashlib
 import json
 import os
+import re
+import shutil
 import stat
 import tarfile
 
-from mongoengine import NotUniqueError, Q
+from mongoengine import NotUniqueError
 
 from pulp.plugins.util.publish_step import PluginStep, GetLocalUnitsStep
 from pulp.server.db import model as pulp_models
 
 from pulp_docker.common import constants, error_codes, tarutils
 from pulp_docker.common.dir_transport import Version
-from pulp_docker.plugins import models
+from pulp_docker.plugins import compression, config_utils, models, step_profiling
 from pulp_docker.plugins.importers import v1_sync
 from pulp.plugins.util import verification
 from pulp.server.controllers import repository
 from pulp.server.exceptions import PulpCodedValidationException
 
 
-class UploadStep(PluginStep):
+# Version of the export manifest written by the export distributor that can be imported
+EXPORT_MANIFEST_VERSION = 1
+# Path of a Blob, Manifest or Manifest List in an export
+EXPORT_BLOB_PATH = re.compile(r'^blobs/(\w+)/([0-9a-f]+)$')
+# Kinds of units added and removed by an export, and the fields of its Tags
+EXPORT_UNIT_KINDS = ('blobs', 'manifests', 'manifest_lists')
+EXPORT_TAG_FIELDS = ('name', 'manifest_digest', 'schema_version', 'manifest_type')
+# Files of a skopeo directory that are extracted before the blobs are processed
+SKOPEO_METADATA_FILES = ('manifest.json', 'version')
+# Size of the reads when streaming a blob out of an uploaded tar file
+BLOB_CHUNK_SIZE = 1024 * 1024
+# Valid gzip compression levels of v1 layers
+COMPRESSION_LEVELS = range(1, 10)
+# Index of the manifests of an OCI image layout
+OCI_INDEX_FILE_NAME = 'index.json'
+# Media types of the manifests of an OCI image layout that can be imported
+OCI_MANIFEST_TYPES = (constants.MEDIATYPE_MANIFEST_S2, constants.MEDIATYPE_MANIFEST_S1,
+                      constants.MEDIATYPE_SIGNED_MANIFEST_S1)
+
+
+class UploadStep(step_profiling.ProfiledTaskMixin, PluginStep):
     """
     This is the parent step for Image uploads.
     """
@@ -73,14 +102,30 @@ class UploadStep(PluginStep):
         self.available_units = []
         self.uploaded_unit = None
 
+        # Result of each tag of a bulk tag update by tag name, populated by UpdateTags
+        self.tag_report = None
+
         # populated by ProcessMetadata
         self.v1_tags = {}
+
+        # Members of the uploaded tar file by file name, populated by ProcessManifest
+        self.archive_members = {}
+
+        # Imported directory, and the paths of its Manifests and Blobs by digest, populated by
+        # ProcessDirectory
+        self.directory = None
+        self.unit_paths = {}
         if type_id == models.Image._content_type_id.default:
             self._handle_image()
         elif type_id == models.Tag._content_type_id.default:
             self._handle_tag(metadata)
         elif type_id == models.Manifest._content_type_id.default:
-            self._handle_image_manifest()
+            if metadata and metadata.get(constants.UPLOAD_KEY_EXPORT_ARCHIVE):
+                self._handle_export_archive()
+            elif metadata and metadata.get(constants.UPLOAD_KEY_DIRECTORY):
+                self._handle_directory(metadata[constants.UPLOAD_KEY_DIRECTORY])
+            else:
+                self._handle_image_manifest()
         elif type_id == models.ManifestList._content_type_id.default:
             self._handle_manifest_list()
         else:
@@ -103,7 +148,10 @@ class UploadStep(PluginStep):
         """
 
         self.metadata = metadata
-        self.add_child(AddTags(step_type=constants.UPLOAD_STEP_SAVE))
+        if constants.UPLOAD_KEY_TAGS in metadata or constants.UPLOAD_KEY_REMOVE_TAGS in metadata:
+            self.add_child(UpdateTags(step_type=constants.UPLOAD_TAG_STEP))
+        else:
+            self.add_child(AddTags(step_type=constants.UPLOAD_STEP_SAVE))
 
     def _handle_image_manifest(self):
         """
@@ -118,6 +166,23 @@ class UploadStep(PluginStep):
         """
         self.add_child(AddManifestList(constants.UPLOAD_STEP_MANIFEST_LIST))
 
+    def _handle_export_archive(self):
+        """
+        Handles the upload of a v2 export of the export distributor
+        """
+        self.add_child(ImportExport(constants.UPLOAD_STEP_EXPORT_ARCHIVE))
+
+    def _handle_directory(self, directory):
+        """
+        Handles the import of a skopeo directory or an OCI image layout on the server
+
+        :param directory: path of the directory
+        :type  directory: basestring
+        """
+        self.directory = directory
+        self.add_child(ProcessDirectory(constants.UPLOAD_STEP_DIRECTORY))
+        self.add_child(AddDirectoryUnits(step_type=constants.UPLOAD_STEP_SAVE))
+
 
 class ProcessMetadata(PluginStep):
     """
@@ -234,11 +299,21 @@ class ProcessManifest(PluginStep):
 
     def initialize(self):
         """
-        Extract the tarfile to get all the layers from it.
+        Read the headers of the tar file in a single pass, extracting only the manifest and the
+        version file. The blobs are streamed out of the tar file by AddUnits, and only if they
+        need to be imported.
         """
-        # Brute force, extract the tar file for now
+        members = {}
         with contextlib.closing(tarfile.open(self.parent.file_path)) as archive:
-            archive.extractall(self.get_working_dir())
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = os.path.basename(member.name)
+                members[name] = member
+                if name in SKOPEO_METADATA_FILES:
+                    with open(os.path.join(self.get_working_dir(), name), 'wb') as metadata_file:
+                        shutil.copyfileobj(archive.extractfile(member), metadata_file)
+        self.parent.archive_members = members
 
     def process_main(self):
         """
@@ -251,7 +326,8 @@ class ProcessManifest(PluginStep):
         self.parent.available_units.append(manifest)
         self.parent.available_units.extend(self.get_models(manifest))
 
-    def get_models(self, manifest):
+    @staticmethod
+    def get_models(manifest):
         """
         Given an image manifest, returns model instances to represent each blob of the image defined
         by the unit_key.
@@ -277,12 +353,24 @@ class ProcessManifest(PluginStep):
 class AddImages(v1_sync.SaveImages):
     """
     Add Images from metadata extracted in the ProcessMetadata step.
+
+    Each layer.tar is gzipped into the layer file that the v1 publish serves. The compression
+    level, the size of the blocks read from layer.tar, and the number of threads compressing
+    the blocks of a layer in parallel can be set in the importer configuration.
     """
 
     def initialize(self):
         """
-        Extract the tarfile to get all the layers from it.
+        Extract the tarfile to get all the layers from it, and read the compression settings.
         """
+        config = self.get_config()
+        self.compression_level = config_utils.get_int_setting(
+            config, constants.CONFIG_KEY_UPLOAD_COMPRESSION_LEVEL, None, COMPRESSION_LEVELS)
+        self.compression_threads = config_utils.get_int_setting(
+            config, constants.CONFIG_KEY_UPLOAD_COMPRESSION_THREADS, 1)
+        self.buffer_size = config_utils.get_int_setting(
+            config, constants.CONFIG_KEY_UPLOAD_BUFFER_SIZE, compression.DEFAULT_BLOCK_SIZE)
+
         # Brute force, extract the tar file for now
         with contextlib.closing(tarfile.open(self.parent.file_path)) as archive:
             archive.extractall(self.get_working_dir())
@@ -313,12 +401,8 @@ class AddImages(v1_sync.SaveImages):
         # compress layer.tar to a new file called layer
         layer_src_path = os.path.join(self.get_working_dir(), item.image_id, 'layer.tar')
         layer_dest_path = os.path.join(self.get_working_dir(), item.image_id, 'layer')
-        with open(layer_src_path) as layer_src:
-            with contextlib.closing(gzip.open(layer_dest_path, 'w')) as layer_dest:
-                # these can be big files, so we chunk them
-                reader = functools.partial(layer_src.read, 4096)
-                for chunk in iter(reader, ''):
-                    layer_dest.write(chunk)
+        compression.gzip_file(layer_src_path, layer_dest_path, self.compression_level,
+                              self.compression_threads, self.buffer_size)
         # we don't need layer.tar anymore
         os.remove(layer_src_path)
 
@@ -351,29 +435,22 @@ class AddTags(PluginStep):
                                                field='manifest_digest')
         pulp_user_metadata = md.get('pulp_user_metadata')
         repo_id = self.parent.repo.id
-        manifest_type_id = models.Manifest._content_type_id.default
-        repo_manifest_ids = repository.get_associated_unit_ids(repo_id, manifest_type_id)
 
-        # check if there is manifest with such id within the queried repo
         # since we don't know if the provided digest is of an image manifest or manifest list
         # we need to try both.
-        manifests = models.Manifest.objects.filter(digest=digest, id__in=repo_manifest_ids)
+        manifest = self._find_in_repo(models.Manifest, digest, repo_id)
         manifest_type = constants.MANIFEST_IMAGE_TYPE
-        if manifests.count() == 0:
-            manifest_list_type_id = models.ManifestList._content_type_id.default
-            repo_manifest_list_ids = repository.get_associated_unit_ids(
-                repo_id, manifest_list_type_id)
-            manifests = models.ManifestList.objects.filter(digest=digest,
-                                                           id__in=repo_manifest_list_ids)
+        if manifest is None:
+            manifest = self._find_in_repo(models.ManifestList, digest, repo_id)
             manifest_type = constants.MANIFEST_LIST_TYPE
-            if manifests.count() == 0:
+            if manifest is None:
                 raise PulpCodedValidationException(error_code=error_codes.DKR1010,
                                                    digest=digest,
                                                    repo_id=repo_id)
 
         new_tag = models.Tag.objects.tag_manifest(repo_id=self.parent.repo.id, tag_name=tag,
                                                   manifest_digest=digest,
-                                                  schema_version=manifests[0].schema_version,
+                                                  schema_version=manifest.schema_version,
                                                   manifest_type=manifest_type,
                                                   pulp_user_metadata=pulp_user_metadata)
 
@@ -381,6 +458,151 @@ class AddTags(PluginStep):
             repository.associate_single_unit(self.parent.repo.repo_obj, new_tag)
         self.parent.uploaded_unit = new_tag
 
+    @staticmethod
+    def _find_in_repo(model, digest, repo_id):
+        """
+        Find the unit with the given digest, if it is associated with the repository. Only the
+        unit with the digest and its association are looked up, both by index.
+
+        :param model:   Manifest or ManifestList
+        :type  model:   type
+        :param digest:  digest of the manifest
+        :type  digest:  basestring
+        :param repo_id: id of the repository
+        :type  repo_id: basestring
+        :return:        the unit, or None if it is not in the repository
+        :rtype:         pulp_docker.plugins.models.Manifest or
+                        pulp_docker.plugins.models.ManifestList or None
+        """
+        unit = model.objects.filter(digest=digest).only('id', 'schema_version').first()
+        if unit is None:
+            return None
+        associations = pulp_models.RepositoryContentUnit.objects.filter(
+            repo_id=repo_id, unit_type_id=model._content_type_id.default, unit_id=unit.id)
+        if associations.count() == 0:
+            return None
+        return unit
+
+
+class UpdateTags(PluginStep):
+    """
+    Create, update and remove many tags of the repository at once, reporting the result for
+    each tag.
+    """
+
+    def process_main(self, item=None):
+        """
+        Point the tags of the parent metadata to their digests, and remove the tags it lists for
+        removal. A tag that is both pointed to a digest and listed for removal is kept.
+
+        :param item: Not used by this step
+        :type  item: None
+        """
+        md = self.parent.metadata
+        tags = md.get(constants.UPLOAD_KEY_TAGS) or {}
+        if not isinstance(tags, dict) or \
+                not all(isinstance(digest, basestring) for digest in tags.values()):
+            raise PulpCodedValidationException(error_code=error_codes.DKR1026,
+                                               field=constants.UPLOAD_KEY_TAGS,
+                                               expected=_('a mapping of tag names to digests'))
+        remove_tags = md.get(constants.UPLOAD_KEY_REMOVE_TAGS) or []
+        if not isinstance(remove_tags, list):
+            raise PulpCodedValidationException(error_code=error_codes.DKR1026,
+                                               field=constants.UPLOAD_KEY_REMOVE_TAGS,
+                                               expected=_('a list of tag names'))
+
+        repo = self.get_repo()
+        report = {}
+        manifests = self._find_in_repo(set(tags.values()), repo.id)
+        to_tag = []
+        for tag_name, digest in sorted(tags.items()):
+            manifest = manifests.get(digest)
+            if manifest is None:
+                report[tag_name] = {'digest': digest,
+                                    'result': constants.TAG_RESULT_MISSING_MANIFEST}
+                continue
+            schema_version, manifest_type = manifest
+            to_tag.append((tag_name, digest, schema_version, manifest_type))
+
+        results = models.Tag.objects.tag_manifests(repo.id, to_tag)
+        tag_ids_in_repo = self._associated_ids(
+            models.Tag, [tag.id for tag, result in results
+                         if result != constants.TAG_RESULT_FAILED], repo.id)
+        for tag, result in results:
+            if result != constants.TAG_RESULT_FAILED and tag.id not in tag_ids_in_repo:
+                repository.associate_single_unit(repo.repo_obj, tag)
+                if result == constants.TAG_RESULT_UNCHANGED:
+                    result = constants.TAG_RESULT_CREATED
+            report_entry = report.setdefault(tag.name, {'digest': tag.manifest_digest,
+                                                        'result': result})
+            if result != constants.TAG_RESULT_UNCHANGED:
+                # a tag pointing to manifests of several schema versions reports any change
+                report_entry['result'] = result
+
+        remove_tags = sorted(set(remove_tags) - set(tags))
+        if remove_tags:
+            removed = list(models.Tag.objects.filter(repo_id=repo.id, name__in=remove_tags))
+            removed_ids = self._associated_ids(models.Tag, [tag.id for tag in removed], repo.id)
+            removed = [tag for tag in removed if tag.id in removed_ids]
+            if removed:
+                repository.disassociate_units(repo.repo_obj, removed)
+            removed_names = set(tag.name for tag in removed)
+            for tag_name in remove_tags:
+                if tag_name in removed_names:
+                    report[tag_name] = {'result': constants.TAG_RESULT_REMOVED}
+                else:
+                    report[tag_name] = {'result': constants.TAG_RESULT_NOT_FOUND}
+
+        self.parent.tag_report = report
+
+    @classmethod
+    def _find_in_repo(cls, digests, repo_id):
+        """
+        Find which of the digests are of image manifests or manifest lists in the repository,
+        with one query per unit type and one on the repository's associations.
+
+        :param digests: digests of the manifests to tag
+        :type  digests: set
+        :param repo_id: id of the repository
+        :type  repo_id: basestring
+        :return:        schema version and manifest type of the manifests in the repository,
+                        by digest
+        :rtype:         dict
+        """
+        found = {}
+        for model, manifest_type in ((models.Manifest, constants.MANIFEST_IMAGE_TYPE),
+                                     (models.ManifestList, constants.MANIFEST_LIST_TYPE)):
+            remaining = sorted(digests - set(found))
+            if not remaining:
+                break
+            units = list(model.objects.filter(digest__in=remaining).only(
+                'id', 'digest', 'schema_version'))
+            unit_ids_in_repo = cls._associated_ids(model, [unit.id for unit in units], repo_id)
+            for unit in units:
+                if unit.id in unit_ids_in_repo:
+                    found[unit.digest] = (unit.schema_version, manifest_type)
+        return found
+
+    @staticmethod
+    def _associated_ids(model, unit_ids, repo_id):
+        """
+        :param model:    model of the units
+        :type  model:    type
+        :param unit_ids: ids of units of the model
+        :type  unit_ids: list
+        :param repo_id:  id of the repository
+        :type  repo_id:  basestring
+        :return:         the ids of those units that are associated with the repository
+        :rtype:          set
+        """
+        if not unit_ids:
+            return set()
+        unit_qs = pulp_models.RepositoryContentUnit.objects.filter(
+            repo_id=repo_id,
+            unit_type_id=model._content_type_id.default,
+            unit_id__in=unit_ids).values_list('unit_id')
+        return set(unit_qs)
+
 
 class AddUnits(PluginStep):
     """
@@ -395,75 +617,106 @@ class AddUnits(PluginStep):
         Manifest:
           - included as-is.
         Blob:
-          - Validated.
-          - Omitted when already in the repository.
-          - The uploaded file is renamed in the working directory to the <digest>.
+          - Omitted when already in the repository, without reading it from the tarball.
+          - Replaced by the existing unit when it is not in the tarball but already known to
+            Pulp. The client leaves out the blobs that Pulp already has.
+          - Streamed out of the tarball to <digest> in the working directory, and validated
+            in the same pass.
 
         :return: An iterable containing the Blobs and Manifests present in the uploaded tarball.
         :rtype:  collections.Iterable
         """
+        blob_digests = [item.digest for item in self.parent.available_units
+                        if isinstance(item, models.Blob)]
+        known_blobs, blob_ids_in_repo = self._find_blobs(blob_digests)
         items = []
-        for item in self.parent.available_units:
-            if isinstance(item, models.Blob):
-                blobs = repository.find_repo_content_units(
-                    repository=self.get_repo().repo_obj,
-                    repo_content_unit_q=Q(unit_type_id=item._content_type_id),
-                    units_q=Q(digest=item.digest),
-                    limit=1)
-                if tuple(blobs):
-                    continue
-                path = self._validate_blob(item)
-                dst_path = os.path.join(self.get_working_dir(), item.digest)
-                os.rename(path, dst_path)
-            items.append(item)
+        with contextlib.closing(tarfile.open(self.parent.file_path)) as archive:
+            for item in self.parent.available_units:
+                if isinstance(item, models.Blob):
+                    known_blob = known_blobs.get(item.digest)
+                    if known_blob is not None and known_blob.id in blob_ids_in_repo:
+                        continue
+                    name = self._blob_name(item.digest.rpartition(':')[2])
+                    if known_blob is not None and name not in self.parent.archive_members:
+                        items.append(known_blob)
+                        continue
+                    self._extract_blob(archive, item)
+                items.append(item)
         return iter(items)
 
-    def _validate_blob(self, item):
+    def _find_blobs(self, digests):
         """
-        Ensure the blob has been uploaded and validate using the digest.
+        Find the blobs Pulp already has, and which of them are in the repository, with one
+        query on the blobs and one on the repository's associations.
+
+        :param digests: digests of the blobs of the uploaded image
+        :type  digests: list
+        :return:        the known blobs by digest, and the ids of those in the repository
+        :rtype:         tuple of (dict, set)
+        """
+        if not digests:
+            return {}, set()
+        known_blobs = dict((blob.digest, blob)
+                           for blob in models.Blob.objects.filter(digest__in=sorted(digests)))
+        if not known_blobs:
+            return known_blobs, set()
+        unit_qs = pulp_models.RepositoryContentUnit.objects.filter(
+            repo_id=self.get_repo().id,
+            unit_type_id=constants.BLOB_TYPE_ID,
+            unit_id__in=[blob.id for blob in known_blobs.values()]).values_list('unit_id')
+        return known_blobs, set(unit_qs)
 
-        :param item: The blob to be validated.
+    def _extract_blob(self, archive, item):
+        """
+        Stream a blob out of the uploaded tarball into the working directory, validating it
+        against its digest while it is written.
+
+        :param archive: The uploaded tarball
+        :type archive: tarfile.TarFile
+        :param item: The blob to be extracted.
         :type item: models.Blob
         :return: The absolute path to the validated blob file.
-        :raises PulpCodedValidationException: On IOError or digest validation failed.
+        :raises PulpCodedValidationException: if the blob is missing or digest validation failed.
         """
-        algorithm, _, digest = item.digest.rpartition(':')
-        if not algorithm:
-            algorithm = 'sha256'
-        path = self._blob_path(digest)
-        try:
-            with open(path) as fp:
-                try:
-                    verification.verify_checksum(fp, algorithm, digest)
-                except verification.VerificationException:
-                    raise PulpCodedValidationException(
-                        error_code=error_codes.DKR1017,
-                        checksum_type=algorithm,
-                        checksum=digest)
-        except IOError:
+        algorithm = get_digest_algorithm(item.digest)
+        digest = item.digest.rpartition(':')[2]
+        name = self._blob_name(digest)
+        member = self.parent.archive_members.get(name)
+        if member is None:
             raise PulpCodedValidationException(
                 error_code=error_codes.DKR1018,
-                layer=os.path.basename(path))
+                layer=name)
+
+        path = os.path.join(self.get_working_dir(), item.digest)
+        hasher = hashlib.new(algorithm)
+        source = archive.extractfile(member)
+        with open(path, 'wb') as blob_file:
+            for chunk in iter(functools.partial(source.read, BLOB_CHUNK_SIZE), ''):
+                hasher.update(chunk)
+                blob_file.write(chunk)
+        if hasher.hexdigest() != digest:
+            os.remove(path)
+            raise PulpCodedValidationException(
+                error_code=error_codes.DKR1017,
+                checksum_type=algorithm,
+                checksum=digest)
         return path
 
-    def _blob_path(self, digest):
+    def _blob_name(self, digest):
         """
-        Determine the appropriate path to an uploaded blob.
+        Determine the file name of an uploaded blob.
         Version < 1.1 has .tar extension.
 
         :param digest: The blob digest.
         :type digest: str
-        :return: The absolute path to the uploaded blob.
+        :return: The file name of the uploaded blob.
         :rtype: str
         """
-        working_dir = self.get_working_dir()
-        path = os.path.join(working_dir, 'version')
+        path = os.path.join(self.get_working_dir(), 'version')
         version = Version.from_file(path)
         if version < Version('1.1'):
-            name = '{d}.tar'.format(d=digest)
-        else:
-            name = digest
-        return os.path.join(working_dir, name)
+            return '{d}.tar'.format(d=digest)
+        return digest
 
     def process_main(self, item=None):
         """
@@ -473,17 +726,403 @@ class AddUnits(PluginStep):
         :type      : pulp_docker.plugins.models.Blob or pulp_docker.plugins.models.Manifest
         :return:     None
         """
-        item.set_storage_path(item.digest)
-
-        try:
-            if isinstance(item, models.Manifest):
-                path = os.path.join(self.get_working_dir(), 'manifest.json')
-            else:
-                path = os.path.join(self.get_working_dir(), item.digest)
-            item.save_and_import_content(path)
-        except NotUniqueError:
-            item = item.__class__.objects.get(**item.unit_key)
+        if item.id is None:
+            item.set_storage_path(item.digest)
+            try:
+                item.save_and_import_content(self._get_path(item))
+            except NotUniqueError:
+                item = item.__class__.objects.get(**item.unit_key)
 
         repository.associate_single_unit(self.get_repo().repo_obj, item)
         if isinstance(item, models.Manifest):
             self.parent.uploaded_unit = item
+
+    def _get_path(self, item):
+        """
+        :param item: A Docker manifest or blob unit
+        :type  item: pulp_docker.plugins.models.Blob or pulp_docker.plugins.models.Manifest
+        :return:     path of the file the unit is imported from
+        :rtype:      str
+        """
+        if isinstance(item, models.Manifest):
+            return os.path.join(self.get_working_dir(), 'manifest.json')
+        return os.path.join(self.get_working_dir(), item.digest)
+
+
+class ProcessDirectory(PluginStep):
+    """
+    Read the manifests of a skopeo directory or an OCI image layout on the server, and find the
+    files of their blobs.
+    """
+
+    def initialize(self):
+        """
+        Check that the directory may be imported from.
+
+        :raises PulpCodedValidationException: if the directory is not in one of the directories
+                                              of the upload_directories setting
+        """
+        directory = os.path.realpath(self.parent.directory)
+        allowed = self.get_config().get(constants.CONFIG_KEY_UPLOAD_DIRECTORIES) or []
+        if not isinstance(allowed, list):
+            allowed = [allowed]
+        for root in allowed:
+            root = os.path.join(os.path.realpath(root), '')
+            if directory.startswith(root) and os.path.isdir(directory):
+                self.directory = directory
+                return
+        raise PulpCodedValidationException(error_code=error_codes.DKR1027,
+                                           path=self.parent.directory)
+
+    def process_main(self, item=None):
+        """
+        Create the Manifests and Blobs of the directory, recording the path of each.
+
+        :param item: Not used by this step
+        :type  item: None
+        :raises PulpCodedValidationException: if the directory is not an image, or one of its
+                                              manifests has an unsupported media type
+        """
+        if os.path.isfile(os.path.join(self.directory, constants.EXPORT_OCI_LAYOUT_FILE_NAME)):
+            manifest_paths = self._get_oci_manifest_paths()
+            version = None
+        elif os.path.isfile(os.path.join(self.directory, 'manifest.json')):
+            manifest_paths = [os.path.join(self.directory, 'manifest.json')]
+            version = Version.from_file(os.path.join(self.directory, 'version'))
+        else:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1028,
+                                               path=self.parent.directory)
+
+        blob_digests = set()
+        for path in manifest_paths:
+            with open(path) as manifest_file:
+                image_manifest = manifest_file.read()
+            digest = models.UnitMixin.calculate_digest(image_manifest)
+            manifest = models.Manifest.from_json(image_manifest, digest)
+            self.parent.unit_paths[digest] = path
+            self.parent.available_units.append(manifest)
+            for blob in ProcessManifest.get_models(manifest):
+                if blob.digest not in blob_digests:
+                    blob_digests.add(blob.digest)
+                    self.parent.available_units.append(blob)
+                    self.parent.unit_paths[blob.digest] = self._get_blob_path(blob.digest,
+                                                                              version)
+
+    def _get_oci_manifest_paths(self):
+        """
+        :return: paths of the image manifests listed by the index of the OCI image layout
+        :rtype:  list
+        :raises PulpCodedValidationException: if a manifest has an unsupported media type
+        """
+        with open(os.path.join(self.directory, OCI_INDEX_FILE_NAME)) as index_file:
+            index = json.load(index_file)
+        paths = []
+        for descriptor in index.get('manifests', []):
+            if descriptor.get('mediaType') not in OCI_MANIFEST_TYPES:
+                raise PulpCodedValidationException(error_code=error_codes.DKR1029,
+                                                   digest=descriptor.get('digest'),
+                                                   media_type=descriptor.get('mediaType'))
+            paths.append(self._get_blob_path(descriptor['digest']))
+        return paths
+
+    def _get_blob_path(self, digest, version=None):
+        """
+        :param digest:  digest of a blob
+        :type  digest:  basestring
+        :param version: version of the skopeo directory, or None for an OCI image layout
+        :type  version: pulp_docker.common.dir_transport.Version or NoneType
+        :return:        path of the blob in the directory
+        :rtype:         str
+        """
+        algorithm, _, checksum = digest.rpartition(':')
+        if version is None:
+            return os.path.join(self.directory, 'blobs', algorithm or 'sha256', checksum)
+        if version < Version('1.1'):
+            return os.path.join(self.directory, '{d}.tar'.format(d=checksum))
+        return os.path.join(self.directory, checksum)
+
+
+class AddDirectoryUnits(AddUnits):
+    """
+    Add the Manifests and Blobs of a directory found by the ProcessDirectory step, importing
+    them straight from the directory.
+    """
+
+    def get_iterator(self):
+        """
+        Return an iterator over the units to add. Blobs already in the repository are omitted,
+        Blobs Pulp already has are replaced by the existing units without being read, and the
+        other Blobs are validated against their digests.
+
+        :return: An iterable containing the Blobs and Manifests of the directory.
+        :rtype:  collections.Iterable
+        """
+        blob_digests = [item.digest for item in self.parent.available_units
+                        if isinstance(item, models.Blob)]
+        known_blobs, blob_ids_in_repo = self._find_blobs(blob_digests)
+        items = []
+        for item in self.parent.available_units:
+            if isinstance(item, models.Blob):
+                known_blob = known_blobs.get(item.digest)
+                if known_blob is not None:
+                    if known_blob.id not in blob_ids_in_repo:
+                        items.append(known_blob)
+                    continue
+                self._validate_blob(item)
+            items.append(item)
+        return iter(items)
+
+    def _validate_blob(self, item):
+        """
+        :param item: The blob to validate
+        :type  item: models.Blob
+        :raises PulpCodedValidationException: if the blob is missing or digest validation failed.
+        """
+        path = self._get_path(item)
+        if not os.path.isfile(path):
+            raise PulpCodedValidationException(error_code=error_codes.DKR1018,
+                                               layer=os.path.basename(path))
+        algorithm = get_digest_algorithm(item.digest)
+        digest = item.digest.rpartition(':')[2]
+        hasher = hashlib.new(algorithm)
+        with open(path, 'rb') as blob_file:
+            for chunk in iter(functools.partial(blob_file.read, BLOB_CHUNK_SIZE), ''):
+                hasher.update(chunk)
+        if hasher.hexdigest() != digest:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1017,
+                                               checksum_type=algorithm, checksum=digest)
+
+    def _get_path(self, item):
+        """
+        :param item: A Docker manifest or blob unit
+        :type  item: pulp_docker.plugins.models.Blob or pulp_docker.plugins.models.Manifest
+        :return:     path of the file of the unit in the directory
+        :rtype:      str
+        """
+        return self.parent.unit_paths[item.digest]
+
+
+class ImportExport(PluginStep):
+    """
+    Apply a v2 export of the export distributor to the repository: add the exported Blobs,
+    Manifests and Manifest Lists, remove the content that the export manifest lists as removed
+    since the export it is based on, and update the Tags to match the exported repository.
+    """
+
+    def initialize(self):
+        """
+        Stream through the possibly compressed tar file, extracting the Blobs, Manifests and
+        Manifest Lists into the working directory, and reading the export manifest.
+        """
+        self.export_manifest = None
+        with open(self.parent.file_path, 'rb') as archive_file:
+            reader = compression.open_reader(archive_file)
+            try:
+                self._extract(reader)
+            except tarfile.TarError:
+                self.export_manifest = None
+        if not isinstance(self.export_manifest, dict) or \
+                self.export_manifest.get('version') != EXPORT_MANIFEST_VERSION:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1025,
+                                               version=EXPORT_MANIFEST_VERSION,
+                                               file_name=constants.EXPORT_MANIFEST_FILE_NAME)
+        self._validate_export_manifest()
+
+    def _validate_export_manifest(self):
+        """
+        Check the structure of the export manifest, and the digest algorithms of the units it
+        adds, before anything is applied to the repository.
+
+        :raises PulpCodedValidationException: if the export manifest is not valid
+        """
+        for key in ('added', 'removed'):
+            units = self.export_manifest.get(key)
+            if not isinstance(units, dict):
+                self._invalid_export_manifest(_('%(key)s is missing or not a mapping') %
+                                              {'key': key})
+            for kind in EXPORT_UNIT_KINDS:
+                digests = units.get(kind)
+                if not isinstance(digests, list) or \
+                        not all(isinstance(digest, basestring) for digest in digests):
+                    self._invalid_export_manifest(
+                        _('%(key)s.%(kind)s is missing or not a list of digests') %
+                        {'key': key, 'kind': kind})
+        tags = self.export_manifest.get('tags')
+        if not isinstance(tags, list):
+            self._invalid_export_manifest(_('tags is missing or not a list'))
+        for tag in tags:
+            if not isinstance(tag, dict) or any(field not in tag for field in EXPORT_TAG_FIELDS):
+                self._invalid_export_manifest(_('each tag must have the fields %(fields)s') %
+                                              {'fields': ', '.join(EXPORT_TAG_FIELDS)})
+        for kind in EXPORT_UNIT_KINDS:
+            for digest in self.export_manifest['added'][kind]:
+                get_digest_algorithm(digest)
+
+    @staticmethod
+    def _invalid_export_manifest(reason):
+        """
+        :param reason: what is wrong with the export manifest
+        :type  reason: basestring
+        :raises PulpCodedValidationException: always
+        """
+        raise PulpCodedValidationException(error_code=error_codes.DKR1035, reason=reason)
+
+    def _extract(self, fileobj):
+        """
+        Extract the Blobs, Manifests and Manifest Lists of a tar file, and read its export manifest.
+
+        :param fileobj: file object the tar file is read from
+        :type  fileobj: file
+        :raises tarfile.TarError: if the file is not a tar file
+        """
+        with contextlib.closing(tarfile.open(fileobj=fileobj, mode='r|*')) as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if member.name == constants.EXPORT_MANIFEST_FILE_NAME:
+                    self.export_manifest = json.load(archive.extractfile(member))
+                    continue
+                match = EXPORT_BLOB_PATH.match(member.name)
+                if match:
+                    path = self._blob_path('%s:%s' % match.groups())
+                    with open(path, 'wb') as blob_file:
+                        shutil.copyfileobj(archive.extractfile(member), blob_file)
+
+    def process_main(self, item=None):
+        """
+        Apply the export to the repository.
+
+        :param item: Not used by this step
+        :type  item: None
+        """
+        added = self.export_manifest['added']
+        for digest in added['blobs']:
+            self._add_unit(models.Blob(digest=digest), self._validate_blob(digest))
+        for digest in added['manifests']:
+            path, manifest = self._read_manifest(digest)
+            self._add_unit(models.Manifest.from_json(manifest, digest), path)
+        for digest in added['manifest_lists']:
+            path, manifest_list = self._read_manifest(digest)
+            self._add_unit(models.ManifestList.from_json(manifest_list, digest), path)
+
+        repo_obj = self.get_repo().repo_obj
+        removed = self.export_manifest['removed']
+        for kind, model in (('blobs', models.Blob), ('manifests', models.Manifest),
+                            ('manifest_lists', models.ManifestList)):
+            if removed[kind]:
+                repository.disassociate_units(repo_obj,
+                                              model.objects.filter(digest__in=removed[kind]))
+
+        self._update_tags()
+
+    def _update_tags(self):
+        """
+        Create or update the exported Tags, and remove the Tags that the export does not contain.
+        """
+        repo_id = self.get_repo().id
+        repo_obj = self.get_repo().repo_obj
+        exported = set()
+        for tag in self.export_manifest['tags']:
+            new_tag = models.Tag.objects.tag_manifest(repo_id=repo_id, tag_name=tag['name'],
+                                                      manifest_digest=tag['manifest_digest'],
+                                                      schema_version=tag['schema_version'],
+                                                      manifest_type=tag['manifest_type'])
+            repository.associate_single_unit(repo_obj, new_tag)
+            exported.add((tag['name'], tag['schema_version'], tag['manifest_type']))
+
+        tag_ids = repository.get_associated_unit_ids(repo_id, models.Tag._content_type_id.default)
+        tags = models.Tag.objects.filter(id__in=tag_ids).only(
+            'id', 'name', 'schema_version', 'manifest_type')
+        stale = [tag for tag in tags
+                 if (tag.name, tag.schema_version, tag.manifest_type) not in exported]
+        if stale:
+            repository.disassociate_units(repo_obj, stale)
+
+    def _add_unit(self, unit, path):
+        """
+        Save a unit, if it is not known yet, and associate it with the repository.
+
+        :param unit: the Blob, Manifest or Manifest List
+        :type  unit: pulp.server.db.model.FileContentUnit
+        :param path: path of the extracted file of the unit
+        :type  path: basestring
+        """
+        unit.set_storage_path(unit.digest)
+        try:
+            unit.save_and_import_content(path)
+        except NotUniqueError:
+            unit = unit.__class__.objects.get(**unit.unit_key)
+        repository.associate_single_unit(self.get_repo().repo_obj, unit)
+
+    def _read_manifest(self, digest):
+        """
+        Read an extracted Manifest or Manifest List and check its digest.
+
+        :param digest: digest of the Manifest or Manifest List
+        :type  digest: basestring
+        :return:       path of the extracted file, and its contents
+        :rtype:        tuple
+        :raises PulpCodedValidationException: if the file is missing or its digest does not match
+        """
+        path = self._blob_path(digest)
+        try:
+            with open(path) as manifest_file:
+                manifest = manifest_file.read()
+        except IOError:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1018, layer=digest)
+        algorithm = get_digest_algorithm(digest)
+        if models.UnitMixin.calculate_digest(manifest, algorithm) != digest:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1017,
+                                               checksum_type=algorithm, checksum=digest)
+        return path, manifest
+
+    def _validate_blob(self, digest):
+        """
+        Check that a Blob has been extracted, and that its contents match its digest.
+
+        :param digest: digest of the Blob
+        :type  digest: basestring
+        :return:       path of the extracted Blob
+        :rtype:        basestring
+        :raises PulpCodedValidationException: if the Blob is missing or does not validate
+        """
+        algorithm = get_digest_algorithm(digest)
+        checksum = digest.rpartition(':')[2]
+        path = self._blob_path(digest)
+        try:
+            with open(path) as blob_file:
+                try:
+                    verification.verify_checksum(blob_file, algorithm, checksum)
+                except verification.VerificationException:
+                    raise PulpCodedValidationException(error_code=error_codes.DKR1017,
+                                                       checksum_type=algorithm,
+                                                       checksum=checksum)
+        except IOError:
+            raise PulpCodedValidationException(error_code=error_codes.DKR1018, layer=digest)
+        return path
+
+    def _blob_path(self, digest):
+        """
+        :param digest: digest of a Blob, Manifest or Manifest List
+        :type  digest: basestring
+        :return:       path of the file the unit is extracted to
+        :rtype:        basestring
+        """
+        return os.path.join(self.get_working_dir(), digest)
+
+
+def get_digest_algorithm(digest):
+    """
+    Get the algorithm of a digest, checking that hashlib supports it.
+
+    :param digest: the digest, like "sha256:<hex>", without an algorithm for sha256
+    :type  digest: basestring
+    :return:       the algorithm
+    :rtype:        basestring
+    :raises PulpCodedValidationException: if the algorithm is not supported
+    """
+    algorithm = digest.rpartition(':')[0] or 'sha256'
+    if algorithm not in hashlib.algorithms:
+        raise PulpCodedValidationException(error_code=error_codes.DKR1036, digest=digest,
+                                           algorithm=algorithm)
+    return algorithm
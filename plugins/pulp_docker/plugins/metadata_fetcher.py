@@ -0,0 +1,142 @@
+"""
+Lightweight fetcher for the metadata requests of the registry clients.
+
+The registry clients make many small requests, for tag lists, manifests and tokens, whose time
+is mostly spent waiting for the registry. By default they go through nectar's threaded
+downloader, which is built for large files: it streams every response in buffers and reports
+progress events. The "direct" metadata engine replaces it with MetadataFetcher, which fetches
+the whole response in a single requests call over the shared connection pools of http_pool, and
+limits the number of requests in flight to each host. The requests are made in the calling
+threads, so a sync with many manifest download threads keeps many of them in flight at the same
+time, while the host limit keeps the number of connections to the registry reasonable.
+
+MetadataFetcher returns nectar download reports, so the registry clients handle its responses,
+including the 401 Basic and Bearer challenges, exactly as they handle the downloader's.
+"""
+import threading
+import urlparse
+
+from nectar.report import DownloadReport
+import requests
+
+from pulp_docker.plugins import http_pool
+
+
+ENGINE_THREADED = 'threaded'
+ENGINE_DIRECT = 'direct'
+ENGINES = (ENGINE_THREADED, ENGINE_DIRECT)
+
+# Number of requests in flight to each host
+DEFAULT_HOST_LIMIT = 10
+
+# Connect and read timeouts in seconds, when the download config does not set them
+DEFAULT_TIMEOUT = (10, 60)
+
+
+class MetadataFetcher(object):
+    """
+    Fetches small documents from a registry. It provides the part of the interface of nectar's
+    HTTPThreadedDownloader used by the registry clients and auth_util: config, extra_headers and
+    download_one().
+    """
+
+    def __init__(self, config, host_limit=DEFAULT_HOST_LIMIT):
+        """
+        :param config:     download configuration, for the TLS, proxy and basic auth settings
+        :type  config:     nectar.config.DownloaderConfig
+        :param host_limit: maximum number of requests in flight to each host
+        :type  host_limit: int
+        """
+        self.config = config
+        self.host_limit = host_limit
+        self.extra_headers = {}
+        self.session = self._build_session(config)
+        http_pool.share_connections(self)
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build_session(config):
+        """
+        :param config: download configuration
+        :type  config: nectar.config.DownloaderConfig
+        :return:       a session using the settings of the config
+        :rtype:        requests.Session
+        """
+        settings = dict((name, getattr(config, name, None)) for name in (
+            'basic_auth_username', 'basic_auth_password', 'ssl_validation', 'ssl_ca_cert_path',
+            'ssl_client_cert_path', 'ssl_client_key_path', 'proxy_url', 'proxy_port',
+            'proxy_username', 'proxy_password'))
+        session = requests.Session()
+        if settings['basic_auth_username'] and settings['basic_auth_password']:
+            session.auth = (settings['basic_auth_username'], settings['basic_auth_password'])
+        if settings['ssl_validation'] is False:
+            session.verify = False
+        elif settings['ssl_ca_cert_path']:
+            session.verify = settings['ssl_ca_cert_path']
+        if settings['ssl_client_cert_path']:
+            if settings['ssl_client_key_path']:
+                session.cert = (settings['ssl_client_cert_path'], settings['ssl_client_key_path'])
+            else:
+                session.cert = settings['ssl_client_cert_path']
+        if settings['proxy_url']:
+            scheme, netloc = urlparse.urlparse(settings['proxy_url'])[:2]
+            if settings['proxy_port']:
+                netloc = '%s:%s' % (netloc.rsplit(':', 1)[0], settings['proxy_port'])
+            if settings['proxy_username']:
+                netloc = '%s:%s@%s' % (settings['proxy_username'],
+                                       settings['proxy_password'] or '', netloc)
+            proxy = '%s://%s' % (scheme, netloc)
+            session.proxies = {'http': proxy, 'https': proxy}
+        return session
+
+    def _host_semaphore(self, url):
+        """
+        :param url: URL of a request
+        :type  url: basestring
+        :return:    the semaphore limiting the requests in flight to the URL's host
+        :rtype:     threading.BoundedSemaphore
+        """
+        host = urlparse.urlparse(url).netloc
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.host_limit)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def download_one(self, request, events=False):
+        """
+        Fetch a document, writing it to the request's destination.
+
+        :param request: the request; its destination is a file-like object
+        :type  request: nectar.request.DownloadRequest
+        :param events:  ignored, no progress events are reported
+        :type  events:  bool
+        :return:        report of the download, with the response headers
+        :rtype:         nectar.report.DownloadReport
+        """
+        report = DownloadReport(request.url, request.destination)
+        headers = dict(self.extra_headers)
+        headers.update(request.headers or {})
+        timeout = (getattr(self.config, 'connect_timeout', None) or DEFAULT_TIMEOUT[0],
+                   getattr(self.config, 'read_timeout', None) or DEFAULT_TIMEOUT[1])
+        semaphore = self._host_semaphore(request.url)
+        try:
+            with semaphore:
+                response = self.session.get(request.url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            report.error_msg = str(e)
+            report.download_failed()
+            return report
+
+        report.headers = response.headers
+        if response.ok:
+            request.destination.write(response.content)
+            report.bytes_downloaded = len(response.content)
+            report.download_succeeded()
+        else:
+            report.error_report['response_code'] = response.status_code
+            report.error_msg = response.reason
+            report.download_failed()
+        return report
@@ -277,28 +277,38 @@ class ManifestList(pulp_models.FileContentUnit, UnitMixin):
         manifest_list = json.loads(manifest_list_json)
         # we will store here the digests of image manifests that manifest list contains
         manifests = []
-        amd64_digest = None
-        amd64_schema_version = None
         for image_man in manifest_list['manifests']:
             manifest = EmbeddedManifest(digest=image_man['digest'],
                                         os=image_man['platform'].get('os', ''),
                                         arch=image_man['platform'].get('architecture', ''))
             manifests.append(manifest)
-            # we need to store separately the digest for the amd64 linux image manifest for later
-            # conversion. There can be several image manifests that would match the ^ criteria but
-            # we would keep just the first occurence.
-            if image_man['platform']['architecture'] == 'amd64' and \
-                    image_man['platform']['os'] == 'linux' and not amd64_digest:
-                amd64_digest = image_man['digest']
-                if image_man['mediaType'] == constants.MEDIATYPE_MANIFEST_S2:
-                    amd64_schema_version = 2
-                else:
-                    amd64_schema_version = 1
+        amd64_digest, amd64_schema_version = cls.get_amd64_manifest(manifest_list)
 
         return cls(digest=digest, schema_version=manifest_list['schemaVersion'],
                    manifests=manifests, amd64_digest=amd64_digest,
                    amd64_schema_version=amd64_schema_version)
 
+    @staticmethod
+    def get_amd64_manifest(manifest_list):
+        """
+        Find the amd64 linux image manifest of a manifest list, which is stored separately for
+        later conversion. There can be several image manifests that match, the first one is used.
+
+        :param manifest_list: decoded manifest list
+        :type  manifest_list: dict
+
+        :return:              the digest and schema version of the image manifest, or None for both
+                              if there is no amd64 linux image manifest
+        :rtype:               tuple
+        """
+        for image_man in manifest_list['manifests']:
+            if image_man['platform']['architecture'] == 'amd64' and \
+                    image_man['platform']['os'] == 'linux':
+                if image_man['mediaType'] == constants.MEDIATYPE_MANIFEST_S2:
+                    return image_man['digest'], 2
+                return image_man['digest'], 1
+        return None, None
+
     @staticmethod
     def check_json(manifest_list_json):
         """
@@ -411,6 +421,52 @@ class TagQuerySet(querysets.QuerySetPreventCache):
                 tag.save()
         return tag
 
+    def tag_manifests(self, repo_id, tags):
+        """
+        Tag many Manifests in a repository at once. The existing Tags are loaded with a single
+        query, and only the Tags that are new or point to another digest are saved.
+
+        A Tag created by another task since the existing Tags were loaded is updated instead. If
+        that Tag was removed again before it could be loaded, the Tag is reported as
+        constants.TAG_RESULT_FAILED and is not saved, and the other Tags are still saved.
+
+        :param repo_id: The repository id that the Tags are to be placed in
+        :type  repo_id: basestring
+        :param tags:    the name, manifest digest, schema version and manifest type of each Tag
+        :type  tags:    list of tuple
+        :return:        each Tag, with constants.TAG_RESULT_CREATED, TAG_RESULT_UPDATED,
+                        TAG_RESULT_UNCHANGED or TAG_RESULT_FAILED
+        :rtype:         list of tuple
+        """
+        existing = dict(((tag.name, tag.schema_version, tag.manifest_type), tag) for tag in
+                        self.filter(repo_id=repo_id, name__in=sorted(set(t[0] for t in tags))))
+        results = []
+        for tag_name, manifest_digest, schema_version, manifest_type in tags:
+            tag = existing.get((tag_name, schema_version, manifest_type))
+            if tag is None:
+                unit_keys = dict(name=tag_name, repo_id=repo_id, schema_version=schema_version,
+                                 manifest_type=manifest_type)
+                tag = Tag(manifest_digest=manifest_digest, **unit_keys)
+                try:
+                    tag.save()
+                except mongoengine.NotUniqueError:
+                    # Another task created the Tag since the existing Tags were loaded
+                    try:
+                        tag = Tag.objects.get(**unit_keys)
+                    except mongoengine.DoesNotExist:
+                        results.append((tag, constants.TAG_RESULT_FAILED))
+                        continue
+                else:
+                    results.append((tag, constants.TAG_RESULT_CREATED))
+                    continue
+            if tag.manifest_digest != manifest_digest:
+                tag.manifest_digest = manifest_digest
+                tag.save()
+                results.append((tag, constants.TAG_RESULT_UPDATED))
+            else:
+                results.append((tag, constants.TAG_RESULT_UNCHANGED))
+        return results
+
 
 class Tag(pulp_models.ContentUnit):
     """
@@ -6,6 +6,8 @@ import json
 import logging
 import os
 import re
+import threading
+import time
 import traceback
 import urlparse
 
@@ -19,7 +21,7 @@ from pulp.plugins.util import misc
 
 from pulp_docker.common import constants, error_codes
 from pulp_docker.plugins import models
-from pulp_docker.plugins import auth_util
+from pulp_docker.plugins import auth_util, http_pool, metadata_fetcher, sync_metrics
 
 
 _logger = logging.getLogger(__name__)
@@ -54,7 +56,8 @@ class V1Repository(object):
         self.download_config = download_config
         self.registry_url = registry_url
         self.listener = AggregatingEventListener()
-        self.downloader = HTTPThreadedDownloader(self.download_config, self.listener)
+        self.downloader = http_pool.share_connections(
+            HTTPThreadedDownloader(self.download_config, self.listener))
         self.working_dir = working_dir
         self.token = None
         self.endpoint = None
@@ -272,23 +275,32 @@ class V2Repository(object):
     This class represents a Docker v2 repository.
     """
     API_VERSION_CHECK_PATH = '/v2/'
+    CATALOG_PATH = '/v2/_catalog'
     LAYER_PATH = '/v2/{name}/blobs/{digest}'
     MANIFEST_PATH = '/v2/{name}/manifests/{reference}'
     TAGS_PATH = '/v2/{name}/tags/list'
 
-    def __init__(self, name, download_config, registry_url, working_dir):
+    def __init__(self, name, download_config, registry_url, working_dir,
+                 metadata_engine=metadata_fetcher.ENGINE_THREADED,
+                 metadata_host_limit=metadata_fetcher.DEFAULT_HOST_LIMIT):
         """
         Initialize the V2Repository.
 
-        :param name:            name of a docker repository
-        :type  name:            basestring
-        :param download_config: download configuration object
-        :type  download_config: nectar.config.DownloaderConfig
-        :param registry_url:    URL for the docker registry
-        :type  registry_url:    basestring
-        :param working_dir:     full path to the directory where files should
-                                be saved
-        :type  working_dir:     basestring
+        :param name:                name of a docker repository
+        :type  name:                basestring
+        :param download_config:     download configuration object
+        :type  download_config:     nectar.config.DownloaderConfig
+        :param registry_url:        URL for the docker registry
+        :type  registry_url:        basestring
+        :param working_dir:         full path to the directory where files should
+                                    be saved
+        :type  working_dir:         basestring
+        :param metadata_engine:     one of metadata_fetcher.ENGINES, what makes the requests for
+                                    tags, manifests and tokens
+        :type  metadata_engine:     basestring
+        :param metadata_host_limit: with the direct engine, maximum number of requests in flight
+                                    to each host
+        :type  metadata_host_limit: int
         """
 
         # Docker's registry aligns non-namespaced images to the library namespace.
@@ -304,14 +316,61 @@ class V2Repository(object):
         self.registry_url = registry_url
 
         # Use basic auth information for retrieving tokens from auth server and for downloading
-        # with basic auth
-        self.auth_downloader = HTTPThreadedDownloader(copy.deepcopy(self.download_config),
-                                                      AggregatingEventListener())
+        # with basic auth. The downloader used for everything else does not send it.
+        self._basic_auth = (download_config.basic_auth_username,
+                            download_config.basic_auth_password)
         self.download_config.basic_auth_username = None
         self.download_config.basic_auth_password = None
-        self.downloader = HTTPThreadedDownloader(self.download_config, AggregatingEventListener())
+        # The downloaders are only created when they are first used, and are shared with the
+        # repositories returned by with_name()
+        self._downloaders = {}
+        self.metadata_engine = metadata_engine
+        self.metadata_host_limit = metadata_host_limit
         self.working_dir = working_dir
         self.token = None
+        # Serializes the token requests of the threads sharing the repository, and of the
+        # repositories returned by with_name()
+        self._token_lock = threading.Lock()
+        # The sync's measurements, which the requests are recorded into
+        self.metrics = None
+
+    @property
+    def downloader(self):
+        """
+        :return: downloader of the registry requests, using the shared connections
+        :rtype:  nectar.downloaders.threaded.HTTPThreadedDownloader or
+                 pulp_docker.plugins.metadata_fetcher.MetadataFetcher
+        """
+        if 'downloader' not in self._downloaders:
+            self._downloaders['downloader'] = self._new_downloader(self.download_config)
+        return self._downloaders['downloader']
+
+    @property
+    def auth_downloader(self):
+        """
+        :return: downloader of the token requests and of the requests retried with basic auth,
+                 using the shared connections
+        :rtype:  nectar.downloaders.threaded.HTTPThreadedDownloader or
+                 pulp_docker.plugins.metadata_fetcher.MetadataFetcher
+        """
+        if 'auth_downloader' not in self._downloaders:
+            auth_config = copy.deepcopy(self.download_config)
+            auth_config.basic_auth_username, auth_config.basic_auth_password = self._basic_auth
+            self._downloaders['auth_downloader'] = self._new_downloader(auth_config)
+        return self._downloaders['auth_downloader']
+
+    def _new_downloader(self, download_config):
+        """
+        :param download_config: download configuration of the downloader
+        :type  download_config: nectar.config.DownloaderConfig
+        :return:                a downloader of the metadata engine, using the shared connections
+        :rtype:                 nectar.downloaders.threaded.HTTPThreadedDownloader or
+                                pulp_docker.plugins.metadata_fetcher.MetadataFetcher
+        """
+        if self.metadata_engine == metadata_fetcher.ENGINE_DIRECT:
+            return metadata_fetcher.MetadataFetcher(download_config, self.metadata_host_limit)
+        return http_pool.share_connections(
+            HTTPThreadedDownloader(download_config, AggregatingEventListener()))
 
     def api_version_check(self):
         """
@@ -460,17 +519,73 @@ class V2Repository(object):
                                                      repo=self.name,
                                                      registry=self.registry_url,
                                                      reason=str(e))
-        tag_list = json.loads(tags)['tags'] or []
+        return self._get_pages(headers, tags, 'tags')
+
+    def get_catalog(self, namespace=None):
+        """
+        Get the names of the repositories in the registry, following the pagination of the
+        catalog.
+
+        :param namespace: if specified, only the repositories in this namespace are returned
+        :type  namespace: basestring or NoneType
+        :return:          names of the repositories
+        :rtype:           list
+        """
+        _logger.debug('retrieving the catalog from remote registry')
+        try:
+            headers, body = self._get_path(self.CATALOG_PATH)
+        except IOError as e:
+            raise pulp_exceptions.PulpCodedException(error_code=error_codes.DKR1030,
+                                                     registry=self.registry_url,
+                                                     reason=str(e))
+        names = self._get_pages(headers, body, 'repositories')
+        if namespace:
+            prefix = namespace.strip('/') + '/'
+            names = [name for name in names if name.startswith(prefix)]
+        return names
+
+    def with_name(self, name, working_dir):
+        """
+        Get a V2Repository for another repository of the same registry, sharing the downloaders
+        and the current token of this one, so the authentication is reused.
+
+        :param name:        name of the docker repository
+        :type  name:        basestring
+        :param working_dir: full path to the directory where files should be saved
+        :type  working_dir: basestring
+        :return:            the repository
+        :rtype:             V2Repository
+        """
+        repository = copy.copy(self)
+        repository.name = name
+        repository.working_dir = working_dir
+        return repository
+
+    def _get_pages(self, headers, body, key):
+        """
+        Collect a list from a paginated response, requesting the next pages as long as the
+        response has a Link header.
+
+        :param headers: headers of the response for the first page
+        :type  headers: dict
+        :param body:    body of the response for the first page
+        :type  body:    basestring
+        :param key:     key of the list in the JSON documents
+        :type  key:     basestring
+        :return:        the items of all the pages
+        :rtype:         list
+        """
+        items = json.loads(body)[key] or []
         # check for the presence of the pagination link header
         link = headers.get('Link')
         while link:
             # according RFC5988 URI-reference can be relative or absolute
             _, _, path, params, query, fragm = urlparse.urlparse(link.split(';')[0].strip('>, <'))
             link = urlparse.urlunparse((None, None, path, params, query, fragm))
-            headers, tags = self._get_path(link)
-            tag_list.extend(json.loads(tags)['tags'])
+            headers, body = self._get_path(link)
+            items.extend(json.loads(body)[key] or [])
             link = headers.get('Link')
-        return tag_list
+        return items
 
     def _get_path(self, path, headers=None):
         """
@@ -491,10 +606,12 @@ class V2Repository(object):
         request = DownloadRequest(url, StringIO())
         request.headers = headers
 
-        if self.token:
-            request.headers = auth_util.update_token_auth_header(request.headers, self.token)
+        sent_token = self.token
+        if sent_token:
+            request.headers = auth_util.update_token_auth_header(request.headers, sent_token)
 
-        report = self.downloader.download_one(request)
+        endpoint = sync_metrics.classify_path(path)
+        report = self._download_one(self.downloader, request, endpoint)
 
         # If the download was unauthorized, check report header, if basic auth is expected
         # retry with basic auth, otherwise attempt to get a token and try again
@@ -504,17 +621,18 @@ class V2Repository(object):
                 if auth_header is None:
                     raise IOError("401 responses are expected to "
                                   "contain authentication information")
-                elif "Basic" in auth_header:
+                if self.metrics is not None:
+                    self.metrics.record_auth_retry()
+                if "Basic" in auth_header:
                     _logger.debug(_('Download unauthorized, retrying with basic authentication'))
-                    report = self.auth_downloader.download_one(request)
+                    report = self._download_one(self.auth_downloader, request, endpoint)
                 else:
                     _logger.debug(_('Download unauthorized, attempting to retrieve a token.'))
-                    self.token = auth_util.request_token(self.auth_downloader, request,
-                                                         auth_header, self.name)
-                    if not isinstance(self.token, DownloadReport):
+                    token = self.refresh_token(request, auth_header, sent_token)
+                    if not isinstance(token, DownloadReport):
                         request.headers = auth_util.update_token_auth_header(request.headers,
-                                                                             self.token)
-                        report = self.downloader.download_one(request)
+                                                                             token)
+                        report = self._download_one(self.downloader, request, endpoint)
         if report.state == report.DOWNLOAD_FAILED:
             # this condition was added in case the registry would not allow to access v2 endpoint
             # but still token would be valid for other endpoints.
@@ -526,6 +644,71 @@ class V2Repository(object):
 
         return report.headers, report.destination.getvalue()
 
+    def _download_one(self, downloader, request, endpoint):
+        """
+        Make a request, recording it in the sync's measurements.
+
+        :param downloader: downloader making the request
+        :type  downloader: nectar.downloaders.threaded.HTTPThreadedDownloader or
+                           pulp_docker.plugins.metadata_fetcher.MetadataFetcher
+        :param request:    the request
+        :type  request:    nectar.request.DownloadRequest
+        :param endpoint:   endpoint class of the request, one of the sync_metrics.ENDPOINT_*
+                           constants
+        :type  endpoint:   basestring
+        :return:           report of the download
+        :rtype:            nectar.report.DownloadReport
+        """
+        start = time.time()
+        report = downloader.download_one(request)
+        if self.metrics is not None:
+            self.metrics.record_request(endpoint, time.time() - start,
+                                        failed=report.state == report.DOWNLOAD_FAILED,
+                                        size=report.bytes_downloaded)
+        return report
+
+    def refresh_token(self, request, auth_header, expired_token):
+        """
+        Replace a token the registry refused. The threads that get a 401 at the same time wait for
+        the first one to get a new token, and retry with it instead of requesting their own.
+
+        :param request:       the request that was unauthorized
+        :type  request:       nectar.request.DownloadRequest
+        :param auth_header:   www-authenticate header of the 401 response
+        :type  auth_header:   basestring
+        :param expired_token: the token sent with the request, or None
+        :type  expired_token: basestring or NoneType
+        :return:              the new token, or the report of the failed token request
+        :rtype:               str or nectar.report.DownloadReport
+        """
+        with self._token_lock:
+            if self.token != expired_token:
+                # another thread already replaced it
+                return self.token
+            token = self.request_token(request, auth_header)
+            if not isinstance(token, DownloadReport):
+                self.token = token
+            return token
+
+    def request_token(self, request, auth_header):
+        """
+        Get a token for a request from the token server, recording the token request in the
+        sync's measurements.
+
+        :param request:     the request that was unauthorized
+        :type  request:     nectar.request.DownloadRequest
+        :param auth_header: www-authenticate header of the 401 response
+        :type  auth_header: basestring
+        :return:            the token, or the report of the failed token request
+        :rtype:             str or nectar.report.DownloadReport
+        """
+        start = time.time()
+        token = auth_util.request_token(self.auth_downloader, request, auth_header, self.name)
+        if self.metrics is not None:
+            self.metrics.record_request(sync_metrics.ENDPOINT_TOKEN, time.time() - start,
+                                        failed=isinstance(token, DownloadReport))
+        return token
+
     @staticmethod
     def _raise_path_error(report):
         """
@@ -0,0 +1,295 @@
+"""
+Opt-in profiling of the steps of the syncs, uploads and publishes, to tell where the time of a
+slow task goes without attaching a profiler to the worker.
+
+Profiling is enabled by the ``profile`` option of the importer or the distributor, or for all
+the tasks of a worker by the PULP_DOCKER_PROFILE environment variable. The top step of the task
+then runs the initialize(), process_main() and finalize() of each of its steps under cProfile,
+with a profile for each step. With the ``profile_memory`` option, or PULP_DOCKER_PROFILE set to
+"memory", the memory of the process is also sampled when each step starts and when it ends.
+tracemalloc does not exist on Python 2, so a sample is the maximum resident set size of the
+process and the number of objects of each type the garbage collector tracks.
+
+When the task is done, the profiles are written as pstats files, one for each step, with the
+memory samples and a summary of the functions the task spent the most time in, to the
+``profile`` directory of the task's working directory. The summary is also added to the
+summary of the task's report and logged. Pulp removes the working directory of a task when the
+task ends, so PULP_DOCKER_PROFILE_DIR can name a directory to keep the profiles in instead.
+
+Only the thread that runs a step is profiled: the time the step waits for the threads it
+starts, like the ones of the downloaders, shows as time spent waiting.
+"""
+from gettext import gettext as _
+import collections
+import cProfile
+import gc
+import json
+import logging
+import os
+import pstats
+import re
+import resource
+import tempfile
+import threading
+import time
+
+from pulp.plugins.util import misc
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import config_utils
+
+
+_logger = logging.getLogger(__name__)
+
+ENV_PROFILE = 'PULP_DOCKER_PROFILE'
+ENV_PROFILE_DIR = 'PULP_DOCKER_PROFILE_DIR'
+
+# Value of PULP_DOCKER_PROFILE that samples the memory too
+PROFILE_MEMORY = 'memory'
+
+PROFILED_METHODS = ('initialize', 'process_main', 'finalize')
+
+# Name of the directory of the profiles in the working directory, and of the profile summary in
+# the summary of the task's report
+PROFILE_DIR = 'profile'
+REPORT_KEY = 'profile'
+
+SUMMARY_FILE_NAME = 'summary.json'
+MEMORY_FILE_NAME = 'memory.json'
+
+# Number of functions in the summary, and of object types in the memory growth of a step
+TOP_FUNCTIONS = 25
+TOP_OBJECT_TYPES = 10
+
+# Whether a profiler runs in the thread
+_running = threading.local()
+
+
+def get_profiler(step, config):
+    """
+    :param step:   the top step of a task
+    :type  step:   pulp.plugins.util.publish_step.PluginStep
+    :param config: configuration of the importer or the distributor
+    :type  config: pulp.plugins.config.PluginCallConfiguration
+    :return:       profiler of the task's steps, or None if profiling is not enabled or another
+                   profiler already profiles the thread, like the one of a catalog sync for the
+                   syncs of its repositories
+    :rtype:        StepProfiler or NoneType
+    """
+    value = os.environ.get(ENV_PROFILE, '').strip().lower()
+    memory = value == PROFILE_MEMORY or \
+        config_utils.get_boolean(config, constants.CONFIG_KEY_PROFILE_MEMORY)
+    enabled = memory or value in ('1', 'true', 'yes') or \
+        config_utils.get_boolean(config, constants.CONFIG_KEY_PROFILE)
+    if not enabled or getattr(_running, 'active', False):
+        return None
+    name = '%s-%s' % (step.get_repo().id, step.step_id)
+    profile_dir = os.environ.get(ENV_PROFILE_DIR)
+    if profile_dir:
+        misc.mkdir(profile_dir)
+        output_dir = tempfile.mkdtemp(prefix=name + '-', dir=profile_dir)
+    else:
+        output_dir = os.path.join(step.get_working_dir(), PROFILE_DIR)
+    return StepProfiler(name, output_dir, memory=memory)
+
+
+class StepProfiler(object):
+    """
+    The profiles of the steps of a task.
+    """
+
+    def __init__(self, name, output_dir, memory=False):
+        """
+        :param name:       name of the task's profiles, in the log
+        :type  name:       basestring
+        :param output_dir: directory the profiles are written to
+        :type  output_dir: basestring
+        :param memory:     whether to sample the memory when each step starts and when it ends
+        :type  memory:     bool
+        """
+        self.name = name
+        self.output_dir = output_dir
+        self.memory = memory
+        # Profile of each step, and the calls and seconds of its profiled methods, by step name
+        self.profiles = collections.OrderedDict()
+        self.calls = collections.defaultdict(int)
+        self.seconds = collections.defaultdict(float)
+        # Memory samples of each step, at its start and at its end, by step name
+        self.memory_samples = collections.defaultdict(dict)
+        self._locks = {}
+
+    def add_step(self, step):
+        """
+        Profile the methods of a step and of its children.
+
+        :param step: the step
+        :type  step: pulp.plugins.util.publish_step.PluginStep
+        """
+        # Steps are numbered in the order they run, several steps may have the same type
+        name = '%02d-%s' % (len(self.profiles),
+                            re.sub(r'[^\w.-]+', '_', step.step_id or step.__class__.__name__))
+        self.profiles[name] = cProfile.Profile()
+        self._locks[name] = threading.Lock()
+        for method_name in PROFILED_METHODS:
+            setattr(step, method_name,
+                    self._profiled(name, method_name, getattr(step, method_name)))
+        for child in step.children:
+            self.add_step(child)
+
+    def _profiled(self, name, method_name, method):
+        """
+        :param name:        name of the step
+        :type  name:        basestring
+        :param method_name: name of the method, one of PROFILED_METHODS
+        :type  method_name: basestring
+        :param method:      the bound method of the step
+        :type  method:      callable
+        :return:            the method, run under the step's profile
+        :rtype:             callable
+        """
+        profile = self.profiles[name]
+        lock = self._locks[name]
+
+        def profiled(*args, **kwargs):
+            # A profile can only profile one thread at a time, and a thread can only run one
+            # profile, so the methods run by other threads or by a profiled method are not
+            if getattr(_running, 'step', None) is not None or not lock.acquire(False):
+                return method(*args, **kwargs)
+            _running.step = name
+            if self.memory and method_name == 'initialize':
+                self._sample_memory(name, 'start')
+            start = time.time()
+            profile.enable()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.calls[name] += 1
+                self.seconds[name] += time.time() - start
+                if self.memory and method_name == 'finalize':
+                    self._sample_memory(name, 'end')
+                _running.step = None
+                lock.release()
+
+        return profiled
+
+    def _sample_memory(self, name, when):
+        """
+        :param name: name of the step
+        :type  name: basestring
+        :param when: "start" or "end"
+        :type  when: basestring
+        """
+        objects = collections.defaultdict(int)
+        for obj in gc.get_objects():
+            objects[type(obj).__name__] += 1
+        self.memory_samples[name][when] = {
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'objects': dict(objects)}
+
+    def write(self):
+        """
+        Write the profiles of the steps that ran, the memory samples and the summary of the
+        profiles to the output directory, and log the summary.
+
+        :return: the summary of the profiles
+        :rtype:  dict
+        """
+        misc.mkdir(self.output_dir)
+        profiled = [name for name in self.profiles if self.calls[name]]
+        for name in profiled:
+            self.profiles[name].dump_stats(os.path.join(self.output_dir, name + '.prof'))
+        summary = self.summary(profiled)
+        if self.memory:
+            with open(os.path.join(self.output_dir, MEMORY_FILE_NAME), 'w') as memory_file:
+                json.dump(self.memory_samples, memory_file, sort_keys=True)
+        with open(os.path.join(self.output_dir, SUMMARY_FILE_NAME), 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2, sort_keys=True)
+        _logger.info(_('Profile of %(name)s written to %(dir)s: %(summary)s') % {
+            'name': self.name, 'dir': self.output_dir,
+            'summary': json.dumps(summary, sort_keys=True)})
+        return summary
+
+    def summary(self, profiled):
+        """
+        :param profiled: names of the steps that ran
+        :type  profiled: list
+        :return:         the output directory, the time spent in each step, the functions the
+                         steps spent the most time in, and with the memory samples, how the
+                         memory grew during each step
+        :rtype:          dict
+        """
+        summary = {
+            'directory': self.output_dir,
+            'steps': dict((name, {'calls': self.calls[name], 'seconds': self.seconds[name]})
+                          for name in profiled),
+            'top_functions': []}
+        if profiled:
+            stats = pstats.Stats(*[self.profiles[name] for name in profiled])
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+            for function, (primitive_calls, calls, seconds, cumulative, callers) in \
+                    functions[:TOP_FUNCTIONS]:
+                summary['top_functions'].append({
+                    'function': pstats.func_std_string(function), 'calls': calls,
+                    'seconds': seconds, 'cumulative_seconds': cumulative})
+        if self.memory:
+            summary['memory'] = dict(
+                (name, _memory_growth(samples['start'], samples['end']))
+                for name, samples in self.memory_samples.items()
+                if 'start' in samples and 'end' in samples)
+        return summary
+
+
+def _memory_growth(start, end):
+    """
+    :param start: memory sample at the start of a step
+    :type  start: dict
+    :param end:   memory sample at the end of the step
+    :type  end:   dict
+    :return:      the maximum resident set size at the end of the step, how much it grew during
+                  the step, and the object types whose number grew the most
+    :rtype:       dict
+    """
+    growth = sorted(((object_type, count - start['objects'].get(object_type, 0))
+                     for object_type, count in end['objects'].items()),
+                    key=lambda item: item[1], reverse=True)
+    return {'max_rss_kb': end['max_rss_kb'],
+            'max_rss_growth_kb': end['max_rss_kb'] - start['max_rss_kb'],
+            'object_growth': dict((object_type, count) for object_type, count
+                                  in growth[:TOP_OBJECT_TYPES] if count > 0)}
+
+
+class ProfiledTaskMixin(object):
+    """
+    Mixin of the top steps of the syncs, uploads and publishes, profiling the steps of the task
+    when profiling is enabled and adding the summary of the profiles to the summary of the
+    task's report.
+    """
+    # Summary of the profiles of the task, once it is done
+    profile_summary = None
+
+    def process_lifecycle(self):
+        """
+        Process the task's steps, profiling them if profiling is enabled.
+
+        :return: the report of the task
+        :rtype:  pulp.plugins.model.SyncReport or pulp.plugins.model.PublishReport
+        """
+        profiler = get_profiler(self, self.get_config())
+        if profiler is None:
+            return super(ProfiledTaskMixin, self).process_lifecycle()
+        profiler.add_step(self)
+        _running.active = True
+        try:
+            report = super(ProfiledTaskMixin, self).process_lifecycle()
+        finally:
+            _running.active = False
+            try:
+                self.profile_summary = profiler.write()
+            except (IOError, OSError):
+                _logger.exception(_('Could not write the profile of %(name)s') %
+                                  {'name': profiler.name})
+        if self.profile_summary is not None and isinstance(getattr(report, 'summary', None),
+                                                           dict):
+            report.summary[REPORT_KEY] = self.profile_summary
+        return report
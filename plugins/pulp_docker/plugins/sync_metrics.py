@@ -0,0 +1,294 @@
+"""
+Measurements of a v2 sync, to tell where the time of a slow sync goes.
+
+The SyncStep keeps a SyncMetrics for the sync, which its steps and its registry client record
+into. The measurements are grouped by phase, each v2 sync step being one phase, and requests
+made outside of the steps, like the check of the registry's API version, going to the setup
+phase. Each phase has its wall time, the count, failures and latency histogram of its HTTP
+requests by endpoint class, the bytes downloaded and the bytes expected for the blobs the sync
+downloads, the authentication retries and the database operations.
+
+The measurements of each phase are the details of its step in the progress report, and the
+SyncStep logs all of them in a single JSON line at the end of the sync.
+"""
+import collections
+import contextlib
+import threading
+import time
+import urlparse
+
+
+PHASE_SETUP = 'setup'
+PHASE_DOWNLOAD_MANIFESTS = 'download_manifests'
+PHASE_GET_LOCAL_MANIFESTS = 'get_local_manifests'
+PHASE_GET_LOCAL_BLOBS = 'get_local_blobs'
+PHASE_DOWNLOAD_BLOBS = 'download_blobs'
+PHASE_SAVE_UNITS = 'save_units'
+PHASE_SAVE_TAGS = 'save_tags'
+
+# Endpoint classes of the requests made to the registry and its token server
+ENDPOINT_VERSION = 'version'
+ENDPOINT_CATALOG = 'catalog'
+ENDPOINT_TAGS = 'tags'
+ENDPOINT_MANIFESTS = 'manifests'
+ENDPOINT_BLOBS = 'blobs'
+ENDPOINT_TOKEN = 'token'
+ENDPOINT_OTHER = 'other'
+
+# Database operations
+DB_QUERY = 'query'
+DB_ASSOCIATE = 'associate'
+DB_SAVE = 'save'
+DB_TAG = 'tag'
+
+# Upper bounds, in milliseconds, of the buckets of the latency histograms. Slower requests are
+# counted in a last bucket.
+LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def classify_path(path):
+    """
+    Get the endpoint class of a registry request.
+
+    :param path: path or URL of the request
+    :type  path: basestring
+    :return:     one of the ENDPOINT_* constants
+    :rtype:      basestring
+    """
+    path = urlparse.urlparse(path).path
+    if path.rstrip('/') == '/v2':
+        return ENDPOINT_VERSION
+    if path.startswith('/v2/_catalog'):
+        return ENDPOINT_CATALOG
+    if path.endswith('/tags/list'):
+        return ENDPOINT_TAGS
+    if '/manifests/' in path:
+        return ENDPOINT_MANIFESTS
+    if '/blobs/' in path:
+        return ENDPOINT_BLOBS
+    return ENDPOINT_OTHER
+
+
+class RequestStats(object):
+    """
+    Count, failures and latencies of the requests to one endpoint class.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, seconds, failed=False):
+        """
+        :param seconds: latency of a request
+        :type  seconds: float
+        :param failed:  True if the request failed
+        :type  failed:  bool
+        """
+        self.count += 1
+        self.failures += int(failed)
+        self.seconds += seconds
+        milliseconds = seconds * 1000
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) and milliseconds > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def merge(self, other):
+        """
+        :param other: stats to add to these
+        :type  other: RequestStats
+        """
+        self.count += other.count
+        self.failures += other.failures
+        self.seconds += other.seconds
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def to_dict(self):
+        """
+        :return: the stats, with the histogram keyed by the bounds of its buckets
+        :rtype:  dict
+        """
+        labels = ['<=%d' % bound for bound in LATENCY_BUCKETS_MS]
+        labels.append('>%d' % LATENCY_BUCKETS_MS[-1])
+        return {'count': self.count,
+                'failures': self.failures,
+                'seconds': round(self.seconds, 3),
+                'latency_ms': dict(zip(labels, self.histogram))}
+
+
+class PhaseMetrics(object):
+    """
+    Measurements of one phase of a sync.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.requests = collections.defaultdict(RequestStats)
+        self.bytes_downloaded = 0
+        self.bytes_expected = 0
+        self.unsized_blobs = 0
+        self.auth_retries = 0
+        self.db_operations = collections.defaultdict(int)
+
+    def merge(self, other):
+        """
+        :param other: measurements to add to these
+        :type  other: PhaseMetrics
+        """
+        self.seconds += other.seconds
+        for endpoint, stats in other.requests.items():
+            self.requests[endpoint].merge(stats)
+        self.bytes_downloaded += other.bytes_downloaded
+        self.bytes_expected += other.bytes_expected
+        self.unsized_blobs += other.unsized_blobs
+        self.auth_retries += other.auth_retries
+        for operation, count in other.db_operations.items():
+            self.db_operations[operation] += count
+
+    def to_dict(self):
+        """
+        :return: the measurements, as JSON serializable types
+        :rtype:  dict
+        """
+        return {'seconds': round(self.seconds, 3),
+                'requests': dict((endpoint, stats.to_dict())
+                                 for endpoint, stats in self.requests.items()),
+                'bytes_downloaded': self.bytes_downloaded,
+                'bytes_expected': self.bytes_expected,
+                'unsized_blobs': self.unsized_blobs,
+                'auth_retries': self.auth_retries,
+                'db_operations': dict(self.db_operations)}
+
+
+class SyncMetrics(object):
+    """
+    Measurements of a sync, by phase. The manifests may be downloaded by several threads, so
+    everything is recorded under a lock.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+        self._current = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Measure a phase: what is recorded until the end of the block is added to it.
+
+        :param name: name of the phase, one of the PHASE_* constants
+        :type  name: basestring
+        :return:     context manager yielding the measurements of the phase
+        :rtype:      contextlib.GeneratorContextManager
+        """
+        with self._lock:
+            self._current = self._get_phase(name)
+        start = time.time()
+        try:
+            yield self._current
+        finally:
+            with self._lock:
+                self._current.seconds += time.time() - start
+                self._current = None
+
+    def _get_phase(self, name):
+        """
+        :param name: name of a phase
+        :type  name: basestring
+        :return:     the measurements of the phase, created if needed
+        :rtype:      PhaseMetrics
+        """
+        if name not in self.phases:
+            self.phases[name] = PhaseMetrics()
+        return self.phases[name]
+
+    @property
+    def _phase(self):
+        """
+        :return: the measurements of the current phase, or of the setup phase between steps
+        :rtype:  PhaseMetrics
+        """
+        return self._current or self._get_phase(PHASE_SETUP)
+
+    def record_request(self, endpoint, seconds, failed=False, size=0):
+        """
+        :param endpoint: endpoint class of the request, one of the ENDPOINT_* constants
+        :type  endpoint: basestring
+        :param seconds:  latency of the request
+        :type  seconds:  float
+        :param failed:   True if the request failed
+        :type  failed:   bool
+        :param size:     number of bytes downloaded
+        :type  size:     int
+        """
+        with self._lock:
+            phase = self._phase
+            phase.requests[endpoint].add(seconds, failed)
+            phase.bytes_downloaded += size or 0
+
+    def record_auth_retry(self):
+        """
+        Record a request retried with other credentials after a 401 response.
+        """
+        with self._lock:
+            self._phase.auth_retries += 1
+
+    def record_db(self, operation, count=1):
+        """
+        :param operation: the database operation, one of the DB_* constants
+        :type  operation: basestring
+        :param count:     number of operations
+        :type  count:     int
+        """
+        with self._lock:
+            self._phase.db_operations[operation] += count
+
+    def expect_blob(self, size):
+        """
+        Add the size of a blob that is going to be downloaded to the expected bytes of the phase.
+        Only the schema 2 manifests give the sizes of their layers, so the blobs only referenced
+        by schema 1 manifests are counted as unsized.
+
+        :param size: size of the blob, kept with the blob in the sync state, or None
+        :type  size: int or NoneType
+        """
+        with self._lock:
+            if size is None:
+                self._phase.unsized_blobs += 1
+            else:
+                self._phase.bytes_expected += size
+
+    def to_dict(self):
+        """
+        :return: the measurements of each phase, and their totals
+        :rtype:  dict
+        """
+        with self._lock:
+            totals = PhaseMetrics()
+            for phase in self.phases.values():
+                totals.merge(phase)
+            return {'phases': dict((name, phase.to_dict()) for name, phase in self.phases.items()),
+                    'totals': totals.to_dict()}
+
+
+class MeasuredStepMixin(object):
+    """
+    Mixin of the steps of a v2 sync, measuring each step as a phase of the SyncStep's metrics
+    and reporting the measurements of the phase in the details of the step's progress.
+    """
+    # Name of the step's phase, one of the PHASE_* constants
+    metrics_phase = None
+
+    def process(self):
+        """
+        Process the step as a phase of the sync.
+        """
+        metrics = self.parent.metrics
+        try:
+            with metrics.phase(self.metrics_phase) as phase:
+                super(MeasuredStepMixin, self).process()
+        finally:
+            self.progress_details = phase.to_dict()
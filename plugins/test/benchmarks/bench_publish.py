@@ -0,0 +1,574 @@
+#!/usr/bin/env python2
+"""
+Benchmarks of the publishes, of synthetic repositories stored in a local mongod.
+
+Each scenario seeds a repository of the configured size, with Blobs, Manifests, Manifest Lists,
+Tags and v1 Images, and publishes it with each of the publishers, as a publish task does. Each
+run reports how long each step of the publish took, the system calls and the calls to the
+filesystem functions the publish made, and the files, directories and symlinks it created, so
+changes to the publish path can be compared between revisions.
+
+The benchmarks need a Pulp server installation and a mongod they can use a database of. For
+example, to compare the web publishes with one and four symlink workers:
+
+    python2 plugins/test/benchmarks/bench_publish.py --publisher v2-web \\
+        --publisher v2-web-incremental --symlink-workers 1 --symlink-workers 4 \\
+        --output results.jsonl
+"""
+import __builtin__
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import threading
+import time
+
+from pulp.plugins.conduits.repo_publish import RepoPublishConduit
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.rsync.publish import RSyncPublishStep
+from pulp.plugins.util import publish_step
+from pulp.server.controllers import repository
+from pulp.server.db import model as pulp_models
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import models
+from pulp_docker.plugins.distributors import publish_steps, v1_publish_steps, v2_export_steps
+from pulp_docker.plugins.distributors.rsync_distributor import TYPE_ID_DISTRIBUTOR_DOCKER_RSYNC
+
+import harness
+import registry_stub
+
+
+BENCHMARK = 'publish'
+REPO_ID = 'benchmark'
+
+WEB_DISTRIBUTOR_ID = 'benchmark_web'
+EXPORT_DISTRIBUTOR_ID = 'benchmark_export'
+RSYNC_DISTRIBUTOR_ID = 'benchmark_rsync'
+
+KB = 1024
+
+# Parameters of the synthetic repository of each scenario, "images" is the number of v1 Images
+SCENARIOS = collections.OrderedDict([
+    ('small', {'tags': 10, 'layers': 3, 'layer_size': 64 * KB, 'images': 10}),
+    ('many-tags', {'tags': 2000, 'layers': 2, 'layer_size': KB}),
+    ('manifest-lists', {'tags': 500, 'manifest_lists': 500, 'layers': 2, 'layer_size': KB}),
+    ('many-blobs', {'tags': 200, 'layers': 20, 'shared_layers': 0, 'layer_size': KB}),
+    ('v1-images', {'tags': 0, 'layers': 5, 'layer_size': KB, 'images': 2000}),
+])
+
+REPOSITORY_PARAMS = ('tags', 'layers', 'shared_layers', 'layer_size', 'manifest_lists')
+
+# The counters of /proc/self/io that are reported
+PROCESS_IO_FIELDS = ('syscr', 'syscw', 'rchar', 'wchar', 'read_bytes', 'write_bytes')
+
+
+def _rsync_publisher(repo, conduit, config):
+    """
+    :return: the rsync publisher, without the steps that rsync the content to the remote server,
+             which the benchmarks have none of
+    :rtype:  pulp_docker.plugins.distributors.publish_steps.DockerRsyncPublisher
+    """
+    publisher = publish_steps.DockerRsyncPublisher(repo, conduit, config,
+                                                   TYPE_ID_DISTRIBUTOR_DOCKER_RSYNC)
+    publisher.children = [child for child in publisher.children
+                          if not isinstance(child, RSyncPublishStep)]
+    return publisher
+
+
+# The factory, the distributor id and the configuration of each publisher
+PUBLISHERS = collections.OrderedDict([
+    ('web', (publish_steps.WebPublisher, WEB_DISTRIBUTOR_ID, {})),
+    ('v1-web', (v1_publish_steps.WebPublisher, WEB_DISTRIBUTOR_ID, {})),
+    ('v2-web', (publish_steps.V2WebPublisher, WEB_DISTRIBUTOR_ID, {})),
+    ('v2-web-incremental', (publish_steps.V2WebPublisher, WEB_DISTRIBUTOR_ID,
+                            {constants.CONFIG_KEY_INCREMENTAL_PUBLISH: True})),
+    ('rsync', (_rsync_publisher, RSYNC_DISTRIBUTOR_ID,
+               {'postdistributor_id': WEB_DISTRIBUTOR_ID})),
+    ('v1-export', (v1_publish_steps.ExportPublisher, EXPORT_DISTRIBUTOR_ID, {})),
+    ('v2-export', (v2_export_steps.ExportPublisher, EXPORT_DISTRIBUTOR_ID, {})),
+])
+
+
+class BenchmarkConduit(RepoPublishConduit):
+    """
+    The publish conduit, counting the progress reports instead of saving them in a task status.
+    """
+
+    def __init__(self, repo_id, distributor_id):
+        """
+        :param repo_id:        id of the repository
+        :type  repo_id:        str
+        :param distributor_id: id of the distributor that publishes
+        :type  distributor_id: str
+        """
+        super(BenchmarkConduit, self).__init__(repo_id, distributor_id)
+        self.progress_reports = 0
+
+    def set_progress(self, status):
+        """
+        :param status: progress report of the publish
+        :type  status: dict
+        """
+        self.progress_reports += 1
+
+
+class StepTimer(object):
+    """
+    Times the process() of each step of a publisher, by path of the step in the publisher.
+    """
+
+    def __init__(self, publisher):
+        """
+        :param publisher: the publisher, with all its steps
+        :type  publisher: pulp.plugins.util.publish_step.PluginStep
+        """
+        self.seconds = collections.OrderedDict()
+        self._children = {}
+        self._wrap(publisher, None)
+
+    def _wrap(self, step, parent_path):
+        """
+        :param step:        the step to time, with its children
+        :type  step:        pulp.plugins.util.publish_step.PluginStep
+        :param parent_path: path of the parent of the step, None for the publisher
+        :type  parent_path: str or NoneType
+        """
+        path = step.step_id if parent_path is None else '%s/%s' % (parent_path, step.step_id)
+        # Steps of the same type under a parent, like the unit query steps of the rsync publisher
+        if path in self.seconds:
+            path = '%s#%d' % (path, sum(1 for known in self.seconds
+                                        if known.split('#')[0] == path))
+        self.seconds[path] = 0.0
+        self._children[path] = []
+        if parent_path is not None:
+            self._children[parent_path].append(path)
+        process = step.process
+
+        def timed_process():
+            start = time.time()
+            try:
+                return process()
+            finally:
+                self.seconds[path] += time.time() - start
+
+        step.process = timed_process
+        for child in step.children:
+            self._wrap(child, path)
+
+    def to_dict(self):
+        """
+        :return: the seconds spent in each step, with and without its children, by path
+        :rtype:  dict
+        """
+        return dict((path, {'seconds': seconds,
+                            'self_seconds': seconds - sum(self.seconds[child]
+                                                          for child in self._children[path])})
+                    for path, seconds in self.seconds.items())
+
+
+class FilesystemCalls(object):
+    """
+    Counts the calls to the functions of os that change the filesystem and to open, while it is
+    entered. The calls made by C code, like the ones of rsync or of the tar compressors, are not
+    seen.
+    """
+
+    FUNCTIONS = ('symlink', 'link', 'mkdir', 'rename', 'remove', 'unlink', 'rmdir', 'chmod')
+
+    def __init__(self):
+        self.counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def __enter__(self):
+        self._originals = [(os, name, getattr(os, name)) for name in self.FUNCTIONS]
+        self._originals.append((__builtin__, 'open', __builtin__.open))
+        for module, name, function in self._originals:
+            setattr(module, name, self._counted(name, function))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for module, name, function in self._originals:
+            setattr(module, name, function)
+
+    def _counted(self, name, function):
+        """
+        :param name:     name of the function
+        :type  name:     str
+        :param function: the function
+        :type  function: callable
+        :return:         the function, counting its calls
+        :rtype:          callable
+        """
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+
+@contextlib.contextmanager
+def task_working_dir(path):
+    """
+    Give the publish the working directory a publish task would have, the benchmarks do not run
+    in tasks.
+
+    :param path: the working directory
+    :type  path: str
+    """
+    get_working_directory = publish_step.common_utils.get_working_directory
+    publish_step.common_utils.get_working_directory = lambda: path
+    try:
+        yield
+    finally:
+        publish_step.common_utils.get_working_directory = get_working_directory
+
+
+def read_process_io():
+    """
+    :return: the I/O counters of the process, with the number of read and write system calls,
+             empty where /proc/self/io does not exist
+    :rtype:  dict
+    """
+    try:
+        with open('/proc/self/io') as io_file:
+            counters = dict(line.split(':', 1) for line in io_file if ':' in line)
+    except IOError:
+        return {}
+    return dict((name, int(counters[name])) for name in PROCESS_IO_FIELDS if name in counters)
+
+
+def read_rusage():
+    """
+    :return: the resource usage of the process
+    :rtype:  dict
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {'user_seconds': usage.ru_utime, 'system_seconds': usage.ru_stime,
+            'voluntary_switches': usage.ru_nvcsw, 'involuntary_switches': usage.ru_nivcsw,
+            'blocks_in': usage.ru_inblock, 'blocks_out': usage.ru_oublock}
+
+
+def count_tree(path):
+    """
+    :param path: a directory
+    :type  path: str
+    :return:     the number of directories, files and symlinks under the directory, and the size
+                 of the files
+    :rtype:      dict
+    """
+    counts = {'dirs': 0, 'files': 0, 'symlinks': 0, 'bytes': 0}
+    for root, dir_names, file_names in os.walk(path):
+        for name in dir_names:
+            counts['symlinks' if os.path.islink(os.path.join(root, name)) else 'dirs'] += 1
+        for name in file_names:
+            file_path = os.path.join(root, name)
+            if os.path.islink(file_path):
+                counts['symlinks'] += 1
+            else:
+                counts['files'] += 1
+                counts['bytes'] += os.path.getsize(file_path)
+    return counts
+
+
+def _delta(before, after):
+    """
+    :param before: counters
+    :type  before: dict
+    :param after:  the same counters, later
+    :type  after:  dict
+    :return:       how much each counter increased
+    :rtype:        dict
+    """
+    return dict((name, after[name] - before[name]) for name in after if name in before)
+
+
+def seed_repository(env, params):
+    """
+    Create the benchmark repository and its distributors, with the content of the scenario.
+
+    :param env:    the benchmarks' environment
+    :type  env:    harness.Environment
+    :param params: parameters of the scenario
+    :type  params: dict
+    :return:       the repository
+    :rtype:        pulp.server.db.model.Repository
+    """
+    repo_obj = pulp_models.Repository(repo_id=REPO_ID)
+    repo_obj.save()
+    for distributor_id, type_id in ((WEB_DISTRIBUTOR_ID, constants.DISTRIBUTOR_WEB_TYPE_ID),
+                                    (EXPORT_DISTRIBUTOR_ID, constants.DISTRIBUTOR_EXPORT_TYPE_ID),
+                                    (RSYNC_DISTRIBUTOR_ID, TYPE_ID_DISTRIBUTOR_DOCKER_RSYNC)):
+        pulp_models.Distributor(repo_id=REPO_ID, distributor_id=distributor_id,
+                                distributor_type_id=type_id, config={}).save()
+
+    source_dir = env.working_dir(prefix='source-')
+    content = registry_stub.SyntheticRepository(
+        REPO_ID, **dict((key, value) for key, value in params.items()
+                        if key in REPOSITORY_PARAMS))
+    for digest in content.blobs:
+        _import_unit(repo_obj, models.Blob(digest=digest),
+                     _write(source_dir, digest, content.get_blob(digest)))
+    for digest, (media_type, manifest) in content.manifests.items():
+        if media_type == constants.MEDIATYPE_MANIFEST_LIST:
+            unit = models.ManifestList.from_json(manifest, digest)
+        else:
+            unit = models.Manifest.from_json(manifest, digest)
+        _import_unit(repo_obj, unit, _write(source_dir, digest, manifest))
+    for tag, digest in content.tags.items():
+        if content.manifests[digest][0] == constants.MEDIATYPE_MANIFEST_LIST:
+            manifest_type = constants.MANIFEST_LIST_TYPE
+        else:
+            manifest_type = constants.MANIFEST_IMAGE_TYPE
+        tag_unit = models.Tag.objects.tag_manifest(repo_id=REPO_ID, tag_name=tag,
+                                                   manifest_digest=digest, schema_version=2,
+                                                   manifest_type=manifest_type)
+        repository.associate_single_unit(repo_obj, tag_unit)
+
+    repo_obj.scratchpad = {u'tags': _seed_images(repo_obj, source_dir, params.get('images', 0),
+                                                 params.get('layers', 1),
+                                                 params.get('layer_size', KB))}
+    repo_obj.save()
+    repository.rebuild_content_unit_counts(repo_obj)
+    shutil.rmtree(source_dir)
+    return pulp_models.Repository.objects.get(repo_id=REPO_ID)
+
+
+def _seed_images(repo_obj, source_dir, count, layers, layer_size):
+    """
+    Add v1 Images to the repository, in chains of as many Images as the scenario's layers, each
+    of them tagged.
+
+    :param repo_obj:   the repository
+    :type  repo_obj:   pulp.server.db.model.Repository
+    :param source_dir: where the files of the Images are written before they are imported
+    :type  source_dir: str
+    :param count:      number of Images
+    :type  count:      int
+    :param layers:     number of Images of each chain
+    :type  layers:     int
+    :param layer_size: size in bytes of the layer of each Image
+    :type  layer_size: int
+    :return:           the v1 tags, as they are stored in the scratchpad of the repository
+    :rtype:            list
+    """
+    tags = []
+    ancestry = []
+    for index in range(count):
+        if index % max(layers, 1) == 0:
+            ancestry = []
+        seed = '%s:image-%d' % (REPO_ID, index)
+        image_id = hashlib.sha256(seed).hexdigest()
+        parent_id = ancestry[0] if ancestry else None
+        ancestry.insert(0, image_id)
+        image_dir = os.path.join(source_dir, image_id)
+        os.makedirs(image_dir)
+        files = {'ancestry': json.dumps(ancestry),
+                 'json': json.dumps({'id': image_id, 'parent': parent_id, 'Size': layer_size}),
+                 'layer': registry_stub.SyntheticRepository.blob_content(seed, layer_size)}
+        image = models.Image(image_id=image_id, parent_id=parent_id, size=layer_size)
+        image.save()
+        for name, data in files.items():
+            image.safe_import_content(_write(image_dir, name, data), location=name)
+        repository.associate_single_unit(repo_obj, image)
+        tags.append({constants.IMAGE_TAG_KEY: 'v1-%05d' % index,
+                     constants.IMAGE_ID_KEY: image_id})
+    return tags
+
+
+def _import_unit(repo_obj, unit, path):
+    """
+    :param repo_obj: the repository
+    :type  repo_obj: pulp.server.db.model.Repository
+    :param unit:     a Blob, Manifest or Manifest List
+    :type  unit:     pulp.server.db.model.FileContentUnit
+    :param path:     path of the file of the unit
+    :type  path:     str
+    """
+    unit.set_storage_path(unit.digest)
+    unit.save_and_import_content(path)
+    repository.associate_single_unit(repo_obj, unit)
+
+
+def _write(directory, name, data):
+    """
+    :return: path of the file the data was written to
+    :rtype:  str
+    """
+    path = os.path.join(directory, name)
+    with open(path, 'w') as output:
+        output.write(data)
+    return path
+
+
+def run_publish(env, repo_obj, publisher_name, symlink_workers, republish=False):
+    """
+    Publish the benchmark repository.
+
+    :param env:             the benchmarks' environment
+    :type  env:             harness.Environment
+    :param repo_obj:        the repository
+    :type  repo_obj:        pulp.server.db.model.Repository
+    :param publisher_name:  name of the publisher in PUBLISHERS
+    :type  publisher_name:  str
+    :param symlink_workers: number of threads creating the symlinks
+    :type  symlink_workers: int
+    :param republish:       whether to publish the repository once before the measured publish,
+                            in the same publish directory
+    :type  republish:       bool
+    :return:                the measurements of the publish
+    :rtype:                 dict
+    """
+    factory, distributor_id, publisher_config = PUBLISHERS[publisher_name]
+    publish_dir = env.working_dir(prefix='publish-')
+    config = dict(publisher_config)
+    config.update({
+        constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: publish_dir,
+        constants.CONFIG_KEY_REDIRECT_URL: 'http://localhost/pulp/docker/%s/' % REPO_ID,
+        constants.CONFIG_KEY_SYMLINK_WORKERS: symlink_workers})
+    if distributor_id == RSYNC_DISTRIBUTOR_ID:
+        config['remote'] = {'host': 'localhost', 'root': os.path.join(publish_dir, 'remote'),
+                            'auth_type': 'publickey', 'ssh_user': 'pulp',
+                            'ssh_identity_file': os.devnull}
+    if republish:
+        _publish(env, repo_obj, factory, distributor_id, config)
+    return _publish(env, repo_obj, factory, distributor_id, config, publish_dir)
+
+
+def _publish(env, repo_obj, factory, distributor_id, config, publish_dir=None):
+    """
+    :param env:            the benchmarks' environment
+    :type  env:            harness.Environment
+    :param repo_obj:       the repository
+    :type  repo_obj:       pulp.server.db.model.Repository
+    :param factory:        creates the publisher
+    :type  factory:        callable
+    :param distributor_id: id of the distributor that publishes
+    :type  distributor_id: str
+    :param config:         configuration of the distributor
+    :type  config:         dict
+    :param publish_dir:    the publish directory, whose files are counted
+    :type  publish_dir:    str
+    :return:               the measurements of the publish
+    :rtype:                dict
+    """
+    conduit = BenchmarkConduit(REPO_ID, distributor_id)
+    working_dir = env.working_dir()
+    fs_calls = FilesystemCalls()
+    timer = None
+    error = None
+    io_before = read_process_io()
+    usage_before = read_rusage()
+    start = time.time()
+    with task_working_dir(working_dir):
+        try:
+            publisher = factory(repo_obj.to_transfer_repo(), conduit,
+                                PluginCallConfiguration({}, config))
+            timer = StepTimer(publisher)
+            with fs_calls:
+                success = publisher.publish().success_flag
+        except Exception as e:
+            success = False
+            error = '%s: %s' % (e.__class__.__name__, e)
+    seconds = time.time() - start
+    units = sum(repo_obj.content_unit_counts.values())
+    return {
+        'seconds': seconds,
+        'success': success,
+        'error': error,
+        'units': units,
+        'units_per_second': units / seconds,
+        'steps': timer.to_dict() if timer is not None else {},
+        'io': _delta(io_before, read_process_io()),
+        'rusage': _delta(usage_before, read_rusage()),
+        'fs_calls': dict(fs_calls.counts),
+        'published': count_tree(publish_dir) if publish_dir else {},
+        'working': count_tree(working_dir),
+        'progress_reports': conduit.progress_reports,
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    :param argv: the command line arguments
+    :type  argv: list
+    :return:     the exit status
+    :rtype:      int
+    """
+    parser = harness.get_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS.keys(),
+                        help='scenario to run, may be repeated, default all of them')
+    parser.add_argument('--publisher', action='append', choices=PUBLISHERS.keys(),
+                        help='publisher, may be repeated, default all of them')
+    parser.add_argument('--symlink-workers', action='append', type=int,
+                        help='number of threads creating the symlinks, may be repeated, '
+                             'default 1')
+    parser.add_argument('--republish', action='store_true',
+                        help='measure a second publish of the repository, which has not changed')
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    env = harness.Environment(options)
+    rows = []
+    try:
+        for scenario in options.scenario or SCENARIOS.keys():
+            params = SCENARIOS[scenario]
+            env.reset()
+            repo_obj = seed_repository(env, params)
+            for publisher_name in options.publisher or PUBLISHERS.keys():
+                for workers in options.symlink_workers or [1]:
+                    variant = dict(params, publisher=publisher_name, symlink_workers=workers,
+                                   republish=options.republish)
+                    results = [env.result(BENCHMARK, scenario, variant, run,
+                                          **run_publish(env, repo_obj, publisher_name, workers,
+                                                        options.republish))
+                               for run in range(options.repeat)]
+                    rows.append(_summary_row(scenario, publisher_name, workers, results))
+    finally:
+        env.close()
+
+    harness.print_table(('scenario', 'publisher', 'workers', 'ok', 'seconds', 'units/s',
+                         'rw syscalls', 'fs calls', 'created', 'slowest step'), rows)
+    return 0 if all(row[3] for row in rows) else 1
+
+
+def _summary_row(scenario, publisher_name, workers, results):
+    """
+    :param scenario:       name of the scenario
+    :type  scenario:       str
+    :param publisher_name: name of the publisher
+    :type  publisher_name: str
+    :param workers:        number of symlink workers
+    :type  workers:        int
+    :param results:        results of the runs
+    :type  results:        list
+    :return:               the medians of the runs, for the summary table
+    :rtype:                list
+    """
+    steps = collections.defaultdict(list)
+    for result in results:
+        for path, step in result['steps'].items():
+            steps[path].append(step['self_seconds'])
+    slowest = max(steps, key=lambda path: harness.median(steps[path])) if steps else ''
+    return [scenario, publisher_name, workers, all(result['success'] for result in results),
+            harness.median([result['seconds'] for result in results]),
+            harness.median([result['units_per_second'] for result in results]),
+            harness.median([result['io'].get('syscr', 0) + result['io'].get('syscw', 0)
+                            for result in results]),
+            harness.median([sum(result['fs_calls'].values()) for result in results]),
+            harness.median([sum(result['published'].get(kind, 0)
+                                for kind in ('dirs', 'files', 'symlinks'))
+                            for result in results]),
+            slowest]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python2
+"""
+Benchmarks of the v2 sync, end to end against a local registry.
+
+Each scenario generates a synthetic repository, serves it from an in-process registry and
+syncs it into an empty Pulp repository with the SyncStep, as a sync task does, against a local
+mongod. Each run reports the throughput of the sync and the time spent in each of its phases,
+from the sync's own measurements, so changes to the sync path can be compared between
+revisions. The scenarios can be run with both metadata engines and several numbers of manifest
+download threads.
+
+The benchmarks need a Pulp server installation and a mongod they can use a database of. For
+example, to compare the metadata engines on the repositories with many tags:
+
+    python2 plugins/test/benchmarks/bench_sync.py --scenario many-tags --scenario paginated \\
+        --engine threaded --engine direct --threads 1 --threads 4 --output results.jsonl
+"""
+import collections
+import logging
+import sys
+import time
+
+from pulp.common.plugins import importer_constants
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.plugins.model import SyncReport
+from pulp.server.db import model as pulp_models
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import metadata_fetcher, models, sync_metrics
+from pulp_docker.plugins.importers import sync
+
+import harness
+import registry_stub
+
+
+BENCHMARK = 'sync'
+REPO_ID = 'benchmark'
+UPSTREAM_NAME = 'benchmark/synthetic'
+
+KB = 1024
+MB = 1024 * KB
+
+# Parameters of the synthetic repository and of the registry of each scenario
+SCENARIOS = collections.OrderedDict([
+    ('small', {'tags': 10, 'layers': 3, 'layer_size': 64 * KB}),
+    ('many-tags', {'tags': 1000, 'layers': 2, 'layer_size': KB}),
+    ('manifest-lists', {'tags': 200, 'manifest_lists': 200, 'layers': 2, 'layer_size': KB}),
+    ('large-layers', {'tags': 4, 'layers': 4, 'shared_layers': 0, 'layer_size': 64 * MB}),
+    ('paginated', {'tags': 1000, 'layers': 2, 'layer_size': KB, 'page_size': 100}),
+    ('basic-auth', {'tags': 200, 'layers': 2, 'layer_size': KB,
+                    'auth': registry_stub.AUTH_BASIC}),
+    ('bearer-auth', {'tags': 200, 'layers': 2, 'layer_size': KB,
+                     'auth': registry_stub.AUTH_BEARER}),
+    ('high-latency', {'tags': 200, 'layers': 2, 'layer_size': KB, 'latency': 0.05}),
+    ('rate-limited', {'tags': 200, 'layers': 2, 'layer_size': KB, 'throttle_every': 100}),
+])
+
+DEFAULT_SCENARIOS = ('small', 'many-tags', 'manifest-lists', 'paginated', 'bearer-auth',
+                     'high-latency')
+
+REPOSITORY_PARAMS = ('tags', 'layers', 'shared_layers', 'layer_size', 'manifest_lists')
+
+
+class BenchmarkConduit(object):
+    """
+    The part of the sync conduit the SyncStep uses, counting the progress reports.
+    """
+
+    def __init__(self):
+        self.progress_reports = 0
+
+    def set_progress(self, status):
+        """
+        :param status: progress report of the sync
+        :type  status: dict
+        """
+        self.progress_reports += 1
+
+    def build_success_report(self, summary, details):
+        """
+        :return: report of a successful sync
+        :rtype:  pulp.plugins.model.SyncReport
+        """
+        return SyncReport(True, -1, -1, -1, summary, details)
+
+    def build_failure_report(self, summary, details):
+        """
+        :return: report of a failed sync
+        :rtype:  pulp.plugins.model.SyncReport
+        """
+        return SyncReport(False, -1, -1, -1, summary, details)
+
+    def build_cancel_report(self, summary, details):
+        """
+        :return: report of a canceled sync
+        :rtype:  pulp.plugins.model.SyncReport
+        """
+        return SyncReport(False, -1, -1, -1, summary, details)
+
+
+def run_sync(env, registry, engine, threads):
+    """
+    Sync the registry's repository into the benchmark repository.
+
+    :param env:      the benchmarks' environment
+    :type  env:      harness.Environment
+    :param registry: the registry
+    :type  registry: registry_stub.RegistryStub
+    :param engine:   the metadata engine
+    :type  engine:   str
+    :param threads:  number of threads downloading the manifests
+    :type  threads:  int
+    :return:         the measurements of the sync
+    :rtype:          dict
+    """
+    repo_obj = pulp_models.Repository.objects.filter(repo_id=REPO_ID).first()
+    if repo_obj is None:
+        repo_obj = pulp_models.Repository(repo_id=REPO_ID)
+        repo_obj.save()
+    config = PluginCallConfiguration({}, {
+        importer_constants.KEY_FEED: registry.url,
+        constants.CONFIG_KEY_UPSTREAM_NAME: UPSTREAM_NAME,
+        constants.CONFIG_KEY_METADATA_ENGINE: engine,
+        constants.CONFIG_KEY_MANIFEST_DOWNLOAD_THREADS: threads,
+        importer_constants.KEY_BASIC_AUTH_USER: 'user',
+        importer_constants.KEY_BASIC_AUTH_PASS: 'password'})
+    conduit = BenchmarkConduit()
+    registry.stats = registry_stub.RegistryStats()
+
+    start = time.time()
+    error = None
+    step = None
+    try:
+        step = sync.SyncStep(repo=repo_obj.to_transfer_repo(), conduit=conduit, config=config,
+                             working_dir=env.working_dir())
+        success = step.process_lifecycle().success_flag
+    except Exception as e:
+        success = False
+        error = '%s: %s' % (e.__class__.__name__, e)
+    seconds = time.time() - start
+
+    metrics = step.metrics.to_dict() if step is not None else {}
+    blob_bytes = metrics.get('phases', {}).get(sync_metrics.PHASE_DOWNLOAD_BLOBS, {}).get(
+        'bytes_downloaded', 0)
+    tags = models.Tag.objects(repo_id=REPO_ID).count()
+    return {
+        'seconds': seconds,
+        'success': success,
+        'error': error,
+        'tags': tags,
+        'manifests': models.Manifest.objects.count() + models.ManifestList.objects.count(),
+        'blobs': models.Blob.objects.count(),
+        'tags_per_second': tags / seconds,
+        'blob_mb_per_second': blob_bytes / float(MB) / seconds,
+        'phases': dict((name, phase['seconds'])
+                       for name, phase in metrics.get('phases', {}).items()),
+        'metrics': metrics,
+        'registry': registry.stats.to_dict(),
+        'progress_reports': conduit.progress_reports,
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    :param argv: the command line arguments
+    :type  argv: list
+    :return:     the exit status
+    :rtype:      int
+    """
+    parser = harness.get_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS.keys(),
+                        help='scenario to run, may be repeated, default %s' %
+                             ', '.join(DEFAULT_SCENARIOS))
+    parser.add_argument('--engine', action='append', choices=metadata_fetcher.ENGINES,
+                        help='metadata engine, may be repeated, default all of them')
+    parser.add_argument('--threads', action='append', type=int,
+                        help='number of threads downloading the manifests, may be repeated, '
+                             'default 1')
+    parser.add_argument('--resync', action='store_true',
+                        help='measure a second sync of the repository, which has nothing new')
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    env = harness.Environment(options)
+    rows = []
+    try:
+        for scenario in options.scenario or DEFAULT_SCENARIOS:
+            params = SCENARIOS[scenario]
+            repository = registry_stub.SyntheticRepository(
+                UPSTREAM_NAME, **dict((key, value) for key, value in params.items()
+                                      if key in REPOSITORY_PARAMS))
+            registry = registry_stub.RegistryStub(
+                [repository], **dict((key, value) for key, value in params.items()
+                                     if key not in REPOSITORY_PARAMS))
+            registry.start()
+            try:
+                for engine in options.engine or metadata_fetcher.ENGINES:
+                    for threads in options.threads or [1]:
+                        variant = dict(params, engine=engine, threads=threads,
+                                       resync=options.resync)
+                        results = []
+                        for run in range(options.repeat):
+                            env.reset()
+                            if options.resync:
+                                run_sync(env, registry, engine, threads)
+                            results.append(env.result(BENCHMARK, scenario, variant, run,
+                                                      **run_sync(env, registry, engine, threads)))
+                        rows.append(_summary_row(scenario, engine, threads, results))
+            finally:
+                registry.stop()
+    finally:
+        env.close()
+
+    harness.print_table(('scenario', 'engine', 'threads', 'ok', 'seconds', 'tags/s', 'blob MB/s',
+                         'requests', 'slowest phase'), rows)
+    return 0 if all(row[3] for row in rows) else 1
+
+
+def _summary_row(scenario, engine, threads, results):
+    """
+    :param scenario: name of the scenario
+    :type  scenario: str
+    :param engine:   the metadata engine
+    :type  engine:   str
+    :param threads:  number of threads downloading the manifests
+    :type  threads:  int
+    :param results:  results of the runs
+    :type  results:  list
+    :return:         the medians of the runs, for the summary table
+    :rtype:          list
+    """
+    phases = collections.defaultdict(list)
+    for result in results:
+        for name, seconds in result['phases'].items():
+            phases[name].append(seconds)
+    slowest = max(phases, key=lambda name: harness.median(phases[name])) if phases else ''
+    return [scenario, engine, threads, all(result['success'] for result in results),
+            harness.median([result['seconds'] for result in results]),
+            harness.median([result['tags_per_second'] for result in results]),
+            harness.median([result['blob_mb_per_second'] for result in results]),
+            harness.median([sum(result['registry']['requests'].values())
+                            for result in results]),
+            slowest]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
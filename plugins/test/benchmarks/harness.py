@@ -0,0 +1,185 @@
+"""
+What the benchmarks share: the Pulp set up against a local mongod, the command line options and
+the results.
+
+The benchmarks run against a database of their own, which is emptied before each run, and
+store the content in a temporary directory, so they never touch the data of a Pulp
+installation. Each run is written as a JSON line to the output file, with the git revision of
+the tree, so the results of two revisions can be compared line by line.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from pulp.server import config as pulp_config
+from pulp.server.db import connection
+from pulp.server.db import model as pulp_models
+from pulp.server.managers import factory
+
+from pulp_docker.plugins import models
+
+
+DEFAULT_MONGO = 'localhost:27017'
+DEFAULT_DATABASE = 'pulp_docker_benchmarks'
+
+# Pulp's own database, which the benchmarks refuse to empty
+PULP_DATABASE = 'pulp_database'
+
+UNIT_MODELS = (models.Blob, models.Image, models.Manifest, models.ManifestList, models.Tag)
+
+
+def get_parser(description):
+    """
+    :param description: description of the benchmark
+    :type  description: str
+    :return:            parser of the options shared by the benchmarks
+    :rtype:             argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--mongo', default=DEFAULT_MONGO,
+                        help='host:port of the mongod, default %(default)s')
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help='database the benchmarks empty and use, default %(default)s')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each benchmark, default %(default)s')
+    parser.add_argument('--output', default=None,
+                        help='file the results are appended to, as JSON lines')
+    parser.add_argument('--work-dir', default=None,
+                        help='directory of the content and working directories, by default a '
+                             'temporary directory')
+    return parser
+
+
+class Environment(object):
+    """
+    The Pulp set up of the benchmarks: the database connection and the content directory.
+    """
+
+    def __init__(self, options):
+        """
+        :param options: the parsed options
+        :type  options: argparse.Namespace
+        """
+        if options.database == PULP_DATABASE:
+            raise ValueError('The benchmarks empty their database, use another one than %s' %
+                             PULP_DATABASE)
+        self.options = options
+        self.root = options.work_dir or tempfile.mkdtemp(prefix='pulp-docker-benchmarks-')
+        self.storage_dir = os.path.join(self.root, 'storage')
+        pulp_config.config.set('server', 'storage_dir', self.storage_dir)
+        connection.initialize(name=options.database, seeds=options.mongo)
+        factory.initialize()
+        self.revision = get_revision()
+
+    def reset(self):
+        """
+        Empty the database and the content directory, and create the indexes the plugin relies
+        on, as pulp-manage-db does.
+        """
+        database = connection.get_database()
+        for name in database.collection_names():
+            if not name.startswith('system.'):
+                database.drop_collection(name)
+        pulp_models.Repository.ensure_indexes()
+        pulp_models.RepositoryContentUnit.ensure_indexes()
+        for model_class in UNIT_MODELS:
+            model_class.ensure_indexes()
+            model_class._get_collection().create_index(
+                [(field, 1) for field in model_class.unit_key_fields], unique=True)
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+        os.makedirs(self.storage_dir)
+
+    def working_dir(self, prefix='working-'):
+        """
+        :param prefix: prefix of the name of the directory
+        :type  prefix: str
+        :return:       a new working directory
+        :rtype:        str
+        """
+        return tempfile.mkdtemp(dir=self.root, prefix=prefix)
+
+    def close(self):
+        """
+        Remove the temporary directory of the benchmarks.
+        """
+        if not self.options.work_dir:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def result(self, benchmark, name, params, run, **measurements):
+        """
+        Record the result of a run, writing it to the output file if there is one.
+
+        :param benchmark:    name of the benchmark suite
+        :type  benchmark:    str
+        :param name:         name of the benchmark in the suite
+        :type  name:         str
+        :param params:       parameters of the benchmark
+        :type  params:       dict
+        :param run:          number of the run
+        :type  run:          int
+        :param measurements: what was measured
+        :type  measurements: dict
+        :return:             the result
+        :rtype:              dict
+        """
+        result = {'benchmark': benchmark, 'name': name, 'params': params, 'run': run,
+                  'revision': self.revision, 'python': platform.python_version(),
+                  'date': datetime.datetime.utcnow().isoformat()}
+        result.update(measurements)
+        if self.options.output:
+            with open(self.options.output, 'a') as output:
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+        return result
+
+
+def get_revision():
+    """
+    :return: the git revision of the tree the benchmarks run from, or None if it is unknown
+    :rtype:  str or NoneType
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def median(values):
+    """
+    :param values: numbers
+    :type  values: list
+    :return:       the median of the numbers
+    :rtype:        float
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def print_table(columns, rows, stream=sys.stdout):
+    """
+    Print rows of results as a table.
+
+    :param columns: titles of the columns
+    :type  columns: list
+    :param rows:    the rows, with a value for each column
+    :type  rows:    list
+    :param stream:  where the table is printed
+    :type  stream:  file
+    """
+    rows = [list(columns)] + [
+        [('%.3f' % value) if isinstance(value, float) else str(value) for value in row]
+        for row in rows]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        stream.write('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+        stream.write('\n')
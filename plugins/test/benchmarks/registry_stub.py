@@ -0,0 +1,493 @@
+"""
+An in-process Docker Registry v2 serving synthetic repositories, for the benchmarks.
+
+The repositories are generated from a few parameters: the number of tags, the number of layers
+of each image and how many of them are shared by all the images, the size of the layers, and
+how many of the tags are manifest lists. The content is the same from one run to the next, so
+the benchmarks are reproducible. The blobs are generated when they are requested instead of
+being kept in memory, so large repositories can be served.
+
+The registry can ask for Basic or Bearer authentication, paginate the tag lists and the catalog,
+add a latency to each request and answer some of the requests with 429 Too Many Requests, to
+reproduce what slows the syncs down against real registries.
+"""
+import BaseHTTPServer
+import base64
+import hashlib
+import json
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+
+from pulp_docker.common import constants
+
+
+AUTH_NONE = 'none'
+AUTH_BASIC = 'basic'
+AUTH_BEARER = 'bearer'
+
+PLATFORMS = (('amd64', 'linux'), ('arm64', 'linux'))
+
+MEDIATYPE_CONFIG = 'application/vnd.docker.container.image.v1+json'
+MEDIATYPE_LAYER = 'application/vnd.docker.image.rootfs.diff.tar.gzip'
+
+
+def _digest(data):
+    """
+    :param data: content of a blob or manifest
+    :type  data: str
+    :return:     the sha256 digest of the content
+    :rtype:      str
+    """
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+class SyntheticRepository(object):
+    """
+    A repository of schema 2 images and manifest lists, generated from its parameters.
+    """
+
+    def __init__(self, name, tags=10, layers=3, shared_layers=1, layer_size=1024,
+                 manifest_lists=0):
+        """
+        :param name:           name of the repository
+        :type  name:           basestring
+        :param tags:           number of tags
+        :type  tags:           int
+        :param layers:         number of layers of each image
+        :type  layers:         int
+        :param shared_layers:  number of the layers that are the same in all the images
+        :type  shared_layers:  int
+        :param layer_size:     size in bytes of each layer
+        :type  layer_size:     int
+        :param manifest_lists: number of the tags that are manifest lists, with an image for each
+                               of PLATFORMS
+        :type  manifest_lists: int
+        """
+        self.name = name
+        self.layer_size = layer_size
+        # (size, seed) of each blob by digest, the content is generated from them
+        self.blobs = {}
+        # (media type, content) of each manifest by digest
+        self.manifests = {}
+        # digest of the manifest of each tag
+        self.tags = {}
+        self._shared = [self._add_layer('shared-%d' % i) for i in range(shared_layers)]
+        for index in range(tags):
+            tag = 'tag-%05d' % index
+            if index < manifest_lists:
+                images = [self._add_image('%s-%s-%s' % (tag, arch, os), layers)
+                          for arch, os in PLATFORMS]
+                self.tags[tag] = self._add_manifest_list(images)
+            else:
+                self.tags[tag] = self._add_image(tag, layers)
+
+    @staticmethod
+    def blob_content(seed, size):
+        """
+        :param seed: what makes the blob unique
+        :type  seed: str
+        :param size: size of the blob in bytes
+        :type  size: int
+        :return:     the content of the blob
+        :rtype:      str
+        """
+        return (seed + '\n').ljust(size, '.')[:size]
+
+    def _add_layer(self, seed):
+        """
+        :param seed: what makes the layer unique
+        :type  seed: str
+        :return:     the digest of the layer
+        :rtype:      str
+        """
+        seed = '%s:%s' % (self.name, seed)
+        digest = _digest(self.blob_content(seed, self.layer_size))
+        self.blobs[digest] = (self.layer_size, seed)
+        return digest
+
+    def _add_config(self, seed):
+        """
+        :param seed: what makes the image unique
+        :type  seed: str
+        :return:     the digest and the size of the image's config blob
+        :rtype:      tuple
+        """
+        content = json.dumps({'architecture': 'amd64', 'os': 'linux',
+                              'config': {'Labels': {'seed': '%s:%s' % (self.name, seed)}}})
+        digest = _digest(content)
+        self.blobs[digest] = (len(content), content)
+        return digest, len(content)
+
+    def _add_image(self, seed, layers):
+        """
+        :param seed:   what makes the image unique
+        :type  seed:   str
+        :param layers: number of layers of the image
+        :type  layers: int
+        :return:       the digest of the image's schema 2 manifest
+        :rtype:        str
+        """
+        config_digest, config_size = self._add_config(seed)
+        digests = self._shared[:layers]
+        digests += [self._add_layer('%s-%d' % (seed, i)) for i in range(layers - len(digests))]
+        manifest = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': constants.MEDIATYPE_MANIFEST_S2,
+            'config': {'mediaType': MEDIATYPE_CONFIG, 'size': config_size,
+                       'digest': config_digest},
+            'layers': [{'mediaType': MEDIATYPE_LAYER, 'size': self.layer_size, 'digest': digest}
+                       for digest in digests]}, indent=3)
+        digest = _digest(manifest)
+        self.manifests[digest] = (constants.MEDIATYPE_MANIFEST_S2, manifest)
+        return digest
+
+    def _add_manifest_list(self, images):
+        """
+        :param images: digests of the images of the list, one for each of PLATFORMS
+        :type  images: list
+        :return:       the digest of the manifest list
+        :rtype:        str
+        """
+        manifest_list = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': constants.MEDIATYPE_MANIFEST_LIST,
+            'manifests': [{'mediaType': constants.MEDIATYPE_MANIFEST_S2,
+                           'size': len(self.manifests[digest][1]),
+                           'digest': digest,
+                           'platform': {'architecture': arch, 'os': os}}
+                          for digest, (arch, os) in zip(images, PLATFORMS)]}, indent=3)
+        digest = _digest(manifest_list)
+        self.manifests[digest] = (constants.MEDIATYPE_MANIFEST_LIST, manifest_list)
+        return digest
+
+    def get_blob(self, digest):
+        """
+        :param digest: digest of a blob
+        :type  digest: basestring
+        :return:       the content of the blob, or None if the repository does not have it
+        :rtype:        str or NoneType
+        """
+        if digest not in self.blobs:
+            return None
+        size, seed = self.blobs[digest]
+        return self.blob_content(seed, size)
+
+    def get_manifest(self, reference, accept):
+        """
+        Get a manifest by tag or digest. Like a registry that does not convert images to schema 1,
+        manifest lists are only returned to clients that accept them and image manifests to
+        clients that accept schema 2.
+
+        :param reference: a tag or a digest
+        :type  reference: basestring
+        :param accept:    media types accepted by the client
+        :type  accept:    list
+        :return:          media type and content of the manifest, or None if there is none the
+                          client accepts
+        :rtype:           tuple or NoneType
+        """
+        digest = self.tags.get(reference, reference)
+        if digest not in self.manifests:
+            return None
+        media_type, content = self.manifests[digest]
+        if media_type not in accept:
+            return None
+        return media_type, content
+
+    @property
+    def size(self):
+        """
+        :return: total size in bytes of the blobs of the repository
+        :rtype:  int
+        """
+        return sum(size for size, seed in self.blobs.values())
+
+
+class RegistryStats(object):
+    """
+    What the registry served, by endpoint class.
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.bytes_served = 0
+        self.unauthorized = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, size):
+        """
+        :param endpoint: endpoint class of the request
+        :type  endpoint: basestring
+        :param status:   status code of the response
+        :type  status:   int
+        :param size:     size of the response body
+        :type  size:     int
+        """
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_served += size
+            self.unauthorized += int(status == 401)
+            self.throttled += int(status == 429)
+
+    def to_dict(self):
+        """
+        :return: the stats
+        :rtype:  dict
+        """
+        with self._lock:
+            return {'requests': dict(self.requests), 'bytes_served': self.bytes_served,
+                    'unauthorized': self.unauthorized, 'throttled': self.throttled}
+
+
+class RegistryStub(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The registry, serving its repositories on a port of localhost from a thread of its own.
+    """
+    daemon_threads = True
+
+    def __init__(self, repositories, auth=AUTH_NONE, username='user', password='password',
+                 page_size=None, latency=0, throttle_every=0):
+        """
+        :param repositories:   the repositories served
+        :type  repositories:   list of SyntheticRepository
+        :param auth:           one of AUTH_NONE, AUTH_BASIC and AUTH_BEARER
+        :type  auth:           basestring
+        :param username:       user name of the Basic authentication
+        :type  username:       basestring
+        :param password:       password of the Basic authentication
+        :type  password:       basestring
+        :param page_size:      number of items in each page of the tag lists and the catalog, or
+                               None to not paginate them
+        :type  page_size:      int or NoneType
+        :param latency:        seconds added to each request
+        :type  latency:        float
+        :param throttle_every: if not 0, every throttle_every-th request is answered with a 429
+        :type  throttle_every: int
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), RegistryRequestHandler)
+        self.repositories = dict((repository.name, repository) for repository in repositories)
+        self.auth = auth
+        self.credentials = base64.b64encode('%s:%s' % (username, password))
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.stats = RegistryStats()
+        self._request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        :return: URL of the registry
+        :rtype:  str
+        """
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        """
+        Start serving, in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving, and close the socket.
+        """
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def throttle(self):
+        """
+        :return: True if the request being handled is to be answered with a 429
+        :rtype:  bool
+        """
+        with self._count_lock:
+            self._request_count += 1
+            return bool(self.throttle_every) and self._request_count % self.throttle_every == 0
+
+    @staticmethod
+    def token(name):
+        """
+        :param name: name of a repository
+        :type  name: basestring
+        :return:     the Bearer token granting access to the repository
+        :rtype:      str
+        """
+        return 'token-' + hashlib.sha1(name).hexdigest()
+
+
+class RegistryRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles the requests of a RegistryStub, with keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """
+        Do not log the requests, the benchmarks report what the registry served.
+        """
+
+    def do_GET(self):
+        """
+        Serve a request for the API version, the catalog, a tag list, a manifest, a blob or a
+        token.
+        """
+        registry = self.server
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        if registry.latency:
+            time.sleep(registry.latency)
+
+        if url.path == '/token':
+            scope = query.get('scope', [''])[0].split(':')
+            name = scope[1] if len(scope) == 3 else ''
+            return self._respond('token', 200, json.dumps({'token': registry.token(name)}),
+                                 'application/json')
+        endpoint = self._classify(parts)
+        if registry.throttle():
+            return self._respond(endpoint, 429, 'Too Many Requests', headers={'Retry-After': '1'})
+
+        name = '/'.join(parts[1:-2]) if endpoint in ('tags', 'manifests', 'blobs') else ''
+        if not self._authorized(name):
+            return self._challenge(endpoint, name)
+
+        if endpoint == 'version':
+            return self._respond(endpoint, 200, '{}', 'application/json')
+        if endpoint == 'catalog':
+            return self._respond_page(endpoint, '/v2/_catalog', 'repositories',
+                                      sorted(registry.repositories), query)
+        repository = registry.repositories.get(name)
+        if repository is None:
+            return self._respond(endpoint, 404, 'Not Found')
+        if endpoint == 'tags':
+            return self._respond_page(endpoint, '/v2/%s/tags/list' % name, 'tags',
+                                      sorted(repository.tags), query, name=name)
+        if endpoint == 'manifests':
+            accept = [media_type.strip() for media_type in
+                      self.headers.get('Accept', '').split(',')]
+            manifest = repository.get_manifest(parts[-1], accept)
+            if manifest is None:
+                return self._respond(endpoint, 404, 'Not Found')
+            media_type, content = manifest
+            return self._respond(endpoint, 200, content, media_type,
+                                 headers={'Docker-Content-Digest': _digest(content)})
+        if endpoint == 'blobs':
+            content = repository.get_blob(parts[-1])
+            if content is None:
+                return self._respond(endpoint, 404, 'Not Found')
+            return self._respond(endpoint, 200, content, 'application/octet-stream')
+        return self._respond(endpoint, 404, 'Not Found')
+
+    @staticmethod
+    def _classify(parts):
+        """
+        :param parts: the parts of the path of a request
+        :type  parts: list
+        :return:      the endpoint class of the request
+        :rtype:       str
+        """
+        if parts == ['v2']:
+            return 'version'
+        if parts == ['v2', '_catalog']:
+            return 'catalog'
+        if len(parts) > 3 and parts[-2:] == ['tags', 'list']:
+            return 'tags'
+        if len(parts) > 3 and parts[-2] in ('manifests', 'blobs'):
+            return parts[-2]
+        return 'other'
+
+    def _authorized(self, name):
+        """
+        :param name: name of the repository requested, if any
+        :type  name: basestring
+        :return:     True if the request has the credentials the registry expects
+        :rtype:      bool
+        """
+        registry = self.server
+        authorization = self.headers.get('Authorization', '')
+        if registry.auth == AUTH_BASIC:
+            return authorization == 'Basic ' + registry.credentials
+        if registry.auth == AUTH_BEARER:
+            return authorization == 'Bearer ' + registry.token(name)
+        return True
+
+    def _challenge(self, endpoint, name):
+        """
+        Answer with a 401 asking for the credentials the registry expects.
+
+        :param endpoint: endpoint class of the request
+        :type  endpoint: str
+        :param name:     name of the repository requested, if any
+        :type  name:     basestring
+        """
+        registry = self.server
+        if registry.auth == AUTH_BASIC:
+            challenge = 'Basic realm="registry"'
+        else:
+            challenge = 'Bearer realm="%s/token",service="registry"' % registry.url
+            if name:
+                challenge += ',scope="repository:%s:pull"' % name
+        self._respond(endpoint, 401, 'Unauthorized', headers={'WWW-Authenticate': challenge})
+
+    def _respond_page(self, endpoint, path, key, items, query, name=None):
+        """
+        Answer with a page of a list, with a Link header to the next page if there is one.
+
+        :param endpoint: endpoint class of the request
+        :type  endpoint: str
+        :param path:     path of the list
+        :type  path:     str
+        :param key:      key of the list in the JSON document
+        :type  key:      str
+        :param items:    the whole list, sorted
+        :type  items:    list
+        :param query:    parameters of the request
+        :type  query:    dict
+        :param name:     name of the repository, for a tag list
+        :type  name:     basestring or NoneType
+        """
+        page_size = int(query.get('n', [self.server.page_size or len(items) or 1])[0])
+        last = query.get('last', [None])[0]
+        if last is not None:
+            items = [item for item in items if item > last]
+        page = items[:page_size]
+        document = {key: page}
+        if name is not None:
+            document['name'] = name
+        headers = {}
+        if len(items) > page_size:
+            headers['Link'] = '<%s?%s>; rel="next"' % (
+                path, urllib.urlencode((('n', page_size), ('last', page[-1]))))
+        self._respond(endpoint, 200, json.dumps(document), 'application/json', headers)
+
+    def _respond(self, endpoint, status, body, content_type='text/plain', headers=None):
+        """
+        :param endpoint:     endpoint class of the request
+        :type  endpoint:     str
+        :param status:       status code
+        :type  status:       int
+        :param body:         body of the response
+        :type  body:         str
+        :param content_type: media type of the body
+        :type  content_type: str
+        :param headers:      other headers of the response
+        :type  headers:      dict or NoneType
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Docker-Distribution-API-Version', 'registry/2.0')
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.record(endpoint, status, len(body))
@@ -7,6 +7,7 @@ from mock import Mock, patch
 
 from pulp.devel.unit.server.util import assert_validation_exception
 from pulp.plugins.config import PluginCallConfiguration
+from pulp.server.exceptions import PulpCodedValidationException
 
 from pulp_docker.common import constants, error_codes
 from pulp_docker.plugins.distributors import configuration
@@ -76,6 +77,72 @@ class TestValidateConfig(unittest.TestCase):
         assert_validation_exception(configuration.validate_config,
                                     [error_codes.DKR1004], config, repo)
 
+    def test_configuration_incremental_publish_bad_str(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_INCREMENTAL_PUBLISH: 'sometimes'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1004], config, repo)
+
+    def test_configuration_static_layout_protected(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_STATIC_LAYOUT: 'true',
+            constants.CONFIG_KEY_PROTECTED: True
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1032], config, repo)
+
+    def test_configuration_shared_blobs_protected(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_SHARED_BLOBS: 'true',
+            constants.CONFIG_KEY_PROTECTED: True
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1034], config, repo)
+
+    def test_configuration_profile_bad_str(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_PROFILE_MEMORY: 'sometimes'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1004], config, repo)
+
+    def test_configuration_symlink_workers_invalid(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_SYMLINK_WORKERS: '0'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1021], config, repo)
+
+    def test_configuration_export_compression_invalid(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_EXPORT_COMPRESSION: 'lzma'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1022], config, repo)
+
+    def test_configuration_export_start_date_invalid(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_EXPORT_START_DATE: 'yesterday'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1024], config, repo)
+
+    def test_configuration_export_delta_base_missing(self):
+        config = PluginCallConfiguration({
+            constants.CONFIG_KEY_EXPORT_DELTA_BASE: '/does/not/exist.tar.json'
+        }, {})
+        repo = Mock(id='repoid')
+        assert_validation_exception(configuration.validate_config,
+                                    [error_codes.DKR1033], config, repo)
+
     def test_repo_regisrty_id_with_slash(self):
         """
         We need to allow a single slash in this field to allow namespacing.
@@ -228,6 +295,83 @@ class TestConfigurationGetters(unittest.TestCase):
         self.assertEquals(computed_result, configuration.get_redirect_url({},
                                                                           Mock(id='baz'), 'v1'))
 
+    def test_get_incremental_publish_default(self):
+        self.assertFalse(configuration.get_incremental_publish(self.config))
+
+    def test_get_incremental_publish_str(self):
+        config = {constants.CONFIG_KEY_INCREMENTAL_PUBLISH: 'True'}
+        self.assertTrue(configuration.get_incremental_publish(config))
+
+    def test_get_compact_redirect_file_default(self):
+        self.assertFalse(configuration.get_compact_redirect_file(self.config))
+
+    def test_get_redirect_file_index(self):
+        config = {constants.CONFIG_KEY_REDIRECT_FILE_INDEX: 'true'}
+        self.assertTrue(configuration.get_redirect_file_index(config))
+
+    def test_get_shared_blobs_dir_default(self):
+        self.assertEqual(configuration.get_shared_blobs_dir(self.config), None)
+
+    def test_get_shared_blobs_dir(self):
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+                  constants.CONFIG_KEY_SHARED_BLOBS: 'true'}
+        self.assertEqual(configuration.get_shared_blobs_dir(config),
+                         os.path.join(self.publish_dir, 'v2', 'blobs'))
+
+    def test_get_symlink_workers_default(self):
+        self.assertEqual(configuration.get_symlink_workers({}), 1)
+
+    def test_get_symlink_workers_str(self):
+        config = {constants.CONFIG_KEY_SYMLINK_WORKERS: '8'}
+        self.assertEqual(configuration.get_symlink_workers(config), 8)
+
+    def test_get_export_repo_file_with_path_v2_compressed(self):
+        self.config[constants.CONFIG_KEY_EXPORT_COMPRESSION] = 'gzip'
+        file_name = configuration.get_export_repo_file_with_path(self.repo, self.config, 'v2')
+        self.assertEquals(file_name,
+                          os.path.join(self.publish_dir, 'v2', 'export', 'repo', 'foo.tar.gz'))
+
+    def test_get_export_compression_threads_default(self):
+        self.assertEqual(configuration.get_export_compression_threads(self.config), 1)
+
+    def test_get_export_start_date(self):
+        self.config[constants.CONFIG_KEY_EXPORT_START_DATE] = '2018-01-01T00:00:00Z'
+        start_date = configuration.get_export_start_date(self.config)
+        self.assertEqual((start_date.year, start_date.month, start_date.day), (2018, 1, 1))
+
+    def test_get_export_start_date_default(self):
+        self.assertEqual(configuration.get_export_start_date(self.config), None)
+
+    def test_read_export_delta_base(self):
+        base_path = os.path.join(self.working_directory, 'base.tar.json')
+        with open(base_path, 'w') as base_file:
+            base_file.write('{"created": "2018-01-01T00:00:00Z", "content": {"blobs": [], '
+                            '"manifests": [], "manifest_lists": []}}')
+        self.config[constants.CONFIG_KEY_EXPORT_DELTA_BASE] = base_path
+
+        base = configuration.read_export_delta_base(self.config)
+
+        self.assertEqual(base['created'], '2018-01-01T00:00:00Z')
+
+    def test_read_export_delta_base_invalid(self):
+        for content in ('not json', '{"created": "2018-01-01T00:00:00Z", "content": {}}'):
+            base_path = os.path.join(self.working_directory, 'base.tar.json')
+            with open(base_path, 'w') as base_file:
+                base_file.write(content)
+            self.config[constants.CONFIG_KEY_EXPORT_DELTA_BASE] = base_path
+
+            with self.assertRaises(PulpCodedValidationException) as context:
+                configuration.read_export_delta_base(self.config)
+
+            self.assertEqual(context.exception.error_code, error_codes.DKR1033)
+
+    def test_read_export_delta_base_default(self):
+        self.assertEqual(configuration.read_export_delta_base(self.config), None)
+
+    def test_get_export_manifest_path(self):
+        self.assertEqual(configuration.get_export_manifest_path('/a/foo.tar.gz'),
+                         '/a/foo.tar.gz.json')
+
     def test_get_export_repo_filename(self):
         filename = configuration.get_export_repo_filename(self.repo, self.config)
         self.assertEquals(filename, "foo.tar")
@@ -40,7 +40,10 @@ class TestBasics(unittest.TestCase):
         metadata = DockerExportDistributor.metadata()
 
         self.assertEqual(metadata['id'], constants.DISTRIBUTOR_EXPORT_TYPE_ID)
-        self.assertEqual(metadata['types'], [constants.IMAGE_TYPE_ID])
+        self.assertEqual(metadata['types'], [constants.IMAGE_TYPE_ID, constants.BLOB_TYPE_ID,
+                                             constants.MANIFEST_TYPE_ID,
+                                             constants.MANIFEST_LIST_TYPE_ID,
+                                             constants.TAG_TYPE_ID])
         self.assertTrue(len(metadata['display_name']) > 0)
 
     @patch('pulp_docker.plugins.distributors.distributor_export.configuration.validate_config')
@@ -60,6 +63,7 @@ class TestBasics(unittest.TestCase):
         config = {}
         touch(os.path.join(working_dir, 'bar.json'))
         touch(os.path.join(mock_repo_dir.return_value, 'bar.tar'))
+        touch(os.path.join(mock_repo_dir.return_value, 'bar.tar.json'))
         self.distributor.distributor_removed(repo, config)
 
         self.assertEquals(0, len(os.listdir(mock_repo_dir.return_value)))
@@ -91,7 +95,7 @@ class TestBasics(unittest.TestCase):
         self.assertEquals(1, len(os.listdir(self.working_dir)))
         self.assertEquals(0, len(os.listdir(mock_repo_dir.return_value)))
 
-    @patch('pulp_docker.plugins.distributors.distributor_export.ExportPublisher')
+    @patch('pulp_docker.plugins.distributors.distributor_export.v1_publish_steps.ExportPublisher')
     def test_publish_repo(self, mock_publisher):
         repo = Repository('test')
         config = PluginCallConfiguration(None, None)
@@ -100,6 +104,15 @@ class TestBasics(unittest.TestCase):
 
         mock_publisher.assert_called_once()
 
+    @patch('pulp_docker.plugins.distributors.distributor_export.v2_export_steps.ExportPublisher')
+    def test_publish_repo_v2(self, mock_publisher):
+        repo = Repository('test')
+        config = PluginCallConfiguration(None, {constants.CONFIG_KEY_EXPORT_API_VERSION: 'v2'})
+        conduit = RepoPublishConduit(repo.id, 'foo_repo')
+        self.distributor.publish_repo(repo, conduit, config)
+
+        mock_publisher.assert_called_once_with(repo, conduit, config)
+
     def test_cancel_publish_repo(self):
         self.distributor._publisher = MagicMock()
         self.distributor.cancel_publish_repo()
@@ -50,12 +50,14 @@ class TestBasics(unittest.TestCase):
         mock_validate.assert_called_once_with('foo', repo)
         self.assertEquals(value, mock_validate.return_value)
 
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_httpd_config_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_app_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_master_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_web_publish_dir')
-    def test_distributor_removed(self, mock_web, mock_master, mock_app):
+    def test_distributor_removed(self, mock_web, mock_master, mock_app, mock_httpd):
 
         mock_app.return_value = os.path.join(self.working_dir)
+        mock_httpd.return_value = os.path.join(self.working_dir)
         mock_web.return_value = os.path.join(self.working_dir, 'web')
         mock_master.return_value = os.path.join(self.working_dir, 'master')
         working_dir = os.path.join(self.working_dir, 'working')
@@ -64,16 +66,20 @@ class TestBasics(unittest.TestCase):
         repo = Mock(id='bar', working_dir=working_dir)
         config = {}
         touch(os.path.join(self.working_dir, 'bar.json'))
+        touch(os.path.join(self.working_dir, 'bar.index'))
+        touch(os.path.join(self.working_dir, 'bar.conf'))
         self.distributor.distributor_removed(repo, config)
 
         self.assertEquals(0, len(os.listdir(self.working_dir)))
 
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_httpd_config_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_app_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_master_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_web_publish_dir')
-    def test_distributor_removed_dir_is_none(self, mock_web, mock_master, mock_app):
+    def test_distributor_removed_dir_is_none(self, mock_web, mock_master, mock_app, mock_httpd):
 
         mock_app.return_value = os.path.join(self.working_dir)
+        mock_httpd.return_value = os.path.join(self.working_dir)
         mock_web.return_value = os.path.join(self.working_dir, 'web')
         mock_master.return_value = os.path.join(self.working_dir, 'master')
         repo_working_dir = None
@@ -85,11 +91,13 @@ class TestBasics(unittest.TestCase):
 
         self.assertEquals(0, len(os.listdir(self.working_dir)))
 
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_httpd_config_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_app_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_master_publish_dir')
     @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_web_publish_dir')
-    def test_distributor_removed_files_missing(self, mock_web, mock_master, mock_app):
+    def test_distributor_removed_files_missing(self, mock_web, mock_master, mock_app, mock_httpd):
         mock_app.return_value = os.path.join(self.working_dir)
+        mock_httpd.return_value = os.path.join(self.working_dir)
         mock_web.return_value = os.path.join(self.working_dir, 'web')
         mock_master.return_value = os.path.join(self.working_dir, 'master')
         working_dir = os.path.join(self.working_dir, 'working')
@@ -98,6 +106,30 @@ class TestBasics(unittest.TestCase):
         self.distributor.distributor_removed(repo, config)
         self.assertEquals(0, len(os.listdir(self.working_dir)))
 
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_shared_blobs_dir')
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_httpd_config_dir')
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_app_publish_dir')
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_master_publish_dir')
+    @patch('pulp_docker.plugins.distributors.distributor_web.configuration.get_web_publish_dir')
+    def test_distributor_removed_shared_blobs(self, mock_web, mock_master, mock_app, mock_httpd,
+                                              mock_shared):
+        """The dangling links of the shared Blob directory are removed"""
+        mock_app.return_value = mock_httpd.return_value = os.path.join(self.working_dir, 'app')
+        mock_web.return_value = os.path.join(self.working_dir, 'web')
+        mock_master.return_value = os.path.join(self.working_dir, 'master')
+        mock_shared.return_value = os.path.join(self.working_dir, 'blobs')
+        blob = os.path.join(self.working_dir, 'content', 'a')
+        touch(blob)
+        os.makedirs(mock_shared.return_value)
+        os.symlink(blob, os.path.join(mock_shared.return_value, 'sha256:a'))
+        os.symlink(os.path.join(self.working_dir, 'content', 'removed'),
+                   os.path.join(mock_shared.return_value, 'sha256:removed'))
+        repo = Mock(id='bar', working_dir=os.path.join(self.working_dir, 'working'))
+
+        self.distributor.distributor_removed(repo, {constants.CONFIG_KEY_SHARED_BLOBS: True})
+
+        self.assertEqual(os.listdir(mock_shared.return_value), ['sha256:a'])
+
     @patch('pulp_docker.plugins.distributors.distributor_web.WebPublisher')
     def test_publish_repo(self, mock_publisher):
         repo = Repository('test')
@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tempfile
@@ -6,10 +7,13 @@ import time
 
 from mock import Mock, patch
 
+from pulp.devel.unit.util import touch
+from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.util import publish_step
+from pulp.server.exceptions import PulpCodedException
 
-from pulp_docker.common import constants
-from pulp_docker.plugins.distributors import publish_steps
+from pulp_docker.common import constants, error_codes
+from pulp_docker.plugins.distributors import publish_steps, symlinks
 
 
 class StepAdapter(object):
@@ -28,6 +32,26 @@ class StepAdapter(object):
         return []
 
 
+class TestWebPublisher(unittest.TestCase):
+
+    @patch('pulp_docker.plugins.distributors.publish_steps.publish_step.PublishStep.'
+           'process_lifecycle')
+    @patch('pulp_docker.plugins.distributors.publish_steps.V2WebPublisher')
+    @patch('pulp_docker.plugins.distributors.publish_steps.v1_publish_steps.WebPublisher')
+    @patch('pulp_docker.plugins.distributors.publish_steps.WebPublisher.get_predistributor')
+    def test_process_lifecycle_failure(self, get_predistributor, v1_publisher, v2_publisher,
+                                       process_lifecycle):
+        """The threads creating the v2 symlinks are stopped when the publish fails"""
+        get_predistributor.return_value = None
+        process_lifecycle.side_effect = IOError('No space left on device')
+        publisher = publish_steps.WebPublisher(Mock(id='foo'), Mock(),
+                                               PluginCallConfiguration({}, {}))
+
+        self.assertRaises(IOError, publisher.process_lifecycle)
+
+        v2_publisher.return_value.symlink_creator.close.assert_called_once_with()
+
+
 class TestV2WebPublisher(unittest.TestCase):
 
     def setUp(self):
@@ -62,6 +86,55 @@ class TestV2WebPublisher(unittest.TestCase):
         self.mock_no_units(publisher)
         return publisher
 
+    @patch('pulp_docker.plugins.distributors.publish_steps.V2WebPublisher.'
+           'get_working_dir')
+    def test_incremental_publish_steps(self, get_working_dir):
+        """In incremental mode links are recorded and applied by IncrementalPublishStep"""
+        get_working_dir.return_value = self.working_temp
+        mock_config = {
+            constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+            constants.CONFIG_KEY_INCREMENTAL_PUBLISH: True
+        }
+        publisher = publish_steps.V2WebPublisher(self.repo, Mock(), mock_config)
+
+        self.assertTrue(isinstance(publisher.children[-1], publish_steps.IncrementalPublishStep))
+        self.assertTrue(isinstance(publisher.children[-3], publish_steps.CreateSymlinksStep))
+        publisher.create_symlink('/content/1', os.path.join(self.working_temp, 'blobs', 'a'))
+        self.assertEqual(publisher.published_links, {'blobs/a': '/content/1'})
+        self.assertFalse(os.path.exists(os.path.join(self.working_temp, 'blobs')))
+
+    @patch('pulp_docker.plugins.distributors.publish_steps.V2WebPublisher.'
+           'get_working_dir')
+    def test_static_layout_protected(self, get_working_dir):
+        """The static layout is refused for protected repositories"""
+        get_working_dir.return_value = self.working_temp
+        mock_config = {
+            constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+            constants.CONFIG_KEY_STATIC_LAYOUT: True,
+            constants.CONFIG_KEY_PROTECTED: True
+        }
+
+        with self.assertRaises(PulpCodedException) as context:
+            publish_steps.V2WebPublisher(self.repo, Mock(), mock_config)
+
+        self.assertEqual(context.exception.error_code, error_codes.DKR1032)
+
+    @patch('pulp_docker.plugins.distributors.publish_steps.V2WebPublisher.'
+           'get_working_dir')
+    def test_shared_blobs_protected(self, get_working_dir):
+        """The shared Blobs are refused for protected repositories"""
+        get_working_dir.return_value = self.working_temp
+        mock_config = {
+            constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+            constants.CONFIG_KEY_SHARED_BLOBS: True,
+            constants.CONFIG_KEY_PROTECTED: True
+        }
+
+        with self.assertRaises(PulpCodedException) as context:
+            publish_steps.V2WebPublisher(self.repo, Mock(), mock_config)
+
+        self.assertEqual(context.exception.error_code, error_codes.DKR1034)
+
     @patch('selinux.restorecon')
     @patch('pulp_docker.plugins.distributors.publish_steps.V2WebPublisher.'
            'get_working_dir')
@@ -133,3 +206,257 @@ class TestV2WebPublisher(unittest.TestCase):
 
         self.assertNotEqual(old_app_file, new_app_file)
         self.assertNotEqual(old_tags_file, new_tags_file)
+
+
+class TestIncrementalPublishStep(unittest.TestCase):
+
+    def setUp(self):
+        self.working_directory = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.working_directory, 'work')
+        self.master_dir = os.path.join(self.working_directory, 'master', 'foo')
+        self.publish_dir = os.path.join(self.working_directory, 'web', 'foo')
+        self.app_file = os.path.join(self.working_directory, 'app', 'foo.json')
+        os.makedirs(os.path.join(self.source_dir, 'tags'))
+        with open(os.path.join(self.source_dir, 'tags', 'list'), 'w') as list_file:
+            list_file.write('{}')
+        with open(os.path.join(self.source_dir, 'foo.json'), 'w') as app_file:
+            app_file.write('{}')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_directory)
+
+    def publish(self, links):
+        step = publish_steps.IncrementalPublishStep(
+            self.source_dir, [('', self.publish_dir), ('foo.json', self.app_file)],
+            self.master_dir)
+        step.parent = Mock(published_links=links)
+        step.process_main()
+
+    def test_first_publish(self):
+        """The first publish builds the tree and replaces non incremental publishes"""
+        os.makedirs(os.path.join(self.master_dir, '1234.5'))
+
+        self.publish({'blobs/sha256:1': '/content/1'})
+
+        live_dir = os.path.join(self.master_dir, 'incremental-a')
+        self.assertEqual(os.readlink(self.publish_dir), live_dir)
+        self.assertEqual(os.readlink(self.app_file), os.path.join(live_dir, 'foo.json'))
+        self.assertEqual(os.readlink(os.path.join(live_dir, 'blobs', 'sha256:1')), '/content/1')
+        self.assertTrue(os.path.exists(os.path.join(live_dir, 'tags', 'list')))
+        self.assertEqual(sorted(os.listdir(self.master_dir)),
+                         ['incremental-a', 'incremental-a.json'])
+
+    def test_republish_applies_changes(self):
+        """Republishing switches directories and only keeps the current links"""
+        self.publish({'blobs/sha256:1': '/content/1', 'blobs/sha256:2': '/content/2'})
+        self.publish({'blobs/sha256:1': '/content/1'})
+        self.assertEqual(os.readlink(self.publish_dir),
+                         os.path.join(self.master_dir, 'incremental-b'))
+
+        self.publish({'blobs/sha256:1': '/content/1', 'blobs/sha256:3': '/content/3'})
+
+        live_dir = os.path.join(self.master_dir, 'incremental-a')
+        self.assertEqual(os.readlink(self.publish_dir), live_dir)
+        self.assertEqual(sorted(os.listdir(os.path.join(live_dir, 'blobs'))),
+                         ['sha256:1', 'sha256:3'])
+
+    @patch('pulp_docker.plugins.distributors.publish_steps.misc.create_symlink')
+    def test_republish_skips_unchanged_links(self, mock_create_symlink):
+        """Links that did not change since the last publish are not created again"""
+        links = {'blobs/sha256:1': '/content/1'}
+        self.publish(links)
+        self.publish(links)
+        mock_create_symlink.reset_mock()
+
+        self.publish(dict(links, **{'blobs/sha256:2': '/content/2'}))
+
+        mock_create_symlink.assert_called_once_with(
+            '/content/2', os.path.join(self.master_dir, 'incremental-a', 'blobs', 'sha256:2'))
+
+
+class TestGetTaggedManifests(unittest.TestCase):
+
+    @patch('pulp_docker.plugins.distributors.publish_steps.models')
+    def test_bulk_lookup(self, mock_models):
+        mock_models.Tag.objects.filter.return_value.distinct.return_value = ['sha256:b',
+                                                                             'sha256:a']
+        manifest = Mock(digest='sha256:a', schema_version=2)
+        manifest_list = Mock(digest='sha256:b')
+        mock_models.Manifest.objects.filter.return_value.only.return_value = [manifest]
+        mock_models.ManifestList.objects.filter.return_value.only.return_value = [manifest_list]
+
+        manifests = publish_steps.get_tagged_manifests('repo1')
+
+        self.assertEqual(manifests, {'sha256:a': (manifest, 2),
+                                     'sha256:b': (manifest_list, constants.MANIFEST_LIST_TYPE)})
+        mock_models.Tag.objects.filter.assert_called_once_with(repo_id='repo1')
+        mock_models.Manifest.objects.filter.assert_called_once_with(
+            digest__in=['sha256:a', 'sha256:b'])
+        mock_models.ManifestList.objects.filter.assert_called_once_with(
+            digest__in=['sha256:a', 'sha256:b'])
+
+    def test_missing_manifest(self):
+        tag = Mock(manifest_digest='sha256:a')
+        tag.name = 'latest'
+
+        self.assertRaises(publish_steps.mongoengine.DoesNotExist,
+                          publish_steps.get_tagged_manifest, {}, tag)
+
+
+class TestPublishBlobsStep(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.temp_dir, 'working')
+        self.shared_dir = os.path.join(self.temp_dir, 'blobs')
+        self.parent = Mock(symlink_creator=symlinks.SymlinkCreator(),
+                           shared_blobs_dir=self.shared_dir)
+        self.parent.get_working_dir.return_value = self.working_dir
+        self.step = publish_steps.PublishBlobsStep()
+        self.step.parent = self.parent
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _blob(self, name):
+        path = os.path.join(self.temp_dir, 'content', name)
+        touch(path)
+        return Mock(_storage_path=path, unit_key={'digest': 'sha256:%s' % name})
+
+    def test_shared_blobs(self):
+        blob_a = self._blob('a')
+        blob_b = self._blob('b')
+        os.makedirs(self.shared_dir)
+        os.symlink(blob_a._storage_path, os.path.join(self.shared_dir, 'sha256:a'))
+        self.parent.symlink_creator = Mock(wraps=self.parent.symlink_creator)
+
+        self.step.initialize()
+        self.step.process_main(blob_a)
+        self.step.process_main(blob_b)
+
+        self.parent.create_symlink.assert_called_once_with(
+            self.shared_dir, os.path.join(self.working_dir, 'blobs'))
+        self.parent.symlink_creator.create_symlink.assert_called_once_with(
+            blob_b._storage_path, os.path.join(self.shared_dir, 'sha256:b'))
+        self.assertEqual(sorted(os.listdir(self.shared_dir)), ['sha256:a', 'sha256:b'])
+
+    @patch('os.listdir')
+    def test_shared_blobs_not_listed(self, listdir):
+        """The shared directory is not listed, only the repository's Blobs are looked up"""
+        self.step.initialize()
+        self.step.process_main(self._blob('a'))
+
+        self.assertFalse(listdir.called)
+
+    def test_shared_blobs_dangling(self):
+        """A link to a removed Blob file is replaced"""
+        blob_a = self._blob('a')
+        os.makedirs(self.shared_dir)
+        os.symlink('/content/removed', os.path.join(self.shared_dir, 'sha256:a'))
+
+        self.step.initialize()
+        self.step.process_main(blob_a)
+
+        self.assertEqual(os.readlink(os.path.join(self.shared_dir, 'sha256:a')),
+                         blob_a._storage_path)
+
+    def test_repository_blobs(self):
+        self.parent.shared_blobs_dir = None
+
+        self.step.initialize()
+        self.step.process_main(Mock(_storage_path='/content/a', unit_key={'digest': 'sha256:a'}))
+
+        self.parent.create_symlink.assert_called_once_with(
+            '/content/a', os.path.join(self.working_dir, 'blobs', 'sha256:a'))
+        self.assertFalse(os.path.exists(self.shared_dir))
+
+
+class TestRedirectFileStep(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.app_file = os.path.join(self.temp_dir, 'app', 'foo.json')
+        self.index_file = os.path.join(self.temp_dir, 'app', 'foo.index')
+        self.parent = Mock(redirect_data={1: set(), 2: set(['sha256:b', 'sha256:a']),
+                                          'list': set(['latest']),
+                                          'amd64': {'latest': ('sha256:c', 2)}})
+        self.config = {constants.CONFIG_KEY_REDIRECT_URL: 'http://example.com/foo'}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_step(self, index_file=None):
+        step = publish_steps.RedirectFileStep(self.app_file, index_file)
+        step.parent = self.parent
+        step.get_repo = Mock(return_value=Mock(id='foo'))
+        step.get_config = Mock(return_value=self.config)
+        return step
+
+    def test_version_4(self):
+        self.make_step().process_main()
+
+        with open(self.app_file) as app_file:
+            rdata = json.load(app_file)
+        self.assertEqual(rdata['version'], 4)
+        self.assertEqual(sorted(rdata['schema2_data']), ['sha256:a', 'sha256:b'])
+        self.assertEqual(rdata['manifest_list_amd64_tags'], {'latest': ['sha256:c', 2]})
+        self.assertFalse(os.path.exists(self.index_file))
+
+    def test_compact_with_index(self):
+        self.config[constants.CONFIG_KEY_COMPACT_REDIRECT_FILE] = True
+
+        self.make_step(self.index_file).process_main()
+
+        with open(self.app_file) as app_file:
+            content = app_file.read()
+        self.assertEqual(content, json.dumps({
+            'type': 'pulp-docker-redirect', 'version': 5, 'repository': 'foo',
+            'repo-registry-id': 'foo', 'url': 'http://example.com/foo/', 'protected': False,
+            'schema2_data': ['sha256:a', 'sha256:b'], 'manifest_list_data': ['latest'],
+            'manifest_list_amd64_tags': {'latest': ['sha256:c', 2]}},
+            separators=(',', ':'), sort_keys=True))
+        with open(self.index_file) as index_file:
+            self.assertEqual(index_file.readlines(), ['amd64 latest sha256:c 2\n',
+                                                      'list latest\n',
+                                                      'schema2 sha256:a\n',
+                                                      'schema2 sha256:b\n'])
+
+    def test_version_4_with_index(self):
+        self.parent.redirect_data['amd64'] = {'latest': ('sha256:c', 2), 'a-b': ('sha256:d', 1),
+                                              'a': ('sha256:e', 2)}
+        self.parent.redirect_data['list'].update(['a-b', 'a'])
+
+        self.make_step(self.index_file).process_main()
+
+        with open(self.app_file) as app_file:
+            rdata = json.load(app_file)
+        self.assertEqual(rdata['version'], 4)
+        self.assertEqual(rdata['manifest_list_data'], ['a', 'a-b', 'latest'])
+        self.assertEqual(rdata['manifest_list_amd64_tags'],
+                         {'latest': ['sha256:c', 2], 'a-b': ['sha256:d', 1],
+                          'a': ['sha256:e', 2]})
+        with open(self.index_file) as index_file:
+            lines = index_file.readlines()
+        self.assertEqual(lines, sorted(lines))
+        self.assertEqual(lines[:3], ['amd64 a sha256:e 2\n', 'amd64 a-b sha256:d 1\n',
+                                     'amd64 latest sha256:c 2\n'])
+
+
+class TestHttpdConfigStep(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_process_main(self):
+        config_file = os.path.join(self.temp_dir, 'foo.conf')
+        step = publish_steps.HttpdConfigStep(config_file, '/pub/v2/web/foo')
+        step.get_repo = Mock(return_value=Mock(id='foo'))
+        step.get_config = Mock(return_value={})
+
+        step.process_main()
+
+        with open(config_file) as config:
+            self.assertTrue('^/v2/foo/manifests/' in config.read())
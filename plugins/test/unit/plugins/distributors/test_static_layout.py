@@ -0,0 +1,73 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from pulp_docker.common import constants
+from pulp_docker.plugins.distributors import static_layout
+
+
+class TestGetManifestFileName(unittest.TestCase):
+
+    def test_schema_versions(self):
+        self.assertEqual(static_layout.get_manifest_file_name('latest', 1), 'latest.v1.json')
+        self.assertEqual(static_layout.get_manifest_file_name('sha256:a', 2), 'sha256:a.v2.json')
+        self.assertEqual(
+            static_layout.get_manifest_file_name('latest', constants.MANIFEST_LIST_TYPE),
+            'latest.list.json')
+
+
+class TestWriteFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_tag_pages(self):
+        tag_names = ['tag%03d' % i for i in range(static_layout.TAGS_PAGE_SIZE + 1)]
+
+        static_layout.write_tag_pages(self.temp_dir, 'foo', reversed(tag_names))
+
+        pages_dir = os.path.join(self.temp_dir, 'list.pages', str(static_layout.TAGS_PAGE_SIZE))
+        with open(os.path.join(pages_dir, 'first.json')) as page_file:
+            self.assertEqual(json.load(page_file),
+                             {'name': 'foo', 'tags': tag_names[:static_layout.TAGS_PAGE_SIZE]})
+        last = tag_names[static_layout.TAGS_PAGE_SIZE - 1]
+        with open(os.path.join(pages_dir, 'after', last + '.json')) as page_file:
+            self.assertEqual(json.load(page_file), {'name': 'foo', 'tags': tag_names[-1:]})
+
+    def test_write_tag_pages_empty(self):
+        static_layout.write_tag_pages(self.temp_dir, 'foo', [])
+
+        pages_dir = os.path.join(self.temp_dir, 'list.pages', str(static_layout.TAGS_PAGE_SIZE))
+        with open(os.path.join(pages_dir, 'first.json')) as page_file:
+            self.assertEqual(json.load(page_file), {'name': 'foo', 'tags': []})
+
+
+class TestRenderHttpdConfig(unittest.TestCase):
+
+    def test_render(self):
+        config = static_layout.render_httpd_config('foo', 'redhat/foo', '/pub/v2/web/foo/')
+
+        self.assertTrue('RewriteRule ^/v2/redhat\\/foo/blobs/([^/]+)$ /pub/v2/web/foo/blobs/$1'
+                        in config)
+        self.assertTrue('/pub/v2/web/foo/manifests/$1.v2.json' in config)
+        self.assertTrue('<Directory /pub/v2/web/foo>' in config)
+        self.assertTrue('SSLRequireSSL' in config)
+        self.assertTrue('[L,T=%s]' % constants.MEDIATYPE_MANIFEST_S2 in config)
+
+    def test_render_tag_pages_last(self):
+        """
+        Assert that the last= parameter of the tag list requests only matches tag names, so it
+        cannot reach files outside of the pages directory.
+        """
+        config = static_layout.render_httpd_config('foo', 'redhat/foo', '/pub/v2/web/foo/')
+
+        query_re = re.search(r'RewriteCond %\{QUERY_STRING\} (\S*last=\S*)', config).group(1)
+        self.assertTrue(re.match(query_re, 'n=100&last=latest-1.0_b'))
+        for last in ('../../../../bar/tags/list', '..', 'a/b', '.hidden', 'a&n=1'):
+            self.assertFalse(re.match(query_re, 'n=100&last=%s' % last), last)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import patch
+
+from pulp_docker.plugins.distributors import symlinks
+
+
+class TestSymlinkCreator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_serial(self):
+        creator = symlinks.SymlinkCreator()
+        link_path = os.path.join(self.temp_dir, 'blobs', 'a')
+
+        creator.create_symlink('/content/a', link_path)
+
+        self.assertEqual(os.readlink(link_path), '/content/a')
+
+    def test_parallel(self):
+        creator = symlinks.SymlinkCreator(workers=4)
+        link_paths = [os.path.join(self.temp_dir, 'manifests', str(i % 3), str(i))
+                      for i in range(50)]
+
+        for i, link_path in enumerate(link_paths):
+            creator.create_symlink('/content/%d' % i, link_path)
+        creator.wait()
+
+        for i, link_path in enumerate(link_paths):
+            self.assertEqual(os.readlink(link_path), '/content/%d' % i)
+
+    def test_existing_link(self):
+        creator = symlinks.SymlinkCreator(workers=2)
+        link_path = os.path.join(self.temp_dir, 'a')
+        os.symlink('/content/a', link_path)
+
+        creator.create_symlink('/content/a', link_path)
+        creator.wait()
+
+        self.assertEqual(os.readlink(link_path), '/content/a')
+
+    def test_conflicting_link(self):
+        creator = symlinks.SymlinkCreator(workers=2)
+        link_path = os.path.join(self.temp_dir, 'a')
+        os.symlink('/content/b', link_path)
+
+        creator.create_symlink('/content/a', link_path)
+
+        self.assertRaises(OSError, creator.wait)
+
+    @patch.object(symlinks.SymlinkCreator, '_symlink')
+    def test_worker_error(self, _symlink):
+        """Any error of a worker is raised by wait(), not only OSError"""
+        _symlink.side_effect = UnicodeDecodeError('ascii', '\xff', 0, 1, 'bad')
+        creator = symlinks.SymlinkCreator(workers=2)
+
+        creator.create_symlink('/content/a', os.path.join(self.temp_dir, 'a'))
+
+        self.assertRaises(UnicodeDecodeError, creator.wait)
+
+    @patch.object(symlinks.SymlinkCreator, '_symlink')
+    def test_close(self, _symlink):
+        """close() stops the workers without waiting for the pending symlinks"""
+        release = threading.Event()
+        _symlink.side_effect = lambda source_path, link_path: release.wait(5)
+        creator = symlinks.SymlinkCreator(workers=2)
+        for i in range(10):
+            creator.create_symlink('/content/%d' % i, os.path.join(self.temp_dir, str(i)))
+        pool = creator._pool
+
+        release.set()
+        creator.close()
+
+        self.assertTrue(creator._pool is None)
+        self.assertTrue(all(not worker.is_alive() for worker in pool._pool))
+        creator.wait()
+
+
+class TestRemoveDanglingLinks(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_remove(self):
+        target = os.path.join(self.temp_dir, 'target')
+        open(target, 'w').close()
+        links_dir = os.path.join(self.temp_dir, 'blobs')
+        os.mkdir(links_dir)
+        os.symlink(target, os.path.join(links_dir, 'valid'))
+        os.symlink(os.path.join(self.temp_dir, 'removed'), os.path.join(links_dir, 'dangling'))
+
+        self.assertEqual(symlinks.remove_dangling_links(links_dir), 1)
+
+        self.assertEqual(os.listdir(links_dir), ['valid'])
+
+    def test_missing_directory(self):
+        self.assertEqual(symlinks.remove_dangling_links(os.path.join(self.temp_dir, 'blobs')), 0)
@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import compression
+from pulp_docker.plugins.distributors import v2_export_steps
+
+
+class TestGetBlobPath(unittest.TestCase):
+
+    def test_get_blob_path(self):
+        self.assertEqual(v2_export_steps.get_blob_path('sha256:abc'), 'blobs/sha256/abc')
+
+
+class TestTarWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.content = os.path.join(self.temp_dir, 'content')
+        with open(self.content, 'w') as content_file:
+            content_file.write('layer data')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, compression_type, threads=1):
+        path = os.path.join(self.temp_dir, 'export', 'foo.tar')
+        writer = v2_export_steps.TarWriter(path, compression_type, threads=threads)
+        writer.add_file('blobs/sha256/abc', self.content)
+        writer.add_data('index.json', '{}')
+        writer.close()
+        return path
+
+    def test_uncompressed(self):
+        path = self._write(compression.COMPRESSION_NONE)
+
+        tar = tarfile.open(path)
+        self.assertEqual(tar.getnames(), ['blobs/sha256/abc', 'index.json'])
+        self.assertEqual(tar.extractfile('blobs/sha256/abc').read(), 'layer data')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['foo.tar'])
+
+    def test_parallel_gzip(self):
+        path = self._write(compression.COMPRESSION_GZIP, threads=4)
+
+        tar = tarfile.open(path, 'r:gz')
+        self.assertEqual(tar.extractfile('index.json').read(), '{}')
+
+    def test_discard(self):
+        path = os.path.join(self.temp_dir, 'export', 'foo.tar')
+        writer = v2_export_steps.TarWriter(path, compression.COMPRESSION_GZIP, threads=2)
+        writer.add_file('blobs/sha256/abc', self.content)
+
+        writer.discard()
+        writer.discard()
+
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
+
+
+class TestExportTagsStep(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        manifest_path = os.path.join(self.temp_dir, 'manifest')
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({'config': {'digest': 'sha256:c'},
+                       'layers': [{'digest': 'sha256:l1'}, {'digest': 'sha256:l2'}]},
+                      manifest_file)
+        self.manifest = Mock(digest='sha256:m', _storage_path=manifest_path)
+        self.parent = Mock(index_manifests=[], load_manifests=[], tags=[], delta=False,
+                           descriptors={'sha256:m': {'digest': 'sha256:m'},
+                                        'sha256:untagged': {'digest': 'sha256:untagged'}})
+        self.step = v2_export_steps.ExportTagsStep()
+        self.step.parent = self.parent
+        self.step.get_repo = Mock(return_value=Mock(id='foo'))
+        self.step.get_config = Mock(return_value={})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @patch('pulp_docker.plugins.distributors.v2_export_steps.get_tagged_manifests')
+    def test_process_main(self, mock_get_tagged_manifests):
+        mock_get_tagged_manifests.return_value = {'sha256:m': (self.manifest, 2)}
+        self.step.initialize()
+        for name in ('latest', '1.0'):
+            tag = Mock(manifest_digest='sha256:m')
+            tag.name = name
+            self.step.process_main(tag)
+        self.step.finalize()
+
+        self.assertEqual(self.parent.load_manifests, [
+            {'Config': 'blobs/sha256/c', 'RepoTags': ['foo:latest', 'foo:1.0'],
+             'Layers': ['blobs/sha256/l1', 'blobs/sha256/l2']}])
+        self.assertEqual(self.parent.index_manifests, [
+            {'digest': 'sha256:m',
+             'annotations': {v2_export_steps.OCI_REF_NAME_ANNOTATION: 'latest'}},
+            {'digest': 'sha256:m',
+             'annotations': {v2_export_steps.OCI_REF_NAME_ANNOTATION: '1.0'}},
+            {'digest': 'sha256:untagged'}])
+
+    @patch('pulp_docker.plugins.distributors.v2_export_steps.get_tagged_manifests')
+    def test_manifest_list(self, mock_get_tagged_manifests):
+        mock_get_tagged_manifests.return_value = {
+            'sha256:m': (self.manifest, constants.MANIFEST_LIST_TYPE)}
+        self.step.initialize()
+        tag = Mock(manifest_digest='sha256:m')
+        tag.name = 'latest'
+
+        self.step.process_main(tag)
+
+        self.assertEqual(self.parent.load_manifests, [])
+        self.assertEqual(len(self.parent.index_manifests), 1)
+
+    @patch('pulp_docker.plugins.distributors.v2_export_steps.get_tagged_manifests')
+    def test_delta(self, mock_get_tagged_manifests):
+        exported = Mock(digest='sha256:old')
+        mock_get_tagged_manifests.return_value = {'sha256:m': (self.manifest, 2),
+                                                  'sha256:old': (exported, 2)}
+        self.parent.delta = True
+        self.step.initialize()
+        for name, digest in (('latest', 'sha256:m'), ('1.0', 'sha256:old')):
+            tag = Mock(manifest_digest=digest, schema_version=2, manifest_type='image')
+            tag.name = name
+            self.step.process_main(tag)
+
+        self.assertEqual(self.parent.load_manifests, [])
+        self.assertEqual(self.parent.index_manifests, [
+            {'digest': 'sha256:m',
+             'annotations': {v2_export_steps.OCI_REF_NAME_ANNOTATION: 'latest'}}])
+        self.assertEqual(self.parent.tags, [
+            {'name': 'latest', 'manifest_digest': 'sha256:m', 'schema_version': 2,
+             'manifest_type': 'image'},
+            {'name': '1.0', 'manifest_digest': 'sha256:old', 'schema_version': 2,
+             'manifest_type': 'image'}])
+
+
+class TestExportPublisher(unittest.TestCase):
+
+    def setUp(self):
+        self.working_directory = tempfile.mkdtemp()
+        self.publish_dir = os.path.join(self.working_directory, 'publish')
+        self.repo = Mock(id='foo', working_dir=os.path.join(self.working_directory, 'work'))
+
+    def tearDown(self):
+        shutil.rmtree(self.working_directory)
+
+    def test_init(self):
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+                  constants.CONFIG_KEY_EXPORT_COMPRESSION: compression.COMPRESSION_GZIP}
+
+        publisher = v2_export_steps.ExportPublisher(self.repo, Mock(), config)
+
+        self.assertEqual(publisher.tar_writer.path,
+                         os.path.join(self.publish_dir, 'v2', 'export', 'repo', 'foo.tar.gz'))
+        self.assertTrue(isinstance(publisher.children[-1], v2_export_steps.ExportIndexStep))
+
+    @patch('pulp_docker.plugins.distributors.v2_export_steps.step_profiling.ProfiledTaskMixin.'
+           'process_lifecycle')
+    def test_process_lifecycle_failure(self, mock_process_lifecycle):
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir}
+        publisher = v2_export_steps.ExportPublisher(self.repo, Mock(), config)
+
+        def process_lifecycle():
+            publisher.tar_writer.add_data('index.json', '{}')
+            raise IOError('No space left on device')
+
+        mock_process_lifecycle.side_effect = process_lifecycle
+
+        self.assertRaises(IOError, publisher.process_lifecycle)
+        self.assertEqual(os.listdir(os.path.dirname(publisher.tar_writer.path)), [])
+
+    def test_delta_base(self):
+        base_path = os.path.join(self.working_directory, 'base.tar.json')
+        with open(base_path, 'w') as base_file:
+            json.dump({'created': '2018-01-01T00:00:00Z',
+                       'content': {'blobs': ['sha256:a', 'sha256:b'], 'manifests': ['sha256:m'],
+                                   'manifest_lists': []}}, base_file)
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+                  constants.CONFIG_KEY_EXPORT_DELTA_BASE: base_path}
+        publisher = v2_export_steps.ExportPublisher(self.repo, Mock(), config)
+
+        self.assertFalse(publisher.add_content('blobs', Mock(digest='sha256:a')))
+        self.assertTrue(publisher.add_content('blobs', Mock(digest='sha256:c')))
+        export_manifest = publisher.get_export_manifest()
+
+        self.assertTrue(publisher.delta)
+        self.assertEqual(export_manifest['base'], '2018-01-01T00:00:00Z')
+        self.assertEqual(export_manifest['content']['blobs'], ['sha256:a', 'sha256:c'])
+        self.assertEqual(export_manifest['added']['blobs'], ['sha256:c'])
+        self.assertEqual(export_manifest['removed'],
+                         {'blobs': ['sha256:b'], 'manifests': ['sha256:m'], 'manifest_lists': []})
+
+    @patch('pulp_docker.plugins.distributors.v2_export_steps.pulp_models.RepositoryContentUnit')
+    def test_start_date(self, mock_rcu):
+        mock_rcu.objects.filter.return_value.values_list.return_value = ['new_id']
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir,
+                  constants.CONFIG_KEY_EXPORT_START_DATE: '2018-01-01T01:00:00+01:00'}
+        publisher = v2_export_steps.ExportPublisher(self.repo, Mock(), config)
+        publisher.get_repo = Mock(return_value=self.repo)
+
+        self.assertTrue(publisher.add_content('manifests', Mock(id='new_id', digest='sha256:n')))
+        self.assertFalse(publisher.add_content('manifests', Mock(id='old_id', digest='sha256:o')))
+
+        mock_rcu.objects.filter.assert_called_once_with(repo_id='foo',
+                                                        created__gte='2018-01-01T00:00:00Z')
+        self.assertEqual(publisher.get_export_manifest()['removed']['manifests'], [])
+
+    def test_full(self):
+        config = {constants.CONFIG_KEY_DOCKER_PUBLISH_DIRECTORY: self.publish_dir}
+        publisher = v2_export_steps.ExportPublisher(self.repo, Mock(), config)
+
+        self.assertTrue(publisher.add_content('blobs', Mock(digest='sha256:a')))
+        self.assertFalse(publisher.delta)
@@ -0,0 +1,177 @@
+"""
+This module contains tests for the pulp_docker.plugins.importers.catalog module.
+"""
+import os
+import shutil
+import tempfile
+
+import mock
+from pulp.common.plugins import importer_constants
+from pulp.common.compat import unittest
+from pulp.plugins.config import PluginCallConfiguration
+from pulp.server.exceptions import PulpCodedException
+
+from pulp_docker.common import constants, error_codes
+from pulp_docker.plugins.importers import catalog
+
+
+MODULE = 'pulp_docker.plugins.importers.catalog'
+
+
+class TestGetRepoId(unittest.TestCase):
+    """
+    This class contains tests for the get_repo_id() function.
+    """
+    def test_get_repo_id(self):
+        """
+        Assert that the namespace separators are replaced, as they are not valid in repo ids.
+        """
+        self.assertEqual(catalog.get_repo_id('mirror', 'pulp/crane'), 'mirror-pulp-crane')
+
+
+@mock.patch('pulp_docker.plugins.registry.V2Repository.api_version_check',
+            mock.MagicMock(return_value=True))
+class TestCatalogSyncStep(unittest.TestCase):
+    """
+    This class contains tests for the CatalogSyncStep class.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        importer_config = {
+            importer_constants.KEY_FEED: 'https://registry.example.com',
+            constants.CONFIG_KEY_CATALOG_SYNC: True,
+            constants.CONFIG_KEY_CATALOG_NAMESPACE: 'pulp',
+        }
+        self.config = PluginCallConfiguration({}, importer_config)
+        self.repo = mock.MagicMock(id='mirror')
+        self.conduit = mock.MagicMock()
+        patcher = mock.patch('pulp.plugins.util.publish_step.common_utils.get_working_directory',
+                             return_value=self.working_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.step = catalog.CatalogSyncStep(self.repo, self.conduit, self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test___init___not_v2(self):
+        """
+        Assert that the catalog sync fails when the feed is not a v2 registry.
+        """
+        with mock.patch('pulp_docker.plugins.registry.V2Repository.api_version_check',
+                        return_value=False):
+            with self.assertRaises(PulpCodedException) as error:
+                catalog.CatalogSyncStep(self.repo, self.conduit, self.config)
+
+        self.assertEqual(error.exception.error_code, error_codes.DKR1008)
+
+    @mock.patch(MODULE + '.CatalogSyncStep._sync_repository')
+    def test_process_main(self, _sync_repository):
+        """
+        Assert that every repository of the namespace is synced, going on after a failure, and
+        that the catalog sync fails when any of them failed.
+        """
+        _sync_repository.side_effect = [True, IOError('oops'), False]
+
+        with mock.patch.object(self.step.index_repository, 'get_catalog',
+                               return_value=['pulp/a', 'pulp/b', 'pulp/c']) as get_catalog:
+            with self.assertRaises(PulpCodedException) as error:
+                self.step.process_main()
+
+        get_catalog.assert_called_once_with('pulp')
+        self.assertEqual([c[0][0] for c in _sync_repository.call_args_list],
+                         ['pulp/a', 'pulp/b', 'pulp/c'])
+        self.assertEqual(self.step.total_units, 3)
+        self.assertEqual(self.step.progress_successes, 1)
+        self.assertEqual(self.step.progress_failures, 2)
+        self.assertEqual(error.exception.error_code, error_codes.DKR1031)
+        self.assertEqual(self.step.failed_repos, ['pulp/b', 'pulp/c'])
+
+    @mock.patch(MODULE + '.pulp_models')
+    @mock.patch(MODULE + '.repository')
+    def test__get_repository_new(self, repository, pulp_models):
+        """
+        Assert that a missing repository is created with the importer config of the catalog
+        repository, without the catalog settings, and with the pulp-admin distributors.
+        """
+        pulp_models.Repository.objects.filter.return_value.first.return_value = None
+
+        repo_obj, importer_config = self.step._get_repository('pulp/crane')
+
+        expected_config = {importer_constants.KEY_FEED: 'https://registry.example.com',
+                           constants.CONFIG_KEY_UPSTREAM_NAME: 'pulp/crane'}
+        self.assertEqual(importer_config, expected_config)
+        self.assertTrue(repo_obj is repository.create_repo.return_value)
+        args, kwargs = repository.create_repo.call_args
+        self.assertEqual(args, ('mirror-pulp-crane',))
+        self.assertEqual(kwargs['importer_type_id'], constants.IMPORTER_TYPE_ID)
+        self.assertEqual(kwargs['importer_repo_plugin_config'], expected_config)
+        self.assertEqual(
+            [(d['distributor_id'], d['auto_publish'], d['distributor_config'])
+             for d in kwargs['distributor_list']],
+            [(constants.CLI_WEB_DISTRIBUTOR_ID, True,
+              {constants.CONFIG_KEY_REPO_REGISTRY_ID: 'pulp/crane'}),
+             (constants.CLI_EXPORT_DISTRIBUTOR_ID, False,
+              {constants.CONFIG_KEY_REPO_REGISTRY_ID: 'pulp/crane'})])
+
+    @mock.patch(MODULE + '.pulp_models')
+    @mock.patch(MODULE + '.repository')
+    def test__get_repository_existing(self, repository, pulp_models):
+        """
+        Assert that an existing repository is synced with its own importer config.
+        """
+        existing = pulp_models.Repository.objects.filter.return_value.first.return_value
+
+        repo_obj, importer_config = self.step._get_repository('pulp/crane')
+
+        pulp_models.Repository.objects.filter.assert_called_once_with(repo_id='mirror-pulp-crane')
+        self.assertTrue(repo_obj is existing)
+        self.assertTrue(importer_config is pulp_models.Importer.objects.get.return_value.config)
+        self.assertEqual(repository.create_repo.call_count, 0)
+
+    @mock.patch(MODULE + '.pulp_models')
+    @mock.patch(MODULE + '.repository')
+    @mock.patch(MODULE + '.sync.SyncStep')
+    @mock.patch(MODULE + '.CatalogSyncStep._get_repository')
+    def test__sync_repository(self, _get_repository, SyncStep, repository, pulp_models):
+        """
+        Assert that the repository is synced with the shared registry client in its own working
+        directory, and that the token and the repository's publishes are taken care of.
+        """
+        repo_obj = mock.MagicMock(repo_id='mirror-pulp-crane')
+        _get_repository.return_value = (repo_obj, {constants.CONFIG_KEY_UPSTREAM_NAME: 'crane'})
+        pulp_models.Distributor.objects.return_value = [mock.MagicMock(distributor_id='web')]
+
+        def sync_repository(repo, conduit, config, index_repository, working_dir):
+            self.assertTrue(os.path.isdir(working_dir))
+            index_repository.token = 'new token'
+            return SyncStep.return_value
+
+        SyncStep.side_effect = sync_repository
+
+        self.assertTrue(self.step._sync_repository('pulp/crane'))
+
+        kwargs = SyncStep.call_args[1]
+        working_dir = os.path.join(self.working_dir, 'mirror-pulp-crane')
+        self.assertEqual(kwargs['working_dir'], working_dir)
+        self.assertEqual(kwargs['index_repository'].name, 'pulp/crane')
+        self.assertTrue(kwargs['index_repository'].downloader is
+                        self.step.index_repository.downloader)
+        self.assertEqual(kwargs['config'].get(constants.CONFIG_KEY_UPSTREAM_NAME), 'crane')
+        self.assertFalse(os.path.exists(working_dir))
+        self.assertEqual(self.step.index_repository.token, 'new token')
+        repository.rebuild_content_unit_counts.assert_called_once_with(repo_obj)
+        pulp_models.Distributor.objects.assert_called_once_with(repo_id='mirror-pulp-crane',
+                                                                auto_publish=True)
+        repository.queue_publish.assert_called_once_with('mirror-pulp-crane', 'web')
+
+    def test_cancel(self):
+        """
+        Assert that the sync of the repository in progress is canceled too.
+        """
+        self.step.repository_sync_step = mock.MagicMock()
+
+        self.step.cancel()
+
+        self.assertTrue(self.step.canceled)
+        self.step.repository_sync_step.cancel.assert_called_once_with()
@@ -49,6 +49,7 @@ class TestSyncRepo(unittest.TestCase):
         self.repo.repo_obj = model.Repository(repo_id=self.repo.id)
         self.sync_conduit = mock.MagicMock()
         self.config = mock.MagicMock()
+        self.config.get_boolean.return_value = False
         self.importer = DockerImporter()
 
     @mock.patch('pulp_docker.plugins.importers.sync.SyncStep')
@@ -72,6 +73,24 @@ class TestSyncRepo(unittest.TestCase):
 
         mock_sync_step.return_value.process_lifecycle.assert_called_once_with()
 
+    @mock.patch('pulp_docker.plugins.importers.catalog.CatalogSyncStep')
+    @mock.patch('pulp_docker.plugins.importers.sync.SyncStep')
+    def test_calls_catalog_sync_step(self, mock_sync_step, mock_catalog_sync_step, mock_rmtree,
+                                     mock_mkdtemp):
+        """
+        Assert that the catalog sync is used when catalog_sync is set.
+        """
+        self.config.get_boolean.return_value = True
+
+        report = self.importer.sync_repo(self.repo, self.sync_conduit, self.config)
+
+        self.config.get_boolean.assert_called_once_with(constants.CONFIG_KEY_CATALOG_SYNC)
+        mock_catalog_sync_step.assert_called_once_with(
+            repo=self.repo, conduit=self.sync_conduit, config=self.config)
+        self.assertEqual(mock_sync_step.call_count, 0)
+        self.assertEqual(report,
+                         mock_catalog_sync_step.return_value.process_lifecycle.return_value)
+
 
 class TestCancel(unittest.TestCase):
     def setUp(self):
@@ -140,7 +159,8 @@ class TestUploadUnit(unittest.TestCase):
                             config_layer="def")
         # _ignored should not appear in the unit's metadata
         mf.__class__._fields = ["digest", "config_layer", "_ignored"]
-        UploadStep.return_value.configure_mock(uploaded_unit=mf)
+        UploadStep.return_value.configure_mock(uploaded_unit=mf, tag_report=None,
+                                               profile_summary=None)
         report = DockerImporter().upload_unit(self.repo, constants.IMAGE_TYPE_ID, self.unit_key, {},
                                               data.busybox_tar_path, self.conduit, self.config)
         UploadStep.assert_called_once_with(repo=self.repo, file_path=data.busybox_tar_path,
@@ -1,26 +1,30 @@
 """
 This module contains tests for the pulp_docker.plugins.importers.sync module.
 """
+import datetime
 import inspect
+import json
 import os
 import shutil
 import tempfile
 from gettext import gettext as _
 
 import mock
+from nectar.config import DownloaderConfig
+from nectar.downloaders.threaded import HTTPThreadedDownloader
+from nectar.report import DownloadReport
 from nectar.request import DownloadRequest
 from pulp.common.plugins import importer_constants
 from pulp.common.compat import unittest
 from pulp.plugins import config as plugin_config
 from pulp.plugins.config import PluginCallConfiguration
-from pulp.plugins.util import publish_step
 from pulp.server import exceptions
 from pulp.server.exceptions import MissingValue, PulpCodedException
 from pulp.server.managers import factory
 
 from pulp_docker.common import constants, error_codes
-from pulp_docker.plugins import models, registry
-from pulp_docker.plugins.importers import sync
+from pulp_docker.plugins import metadata_fetcher, models, registry, sync_metrics
+from pulp_docker.plugins.importers import sync, sync_state
 
 
 TEST_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data')
@@ -49,9 +53,7 @@ class TestDownloadManifestsStep(unittest.TestCase):
             step, step_type=constants.SYNC_STEP_METADATA, repo=repo, conduit=conduit, config=config,
             plugin_type=constants.IMPORTER_TYPE_ID)
 
-    @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
-                side_effect=models.Manifest.from_json)
-    def test_process_manifest_with_one_layer(self, from_json):
+    def test_process_manifest_with_one_layer(self):
         """
         Test _process_manifest() when there is only one layer.
         """
@@ -67,28 +69,31 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:a001e892f3ba0685184486b08cda99bf81f551513f4b56e72954a1d4404195b1'
         repo_tag = 'latest'
         step.parent.available_manifests = []
+        available_blobs = sync_state.DigestSizes()
 
         with mock.patch('__builtin__.open') as mock_open:
-            step._process_manifest(manifest, digest, set(), repo_tag)
+            step._process_manifest(manifest, digest, available_blobs, repo_tag)
 
             # Assert that the manifest was written to disk in the working dir
             mock_open.return_value.__enter__.return_value.write.assert_called_once_with(manifest)
 
-        from_json.assert_called_once_with(manifest, digest)
         # There should be one manifest that has the correct digest
         self.assertEqual(len(step.parent.available_manifests), 1)
-        self.assertEqual(step.parent.available_manifests[0].digest, digest)
+        sync_unit = step.parent.available_manifests[0]
+        self.assertTrue(isinstance(sync_unit, sync.SyncUnit))
+        self.assertTrue(sync_unit.model is models.Manifest)
+        self.assertEqual(sync_unit.digest, digest)
+        self.assertEqual(sync_unit.schema_version, 1)
         # There should be one layer
         expected_blob_sum = ('sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6'
                              'ef')
-        expected_layer = step.parent.available_manifests[0].fs_layers[0]
-        self.assertEqual(expected_layer.blob_sum, expected_blob_sum)
-        self.assertEqual(step.parent.available_manifests[0].fs_layers, [expected_layer])
+        # A schema 1 manifest does not give the sizes of its layers
+        self.assertEqual(available_blobs, {expected_blob_sum: None})
+        self.assertEqual(step.parent.save_tags_step.tagged_manifests.append.call_args[0][0],
+                         (repo_tag, sync_unit, constants.MANIFEST_IMAGE_TYPE))
 
     @mock.patch('pulp_docker.plugins.importers.sync.DownloadManifestsStep._process_manifest')
-    @mock.patch('pulp_docker.plugins.importers.sync.models.ManifestList.from_json',
-                side_effect=models.ManifestList.from_json)
-    def test_process_manifest_list(self, from_json, mock_manifest):
+    def test_process_manifest_list(self, mock_manifest):
         """
         Test _process_manifest_list().
         """
@@ -119,27 +124,25 @@ class TestDownloadManifestsStep(unittest.TestCase):
                 manifest_list
             )
 
-        from_json.assert_called_once_with(manifest_list, digest)
         # There should be one manifest that has the correct digest
         self.assertEqual(len(step.parent.available_manifests), 1)
-        self.assertEqual(step.parent.available_manifests[0].digest, digest)
-        expected_man = [
-            models.EmbeddedManifest(
-                digest='sha256:c55544de64a01e157b9d931f5db7a16554a14be19c367f91c9a8cdc46db086bf',
-                os='linux',
-                arch='amd64'),
-            models.EmbeddedManifest(
-                digest='sha256:de9576aa7f9ac6aff09029293ca23136011302c02e183e856a2cd6d37b84ab92',
-                os='linux',
-                arch='arm')]
-        self.assertEqual(step.parent.available_manifests[0].manifests, expected_man)
+        sync_unit = step.parent.available_manifests[0]
+        self.assertTrue(sync_unit.model is models.ManifestList)
+        self.assertEqual(sync_unit.digest, digest)
+        self.assertEqual(sync_unit.schema_version, 2)
+        # The image manifests of the list should have been fetched, then the schema 1 conversion
+        expected_calls = [
+            mock.call('sha256:c55544de64a01e157b9d931f5db7a16554a14be19c367f91c9a8cdc46db086bf',
+                      headers=True, tag=False),
+            mock.call('sha256:de9576aa7f9ac6aff09029293ca23136011302c02e183e856a2cd6d37b84ab92',
+                      headers=True, tag=False),
+            mock.call(repo_tag, headers=False, tag=True)]
+        self.assertEqual(step.parent.index_repository.get_manifest.mock_calls, expected_calls)
         self.assertEqual(mock_manifest.call_count, 2)
-        self.assertEqual(step.parent.index_repository.get_manifest.call_count, 3)
-        self.assertEqual(len(step.parent.save_tags_step.tagged_manifests), 1)
+        self.assertEqual(step.parent.save_tags_step.tagged_manifests,
+                         [(repo_tag, sync_unit, constants.MANIFEST_LIST_TYPE)])
 
-    @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
-                side_effect=models.Manifest.from_json)
-    def test_process_manifest_schema2_with_one_layer(self, from_json):
+    def test_process_manifest_schema2_with_one_layer(self):
         """
         Test _process_manifest() when there is only one layer.
         """
@@ -155,23 +158,25 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:817a12c32a39bbe394944ba49de563e085f1d3c5266eb8e9723256bc4448680e'
         repo_tag = 'latest'
         step.parent.available_manifests = []
+        available_blobs = sync_state.DigestSizes()
 
         with mock.patch('__builtin__.open') as mock_open:
-            step._process_manifest(manifest, digest, set(), repo_tag)
+            has_foreign_layer = step._process_manifest(manifest, digest, available_blobs, repo_tag)
 
             # Assert that the manifest was written to disk in the working dir
             mock_open.return_value.__enter__.return_value.write.assert_called_once_with(manifest)
 
-        from_json.assert_called_once_with(manifest, digest)
+        self.assertFalse(has_foreign_layer)
         # There should be one manifest that has the correct digest
         self.assertEqual(len(step.parent.available_manifests), 1)
         self.assertEqual(step.parent.available_manifests[0].digest, digest)
-        # There should be one layer
+        self.assertEqual(step.parent.available_manifests[0].schema_version, 2)
+        # There should be one layer and the config layer
         expected_blob_sum = ('sha256:4b0bc1c4050b03c95ef2a8e36e25feac42fd31283e8c30b3ee5df6b043155d'
                              '3c')
-        expected_layer = step.parent.available_manifests[0].fs_layers[0]
-        self.assertEqual(expected_layer.blob_sum, expected_blob_sum)
-        self.assertEqual(step.parent.available_manifests[0].fs_layers, [expected_layer])
+        config_layer = json.loads(manifest)['config']['digest']
+        # The sizes of the layers are kept with them for the measurements of the blob downloads
+        self.assertEqual(available_blobs, {expected_blob_sum: 677628, config_layer: 1465})
 
     @mock.patch('pulp_docker.plugins.importers.sync.DownloadManifestsStep._process_manifest')
     @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
@@ -194,6 +199,7 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:a001e892f3ba0685184486b08cda99bf81f551513f4b56e72954a1d4404195b1'
         manifest = models.Manifest.from_json(manifest, digest)
         step.parent.index_repository.get_manifest.return_value = [(digest, manifest, 'image')]
+        step.parent.sync_state_db = None
         step.parent.available_blobs = []
 
         step.process_main()
@@ -226,6 +232,7 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:817a12c32a39bbe394944ba49de563e085f1d3c5266eb8e9723256bc4448680e'
         manifest = models.Manifest.from_json(manifest, digest)
         step.parent.index_repository.get_manifest.return_value = [(digest, manifest, 'image')]
+        step.parent.sync_state_db = None
         step.parent.available_blobs = []
 
         step.process_main()
@@ -236,9 +243,7 @@ class TestDownloadManifestsStep(unittest.TestCase):
         # since it is a manifest schema 2 version, there should a config_layer
         self.assertTrue(manifest.config_layer)
 
-    @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
-                side_effect=models.Manifest.from_json)
-    def test_process_manifest_with_repeated_layers(self, from_json):
+    def test_process_manifest_with_repeated_layers(self):
         """
         Test _process_manifest() when the various tags contains some layers in common, which is a
         typical pattern. The available_blobs set on the SyncStep should only have the layers once
@@ -256,28 +261,24 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:a001e892f3ba0685184486b08cda99bf81f551513f4b56e72954a1d4404195b1'
         repo_tag = 'latest'
         step.parent.available_manifests = []
+        available_blobs = sync_state.DigestSizes()
 
         with mock.patch('__builtin__.open') as mock_open:
-            step._process_manifest(manifest, digest, set(), repo_tag)
+            step._process_manifest(manifest, digest, available_blobs, repo_tag)
 
             # Assert that the manifest was written to disk in the working dir
             mock_open.return_value.__enter__.return_value.write.assert_called_once_with(manifest)
 
-        from_json.assert_called_once_with(manifest, digest)
         # There should be one manifest that has the correct digest
         self.assertEqual(len(step.parent.available_manifests), 1)
         self.assertEqual(step.parent.available_manifests[0].digest, digest)
-        # There should be two layers, but oddly one of them is used three times
-        expected_blob_sums = (
+        # There should be two layers, even though one of them is used three times
+        expected_blob_sums = set([
             'sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef',
-            'sha256:cc8567d70002e957612902a8e985ea129d831ebe04057d88fb644857caa45d11')
-        expected_digests = [expected_blob_sums[i] for i in (0, 0, 1, 0)]
-        layer_digests = [layer.blob_sum for layer in step.parent.available_manifests[0].fs_layers]
-        self.assertEqual(layer_digests, expected_digests)
+            'sha256:cc8567d70002e957612902a8e985ea129d831ebe04057d88fb644857caa45d11'])
+        self.assertEqual(set(available_blobs), expected_blob_sums)
 
-    @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
-                side_effect=models.Manifest.from_json)
-    def test_process_manifest_with_unique_layers(self, from_json):
+    def test_process_manifest_with_unique_layers(self):
         """
         Test _process_manifest() when the various tags all have unique layers.
         """
@@ -293,24 +294,22 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:a001e892f3ba0685184486b08cda99bf81f551513f4b56e72954a1d4404195b1'
         repo_tag = 'latest'
         step.parent.available_manifests = []
+        available_blobs = sync_state.DigestSizes()
 
         with mock.patch('__builtin__.open') as mock_open:
-            step._process_manifest(manifest, digest, set(), repo_tag)
+            step._process_manifest(manifest, digest, available_blobs, repo_tag)
 
             # Assert that the manifest was written to disk in the working dir
             mock_open.return_value.__enter__.return_value.write.assert_called_once_with(manifest)
 
-        from_json.assert_called_once_with(manifest, digest)
         # There should be one manifest that has the correct digest
         self.assertEqual(len(step.parent.available_manifests), 1)
         self.assertEqual(step.parent.available_manifests[0].digest, digest)
-        # There should be two layers, but oddly one of them is used three times
-        expected_blob_sums = [
+        # There should be two layers
+        expected_blob_sums = set([
             'sha256:cc8567d70002e957612902a8e985ea129d831ebe04057d88fb644857caa45d11',
-            'sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef']
-        fs_layer_blob_sums = [
-            layer.blob_sum for layer in step.parent.available_manifests[0].fs_layers]
-        self.assertEqual(fs_layer_blob_sums, expected_blob_sums)
+            'sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef'])
+        self.assertEqual(set(available_blobs), expected_blob_sums)
 
     @mock.patch('pulp_docker.plugins.importers.sync.DownloadManifestsStep._process_manifest')
     @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.from_json',
@@ -334,6 +333,7 @@ class TestDownloadManifestsStep(unittest.TestCase):
         digest = 'sha256:817a12c32a39bbe394944ba49de563e085f1d3c5266eb8e9723256bc4448680e'
         manifest = models.Manifest.from_json(manifest, digest)
         step.parent.index_repository.get_manifest.return_value = [(digest, manifest, 'image')]
+        step.parent.sync_state_db = None
         step.parent.available_blobs = []
 
         step.process_main()
@@ -343,6 +343,185 @@ class TestDownloadManifestsStep(unittest.TestCase):
         step.parent.index_repository.get_manifest.assert_called_once_with('1')
 
 
+class TestDownloadManifestsStepShards(unittest.TestCase):
+    """
+    This class contains tests for the sharded manifest download of the DownloadManifestsStep.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.step = sync.DownloadManifestsStep(
+            mock.MagicMock(), mock.MagicMock(),
+            {constants.CONFIG_KEY_MANIFEST_DOWNLOAD_THREADS: '2'})
+        self.step.parent = mock.MagicMock()
+        self.step.parent.get_working_dir.return_value = self.working_dir
+        self.step.parent.sync_state_db = None
+        self.step.parent.available_manifests = sync_state.SyncUnitList()
+        self.step.parent.available_blobs = sync_state.SyncUnitList()
+        self.step.parent.save_tags_step.tagged_manifests = []
+        self.manifests = {}
+        for tag, file_name in (('one', 'manifest_one_layer.json'),
+                               ('repeated', 'manifest_repeated_layers.json'),
+                               ('unique', 'manifest_unique_layers.json')):
+            with open(os.path.join(TEST_DATA_PATH, file_name)) as manifest_file:
+                manifest = manifest_file.read()
+            self.manifests[tag] = [(manifest, 'sha256:%s' % tag, constants.MEDIATYPE_MANIFEST_S1)]
+        self.step.parent.index_repository.get_tags.return_value = ['one', 'repeated', 'unique']
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    @mock.patch('pulp_docker.plugins.importers.sync.SYNC_SHARD_SIZE', 1)
+    def test_process_main(self):
+        """
+        Assert that the shards are merged in the order of the tags, each blob once.
+        """
+        self.step.parent.index_repository.get_manifest.side_effect = self.manifests.get
+
+        self.step.process_main()
+
+        self.assertEqual(
+            [(tag, unit.digest) for tag, unit, _ in
+             self.step.parent.save_tags_step.tagged_manifests],
+            [('one', 'sha256:one'), ('repeated', 'sha256:repeated'), ('unique', 'sha256:unique')])
+        self.assertEqual([unit.digest for unit in self.step.parent.available_manifests],
+                         ['sha256:one', 'sha256:repeated', 'sha256:unique'])
+        self.assertEqual(
+            sorted(unit.digest for unit in self.step.parent.available_blobs),
+            ['sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef',
+             'sha256:cc8567d70002e957612902a8e985ea129d831ebe04057d88fb644857caa45d11'])
+        self.assertEqual(self.step.progress_successes, 3)
+        self.assertTrue(os.path.exists(os.path.join(self.working_dir, 'sha256:unique')))
+
+    @mock.patch('pulp_docker.plugins.importers.sync.SYNC_SHARD_SIZE', 1)
+    def test_process_main_error(self):
+        """
+        Assert that an error on a worker thread fails the step.
+        """
+        self.step.parent.index_repository.get_manifest.side_effect = IOError('404 Client Error')
+
+        self.assertRaises(IOError, self.step.process_main)
+
+    def test_process_main_invalid_threads(self):
+        """
+        Assert that the number of threads must be a positive integer.
+        """
+        self.step.config = {constants.CONFIG_KEY_MANIFEST_DOWNLOAD_THREADS: 'many'}
+
+        with self.assertRaises(exceptions.PulpCodedValidationException) as assertion:
+            self.step.process_main()
+
+        self.assertEqual(assertion.exception.error_code, error_codes.DKR1021)
+
+
+class TestGetLocalV2UnitsStep(unittest.TestCase):
+    """
+    This class contains tests for the GetLocalV2UnitsStep class.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.step = sync.GetLocalV2UnitsStep(available_units=sync_state.SyncUnitList())
+        self.step.parent = mock.MagicMock()
+        self.step.parent.get_working_dir.return_value = self.working_dir
+        self.step.parent.get_repo.return_value.id = 'repo1'
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test___init__(self):
+        """
+        Assert the correct attributes are set by __init__().
+        """
+        available_units = sync_state.SyncUnitList([sync_state.SyncUnit(models.Blob, 'sha256:a')])
+        new_units = sync_state.SyncUnitList()
+
+        step = sync.GetLocalV2UnitsStep(available_units=available_units, new_units=new_units)
+
+        self.assertEqual(step.step_id, constants.SYNC_STEP_GET_LOCAL)
+        self.assertEqual(step.plugin_type, constants.IMPORTER_TYPE_ID)
+        self.assertTrue(step.available_units is available_units)
+        self.assertTrue(step.new_units is new_units)
+        self.assertEqual(list(step.units_to_download), [])
+
+    @mock.patch('pulp_docker.plugins.importers.sync.repository.associate_single_unit')
+    @mock.patch('pulp_docker.plugins.importers.sync.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch('pulp_docker.plugins.importers.sync.models.Blob.objects')
+    def test_process_main_blobs(self, blob_objects, rcu_objects, associate_single_unit):
+        """
+        Assert that known blobs are associated unless they are in the repository already, and
+        that documents are only built for the new blobs.
+        """
+        self.step.available_units.extend(
+            sync_state.SyncUnit(models.Blob, digest) for digest in
+            ('sha256:new', 'sha256:in_repo', 'sha256:known', 'sha256:new'))
+        in_repo = mock.MagicMock(id='id1', digest='sha256:in_repo')
+        known = mock.MagicMock(id='id2', digest='sha256:known')
+        blob_objects.filter.return_value.only.return_value = [in_repo, known]
+        rcu_objects.filter.return_value.values_list.return_value = ['id1']
+
+        self.step.process_main()
+
+        blob_objects.filter.assert_called_once_with(
+            digest__in=['sha256:in_repo', 'sha256:known', 'sha256:new'])
+        blob_objects.filter.return_value.only.assert_called_once_with('id', 'digest')
+        rcu_objects.filter.assert_called_once_with(
+            repo_id='repo1', unit_type_id=constants.BLOB_TYPE_ID, unit_id__in=mock.ANY)
+        self.assertEqual(sorted(rcu_objects.filter.call_args[1]['unit_id__in']), ['id1', 'id2'])
+        associate_single_unit.assert_called_once_with(
+            self.step.parent.get_repo.return_value.repo_obj, known)
+        # the new blob is only downloaded once
+        units_to_download = list(self.step.units_to_download)
+        self.assertEqual(len(units_to_download), 1)
+        self.assertTrue(isinstance(units_to_download[0], models.Blob))
+        self.assertEqual(units_to_download[0].digest, 'sha256:new')
+
+    @mock.patch('pulp_docker.plugins.importers.sync.repository.associate_single_unit')
+    @mock.patch('pulp_docker.plugins.importers.sync.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch('pulp_docker.plugins.importers.sync.models.Manifest.objects')
+    def test_process_main_new_manifest(self, manifest_objects, rcu_objects,
+                                       associate_single_unit):
+        """
+        Assert that a new manifest is read back from the working directory.
+        """
+        with open(os.path.join(TEST_DATA_PATH, 'manifest_one_layer.json')) as manifest_file:
+            manifest = manifest_file.read()
+        digest = 'sha256:a001e892f3ba0685184486b08cda99bf81f551513f4b56e72954a1d4404195b1'
+        with open(os.path.join(self.working_dir, digest), 'w') as manifest_file:
+            manifest_file.write(manifest)
+        self.step.available_units.append(sync_state.SyncUnit(models.Manifest, digest, 1))
+        manifest_objects.filter.return_value.only.return_value = []
+
+        self.step.process_main()
+
+        self.assertEqual(rcu_objects.filter.call_count, 0)
+        self.assertEqual(associate_single_unit.call_count, 0)
+        units_to_download = list(self.step.units_to_download)
+        self.assertEqual(len(units_to_download), 1)
+        unit = units_to_download[0]
+        self.assertTrue(isinstance(unit, models.Manifest))
+        self.assertEqual(unit.digest, digest)
+        self.assertEqual(
+            [layer.blob_sum for layer in unit.fs_layers],
+            ['sha256:5f70bf18a086007016e948b04aed3b82103a36bea41755b6cddfaf10ace3c6ef'])
+
+    @mock.patch('pulp_docker.plugins.importers.sync.UNIT_QUERY_PAGE_SIZE', 2)
+    @mock.patch('pulp_docker.plugins.importers.sync.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch('pulp_docker.plugins.importers.sync.models.Blob.objects')
+    def test_process_main_pages(self, blob_objects, rcu_objects):
+        """
+        Assert that the digests are looked up a page at a time.
+        """
+        self.step.available_units.extend(
+            sync_state.SyncUnit(models.Blob, 'sha256:%d' % i) for i in range(5))
+        blob_objects.filter.return_value.only.return_value = []
+
+        self.step.process_main()
+
+        self.assertEqual(
+            [c[1]['digest__in'] for c in blob_objects.filter.call_args_list],
+            [['sha256:0', 'sha256:1'], ['sha256:2', 'sha256:3'], ['sha256:4']])
+        self.assertEqual(len(self.step.units_to_download), 5)
+
+
 class TestSaveUnitsStep(unittest.TestCase):
     """
     This class contains tests for the SaveUnitsStep class.
@@ -450,6 +629,91 @@ class TestSaveUnitsStep(unittest.TestCase):
             self.assertEqual(associate_single_unit.mock_calls[-1][1][1], unit)
 
 
+class TestAuthDownloadStep(unittest.TestCase):
+    """
+    This class contains tests for the AuthDownloadStep class.
+    """
+    @mock.patch('pulp_docker.plugins.importers.sync.http_pool.share_connections')
+    @mock.patch('pulp_docker.plugins.importers.sync.publish_step.DownloadStep.initialize',
+                autospec=True)
+    def test_initialize(self, initialize, share_connections):
+        """
+        Assert that the downloader uses the shared connections, and starts with the token of the
+        registry client.
+        """
+        def create_downloader(step):
+            step.downloader = HTTPThreadedDownloader(DownloaderConfig(), None)
+
+        initialize.side_effect = create_downloader
+        step = sync.AuthDownloadStep(constants.SYNC_STEP_DOWNLOAD,
+                                     config=PluginCallConfiguration({}, {}))
+        step.parent = mock.MagicMock()
+        step.parent.index_repository.token = 'token'
+
+        step.initialize()
+
+        share_connections.assert_called_once_with(step.downloader)
+        self.assertEqual(step.downloader.extra_headers['Authorization'], 'Bearer token')
+
+    @mock.patch('pulp_docker.plugins.importers.sync.publish_step.DownloadStep.download_succeeded')
+    def test_download_succeeded(self, download_succeeded):
+        """
+        Assert that the blob downloads are recorded in the sync's measurements.
+        """
+        step = sync.AuthDownloadStep(constants.SYNC_STEP_DOWNLOAD,
+                                     config=PluginCallConfiguration({}, {}))
+        step.parent = mock.MagicMock()
+        report = DownloadReport('https://registry.example.com/v2/pulp/blobs/sha256:a', '/a/b')
+        report.download_started()
+        report.start_time -= datetime.timedelta(seconds=2)
+        report.bytes_downloaded = 100
+        report.download_succeeded()
+
+        step.download_succeeded(report)
+
+        step.parent.metrics.record_request.assert_called_once_with(
+            sync_metrics.ENDPOINT_BLOBS, mock.ANY, failed=False, size=100)
+        self.assertTrue(step.parent.metrics.record_request.call_args[0][1] >= 2)
+        download_succeeded.assert_called_once_with(report)
+
+
+class TestGetMetadataOptions(unittest.TestCase):
+    """
+    This class contains tests for the get_metadata_options() function.
+    """
+    def test_defaults(self):
+        """
+        Assert that the threaded engine is used by default.
+        """
+        options = sync.get_metadata_options(PluginCallConfiguration({}, {}))
+
+        self.assertEqual(options, {'metadata_engine': metadata_fetcher.ENGINE_THREADED,
+                                   'metadata_host_limit': metadata_fetcher.DEFAULT_HOST_LIMIT})
+
+    def test_direct(self):
+        """
+        Assert that the settings are read from the config.
+        """
+        config = PluginCallConfiguration({}, {constants.CONFIG_KEY_METADATA_ENGINE: 'direct',
+                                              constants.CONFIG_KEY_METADATA_HOST_LIMIT: '50'})
+
+        options = sync.get_metadata_options(config)
+
+        self.assertEqual(options, {'metadata_engine': metadata_fetcher.ENGINE_DIRECT,
+                                   'metadata_host_limit': 50})
+
+    def test_invalid_engine(self):
+        """
+        Assert that an unknown engine is rejected.
+        """
+        config = PluginCallConfiguration({}, {constants.CONFIG_KEY_METADATA_ENGINE: 'asyncio'})
+
+        with self.assertRaises(exceptions.PulpCodedValidationException) as error:
+            sync.get_metadata_options(config)
+
+        self.assertEqual(error.exception.error_code, error_codes.DKR1022)
+
+
 class TestSyncStep(unittest.TestCase):
     """
     This class contains tests for the SyncStep class.
@@ -507,8 +771,8 @@ class TestSyncStep(unittest.TestCase):
         # The correct children should be in place in the right order
         self.assertEqual(
             [type(child) for child in step.children],
-            [sync.DownloadManifestsStep, publish_step.GetLocalUnitsStep,
-             publish_step.GetLocalUnitsStep, sync.AuthDownloadStep, sync.SaveUnitsStep,
+            [sync.DownloadManifestsStep, sync.GetLocalV2UnitsStep,
+             sync.GetLocalV2UnitsStep, sync.AuthDownloadStep, sync.SaveUnitsStep,
              sync.SaveTagsStep])
         # Ensure the first step was initialized correctly
         self.assertEqual(step.children[0].repo, repo)
@@ -527,6 +791,59 @@ class TestSyncStep(unittest.TestCase):
         self.assertEqual(step.children[3].repo, repo)
         self.assertEqual(step.children[3].config, config)
         self.assertEqual(step.children[3].description, _('Downloading remote files'))
+        # The sync state is kept in memory by default
+        self.assertEqual(step.sync_state_db, None)
+        # v1 is disabled, so no v1 repository is needed
+        self.assertEqual(step.v1_index_repository, None)
+        self.assertTrue(isinstance(step.step_get_local_blobs.new_units, sync_state.SyncUnitList))
+
+    @mock.patch('pulp.server.managers.repo._common._working_directory_path')
+    @mock.patch('pulp_docker.plugins.registry.V2Repository.api_version_check', return_value=True)
+    def test___init___sync_state_on_disk(self, api_version_check, _working_directory_path):
+        """
+        Assert that the collections of the sync are kept in the sync state database when
+        sync_state_on_disk is set, and that the database is closed once the sync is done.
+        """
+        _working_directory_path.return_value = self.working_dir
+        self.config.override_config[constants.CONFIG_KEY_SYNC_STATE_ON_DISK] = 'true'
+
+        step = sync.SyncStep(self.repo, self.conduit, self.config)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.working_dir, sync_state.DATABASE_FILE_NAME)))
+        self.assertTrue(isinstance(step.available_manifests, sync_state.DiskSyncUnitList))
+        self.assertTrue(isinstance(step.available_blobs, sync_state.DiskSyncUnitList))
+        self.assertTrue(step.step_get_local_manifests.available_units is step.available_manifests)
+        self.assertTrue(isinstance(step.step_get_local_manifests.new_units,
+                                   sync_state.DiskSyncUnitList))
+        self.assertTrue(isinstance(step.step_get_local_blobs.new_units,
+                                   sync_state.DiskSyncUnitList))
+        self.assertTrue(isinstance(step.save_tags_step.tagged_manifests, sync_state.DiskTagList))
+
+        with mock.patch.object(step, 'sync_state_db') as sync_state_db:
+            with mock.patch('pulp_docker.plugins.importers.sync.publish_step.PluginStep.'
+                            'process_lifecycle', side_effect=IOError):
+                self.assertRaises(IOError, step.process_lifecycle)
+
+        sync_state_db.close.assert_called_once_with()
+
+    @mock.patch('pulp_docker.plugins.registry.V2Repository.api_version_check')
+    def test___init___index_repository(self, api_version_check):
+        """
+        Assert that a given index repository is used as it is, without checking the registry
+        again, and that the sync uses the given working directory.
+        """
+        index_repository = registry.V2Repository('pulp/crane', DownloaderConfig(),
+                                                 'http://pulpproject.org/', self.working_dir)
+
+        step = sync.SyncStep(self.repo, self.conduit, self.config,
+                             index_repository=index_repository, working_dir=self.working_dir)
+
+        self.assertTrue(step.index_repository is index_repository)
+        self.assertTrue(index_repository.metrics is step.metrics)
+        self.assertEqual(api_version_check.call_count, 0)
+        self.assertEqual(step.get_working_dir(), self.working_dir)
+        self.assertTrue(sync.DownloadManifestsStep in [type(child) for child in step.children])
 
     @mock.patch('pulp.server.managers.repo._common._working_directory_path')
     @mock.patch('pulp_docker.plugins.importers.sync.SyncStep._validate')
@@ -708,8 +1025,8 @@ class TestSyncStep(unittest.TestCase):
             {'feed': 'https://registry.example.com', 'upstream_name': 'busybox',
              importer_constants.KEY_MAX_DOWNLOADS: 25})
         step = sync.SyncStep(repo, conduit, config)
-        step.step_get_local_blobs.units_to_download = [
-            models.Blob(digest=i) for i in ['cool', 'stuff']]
+        step.step_get_local_blobs.new_units.extend([
+            sync.SyncUnit(models.Blob, 'cool'), sync.SyncUnit(models.Blob, 'stuff', size=100)])
 
         requests = step.generate_download_requests()
 
@@ -723,6 +1040,9 @@ class TestSyncStep(unittest.TestCase):
         self.assertEqual(requests[1].destination, os.path.join(self.working_dir, 'stuff'))
         self.assertEqual(requests[1].data, None)
         self.assertEqual(requests[1].headers, None)
+        # the size of a blob is only known when a schema 2 manifest announced it
+        self.assertEqual(step.metrics.phases[sync_metrics.PHASE_SETUP].unsized_blobs, 1)
+        self.assertEqual(step.metrics.phases[sync_metrics.PHASE_SETUP].bytes_expected, 100)
 
     @mock.patch('pulp_docker.plugins.registry.V2Repository.api_version_check', return_value=False)
     @mock.patch('pulp_docker.plugins.registry.V1Repository.api_version_check', return_value=True)
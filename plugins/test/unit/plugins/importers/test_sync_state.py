@@ -0,0 +1,168 @@
+"""
+This module contains tests for the pulp_docker.plugins.importers.sync_state module.
+"""
+import os
+import shutil
+import tempfile
+
+from pulp.common.compat import unittest
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import models
+from pulp_docker.plugins.importers import sync_state
+
+
+class TestSyncUnit(unittest.TestCase):
+    """
+    This class contains tests for the SyncUnit class.
+    """
+    def test___init__(self):
+        """
+        Assert that the digest is interned, so that records share a single copy of it.
+        """
+        digest = u'sha256:' + 'a' * 64
+
+        first = sync_state.SyncUnit(models.Blob, digest)
+        second = sync_state.SyncUnit(models.Blob, 'sha256:' + 'a' * 64)
+
+        self.assertTrue(first.digest is second.digest)
+        self.assertEqual(first.schema_version, None)
+        self.assertEqual(first.size, None)
+        self.assertFalse(hasattr(first, '__dict__'))
+
+
+class TestSyncUnitList(unittest.TestCase):
+    """
+    This class contains tests for the SyncUnitList class.
+    """
+    def test_pages(self):
+        """
+        Assert that the units are returned by model, sorted by digest, each of them once.
+        """
+        units = sync_state.SyncUnitList(
+            [sync_state.SyncUnit(models.Blob, digest) for digest in ('c', 'a', 'b', 'a')])
+        units.append(sync_state.SyncUnit(models.Manifest, 'm', 2))
+
+        pages = [(model, [unit.digest for unit in page]) for model, page in units.pages(2)]
+
+        self.assertEqual(sorted(pages),
+                         sorted([(models.Blob, ['a', 'b']), (models.Blob, ['c']),
+                                 (models.Manifest, ['m'])]))
+
+
+class TestDigestSizes(unittest.TestCase):
+    """
+    This class contains tests for the DigestSizes class.
+    """
+    def test_add(self):
+        """
+        Assert that a blob keeps the size a manifest gave it, whatever the order of the manifests.
+        """
+        digests = sync_state.DigestSizes()
+
+        digests.add('sha256:a')
+        digests.add('sha256:a', 10)
+        digests.add('sha256:b', 20)
+        digests.add('sha256:b')
+
+        self.assertEqual(digests, {'sha256:a': 10, 'sha256:b': 20})
+
+
+class TestSyncStateDatabase(unittest.TestCase):
+    """
+    This class contains tests for the SyncStateDatabase class and its collections.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.database = sync_state.SyncStateDatabase(
+            os.path.join(self.working_dir, sync_state.DATABASE_FILE_NAME))
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.working_dir)
+
+    def test_unit_list(self):
+        """
+        Assert that a unit is only stored once, and read back with its model and schema version.
+        """
+        units = self.database.unit_list('units')
+
+        units.extend([sync_state.SyncUnit(models.Manifest, 'sha256:b', 2),
+                      sync_state.SyncUnit(models.ManifestList, 'sha256:a', 2)])
+        units.append(sync_state.SyncUnit(models.Manifest, 'sha256:b', 2))
+        units.digest_set(models.Blob).add('sha256:c')
+        units.digest_set(models.Blob).add('sha256:c')
+
+        self.assertEqual(len(units), 3)
+        self.assertEqual(
+            sorted((unit.model._content_type_id.default, unit.digest, unit.schema_version)
+                   for unit in units),
+            [(constants.BLOB_TYPE_ID, 'sha256:c', None),
+             (constants.MANIFEST_TYPE_ID, 'sha256:b', 2),
+             (constants.MANIFEST_LIST_TYPE_ID, 'sha256:a', 2)])
+
+    def test_unit_list_pages(self):
+        """
+        Assert that the pages are read while units are added to another collection.
+        """
+        units = self.database.unit_list('units')
+        new_units = self.database.unit_list('new_units')
+        units.extend(sync_state.SyncUnit(models.Blob, 'sha256:%d' % i) for i in range(5))
+
+        pages = []
+        for model, page in units.pages(2):
+            pages.append([unit.digest for unit in page])
+            new_units.extend(page)
+
+        self.assertEqual(pages, [['sha256:0', 'sha256:1'], ['sha256:2', 'sha256:3'],
+                                 ['sha256:4']])
+        self.assertEqual(len(new_units), 5)
+
+    def test_unit_list_sizes(self):
+        """
+        Assert that a blob keeps the size a manifest gave it, whatever the order of the manifests.
+        """
+        units = self.database.unit_list('units')
+        blobs = units.digest_set(models.Blob)
+
+        blobs.add('sha256:a')
+        blobs.add('sha256:a', 10)
+        blobs.add('sha256:b', 20)
+        blobs.add('sha256:b')
+        blobs.add('sha256:c')
+
+        self.assertEqual(sorted((unit.digest, unit.size) for unit in units),
+                         [('sha256:a', 10), ('sha256:b', 20), ('sha256:c', None)])
+
+    def test_tag_list(self):
+        """
+        Assert that the tagged manifests are read back in the order they were added.
+        """
+        tags = self.database.tag_list('tags')
+        tags.append(('latest', sync_state.SyncUnit(models.ManifestList, 'sha256:b', 2),
+                     constants.MANIFEST_LIST_TYPE))
+        tags.append(('1.0', sync_state.SyncUnit(models.Manifest, 'sha256:a', 1),
+                     constants.MANIFEST_IMAGE_TYPE))
+
+        self.assertEqual(len(tags), 2)
+        self.assertEqual(
+            [(tag, unit.model, unit.digest, unit.schema_version, manifest_type)
+             for tag, unit, manifest_type in tags],
+            [('latest', models.ManifestList, 'sha256:b', 2, constants.MANIFEST_LIST_TYPE),
+             ('1.0', models.Manifest, 'sha256:a', 1, constants.MANIFEST_IMAGE_TYPE)])
+
+
+class TestUnitDocuments(unittest.TestCase):
+    """
+    This class contains tests for the UnitDocuments class.
+    """
+    def test___iter__(self):
+        """
+        Assert that the documents are built as they are iterated over.
+        """
+        units = sync_state.SyncUnitList([sync_state.SyncUnit(models.Blob, 'sha256:a')])
+
+        documents = sync_state.UnitDocuments(units, lambda unit: models.Blob(digest=unit.digest))
+
+        self.assertEqual(len(documents), 1)
+        self.assertEqual([blob.digest for blob in documents], ['sha256:a'])
@@ -25,8 +25,10 @@ class UploadTest(unittest.TestCase):
         self.work_dir = tempfile.mkdtemp()
         self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
 
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
-    def test_AddUnits(self, mock_v, _repo_controller, _Manifest_save, _Blob_save):
+    def test_AddUnits(self, mock_v, _Blob_objects, _repo_controller, _Manifest_save, _Blob_save):
+        _Blob_objects.filter.return_value = []
         mock_v.return_value = upload.Version('1.0')
         # This is where we will untar the image
         step_work_dir = os.path.join(self.work_dir, "working_dir")
@@ -82,8 +84,11 @@ class UploadTest(unittest.TestCase):
             units[0],
             parent.uploaded_unit)
 
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
-    def test_AddUnits_skopeo11(self, mock_v, _repo_controller, _Manifest_save, _Blob_save):
+    def test_AddUnits_skopeo11(self, mock_v, _Blob_objects, _repo_controller, _Manifest_save,
+                               _Blob_save):
+        _Blob_objects.filter.return_value = []
         mock_v.return_value = upload.Version('1.1')
 
         # This is where we will untar the image
@@ -141,9 +146,11 @@ class UploadTest(unittest.TestCase):
             units[0],
             parent.uploaded_unit)
 
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
-    def test_AddUnits_error_bad_checksum(self, mock_v, _repo_controller, _Manifest_save,
-                                         _Blob_save):
+    def test_AddUnits_error_bad_checksum(self, mock_v, _Blob_objects, _repo_controller,
+                                         _Manifest_save, _Blob_save):
+        _Blob_objects.filter.return_value = []
         mock_v.return_value = upload.Version('1.0')
         # This is where we will untar the image
         step_work_dir = os.path.join(self.work_dir, "working_dir")
@@ -181,10 +188,11 @@ class UploadTest(unittest.TestCase):
             "Checksum bad-digest (sha256) does not validate",
             str(ctx.exception))
 
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
-    def test_AddUnits_error_missing_layer(self, mock_v, _repo_controller, _Manifest_save,
-                                          _Blob_save):
-        _repo_controller.find_repo_content_units.return_value = ()
+    def test_AddUnits_error_missing_layer(self, mock_v, _Blob_objects, _repo_controller,
+                                          _Manifest_save, _Blob_save):
+        _Blob_objects.filter.return_value = []
         mock_v.return_value = upload.Version('1.0')
 
         # This is where we will untar the image
@@ -225,9 +233,11 @@ class UploadTest(unittest.TestCase):
             "Layer this-is-missing.tar is not present in the image",
             str(ctx.exception))
 
-    @mock.patch('pulp_docker.plugins.importers.upload.Q', mock.Mock)
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
-    def test_AddUnits_existing_layer(self, mock_v, _repo_controller, _Manifest_save, _Blob_save):
+    def test_AddUnits_existing_layer(self, mock_v, _Blob_objects, _RCU_objects, _repo_controller,
+                                     _Manifest_save, _Blob_save):
         mock_v.return_value = upload.Version('1.0')
         # This is where we will untar the image
         step_work_dir = os.path.join(self.work_dir, "working_dir")
@@ -246,13 +256,8 @@ class UploadTest(unittest.TestCase):
         # This layer not in the tarball.
         units.append(models.Blob(digest="sha256:this-already-in-the-repository"))
 
-        def find_units(units_q, **unused):
-            if units_q.digest == units[-1].digest:
-                return (mock.Mock(),)
-            else:
-                return ()
-
-        _repo_controller.find_repo_content_units.side_effect = find_units
+        _Blob_objects.filter.return_value = [mock.Mock(id='in-repo', digest=units[-1].digest)]
+        _RCU_objects.filter.return_value.values_list.return_value = ['in-repo']
 
         parent = mock.MagicMock()
         parent.configure_mock(file_path=img, parent=None)
@@ -268,6 +273,12 @@ class UploadTest(unittest.TestCase):
                                working_dir=step_work_dir)
         step.parent = parent
         step.process_lifecycle()
+        # All the blobs are looked up at once
+        _Blob_objects.filter.assert_called_once_with(
+            digest__in=sorted(unit.digest for unit in units[1:]))
+        _RCU_objects.filter.assert_called_once_with(
+            repo_id=parent.get_repo.return_value.id, unit_type_id=constants.BLOB_TYPE_ID,
+            unit_id__in=['in-repo'])
         # Make sure associate_single_unit got called
         repo_obj = parent.get_repo.return_value.repo_obj
         self.assertEquals(
@@ -277,14 +288,51 @@ class UploadTest(unittest.TestCase):
             units[0],
             parent.uploaded_unit)
 
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch('pulp_docker.plugins.importers.upload.models.Blob.objects')
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
+    def test_AddUnits_known_layer(self, mock_v, _Blob_objects, _RCU_objects, _repo_controller,
+                                  _Manifest_save, _Blob_save):
+        known_blob = mock.Mock(id='known', digest="sha256:this-is-known")
+        _Blob_objects.filter.return_value = [known_blob]
+        _RCU_objects.filter.return_value.values_list.return_value = []
+        mock_v.return_value = upload.Version('1.0')
+        step_work_dir = os.path.join(self.work_dir, "working_dir")
+        os.makedirs(step_work_dir)
+
+        img, layers = self._create_image()
+        units = [models.Blob(digest="sha256:%s" % x['digest']) for x in layers]
+        # The client left this layer out of the tarball, Pulp already has it
+        units.append(models.Blob(digest="sha256:this-is-known"))
+
+        parent = mock.MagicMock(file_path=img, parent=None)
+        parent.available_units = units
+        step = upload.ProcessManifest(step_type=constants.UPLOAD_STEP_IMAGE_MANIFEST,
+                                      working_dir=step_work_dir)
+        step.parent = parent
+        step.initialize()
+
+        step = upload.AddUnits(step_type=constants.UPLOAD_STEP_SAVE,
+                               working_dir=step_work_dir)
+        step.parent = parent
+        step.process_lifecycle()
+
+        self.assertEquals(len(layers), _Blob_save.call_count)
+        repo_obj = parent.get_repo.return_value.repo_obj
+        self.assertEquals(
+            [mock.call(repo_obj, x) for x in units[:-1] + [known_blob]],
+            _repo_controller.associate_single_unit.call_args_list)
+
+    @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
     @mock.patch("pulp_docker.plugins.importers.upload.models.Manifest.objects")
     @mock.patch("pulp_docker.plugins.importers.upload.models.Tag.objects")
-    def test_AddTags(self, _Tag_objects, _Manifest_objects, mock_v, _repos, _Manifest_save,
-                     _Blob_save):
+    def test_AddTags(self, _Tag_objects, _Manifest_objects, _RCU_objects, mock_v, _repos,
+                     _Manifest_save, _Blob_save):
         mock_v.return_value = upload.Version('1.0')
-        _Manifest_objects.filter.return_value.count.return_value = 1
-        _Manifest_objects.filter.return_value.__getitem__.return_value.schema_version = 42
+        manifest = _Manifest_objects.filter.return_value.only.return_value.first.return_value
+        manifest.schema_version = 42
+        _RCU_objects.filter.return_value.count.return_value = 1
 
         step_work_dir = os.path.join(self.work_dir, "working_dir")
 
@@ -301,6 +349,110 @@ class UploadTest(unittest.TestCase):
             tag_name="a", repo_id=parent.repo.id, manifest_type="image",
             schema_version=42, manifest_digest='sha256:123',
             pulp_user_metadata=None)
+        # Only the tagged digest and its association are looked up
+        _Manifest_objects.filter.assert_called_once_with(digest='sha256:123')
+        _RCU_objects.filter.assert_called_once_with(
+            repo_id=parent.repo.id, unit_type_id=constants.MANIFEST_TYPE_ID, unit_id=manifest.id)
+
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch("pulp_docker.plugins.importers.upload.models.ManifestList.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Manifest.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Tag.objects")
+    def test_AddTags_manifest_list(self, _Tag_objects, _Manifest_objects, _ManifestList_objects,
+                                   _RCU_objects, _repos, _Manifest_save, _Blob_save):
+        _Manifest_objects.filter.return_value.only.return_value.first.return_value = None
+        manifest_list = \
+            _ManifestList_objects.filter.return_value.only.return_value.first.return_value
+        manifest_list.schema_version = 2
+        _RCU_objects.filter.return_value.count.return_value = 1
+
+        parent = mock.MagicMock(metadata=dict(name="a", digest="sha256:123"), parent=None)
+        step = upload.AddTags(step_type=constants.UPLOAD_STEP_SAVE,
+                              working_dir=os.path.join(self.work_dir, "working_dir"))
+        step.parent = parent
+        step.process_main()
+
+        _Tag_objects.tag_manifest.assert_called_once_with(
+            tag_name="a", repo_id=parent.repo.id, manifest_type=constants.MANIFEST_LIST_TYPE,
+            schema_version=2, manifest_digest='sha256:123', pulp_user_metadata=None)
+
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch("pulp_docker.plugins.importers.upload.models.ManifestList.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Manifest.objects")
+    def test_AddTags__error_not_in_repo(self, _Manifest_objects, _ManifestList_objects,
+                                        _RCU_objects, _repos, _Manifest_save, _Blob_save):
+        _ManifestList_objects.filter.return_value.only.return_value.first.return_value = None
+        _RCU_objects.filter.return_value.count.return_value = 0
+
+        parent = mock.MagicMock(metadata=dict(name="a", digest="sha256:123"), parent=None)
+        step = upload.AddTags(step_type=constants.UPLOAD_STEP_SAVE,
+                              working_dir=os.path.join(self.work_dir, "working_dir"))
+        step.parent = parent
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.process_main()
+        self.assertEquals("DKR1010", ctx.exception.error_code.code)
+
+    @mock.patch('pulp_docker.plugins.importers.upload.pulp_models.RepositoryContentUnit.objects')
+    @mock.patch("pulp_docker.plugins.importers.upload.models.ManifestList.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Manifest.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Tag.objects")
+    def test_UpdateTags(self, _Tag_objects, _Manifest_objects, _ManifestList_objects,
+                        _RCU_objects, _repo_controller, _Manifest_save, _Blob_save):
+        _Manifest_objects.filter.return_value.only.return_value = [
+            mock.Mock(id='manifest', digest='sha256:1', schema_version=2)]
+        _ManifestList_objects.filter.return_value.only.return_value = []
+        tag = mock.Mock(id='tag', manifest_digest='sha256:1')
+        tag.name = 'latest'
+        busy_tag = mock.Mock(id=None, manifest_digest='sha256:1')
+        busy_tag.name = 'busy'
+        _Tag_objects.tag_manifests.return_value = [(busy_tag, constants.TAG_RESULT_FAILED),
+                                                   (tag, constants.TAG_RESULT_UNCHANGED)]
+        old_tag = mock.Mock(id='old-tag')
+        old_tag.name = 'old'
+        _Tag_objects.filter.return_value = [old_tag]
+
+        def filter_associated(unit_id__in, **unused):
+            associated = mock.Mock()
+            associated.values_list.return_value = [
+                unit_id for unit_id in unit_id__in if unit_id in ('manifest', 'old-tag')]
+            return associated
+
+        _RCU_objects.filter.side_effect = filter_associated
+
+        parent = mock.MagicMock(parent=None, metadata={
+            constants.UPLOAD_KEY_TAGS: {'latest': 'sha256:1', 'missing': 'sha256:2',
+                                        'busy': 'sha256:1'},
+            constants.UPLOAD_KEY_REMOVE_TAGS: ['old', 'gone', 'latest']})
+        step = upload.UpdateTags(step_type=constants.UPLOAD_TAG_STEP,
+                                 working_dir=os.path.join(self.work_dir, "working_dir"))
+        step.parent = parent
+        step.process_main()
+
+        repo = parent.get_repo.return_value
+        _Manifest_objects.filter.assert_called_once_with(digest__in=['sha256:1', 'sha256:2'])
+        _ManifestList_objects.filter.assert_called_once_with(digest__in=['sha256:2'])
+        _Tag_objects.tag_manifests.assert_called_once_with(
+            repo.id, [('busy', 'sha256:1', 2, constants.MANIFEST_IMAGE_TYPE),
+                      ('latest', 'sha256:1', 2, constants.MANIFEST_IMAGE_TYPE)])
+        # the tag was not associated with the repository yet
+        _repo_controller.associate_single_unit.assert_called_once_with(repo.repo_obj, tag)
+        _Tag_objects.filter.assert_called_once_with(repo_id=repo.id, name__in=['gone', 'old'])
+        _repo_controller.disassociate_units.assert_called_once_with(repo.repo_obj, [old_tag])
+        self.assertEquals(parent.tag_report, {
+            'busy': {'digest': 'sha256:1', 'result': constants.TAG_RESULT_FAILED},
+            'latest': {'digest': 'sha256:1', 'result': constants.TAG_RESULT_CREATED},
+            'missing': {'digest': 'sha256:2', 'result': constants.TAG_RESULT_MISSING_MANIFEST},
+            'old': {'result': constants.TAG_RESULT_REMOVED},
+            'gone': {'result': constants.TAG_RESULT_NOT_FOUND}})
+
+    def test_UpdateTags__error_not_a_mapping(self, _repo_controller, _Manifest_save, _Blob_save):
+        parent = mock.MagicMock(parent=None, metadata={constants.UPLOAD_KEY_TAGS: ['latest']})
+        step = upload.UpdateTags(step_type=constants.UPLOAD_TAG_STEP,
+                                 working_dir=os.path.join(self.work_dir, "working_dir"))
+        step.parent = parent
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.process_main()
+        self.assertEquals("DKR1026", ctx.exception.error_code.code)
 
     @mock.patch('pulp_docker.plugins.importers.upload.Version.from_file')
     def test_AddTags__error_no_name(self, mock_v, _repo_controller, _Manifest_save, _Blob_save):
@@ -333,6 +485,23 @@ class UploadTest(unittest.TestCase):
             "Tag does not contain required field: manifest_digest.",
             str(ctx.exception))
 
+    def test_ProcessManifest_initialize(self, _repo_controller, _Manifest_save, _Blob_save):
+        step_work_dir = os.path.join(self.work_dir, "working_dir")
+        os.makedirs(step_work_dir)
+        img, layers = self._create_image()
+        parent = mock.MagicMock(file_path=img, parent=None)
+
+        step = upload.ProcessManifest(step_type=constants.UPLOAD_STEP_IMAGE_MANIFEST,
+                                      working_dir=step_work_dir)
+        step.parent = parent
+        step.initialize()
+
+        # The blobs are only read by AddUnits
+        self.assertEquals([], os.listdir(step_work_dir))
+        self.assertEquals(
+            sorted("%s.tar" % x['digest'] for x in layers),
+            sorted(parent.archive_members))
+
     def _create_layer(self, content):
         sha = hashlib.sha256()
         sha.update(content)
@@ -360,3 +529,262 @@ class UploadTest(unittest.TestCase):
             layers.append(dict(digest=digest, content=content))
         tobj.close()
         return fname, layers
+
+
+class TestImportExport(unittest.TestCase):
+    def setUp(self):
+        super(TestImportExport, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        self.step_work_dir = os.path.join(self.work_dir, "working_dir")
+        os.makedirs(self.step_work_dir)
+        self.blob = "blob content"
+        self.blob_digest = "sha256:%s" % hashlib.sha256(self.blob).hexdigest()
+        self.export_manifest = {
+            'version': 1,
+            'added': {'blobs': [self.blob_digest], 'manifests': [], 'manifest_lists': []},
+            'removed': {'blobs': [], 'manifests': ['sha256:old'], 'manifest_lists': []},
+            'tags': [{'name': 'latest', 'manifest_digest': 'sha256:abc', 'schema_version': 2,
+                      'manifest_type': 'image'}]}
+
+    def _create_export(self, files):
+        fname = os.path.join(self.work_dir, "export.tar.gz")
+        tobj = tarfile.open(fname, mode="w:gz")
+        for name, content in files:
+            path = os.path.join(self.work_dir, "member")
+            with open(path, "w") as member:
+                member.write(content)
+            tobj.add(path, name)
+        tobj.close()
+        return fname
+
+    def _create_step(self, files):
+        parent = mock.MagicMock(file_path=self._create_export(files), parent=None)
+        step = upload.ImportExport(constants.UPLOAD_STEP_EXPORT_ARCHIVE,
+                                   working_dir=self.step_work_dir)
+        step.parent = parent
+        return step
+
+    def test_upload_step(self):
+        step = upload.UploadStep(repo=mock.Mock(), file_path='/a/export.tar', config={},
+                                 metadata={constants.UPLOAD_KEY_EXPORT_ARCHIVE: True},
+                                 type_id=constants.MANIFEST_TYPE_ID)
+        self.assertEqual(len(step.children), 1)
+        self.assertTrue(isinstance(step.children[0], upload.ImportExport))
+
+    def test_initialize(self):
+        step = self._create_step([
+            (constants.EXPORT_OCI_LAYOUT_FILE_NAME, '{}'),
+            ("blobs/sha256/%s" % self.blob_digest.split(':')[1], self.blob),
+            ("index.json", '{}'),
+            (constants.EXPORT_MANIFEST_FILE_NAME, json.dumps(self.export_manifest))])
+
+        step.initialize()
+
+        self.assertEqual(step.export_manifest, self.export_manifest)
+        self.assertEqual(os.listdir(self.step_work_dir), [self.blob_digest])
+
+    def test_initialize_not_an_export(self):
+        step = self._create_step([("manifest.json", '{}')])
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.initialize()
+        self.assertEqual(ctx.exception.error_code.code, "DKR1025")
+
+    def test_initialize_missing_key(self):
+        del self.export_manifest['removed']['manifests']
+        step = self._create_step([
+            (constants.EXPORT_MANIFEST_FILE_NAME, json.dumps(self.export_manifest))])
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.initialize()
+        self.assertEqual(ctx.exception.error_code.code, "DKR1035")
+
+    def test_initialize_tag_missing_field(self):
+        del self.export_manifest['tags'][0]['manifest_digest']
+        step = self._create_step([
+            (constants.EXPORT_MANIFEST_FILE_NAME, json.dumps(self.export_manifest))])
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.initialize()
+        self.assertEqual(ctx.exception.error_code.code, "DKR1035")
+
+    def test_initialize_bad_algorithm(self):
+        self.export_manifest['added']['blobs'] = ['sha999:abc']
+        step = self._create_step([
+            (constants.EXPORT_MANIFEST_FILE_NAME, json.dumps(self.export_manifest))])
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.initialize()
+        self.assertEqual(ctx.exception.error_code.code, "DKR1036")
+
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Manifest.objects")
+    @mock.patch("pulp_docker.plugins.importers.upload.models.Tag.objects")
+    @mock.patch("pulp_docker.plugins.models.Blob.save_and_import_content")
+    @mock.patch("pulp_docker.plugins.importers.upload.repository")
+    def test_process_main(self, mock_repository, mock_blob_save, mock_tag_objects,
+                          mock_manifest_objects):
+        with open(os.path.join(self.step_work_dir, self.blob_digest), "w") as blob_file:
+            blob_file.write(self.blob)
+        stale_tag = models.Tag(name='old', schema_version=2, manifest_type='image')
+        kept_tag = models.Tag(name='latest', schema_version=2, manifest_type='image')
+        mock_tag_objects.filter.return_value.only.return_value = [stale_tag, kept_tag]
+        step = self._create_step([])
+        step.export_manifest = self.export_manifest
+
+        step.process_main()
+
+        mock_blob_save.assert_called_once_with(
+            os.path.join(self.step_work_dir, self.blob_digest))
+        repo_obj = step.parent.get_repo.return_value.repo_obj
+        mock_manifest_objects.filter.assert_called_once_with(digest__in=['sha256:old'])
+        mock_tag_objects.tag_manifest.assert_called_once_with(
+            repo_id=step.parent.get_repo.return_value.id, tag_name='latest',
+            manifest_digest='sha256:abc', schema_version=2, manifest_type='image')
+        self.assertEqual(mock_repository.disassociate_units.call_args_list,
+                         [mock.call(repo_obj, mock_manifest_objects.filter.return_value),
+                          mock.call(repo_obj, [stale_tag])])
+
+    @mock.patch("pulp_docker.plugins.importers.upload.repository")
+    def test_process_main_bad_checksum(self, mock_repository):
+        with open(os.path.join(self.step_work_dir, self.blob_digest), "w") as blob_file:
+            blob_file.write("corrupted")
+        step = self._create_step([])
+        step.export_manifest = self.export_manifest
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            step.process_main()
+        self.assertEqual(ctx.exception.error_code.code, "DKR1017")
+        self.assertFalse(mock_repository.associate_single_unit.called)
+
+
+class TestAddImages(unittest.TestCase):
+    def setUp(self):
+        super(TestAddImages, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        os.makedirs(os.path.join(self.work_dir, "abc"))
+        with open(os.path.join(self.work_dir, "abc", "layer.tar"), "w") as layer:
+            layer.write("layer")
+
+    @mock.patch("pulp_docker.plugins.importers.upload.v1_sync.SaveImages.process_main")
+    @mock.patch("pulp_docker.plugins.importers.upload.tarutils.get_ancestry")
+    @mock.patch("pulp_docker.plugins.importers.upload.compression.gzip_file")
+    def test_process_main(self, mock_gzip_file, mock_get_ancestry, mock_process_main):
+        mock_get_ancestry.return_value = ["abc"]
+        step = upload.AddImages(step_type=constants.UPLOAD_STEP_SAVE, working_dir=self.work_dir)
+        step.parent = mock.MagicMock()
+        step.compression_level = 9
+        step.compression_threads = 4
+        step.buffer_size = 65536
+
+        step.process_main(item=mock.Mock(image_id="abc"))
+
+        layer_dir = os.path.join(self.work_dir, "abc")
+        mock_gzip_file.assert_called_once_with(os.path.join(layer_dir, "layer.tar"),
+                                               os.path.join(layer_dir, "layer"), 9, 4, 65536)
+        self.assertEqual(os.listdir(layer_dir), ["ancestry"])
+        self.assertEqual(step.parent.uploaded_unit, mock_process_main.return_value)
+
+
+class TestImportDirectory(unittest.TestCase):
+    def setUp(self):
+        super(TestImportDirectory, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir, ignore_errors=True)
+        self.upload_dir = os.path.join(self.work_dir, "uploads")
+        self.layer = "layer content"
+        self.layer_digest = "sha256:%s" % hashlib.sha256(self.layer).hexdigest()
+        self.config = "config content"
+        self.config_digest = "sha256:%s" % hashlib.sha256(self.config).hexdigest()
+        self.manifest = json.dumps(dict(
+            schemaVersion=2, mediaType=constants.MEDIATYPE_MANIFEST_S2,
+            config=dict(digest=self.config_digest, mediaType="ignored"),
+            layers=[dict(digest=self.layer_digest, mediaType="ignored")]))
+        self.manifest_digest = "sha256:%s" % hashlib.sha256(self.manifest).hexdigest()
+
+    def _write(self, path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as content_file:
+            content_file.write(content)
+
+    def _create_skopeo_dir(self):
+        directory = os.path.join(self.upload_dir, "skopeo")
+        self._write(os.path.join(directory, "manifest.json"), self.manifest)
+        self._write(os.path.join(directory, "version"), "Directory Transport Version: 1.1\n")
+        self._write(os.path.join(directory, self.layer_digest[7:]), self.layer)
+        self._write(os.path.join(directory, self.config_digest[7:]), self.config)
+        return directory
+
+    def _create_oci_layout(self, media_type=constants.MEDIATYPE_MANIFEST_S2):
+        directory = os.path.join(self.upload_dir, "oci")
+        self._write(os.path.join(directory, "oci-layout"), '{"imageLayoutVersion": "1.0.0"}')
+        self._write(os.path.join(directory, "index.json"), json.dumps(dict(
+            schemaVersion=2, manifests=[dict(digest=self.manifest_digest, mediaType=media_type)])))
+        for digest, content in ((self.manifest_digest, self.manifest),
+                                (self.layer_digest, self.layer),
+                                (self.config_digest, self.config)):
+            self._write(os.path.join(directory, "blobs", "sha256", digest[7:]), content)
+        return directory
+
+    def _process(self, directory):
+        parent = mock.MagicMock(directory=directory, unit_paths={}, available_units=[])
+        parent.get_config.return_value = {
+            constants.CONFIG_KEY_UPLOAD_DIRECTORIES: [self.upload_dir]}
+        step = upload.ProcessDirectory(constants.UPLOAD_STEP_DIRECTORY)
+        step.parent = parent
+        step.initialize()
+        step.process_main()
+        return parent
+
+    def test_skopeo_dir(self):
+        directory = self._create_skopeo_dir()
+
+        parent = self._process(directory)
+
+        self.assertEqual([unit.digest for unit in parent.available_units],
+                         [self.manifest_digest, self.layer_digest, self.config_digest])
+        self.assertEqual(parent.unit_paths, {
+            self.manifest_digest: os.path.join(directory, "manifest.json"),
+            self.layer_digest: os.path.join(directory, self.layer_digest[7:]),
+            self.config_digest: os.path.join(directory, self.config_digest[7:])})
+
+    def test_oci_layout(self):
+        directory = self._create_oci_layout()
+
+        parent = self._process(directory)
+
+        self.assertEqual([unit.digest for unit in parent.available_units],
+                         [self.manifest_digest, self.layer_digest, self.config_digest])
+        self.assertEqual(parent.unit_paths[self.manifest_digest],
+                         os.path.join(directory, "blobs", "sha256", self.manifest_digest[7:]))
+
+    def test_oci_manifest_not_supported(self):
+        directory = self._create_oci_layout(media_type="application/vnd.oci.image.manifest.v1+json")
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            self._process(directory)
+        self.assertEqual(ctx.exception.error_code.code, "DKR1029")
+
+    def test_directory_not_allowed(self):
+        directory = self._create_skopeo_dir()
+        self.upload_dir = os.path.join(self.work_dir, "other")
+
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            self._process(os.path.join(self.upload_dir, "..", "uploads", "skopeo"))
+        self.assertEqual(ctx.exception.error_code.code, "DKR1027")
+        self.assertTrue(os.path.isdir(directory))
+
+    @mock.patch("pulp_docker.plugins.importers.upload.AddUnits._find_blobs")
+    def test_add_units_bad_checksum(self, mock_find_blobs):
+        mock_find_blobs.return_value = ({}, set())
+        directory = self._create_skopeo_dir()
+        self._write(os.path.join(directory, self.layer_digest[7:]), "tampered")
+        parent = self._process(directory)
+
+        step = upload.AddDirectoryUnits(step_type=constants.UPLOAD_STEP_SAVE)
+        step.parent = parent
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            list(step.get_iterator())
+        self.assertEqual(ctx.exception.error_code.code, "DKR1017")
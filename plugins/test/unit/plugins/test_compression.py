@@ -0,0 +1,63 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from pulp_docker.plugins import compression
+
+
+class TestOpenWriter(unittest.TestCase):
+
+    data = ''.join(chr(i % 251) for i in range(300000))
+
+    def _compress(self, compression_type, threads=1, block_size=compression.DEFAULT_BLOCK_SIZE):
+        output = StringIO()
+        writer = compression.open_writer(output, compression_type, threads=threads,
+                                         block_size=block_size)
+        for start in range(0, len(self.data), 7000):
+            writer.write(self.data[start:start + 7000])
+        writer.close()
+        return output.getvalue()
+
+    def test_none(self):
+        self.assertEqual(self._compress(compression.COMPRESSION_NONE), self.data)
+
+    def test_gzip(self):
+        compressed = self._compress(compression.COMPRESSION_GZIP)
+
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(), self.data)
+
+    def test_parallel_gzip(self):
+        compressed = self._compress(compression.COMPRESSION_GZIP, threads=4, block_size=65536)
+
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(), self.data)
+
+    def test_parallel_gzip_empty(self):
+        output = StringIO()
+        compression.open_writer(output, compression.COMPRESSION_GZIP, threads=2).close()
+
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(output.getvalue())).read(), '')
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, compression.open_writer, StringIO(), 'lzma')
+
+
+class TestGzipFile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_gzip_file(self):
+        source = os.path.join(self.temp_dir, 'layer.tar')
+        destination = os.path.join(self.temp_dir, 'layer')
+        with open(source, 'w') as source_file:
+            source_file.write('x' * 100000)
+
+        compression.gzip_file(source, destination, level=1, threads=2, buffer_size=4096)
+
+        self.assertEqual(gzip.open(destination).read(), 'x' * 100000)
@@ -0,0 +1,57 @@
+import unittest
+
+from pulp.server.exceptions import PulpCodedValidationException
+
+from pulp_docker.plugins import config_utils
+
+
+class TestGetBoolean(unittest.TestCase):
+    def test_default(self):
+        self.assertFalse(config_utils.get_boolean({}, "flag"))
+        self.assertTrue(config_utils.get_boolean({}, "flag", True))
+
+    def test_string(self):
+        self.assertTrue(config_utils.get_boolean({"flag": "True"}, "flag"))
+        self.assertFalse(config_utils.get_boolean({"flag": "false"}, "flag", True))
+
+    def test_bool(self):
+        self.assertTrue(config_utils.get_boolean({"flag": True}, "flag"))
+
+
+class TestParsePositiveInt(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(config_utils.parse_positive_int("4"), 4)
+        self.assertEqual(config_utils.parse_positive_int(4), 4)
+
+    def test_invalid(self):
+        for value in ("0", -1, "four", None):
+            self.assertEqual(config_utils.parse_positive_int(value), None)
+
+
+class TestGetPositiveInt(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(config_utils.get_positive_int({}, "threads", 1), 1)
+
+    def test_string(self):
+        self.assertEqual(config_utils.get_positive_int({"threads": "4"}, "threads", 1), 4)
+
+    def test_invalid(self):
+        self.assertEqual(config_utils.get_positive_int({"threads": "0"}, "threads", 1), 1)
+
+
+class TestGetIntSetting(unittest.TestCase):
+    def test_default(self):
+        self.assertEqual(config_utils.get_int_setting({}, "threads", 1), 1)
+
+    def test_string(self):
+        self.assertEqual(config_utils.get_int_setting({"threads": "4"}, "threads", 1), 4)
+
+    def test_not_positive(self):
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            config_utils.get_int_setting({"threads": "0"}, "threads", 1)
+        self.assertEqual(ctx.exception.error_code.code, "DKR1021")
+
+    def test_choices(self):
+        with self.assertRaises(PulpCodedValidationException) as ctx:
+            config_utils.get_int_setting({"level": 12}, "level", None, range(1, 10))
+        self.assertEqual(ctx.exception.error_code.code, "DKR1022")
@@ -0,0 +1,58 @@
+"""
+This module contains tests for the pulp_docker.plugins.http_pool module.
+"""
+import mock
+from nectar.config import DownloaderConfig
+from pulp.common.compat import unittest
+import requests
+
+from pulp_docker.plugins import http_pool
+
+
+class TestShareConnections(unittest.TestCase):
+    """
+    This class contains tests for the share_connections() function.
+    """
+    def tearDown(self):
+        http_pool.clear()
+
+    @staticmethod
+    def _downloader(**config):
+        return mock.MagicMock(config=DownloaderConfig(**config), session=requests.Session())
+
+    def test_same_settings(self):
+        """
+        Assert that downloaders with the same connection settings share the adapter, whatever
+        their credentials.
+        """
+        first = http_pool.share_connections(self._downloader(max_concurrent=5))
+        second = http_pool.share_connections(self._downloader(basic_auth_username='user'))
+
+        adapter = first.session.get_adapter('https://registry.example.com/v2/')
+        self.assertTrue(adapter is second.session.get_adapter('https://auth.example.com/token'))
+        self.assertTrue(adapter is first.session.get_adapter('http://registry.example.com/'))
+        self.assertEqual(adapter._pool_maxsize, http_pool.DEFAULT_POOL_SIZE)
+
+    def test_different_settings(self):
+        """
+        Assert that downloaders with different TLS settings do not share connections.
+        """
+        first = http_pool.share_connections(self._downloader())
+        second = http_pool.share_connections(self._downloader(ssl_validation=False))
+
+        self.assertFalse(first.session.get_adapter('https://a/') is
+                         second.session.get_adapter('https://a/'))
+
+    def test_pool_size(self):
+        """
+        Assert that a downloader with more threads than the pool size gets a bigger pool.
+        """
+        first = http_pool.share_connections(self._downloader())
+        second = http_pool.share_connections(self._downloader(max_concurrent=25))
+        third = http_pool.share_connections(self._downloader(max_concurrent=20))
+
+        self.assertEqual(second.session.get_adapter('https://a/')._pool_maxsize, 25)
+        self.assertTrue(third.session.get_adapter('https://a/') is
+                        second.session.get_adapter('https://a/'))
+        self.assertEqual(first.session.get_adapter('https://a/')._pool_maxsize,
+                         http_pool.DEFAULT_POOL_SIZE)
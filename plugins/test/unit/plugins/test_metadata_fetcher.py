@@ -0,0 +1,98 @@
+"""
+This module contains tests for the pulp_docker.plugins.metadata_fetcher module.
+"""
+from cStringIO import StringIO
+import httplib
+
+import mock
+from nectar.config import DownloaderConfig
+from nectar.report import DownloadReport
+from nectar.request import DownloadRequest
+from pulp.common.compat import unittest
+import requests
+
+from pulp_docker.plugins import http_pool, metadata_fetcher
+
+
+class TestMetadataFetcher(unittest.TestCase):
+    """
+    This class contains tests for the MetadataFetcher class.
+    """
+    def setUp(self):
+        self.fetcher = metadata_fetcher.MetadataFetcher(
+            DownloaderConfig(basic_auth_username='user', basic_auth_password='password'),
+            host_limit=2)
+        self.request = DownloadRequest('https://registry.example.com/v2/pulp/tags/list',
+                                       StringIO())
+
+    def tearDown(self):
+        http_pool.clear()
+
+    def test___init__(self):
+        """
+        Assert that the session uses the basic auth credentials and the shared connections.
+        """
+        self.assertEqual(self.fetcher.session.auth, ('user', 'password'))
+        self.assertTrue(isinstance(self.fetcher.session.get_adapter('https://a/'),
+                                   requests.adapters.HTTPAdapter))
+        self.assertTrue(self.fetcher.session.get_adapter('https://a/') is
+                        metadata_fetcher.MetadataFetcher(DownloaderConfig()).session.get_adapter(
+                            'https://b/'))
+
+    def test_download_one(self):
+        """
+        Assert that a successful response is written to the destination, with the headers of the
+        request and of the fetcher.
+        """
+        response = mock.MagicMock(ok=True, content='{"tags": []}', headers={'Link': 'next'})
+        self.fetcher.extra_headers = {'Authorization': 'Basic old', 'X-Extra': 'yes'}
+        self.request.headers = {'Authorization': 'Bearer token'}
+
+        with mock.patch.object(self.fetcher.session, 'get', return_value=response) as get:
+            report = self.fetcher.download_one(self.request)
+
+        self.assertEqual(get.call_args[1]['headers'],
+                         {'Authorization': 'Bearer token', 'X-Extra': 'yes'})
+        self.assertEqual(report.state, DownloadReport.DOWNLOAD_SUCCEEDED)
+        self.assertEqual(report.headers, {'Link': 'next'})
+        self.assertEqual(self.request.destination.getvalue(), '{"tags": []}')
+
+    def test_download_one_unauthorized(self):
+        """
+        Assert that an error response is reported with its status code and headers, as the
+        registry client needs them to authenticate.
+        """
+        response = mock.MagicMock(ok=False, status_code=httplib.UNAUTHORIZED,
+                                  reason='Unauthorized',
+                                  headers={'www-authenticate': 'Bearer realm="x"'})
+
+        with mock.patch.object(self.fetcher.session, 'get', return_value=response):
+            report = self.fetcher.download_one(self.request)
+
+        self.assertEqual(report.state, DownloadReport.DOWNLOAD_FAILED)
+        self.assertEqual(report.error_report['response_code'], httplib.UNAUTHORIZED)
+        self.assertEqual(report.headers['www-authenticate'], 'Bearer realm="x"')
+        self.assertEqual(self.request.destination.getvalue(), '')
+
+    def test_download_one_connection_error(self):
+        """
+        Assert that a connection error is reported as a failed download.
+        """
+        with mock.patch.object(self.fetcher.session, 'get',
+                               side_effect=requests.ConnectionError('refused')):
+            report = self.fetcher.download_one(self.request)
+
+        self.assertEqual(report.state, DownloadReport.DOWNLOAD_FAILED)
+        self.assertEqual(report.error_msg, 'refused')
+
+    def test__host_semaphore(self):
+        """
+        Assert that the requests are limited by host.
+        """
+        semaphore = self.fetcher._host_semaphore('https://registry.example.com/v2/a')
+
+        self.assertTrue(semaphore is self.fetcher._host_semaphore('https://registry.example.com/'))
+        self.assertFalse(semaphore is self.fetcher._host_semaphore('https://auth.example.com/'))
+        self.assertTrue(semaphore.acquire(False))
+        self.assertTrue(semaphore.acquire(False))
+        self.assertFalse(semaphore.acquire(False))
@@ -5,6 +5,7 @@ import mock
 import os
 import unittest
 
+from pulp_docker.common import constants
 from pulp_docker.plugins import models
 
 from pulp.server.exceptions import PulpCodedValidationException
@@ -186,6 +187,29 @@ class TestManifestList(unittest.TestCase):
         self.assertEqual(m.amd64_schema_version, 2)
         self.assertEqual(len(m.manifests), 2)
 
+    def test_get_amd64_manifest_none(self):
+        """
+        Assert get_amd64_manifest() returns None for both values without an amd64 linux manifest.
+        """
+        manifest_list = {'manifests': [
+            {'digest': 'sha256:arm', 'mediaType': constants.MEDIATYPE_MANIFEST_S2,
+             'platform': {'architecture': 'arm', 'os': 'linux'}}]}
+
+        self.assertEqual(models.ManifestList.get_amd64_manifest(manifest_list), (None, None))
+
+    def test_get_amd64_manifest_schema1(self):
+        """
+        Assert get_amd64_manifest() returns the first amd64 linux manifest.
+        """
+        manifest_list = {'manifests': [
+            {'digest': 'sha256:first', 'mediaType': constants.MEDIATYPE_MANIFEST_S1,
+             'platform': {'architecture': 'amd64', 'os': 'linux'}},
+            {'digest': 'sha256:second', 'mediaType': constants.MEDIATYPE_MANIFEST_S2,
+             'platform': {'architecture': 'amd64', 'os': 'linux'}}]}
+
+        self.assertEqual(models.ManifestList.get_amd64_manifest(manifest_list),
+                         ('sha256:first', 1))
+
     def test_check_json_invalid_json(self):
         """
         Assert validation exception is raised if json is invalid.
@@ -439,3 +463,53 @@ class TestTag(unittest.TestCase):
         fields['pulp_user_metadata'] = fields_old['pulp_user_metadata']
         for fname, fval in fields.items():
             self.assertEquals(fval, getattr(m, fname))
+
+    @mock.patch("pulp_docker.plugins.models.TagQuerySet.filter")
+    @mock.patch("pulp_docker.plugins.models.Tag.save")
+    @mock.patch("pulp_docker.plugins.models.Tag._get_db")
+    def test_tag_manifests(self, _get_db, _Tag_save, _filter):
+        unchanged = models.Tag(name="unchanged", repo_id="fedora", schema_version=2,
+                               manifest_type="image", manifest_digest="sha256:1")
+        updated = models.Tag(name="updated", repo_id="fedora", schema_version=2,
+                             manifest_type="image", manifest_digest="sha256:1")
+        _filter.return_value = [unchanged, updated]
+
+        results = models.Tag.objects.tag_manifests("fedora", [
+            ("unchanged", "sha256:1", 2, "image"),
+            ("updated", "sha256:2", 2, "image"),
+            # a tag with the same name for another schema version is another Tag
+            ("updated", "sha256:3", 1, "image"),
+        ])
+
+        _filter.assert_called_once_with(repo_id="fedora", name__in=["unchanged", "updated"])
+        self.assertEquals([(unchanged, "unchanged"), (updated, "updated")], results[:2])
+        self.assertEquals("created", results[2][1])
+        self.assertEquals(("updated", "sha256:3", 1),
+                          (results[2][0].name, results[2][0].manifest_digest,
+                           results[2][0].schema_version))
+        self.assertEquals("sha256:2", updated.manifest_digest)
+        self.assertEquals(2, _Tag_save.call_count)
+
+    @mock.patch("pulp_docker.plugins.models.TagQuerySet.get")
+    @mock.patch("pulp_docker.plugins.models.TagQuerySet.filter")
+    @mock.patch("pulp_docker.plugins.models.Tag.save")
+    @mock.patch("pulp_docker.plugins.models.Tag._get_db")
+    def test_tag_manifests_created_concurrently(self, _get_db, _Tag_save, _filter, _get):
+        concurrent = models.Tag(name="concurrent", repo_id="fedora", schema_version=2,
+                                manifest_type="image", manifest_digest="sha256:1")
+        _filter.return_value = []
+        # the new Tags were created by another task, which removed the second one again
+        _Tag_save.side_effect = [models.mongoengine.NotUniqueError(), None,
+                                 models.mongoengine.NotUniqueError()]
+        _get.side_effect = [concurrent, models.mongoengine.DoesNotExist()]
+
+        results = models.Tag.objects.tag_manifests("fedora", [
+            ("concurrent", "sha256:2", 2, "image"),
+            ("removed", "sha256:1", 2, "image"),
+        ])
+
+        self.assertEquals((concurrent, "updated"), results[0])
+        self.assertEquals("sha256:2", concurrent.manifest_digest)
+        self.assertEquals(("removed", "failed"), (results[1][0].name, results[1][1]))
+        _get.assert_called_with(name="removed", repo_id="fedora", schema_version=2,
+                                manifest_type="image")
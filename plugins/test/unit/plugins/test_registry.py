@@ -4,6 +4,7 @@ import json
 import os
 import shutil
 import tempfile
+import threading
 
 import mock
 from nectar.config import DownloaderConfig
@@ -14,7 +15,7 @@ from pulp.common.compat import unittest
 from pulp.server.exceptions import PulpCodedException
 
 from pulp_docker.common import error_codes
-from pulp_docker.plugins import registry
+from pulp_docker.plugins import metadata_fetcher, registry, sync_metrics
 
 
 TEST_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
@@ -382,6 +383,39 @@ class TestV2Repository(unittest.TestCase):
         self.assertEqual(r.downloader.config, download_config)
         self.assertEqual(r.working_dir, working_dir)
 
+    @mock.patch('pulp_docker.plugins.registry.http_pool.share_connections',
+                side_effect=lambda downloader: downloader)
+    def test_downloaders(self, share_connections):
+        """
+        Assert that the downloaders are created when first used, with the shared connections,
+        and that only the auth downloader sends the basic auth credentials.
+        """
+        download_config = DownloaderConfig(basic_auth_username='user',
+                                           basic_auth_password='password')
+        r = registry.V2Repository('pulp', download_config, 'https://registry.example.com',
+                                  '/a/working/dir')
+
+        self.assertEqual(share_connections.call_count, 0)
+        self.assertTrue(r.downloader is r.downloader)
+        self.assertTrue(r.auth_downloader is r.auth_downloader)
+        self.assertEqual(share_connections.call_count, 2)
+        self.assertEqual(r.downloader.config.basic_auth_username, None)
+        self.assertEqual(r.auth_downloader.config.basic_auth_username, 'user')
+        self.assertEqual(r.auth_downloader.config.basic_auth_password, 'password')
+
+    def test_downloaders_direct_engine(self):
+        """
+        Assert that the direct metadata engine uses MetadataFetchers with the host limit.
+        """
+        r = registry.V2Repository('pulp', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir',
+                                  metadata_engine=metadata_fetcher.ENGINE_DIRECT,
+                                  metadata_host_limit=50)
+
+        self.assertTrue(isinstance(r.downloader, metadata_fetcher.MetadataFetcher))
+        self.assertTrue(isinstance(r.auth_downloader, metadata_fetcher.MetadataFetcher))
+        self.assertEqual(r.downloader.host_limit, 50)
+
     def test_api_version_check_incorrect_header(self):
         """
         The the api_version_check() method when the response has the Docker-Distribution-API-Version
@@ -564,6 +598,58 @@ class TestV2Repository(unittest.TestCase):
 
         self.assertEqual(tags, ["best_ever", "latest", "decent"])
 
+    def test_get_catalog(self):
+        """
+        Assert that get_catalog() follows the pagination of the catalog, and only returns the
+        repositories of the namespace.
+        """
+        pages = {
+            '/v2/_catalog': ('</v2/_catalog?last=pulp%2Fcrane&n=2>; rel="next"',
+                             {'repositories': ['other/image', 'pulp/crane']}),
+            '/v2/_catalog?last=pulp%2Fcrane&n=2': (None, {'repositories': ['pulp/pulp']}),
+        }
+
+        def get_path(path):
+            link, body = pages[path]
+            return ({'Link': link} if link else {}), json.dumps(body)
+
+        r = registry.V2Repository('', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir')
+
+        with mock.patch.object(r, '_get_path', side_effect=get_path):
+            self.assertEqual(r.get_catalog(), ['other/image', 'pulp/crane', 'pulp/pulp'])
+            self.assertEqual(r.get_catalog('pulp'), ['pulp/crane', 'pulp/pulp'])
+
+    @mock.patch('pulp_docker.plugins.registry.V2Repository._get_path', side_effect=IOError)
+    def test_get_catalog_failed(self, mock_get_path):
+        """
+        When the catalog cannot be retrieved, make sure the correct exception is raised.
+        """
+        r = registry.V2Repository('', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir')
+
+        with self.assertRaises(PulpCodedException) as assertion:
+            r.get_catalog()
+
+        self.assertEqual(assertion.exception.error_code, error_codes.DKR1030)
+
+    def test_with_name(self):
+        """
+        Assert that the repository returned by with_name() shares the downloaders and the token.
+        """
+        r = registry.V2Repository('', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir')
+        r.token = 'token'
+
+        other = r.with_name('pulp/crane', '/other/working/dir')
+
+        self.assertEqual(other.name, 'pulp/crane')
+        self.assertEqual(other.working_dir, '/other/working/dir')
+        self.assertEqual(other.token, 'token')
+        self.assertTrue(other.downloader is r.downloader)
+        self.assertTrue(other.auth_downloader is r.auth_downloader)
+        self.assertEqual(r.name, '')
+
     @mock.patch('pulp_docker.plugins.registry.V2Repository._get_path', side_effect=IOError)
     def test_get_tags_failed(self, mock_download_one):
         """
@@ -629,6 +715,90 @@ class TestV2Repository(unittest.TestCase):
         self.assertEqual(headers, {'some': 'cool stuff'})
         self.assertEqual(body, "This is the stuff you've been waiting for.")
 
+    @mock.patch('pulp_docker.plugins.auth_util.request_token', return_value='token')
+    def test__get_path_metrics(self, request_token):
+        """
+        Assert that the requests, the token request and the retry are recorded in the sync's
+        measurements.
+        """
+        def download_one(request):
+            report = DownloadReport(request.url, request.destination)
+            if 'Authorization' in (request.headers or {}):
+                report.bytes_downloaded = 20
+                report.download_succeeded()
+            else:
+                report.error_report['response_code'] = httplib.UNAUTHORIZED
+                report.headers = {'www-authenticate': 'Bearer realm="https://auth.example.com"'}
+                report.download_failed()
+            return report
+
+        r = registry.V2Repository('pulp', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir')
+        r.metrics = sync_metrics.SyncMetrics()
+        r.downloader.download_one = mock.MagicMock(side_effect=download_one)
+
+        r._get_path('/v2/pulp/manifests/latest')
+
+        setup = r.metrics.to_dict()['phases'][sync_metrics.PHASE_SETUP]
+        self.assertEqual(setup['auth_retries'], 1)
+        self.assertEqual(setup['bytes_downloaded'], 20)
+        manifests = setup['requests'][sync_metrics.ENDPOINT_MANIFESTS]
+        self.assertEqual((manifests['count'], manifests['failures']), (2, 1))
+        self.assertEqual(setup['requests'][sync_metrics.ENDPOINT_TOKEN]['count'], 1)
+        request_token.assert_called_once_with(r.auth_downloader, mock.ANY, mock.ANY, 'pulp')
+
+    def test__get_path_token_expired(self):
+        """
+        Assert that when the token expires while several threads make requests, only one of them
+        requests a new token and all of them retry with it.
+        """
+        threads = 4
+        refused = []
+        lock = threading.Lock()
+        all_refused = threading.Event()
+
+        def download_one(request):
+            report = DownloadReport(request.url, request.destination)
+            if request.headers['Authorization'] == 'Bearer new':
+                report.download_succeeded()
+                return report
+            # hold the 401 responses until every thread got one
+            with lock:
+                refused.append(request.url)
+                if len(refused) == threads:
+                    all_refused.set()
+            all_refused.wait(5)
+            report.error_report['response_code'] = httplib.UNAUTHORIZED
+            report.headers = {'www-authenticate': 'Bearer realm="https://auth.example.com"'}
+            report.download_failed()
+            return report
+
+        r = registry.V2Repository('pulp', DownloaderConfig(), 'https://registry.example.com',
+                                  '/a/working/dir')
+        r.token = 'expired'
+        r.downloader.download_one = mock.MagicMock(side_effect=download_one)
+        errors = []
+
+        def get_path(tag):
+            try:
+                r._get_path('/v2/pulp/manifests/%s' % tag)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch('pulp_docker.plugins.auth_util.request_token',
+                        return_value='new') as request_token:
+            workers = [threading.Thread(target=get_path, args=(str(i),)) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(refused), threads)
+        self.assertEqual(request_token.call_count, 1)
+        self.assertEqual(r.token, 'new')
+        self.assertEqual(r.downloader.download_one.call_count, 2 * threads)
+
     def test__raise_path_error_not_found(self):
         """
         For a standard error like 404, the report's error message should be used.
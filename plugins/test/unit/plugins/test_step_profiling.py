@@ -0,0 +1,179 @@
+"""
+This module contains tests for the pulp_docker.plugins.step_profiling module.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+from pulp.common.compat import unittest
+from pulp.plugins.config import PluginCallConfiguration
+
+from pulp_docker.common import constants
+from pulp_docker.plugins import step_profiling
+
+
+class Step(object):
+    """
+    A step with the methods the profiler wraps.
+    """
+    def __init__(self, step_id, children=()):
+        self.step_id = step_id
+        self.children = list(children)
+
+    def initialize(self):
+        pass
+
+    def process_main(self, item=None):
+        return sorted(range(1000), reverse=True)
+
+    def finalize(self):
+        pass
+
+    def process(self):
+        self.initialize()
+        for item in range(3):
+            self.process_main(item=item)
+        self.finalize()
+        for child in self.children:
+            child.process()
+
+
+class Task(Step):
+    """
+    The top step of a task.
+    """
+    def __init__(self, working_dir, config, children=()):
+        super(Task, self).__init__('task', children)
+        self.working_dir = working_dir
+        self.config = config
+
+    def get_repo(self):
+        return mock.MagicMock(id='repo1')
+
+    def get_config(self):
+        return self.config
+
+    def get_working_dir(self):
+        return self.working_dir
+
+    def process_lifecycle(self):
+        self.process()
+        return mock.MagicMock(summary={'task': 'FINISHED'})
+
+
+class ProfiledTask(step_profiling.ProfiledTaskMixin, Task):
+    pass
+
+
+class TestGetProfiler(unittest.TestCase):
+    """
+    This class contains tests for the get_profiler() function.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_disabled(self):
+        """
+        Assert that the steps are not profiled by default.
+        """
+        task = Task(self.working_dir, PluginCallConfiguration({}, {}))
+
+        self.assertEqual(step_profiling.get_profiler(task, task.config), None)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_config(self):
+        """
+        Assert that the profile option enables profiling, and the profiles are written to the
+        working directory.
+        """
+        task = Task(self.working_dir,
+                    PluginCallConfiguration({}, {constants.CONFIG_KEY_PROFILE: 'true'}))
+
+        profiler = step_profiling.get_profiler(task, task.config)
+
+        self.assertEqual(profiler.output_dir, os.path.join(self.working_dir, 'profile'))
+        self.assertFalse(profiler.memory)
+
+    def test_environment(self):
+        """
+        Assert that the environment enables profiling, with the memory samples, and that the
+        profiles of each task go to their own directory of the profile directory.
+        """
+        task = Task(self.working_dir, PluginCallConfiguration({}, {}))
+        profile_dir = os.path.join(self.working_dir, 'profiles')
+
+        with mock.patch.dict(os.environ, {step_profiling.ENV_PROFILE: 'memory',
+                                          step_profiling.ENV_PROFILE_DIR: profile_dir}):
+            profiler = step_profiling.get_profiler(task, task.config)
+
+        self.assertEqual(os.path.dirname(profiler.output_dir), profile_dir)
+        self.assertTrue(os.path.basename(profiler.output_dir).startswith('repo1-task-'))
+        self.assertTrue(profiler.memory)
+
+    @mock.patch.dict(os.environ, {step_profiling.ENV_PROFILE: '1'})
+    @mock.patch.object(step_profiling, '_running')
+    def test_nested(self, _running):
+        """
+        Assert that the tasks run by a profiled task, like the syncs of a catalog sync, are not
+        profiled on their own.
+        """
+        _running.active = True
+        task = Task(self.working_dir, PluginCallConfiguration({}, {}))
+
+        self.assertEqual(step_profiling.get_profiler(task, task.config), None)
+
+
+class TestProfiledTaskMixin(unittest.TestCase):
+    """
+    This class contains tests for the ProfiledTaskMixin class.
+    """
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_process_lifecycle(self):
+        """
+        Assert that each step is profiled, and that the profiles, the memory samples and the
+        summary are written to the working directory and the summary added to the report.
+        """
+        config = PluginCallConfiguration({}, {constants.CONFIG_KEY_PROFILE_MEMORY: True})
+        task = ProfiledTask(self.working_dir, config, [Step('child'), Step('child')])
+
+        report = task.process_lifecycle()
+
+        summary = report.summary[step_profiling.REPORT_KEY]
+        self.assertTrue(summary is task.profile_summary)
+        self.assertEqual(sorted(summary['steps']), ['00-task', '01-child', '02-child'])
+        self.assertEqual(summary['steps']['01-child']['calls'], 5)
+        self.assertTrue(any('sorted' in function['function']
+                            for function in summary['top_functions']))
+        self.assertEqual(sorted(summary['memory']), ['00-task', '01-child', '02-child'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.working_dir, 'profile'))),
+                         ['00-task.prof', '01-child.prof', '02-child.prof', 'memory.json',
+                          'summary.json'])
+        with open(os.path.join(self.working_dir, 'profile', 'summary.json')) as summary_file:
+            self.assertEqual(json.load(summary_file)['steps'], summary['steps'])
+        self.assertFalse(step_profiling._running.active)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_process_lifecycle_disabled(self):
+        """
+        Assert that the steps are left alone when profiling is not enabled.
+        """
+        task = ProfiledTask(self.working_dir, PluginCallConfiguration({}, {}), [Step('child')])
+
+        report = task.process_lifecycle()
+
+        self.assertEqual(report.summary, {'task': 'FINISHED'})
+        self.assertEqual(task.profile_summary, None)
+        self.assertFalse('process_main' in task.children[0].__dict__)
+        self.assertEqual(os.listdir(self.working_dir), [])
@@ -0,0 +1,138 @@
+"""
+This module contains tests for the pulp_docker.plugins.sync_metrics module.
+"""
+import mock
+from pulp.common.compat import unittest
+
+from pulp_docker.plugins import sync_metrics
+
+
+class TestClassifyPath(unittest.TestCase):
+    """
+    This class contains tests for the classify_path() function.
+    """
+    def test_endpoints(self):
+        """
+        Assert that the requests are classified by endpoint, whether given a path or a URL.
+        """
+        for path, endpoint in (
+                ('/v2/', sync_metrics.ENDPOINT_VERSION),
+                ('/v2/_catalog?n=100&last=a', sync_metrics.ENDPOINT_CATALOG),
+                ('/v2/library/busybox/tags/list', sync_metrics.ENDPOINT_TAGS),
+                ('https://registry.example.com/v2/pulp/manifests/latest',
+                 sync_metrics.ENDPOINT_MANIFESTS),
+                ('/v2/pulp/blobs/sha256:a', sync_metrics.ENDPOINT_BLOBS),
+                ('https://auth.example.com/token?scope=x', sync_metrics.ENDPOINT_OTHER)):
+            self.assertEqual(sync_metrics.classify_path(path), endpoint)
+
+
+class TestRequestStats(unittest.TestCase):
+    """
+    This class contains tests for the RequestStats class.
+    """
+    def test_add(self):
+        """
+        Assert that the requests are counted in the buckets of their latencies.
+        """
+        stats = sync_metrics.RequestStats()
+
+        stats.add(0.005)
+        stats.add(0.2, failed=True)
+        stats.add(0.25)
+        stats.add(30)
+
+        report = stats.to_dict()
+        self.assertEqual(report['count'], 4)
+        self.assertEqual(report['failures'], 1)
+        self.assertEqual(report['seconds'], 30.455)
+        self.assertEqual(report['latency_ms']['<=10'], 1)
+        self.assertEqual(report['latency_ms']['<=250'], 2)
+        self.assertEqual(report['latency_ms']['>10000'], 1)
+        self.assertEqual(sum(report['latency_ms'].values()), 4)
+
+
+class TestSyncMetrics(unittest.TestCase):
+    """
+    This class contains tests for the SyncMetrics class.
+    """
+    def setUp(self):
+        self.metrics = sync_metrics.SyncMetrics()
+
+    def test_phase(self):
+        """
+        Assert that what is recorded during a phase is added to it, and what is recorded outside
+        of the phases to the setup phase.
+        """
+        self.metrics.record_request(sync_metrics.ENDPOINT_VERSION, 0.1)
+        with mock.patch('time.time', side_effect=[10, 12.5]):
+            with self.metrics.phase(sync_metrics.PHASE_SAVE_TAGS) as phase:
+                self.metrics.record_db(sync_metrics.DB_TAG, 3)
+                self.metrics.record_db(sync_metrics.DB_ASSOCIATE)
+
+        self.assertEqual(list(self.metrics.phases),
+                         [sync_metrics.PHASE_SETUP, sync_metrics.PHASE_SAVE_TAGS])
+        self.assertEqual(phase.seconds, 2.5)
+        self.assertEqual(dict(phase.db_operations), {'tag': 3, 'associate': 1})
+        self.assertEqual(
+            self.metrics.phases[sync_metrics.PHASE_SETUP].requests.keys(), ['version'])
+
+    def test_expect_blob(self):
+        """
+        Assert that the expected bytes are the sizes announced by the manifests, and that the
+        blobs without a size are counted.
+        """
+        with self.metrics.phase(sync_metrics.PHASE_DOWNLOAD_BLOBS) as phase:
+            self.metrics.expect_blob(100)
+            self.metrics.expect_blob(None)
+            self.metrics.record_request(sync_metrics.ENDPOINT_BLOBS, 1, size=90)
+
+        self.assertEqual(phase.bytes_expected, 100)
+        self.assertEqual(phase.bytes_downloaded, 90)
+        self.assertEqual(phase.unsized_blobs, 1)
+
+    def test_to_dict(self):
+        """
+        Assert that the totals add up the phases.
+        """
+        with self.metrics.phase(sync_metrics.PHASE_DOWNLOAD_MANIFESTS):
+            self.metrics.record_request(sync_metrics.ENDPOINT_MANIFESTS, 0.1, size=10)
+            self.metrics.record_auth_retry()
+        with self.metrics.phase(sync_metrics.PHASE_DOWNLOAD_BLOBS):
+            self.metrics.record_request(sync_metrics.ENDPOINT_MANIFESTS, 0.2, failed=True)
+            self.metrics.record_request(sync_metrics.ENDPOINT_BLOBS, 1, size=90)
+
+        report = self.metrics.to_dict()
+
+        self.assertEqual(sorted(report['phases']), ['download_blobs', 'download_manifests'])
+        totals = report['totals']
+        self.assertEqual(totals['bytes_downloaded'], 100)
+        self.assertEqual(totals['auth_retries'], 1)
+        self.assertEqual(totals['requests']['manifests']['count'], 2)
+        self.assertEqual(totals['requests']['manifests']['failures'], 1)
+        self.assertEqual(totals['requests']['blobs']['count'], 1)
+
+
+class TestMeasuredStepMixin(unittest.TestCase):
+    """
+    This class contains tests for the MeasuredStepMixin class.
+    """
+    def test_process(self):
+        """
+        Assert that the step is measured as its phase, and reports the measurements of the phase
+        in its progress details, even when it fails.
+        """
+        class Step(object):
+            def process(self):
+                self.parent.metrics.record_db(sync_metrics.DB_SAVE)
+                raise IOError()
+
+        class MeasuredStep(sync_metrics.MeasuredStepMixin, Step):
+            metrics_phase = sync_metrics.PHASE_SAVE_UNITS
+
+        step = MeasuredStep()
+        step.parent = mock.MagicMock(metrics=sync_metrics.SyncMetrics())
+
+        self.assertRaises(IOError, step.process)
+
+        self.assertEqual(step.progress_details['db_operations'], {'save': 1})
+        self.assertTrue(sync_metrics.PHASE_SAVE_UNITS in step.parent.metrics.phases)